@@ -0,0 +1,12 @@
+"""
+Configuration gunicorn du service Adha AI (gunicorn -c python:adha_ai_service.gunicorn_conf)
+"""
+
+
+def child_exit(server, worker):
+    """
+    Retire les métriques d'un worker arrêté des agrégats multiprocessus
+    (PROMETHEUS_MULTIPROC_DIR), pour que ses jauges ne restent pas dans /metrics/
+    """
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -268,6 +268,21 @@ CACHES = {
 ISOLATION_CACHE_TTL = 3600  # 1 heure pour les contextes d'isolation
 SESSION_CACHE_TTL = 14400   # 4 heures pour les sessions actives
 
+# 📦 BATCH DOCUMENT PROCESSING (api.services.batch_engine)
+# Les fichiers d'un lot doivent être lisibles par les workers : volume partagé en production
+BATCH_UPLOAD_DIR = Path(os.environ.get('BATCH_UPLOAD_DIR', BASE_DIR / 'data' / 'batch_uploads'))
+BATCH_WORKER_PROCESSES = int(os.environ.get('BATCH_WORKER_PROCESSES', 2))
+BATCH_MAX_ATTEMPTS = int(os.environ.get('BATCH_MAX_ATTEMPTS', 3))
+BATCH_LEASE_SECONDS = int(os.environ.get('BATCH_LEASE_SECONDS', 600))
+BATCH_BACKOFF_BASE_SECONDS = float(os.environ.get('BATCH_BACKOFF_BASE_SECONDS', 2.0))
+BATCH_BACKOFF_CAP_SECONDS = float(os.environ.get('BATCH_BACKOFF_CAP_SECONDS', 300.0))
+
+# ⚙️ PIPELINE EXECUTOR (agents.utils.pipeline_executor) - tâches simultanées par ressource et par processus
+PIPELINE_CPU_CONCURRENCY = int(os.environ.get('PIPELINE_CPU_CONCURRENCY', max(2, os.cpu_count() or 2)))
+PIPELINE_LLM_CONCURRENCY = int(os.environ.get('PIPELINE_LLM_CONCURRENCY', 8))
+PIPELINE_DB_CONCURRENCY = int(os.environ.get('PIPELINE_DB_CONCURRENCY', 4))
+
 # Ensure directories exist
 os.makedirs(KNOWLEDGE_BASE_PATH, exist_ok=True)
+os.makedirs(BATCH_UPLOAD_DIR, exist_ok=True)
 os.makedirs(EMBEDDINGS_PATH, exist_ok=True)
@@ -1,6 +1,8 @@
 import os
 import requests
 
+from agents.utils.resilience import BulkheadFullError, CallTimeoutError, CircuitOpenError, dependency
+
 class HuggingFaceConnector:
     def __init__(self, api_token=None, model_name="google/flan-t5-large"):
         self.api_token = api_token or os.environ.get("HUGGINGFACE_API_TOKEN")
@@ -16,11 +18,11 @@ class HuggingFaceConnector:
         """
         payload = {"inputs": prompt, "parameters": {"max_length": max_length, "temperature": temperature}}
         try:
-            response = requests.post(self.api_url, headers=self.headers, json=payload)
+            response = dependency("huggingface").call(requests.post, self.api_url, headers=self.headers, json=payload)
             response.raise_for_status()
             output = response.json()
             return [output[0]['generated_text']] if output else None
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, CircuitOpenError, BulkheadFullError, CallTimeoutError) as e:
             print(f"Erreur lors de l'appel à Hugging Face Inference API: {e}")
             return None
 
@@ -1,6 +1,7 @@
 # agents/llm_connectors/openai_connector.py
 import os
-from openai import OpenAI
+from agents.utils.agent_pool import agent_pool
+from agents.utils.model_router import model_router
 from typing import Optional # Garder Optional pour model_name
 
 class OpenAIConnector:
@@ -21,7 +22,8 @@ class OpenAIConnector:
             raise ValueError(f"La variable d'environnement '{env_var_name}' n'est pas définie. Assurez-vous qu'elle est dans votre fichier .env ou dans l'environnement système.")
 
         try:
-            self.client = OpenAI(api_key=self.api_key)
+            # Client du processus : budget OpenAI partagé, disjoncteur et bulkhead
+            self.client = agent_pool.get("openai_client")
             print("OpenAI client initialized successfully.")
         except Exception as client_e:
             print(f"Erreur lors de l'initialisation du client OpenAI: {client_e}")
@@ -31,18 +33,28 @@ class OpenAIConnector:
         self.model_name = model_name if model_name is not None else "gpt-4"
         print(f"Using OpenAI model: {self.model_name}")
 
-    def generate_text(self, prompt, max_tokens=200, temperature=0.7, n=1, stop=None):
-        """Génère du texte en utilisant le modèle OpenAI."""
-        print(f"Generating text with model {self.model_name}...")
+    def generate_text(self, prompt, max_tokens=200, temperature=0.7, n=1, stop=None, site=None, validate=None):
+        """
+        Génère du texte en utilisant le modèle OpenAI. Avec ``site``, le modèle
+        est choisi par le routeur (voir agents.utils.model_router) : modèle
+        économique d'abord, réponse vérifiée par ``validate``.
+        """
+        messages = [{"role": "user", "content": prompt}]
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=temperature,
-                n=n,
-                stop=stop,
-            )
+            if site:
+                print(f"Generating text for {site} (routed model)...")
+                response = model_router().complete(self.client, site, messages, validate=validate,
+                                                   max_tokens=max_tokens, temperature=temperature, n=n, stop=stop)
+            else:
+                print(f"Generating text with model {self.model_name}...")
+                response = self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    n=n,
+                    stop=stop,
+                )
             print("OpenAI API call successful.")
             return [choice.message.content.strip() for choice in response.choices if choice.message and choice.message.content]
         except Exception as e:
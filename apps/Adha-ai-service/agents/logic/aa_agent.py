@@ -1,27 +1,44 @@
-from openai import OpenAI
 import os
 import json
 import re
 import time
 from datetime import datetime
 from typing import Dict, Any, List, Optional
-from .retriever_agent import RetrieverAgent
-from .generator_agent import GeneratorAgent
 from agents.utils.document_analyzer import DocumentAnalyzer
-from agents.utils.token_manager import get_token_counter
+from agents.utils.agent_pool import ContextTokenCounterMixin, agent_pool
 from agents.utils.calculation_helper import CalculationHelper
 from agents.utils.calculation_validator import CalculationValidator
+from agents.utils.model_router import journal_entries, model_router, one_of
+from agents.utils.syscohada_rules import SyscohadaRulesEngine
 from decimal import Decimal
 
-class AAgent:
+class AAgent(ContextTokenCounterMixin):
+    """
+    Accounting analysis agent. Instances hold no per-request state and are shared
+    through ``agent_pool``; the token counter of a call comes from its AgentContext.
+    """
+    _syscohada_templates_cache = None
+    _rules_engine_cache = None
+
+    # Categories of classify_operation
+    OPERATION_TYPES = ["achat_marchandises", "vente_marchandises", "reglement_fournisseur", "encaissement_client",
+                       "achat_immobilisation", "paie_salaires", "dotation_amortissements", "autre"]
+
     def __init__(self, token_limit=None):
         print("AAgent initialized")
-        self.retriever = RetrieverAgent()
-        self.generator = GeneratorAgent()
-        self.client = OpenAI()
-        self.token_counter = get_token_counter(token_limit)
+        # Retriever (embedding model), generator and OpenAI client are process singletons
+        self.retriever = agent_pool.get("retriever")
+        self.generator = agent_pool.get("generator")
+        self.client = agent_pool.get("openai_client")
+        self._token_limit = token_limit
         self.doc_analyzer = DocumentAnalyzer()
-        self.syscohada_templates = self._load_syscohada_templates()
+        if AAgent._syscohada_templates_cache is None:
+            AAgent._syscohada_templates_cache = self._load_syscohada_templates()
+        self.syscohada_templates = AAgent._syscohada_templates_cache
+        # Templates compiled once: common documents get their entry without the LLM
+        if AAgent._rules_engine_cache is None:
+            AAgent._rules_engine_cache = SyscohadaRulesEngine(self.syscohada_templates)
+        self.rules_engine = AAgent._rules_engine_cache
         self.calculator = CalculationHelper(precision=2)  # Calculator for basic operations
         self.validator = CalculationValidator(precision=2)  # New calculation validator
 
@@ -131,7 +148,8 @@ class AAgent:
         
         Args:
             intent: Classification of the operation (optional)
-            entities: Named entities extracted from the prompt (optional)
+            entities: Named entities extracted from the prompt (optional);
+                ``company_name`` is the tenant company, party of its invoices
             extracted_data: Extracted document data
             
         Returns:
@@ -162,6 +180,15 @@ class AAgent:
         # Extract data type and content for customized handling
         document_type = extracted_data.get("document_type", "unknown")
         debug_info["document_type"] = document_type
+
+        # Deterministic fast path: invoices and receipts matching a SYSCOHADA template
+        company_name = entities.get("company_name") if isinstance(entities, dict) else None
+        fast_path = self.rules_engine.propose(extracted_data, intent, company_name=company_name)
+        if fast_path is not None:
+            debug_info["step"] = "syscohada_rules"
+            result.update(fast_path)
+            result["processing_time"] = time.time() - start_time
+            return result
         
         # Determine if the data came from a prompt or a document
         is_prompt = document_type == "prompt"
@@ -302,13 +329,14 @@ RÈGLES POUR LA RÉPONSE:
 Ne fournissez que la structure JSON demandée, sans explication supplémentaire.
 """
 
-            # Send to OpenAI for direct processing
-            response = self.generator_agent.llm_connector.client.chat.completions.create(
-                model="gpt-4o-2024-08-06",
+            # Send to OpenAI for direct processing (no template matched: strong tier)
+            response = model_router().complete(
+                self.client, "aa.entries",
                 messages=[
                     {"role": "system", "content": "Vous êtes un expert-comptable spécialiste du système SYSCOHADA qui génère des écritures comptables précises."},
                     {"role": "user", "content": fallback_prompt}
                 ],
+                validate=journal_entries,
                 temperature=0.1,
                 response_format={"type": "json_object"}
             )
@@ -472,17 +500,18 @@ Si les informations sont insuffisantes pour générer une écriture, retournez u
         """
         Classifie le type d'opération comptable à partir du texte.
         """
-        # Utilisez le LLM pour déterminer le type d'opération
-        response = self.client.chat.completions.create(
-            model="gpt-4o-2024-08-06",
+        # Utilisez le LLM pour déterminer le type d'opération (modèle économique, gpt-4o si la catégorie est inconnue)
+        response = model_router().complete(
+            self.client, "aa.classify",
             messages=[
-                {"role": "system", "content": "Vous êtes un expert-comptable SYSCOHADA. Classifiez cette opération dans l'une des catégories suivantes : achat_marchandises, vente_marchandises, reglement_fournisseur, encaissement_client, achat_immobilisation, paie_salaires, dotation_amortissements, autre."},
+                {"role": "system", "content": f"Vous êtes un expert-comptable SYSCOHADA. Classifiez cette opération dans l'une des catégories suivantes : {', '.join(self.OPERATION_TYPES)}."},
                 {"role": "user", "content": f"Texte à classer : {text}"}
             ],
+            validate=one_of(self.OPERATION_TYPES),
             temperature=0.1,
             max_tokens=50,
         )
-        operation_type = response.choices[0].message.content.strip().lower()
+        operation_type = response.choices[0].message.content.strip().strip('."\'').lower()
         return operation_type
 
     def _process_natural_language(self, text, intent, entities):
@@ -547,8 +576,9 @@ Si les informations sont insuffisantes pour générer une écriture, retournez u
             5. Ne créez jamais de libellés génériques ou imprécis"""
             # Récupérer les règles spécifiques au type d'opération
             specific_rules = self.retriever.retrieve(f"règles comptables pour {operation_type} en SYSCOHADA")
-            response = self.client.chat.completions.create(
-                model="gpt-4",  # Using GPT-4 for better comprehension 
+            # Cheap model when a template matched, gpt-4o otherwise or when the entries do not check out
+            response = model_router().complete(
+                self.client, "aa.entries",
                 messages=[
                     {
                         "role": "system",
@@ -559,13 +589,16 @@ Si les informations sont insuffisantes pour générer une écriture, retournez u
                         "content": f"TEXTE À ANALYSER: {text}\n\nINTENTION: {intent or 'Non spécifiée'}\n\nRÈGLES SPÉCIFIQUES:\n{specific_rules[0] if specific_rules and len(specific_rules) > 0 else 'Aucune règle spécifique trouvée.'}"
                     }
                 ],
+                validate=journal_entries,
+                doc_type="prompt",
+                template_matched=bool(template),
                 temperature=0.1,
                 max_tokens=1000,
             )
             # Logging token usage with the shared TokenCounter
             self.token_counter.log_operation(
                 agent_name="AAgent",
-                model="gpt-4",
+                model=response.model,
                 input_text=syscohada_prompt + f"\nTEXTE À ANALYSER: {text}\n\nINTENTION: {intent or 'Non spécifiée'}",
                 output_text=response.choices[0].message.content,
                 operation_id=operation_id,
@@ -670,8 +703,8 @@ Si les informations sont insuffisantes pour générer une écriture, retournez u
                     if "correction_suggeree" in validation:
                         elements_validés += f"- Correction suggérée: {json.dumps(validation['correction_suggeree'], indent=2, ensure_ascii=False)}\n"
 
-            response = self.client.chat.completions.create(
-                model="gpt-4o-2024-08-06",
+            response = model_router().complete(
+                self.client, "aa.document_entries",
                 messages=[
                     {
                         "role": "system",
@@ -682,6 +715,8 @@ Si les informations sont insuffisantes pour générer une écriture, retournez u
                         "content": f"DOCUMENT À ANALYSER:\n{extracted_data['full_text']}\n\n{elements_validés}"
                     },
                 ],
+                validate=journal_entries,
+                doc_type=doc_type,
                 temperature=0.1,
                 max_tokens=2000
             )
@@ -787,8 +822,8 @@ Si les informations sont insuffisantes pour générer une écriture, retournez u
                 "informations_manquantes": ["Liste des règles appliquées"]
             }}
             IMPORTANT : RÉPONDRE UNIQUEMENT EN JSON VALIDE"""
-            response = self.client.chat.completions.create(
-                model="gpt-4o-2024-08-06",
+            response = model_router().complete(
+                self.client, "aa.document_entries",
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {
@@ -796,6 +831,8 @@ Si les informations sont insuffisantes pour générer une écriture, retournez u
                         "content": f"Analysez ce document et générez les écritures comptables SYSCOHADA :\n\n{extracted_data['full_text']}"
                     },
                 ],
+                validate=journal_entries,
+                doc_type=doc_type,
                 temperature=0.1,
                 max_tokens=2000
             )
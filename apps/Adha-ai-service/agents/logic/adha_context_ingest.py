@@ -8,6 +8,8 @@ from langchain.vectorstores import Chroma
 from langchain.embeddings import SentenceTransformerEmbeddings
 from django.conf import settings
 
+from agents.utils.resilience import dependency
+
 ADMIN_SERVICE_URL = os.environ.get('ADMIN_SERVICE_URL', 'http://admin-service:3000/api/adha-context/sources')
 
 class AdhaContextIngestor:
@@ -27,14 +29,14 @@ class AdhaContextIngestor:
         )
 
     def fetch_active_sources(self) -> List[dict]:
-        resp = requests.get(ADMIN_SERVICE_URL, params={"active": "true", "pageSize": 100})
+        resp = dependency("admin_service").call(requests.get, ADMIN_SERVICE_URL, params={"active": "true", "pageSize": 100})
         resp.raise_for_status()
         return resp.json().get('data', [])
 
     def download_pdf(self, url: str) -> str:
         # Télécharge le PDF et retourne le chemin local temporaire
         with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
-            r = requests.get(url, stream=True)
+            r = dependency("admin_service").call(requests.get, url, stream=True)
             for chunk in r.iter_content(chunk_size=8192):
                 tmp.write(chunk)
             tmp.flush()
@@ -3,7 +3,6 @@ from openai import OpenAI
 import os
 import re
 import warnings
-import yaml
 import fitz  # PyMuPDF for PDFs
 import tempfile
 import time
@@ -16,18 +15,21 @@ from PIL import Image  # For image processing
 from io import BytesIO
 from decimal import Decimal, InvalidOperation
 import csv
-from agents.utils.token_manager import get_token_counter
+from agents.utils.agent_pool import ContextTokenCounterMixin, agent_pool, load_config
+from agents.utils.model_router import has_content, json_object, model_router
 from agents.utils.document_extraction import DocumentExtractor
+from agents.utils.tabular_summarizer import TabularSummarizer, classify_headers, estimate_tokens
+from agents.utils.extraction_patterns import (
+    DATE_CONTEXT_PATTERN, DATE_CONTEXT_PRIORITY, DATE_PATTERN, DECIMAL_COMMA, MONTANT_PATTERNS,
+    MONTANTS_CLES_PATTERNS, PARTIES_PATTERNS, REFERENCE_PATTERNS, THOUSANDS_DOT
+)
 
-class DDEAgent:
+class DDEAgent(ContextTokenCounterMixin):
     def __init__(self, token_limit=None):
         print("DDE Agent initialized")
-        # Load OpenAI API key from config file
-        config_path = os.path.join(os.path.dirname(__file__), "../../config/config.yaml")
+        # Load OpenAI API key from config file (read once per process)
         try:
-            with open(config_path, "r") as config_file:
-                config = yaml.safe_load(config_file)
-                self.OPENAI_API_KEY = config.get("OPENAI_API_KEY")
+            self.OPENAI_API_KEY = load_config().get("OPENAI_API_KEY")
         except Exception as e:
             raise RuntimeError(f"Error loading configuration file: {e}")
 
@@ -37,15 +39,16 @@ class DDEAgent:
             )
         openai.api_key = self.OPENAI_API_KEY
 
-        # Initialiser le client OpenAI
-        self.client = OpenAI(api_key=self.OPENAI_API_KEY)
+        # Client OpenAI partagé par le processus
+        self.client = agent_pool.get("config_openai_client")
 
         # Ignore unnecessary warnings
         warnings.filterwarnings("ignore", category=UserWarning)
 
         # Initialize document extractor
         self.document_extractor = DocumentExtractor()
-        self.token_counter = get_token_counter(token_limit)
+        self.tabular_summarizer = TabularSummarizer()
+        self._token_limit = token_limit
         
         # Initialize supported formats
         self.supported_formats = {
@@ -216,8 +219,9 @@ IMPORTANT: Répondez en français. Ne traduisez pas le contenu, préservez-le da
                 try:
                     print("Analyse du texte extrait pour identifier la structure du document...")
                     analysis_start_time = time.time()
-                    analysis = self.client.chat.completions.create(
-                        model="gpt-4o-2024-08-06",
+                    analysis = model_router().complete(
+                        self.client, "dde.summary",
+                        validate=has_content,
                         messages=[
                             {
                                 "role": "system",
@@ -247,7 +251,7 @@ IMPORTANT: Répondez en français. Ne traduisez pas le contenu, préservez-le da
                     extraction_details["document_analysis"] = {
                         "processing_time_seconds": time.time() - analysis_start_time,
                         "analysis_text": analysis_text,
-                        "processing_method": "gpt-4o-2024-08-06"
+                        "processing_method": analysis.model
                     }
                     
                 except Exception as e:
@@ -396,8 +400,9 @@ Votre extraction sera utilisée pour le traitement automatisé des écritures co
             try:
                 print("Analyse du texte extrait pour identifier les éléments comptables...")
                 analysis_start_time = time.time()
-                analysis = self.client.chat.completions.create(
-                    model="gpt-4o-2024-08-06",
+                analysis = model_router().complete(
+                    self.client, "dde.summary",
+                    validate=has_content,
                     messages=[
                         {
                             "role": "system",
@@ -686,18 +691,10 @@ Votre extraction sera utilisée pour le traitement automatisé des écritures co
         """Extrait tous les montants du texte avec contexte"""
         montants = []
         
-        # Pattern pour détecter les montants avec indication monétaire
-        patterns = [
-            # Format 1,234.56 € / 1,234.56€ / 1 234.56 €
-            r'(\d{1,3}(?:[ \.,]\d{3})*(?:[,.]\d{1,3})?)\s*(?:€|EUR|EURO|EUROS|F|FCFA|XOF|\$|USD)',
-            # Format € 1,234.56 / FCFA 1,234.56
-            r'(?:€|EUR|EURO|EUROS|F|FCFA|XOF|\$|USD)\s*(\d{1,3}(?:[ \.,]\d{3})*(?:[,.]\d{1,3})?)'
-        ]
-        
-        for pattern in patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE)
-            for match in matches:
-                # Récupérer le contexte (10 caractères avant et après)
+        # Patterns précompilés (montant suivi ou précédé d'une devise), voir extraction_patterns
+        for pattern in MONTANT_PATTERNS:
+            for match in pattern.finditer(text):
+                # Récupérer le contexte (30 caractères avant et après)
                 start = max(0, match.start() - 30)
                 end = min(len(text), match.end() + 30)
                 contexte = text[start:end].strip()
@@ -706,9 +703,9 @@ Votre extraction sera utilisée pour le traitement automatisé des écritures co
                 if match.group(1):
                     montant_str = match.group(1).replace(' ', '')
                     # Gérer le cas où la virgule est utilisée comme séparateur décimal
-                    montant_str = re.sub(r'(\d+)[,](\d+)', r'\1.\2', montant_str)
+                    montant_str = DECIMAL_COMMA.sub(r'\1.\2', montant_str)
                     # Supprimer les séparateurs de milliers
-                    montant_str = re.sub(r'(\d+)[.](\d{3})', r'\1\2', montant_str)
+                    montant_str = THOUSANDS_DOT.sub(r'\1\2', montant_str)
                     
                     try:
                         montant = float(montant_str)
@@ -725,57 +722,19 @@ Votre extraction sera utilisée pour le traitement automatisé des écritures co
     def _extraire_montants_cles(self, text):
         """Extrait spécifiquement les montants clés: HT, TVA, TTC"""
         montants_cles = {}
+        text_lower = text.lower()
         
-        # Patterns pour montant HT
-        ht_patterns = [
-            r'(?:montant|prix|total)\s+(?:ht|h\.t\.|hors\s+taxe)[^\d]*?(\d{1,3}(?:[ \.,]\d{3})*(?:[,.]\d{1,3})?)',
-            r'(?:ht|h\.t\.|hors\s+taxe)[^\d]*?[:]?\s*(\d{1,3}(?:[ \.,]\d{3})*(?:[,.]\d{1,3})?)'
-        ]
-        
-        # Patterns pour TVA
-        tva_patterns = [
-            r'(?:tva|taxe)[^\d]*?(\d{1,3}(?:[ \.,]\d{3})*(?:[,.]\d{1,3})?)',
-            r'(?:tva|taxe)[^\d]*?[:]?\s*(\d{1,3}(?:[ \.,]\d{3})*(?:[,.]\d{1,3})?)'
-        ]
-        
-        # Patterns pour TTC
-        ttc_patterns = [
-            r'(?:montant|prix|total)\s+(?:ttc|t\.t\.c\.|toutes\s+taxes)[^\d]*?(\d{1,3}(?:[ \.,]\d{3})*(?:[,.]\d{1,3})?)',
-            r'(?:ttc|t\.t\.c\.|toutes\s+taxes)[^\d]*?[:]?\s*(\d{1,3}(?:[ \.,]\d{3})*(?:[,.]\d{1,3})?)'
-        ]
-        
-        # Recherche HT
-        for pattern in ht_patterns:
-            match = re.search(pattern, text.lower())
-            if match:
-                montant_str = match.group(1).strip().replace(' ', '').replace(',', '.')
-                try:
-                    montants_cles["montant_ht"] = float(montant_str)
-                    break
-                except ValueError:
-                    continue
-                    
-        # Recherche TVA
-        for pattern in tva_patterns:
-            match = re.search(pattern, text.lower())
-            if match:
-                montant_str = match.group(1).strip().replace(' ', '').replace(',', '.')
-                try:
-                    montants_cles["montant_tva"] = float(montant_str)
-                    break
-                except ValueError:
-                    continue
-        
-        # Recherche TTC
-        for pattern in ttc_patterns:
-            match = re.search(pattern, text.lower())
-            if match:
-                montant_str = match.group(1).strip().replace(' ', '').replace(',', '.')
-                try:
-                    montants_cles["montant_ttc"] = float(montant_str)
-                    break
-                except ValueError:
-                    continue
+        # Pour chaque montant clé, le premier pattern qui donne un nombre valide l'emporte
+        for cle, patterns in MONTANTS_CLES_PATTERNS.items():
+            for pattern in patterns:
+                match = pattern.search(text_lower)
+                if match:
+                    montant_str = match.group(1).strip().replace(' ', '').replace(',', '.')
+                    try:
+                        montants_cles[cle] = float(montant_str)
+                        break
+                    except ValueError:
+                        continue
                     
         return montants_cles
 
@@ -783,40 +742,22 @@ Votre extraction sera utilisée pour le traitement automatisé des écritures co
         """Extrait les dates du document"""
         dates = []
         
-        # Différents formats de dates courants
-        date_patterns = [
-            # Format JJ/MM/AAAA ou JJ-MM-AAAA
-            r'(\d{1,2}[/\-\.]\d{1,2}[/\-\.]\d{2,4})',
-            # Format textuel français: JJ mois AAAA
-            r'(\d{1,2}\s+(?:janvier|février|mars|avril|mai|juin|juillet|août|septembre|octobre|novembre|décembre)\s+\d{2,4})',
-            # Format abrégé: JJ mois. AA
-            r'(\d{1,2}\s+(?:janv|févr|mars|avr|mai|juin|juil|août|sept|oct|nov|déc)\.?\s+\d{2,4})'
-        ]
-        
-        for pattern in date_patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE)
-            for match in matches:
-                # Récupérer le contexte
-                start = max(0, match.start() - 20)
-                end = min(len(text), match.end() + 20)
-                contexte = text[start:end].strip()
-                
-                # Déterminer le type de date (facture, livraison, etc.)
-                type_date = "inconnue"
-                if re.search(r'facture|fact\.', contexte, re.IGNORECASE):
-                    type_date = "facture"
-                elif re.search(r'livraison|livré', contexte, re.IGNORECASE):
-                    type_date = "livraison"
-                elif re.search(r'paiement|échéance|règlement', contexte, re.IGNORECASE):
-                    type_date = "paiement"
-                elif re.search(r'commande', contexte, re.IGNORECASE):
-                    type_date = "commande"
-                
-                dates.append({
-                    "valeur": match.group(0),
-                    "type": type_date,
-                    "contexte": contexte
-                })
+        # Formats JJ/MM/AAAA, JJ mois AAAA et JJ mois. AA en une seule passe
+        for match in DATE_PATTERN.finditer(text):
+            # Récupérer le contexte
+            start = max(0, match.start() - 20)
+            end = min(len(text), match.end() + 20)
+            contexte = text[start:end].strip()
+            
+            # Déterminer le type de date (facture, livraison, etc.)
+            trouves = {m.lastgroup for m in DATE_CONTEXT_PATTERN.finditer(contexte)}
+            type_date = next((t for t in DATE_CONTEXT_PRIORITY if t in trouves), "inconnue")
+            
+            dates.append({
+                "valeur": match.group(0),
+                "type": type_date,
+                "contexte": contexte
+            })
                 
         return dates
 
@@ -824,26 +765,9 @@ Votre extraction sera utilisée pour le traitement automatisé des écritures co
         """Extrait les références du document (numéros de facture, etc.)"""
         references = []
         
-        # Patterns pour différents types de références
-        ref_patterns = {
-            "facture": [
-                r'(?:facture|fact\.?|invoice)\s*(?:n[o°]\.?|numéro|ref\.?)[:]?\s*([A-Z0-9][A-Z0-9\-_/]{2,20})',
-                r'(?:n[o°]\.?|numéro|ref\.?)\s*(?:facture|fact\.?)[:]?\s*([A-Z0-9][A-Z0-9\-_/]{2,20})'
-            ],
-            "commande": [
-                r'(?:commande|cmd\.?|purchase order|order)\s*(?:n[o°]\.?|numéro|ref\.?)[:]?\s*([A-Z0-9][A-Z0-9\-_/]{2,20})',
-                r'(?:n[o°]\.?|numéro|ref\.?)\s*(?:commande|cmd\.?)[:]?\s*([A-Z0-9][A-Z0-9\-_/]{2,20})'
-            ],
-            "client": [
-                r'(?:client|customer)\s*(?:n[o°]\.?|numéro|ref\.?|id)[:]?\s*([A-Z0-9][A-Z0-9\-_/]{2,20})',
-                r'(?:n[o°]\.?|numéro|ref\.?|id)\s*(?:client|customer)[:]?\s*([A-Z0-9][A-Z0-9\-_/]{2,20})'
-            ]
-        }
-        
-        for ref_type, patterns in ref_patterns.items():
+        for ref_type, patterns in REFERENCE_PATTERNS.items():
             for pattern in patterns:
-                matches = re.finditer(pattern, text, re.IGNORECASE)
-                for match in matches:
+                for match in pattern.finditer(text):
                     # Récupérer le contexte
                     start = max(0, match.start() - 20)
                     end = min(len(text), match.end() + 20)
@@ -862,31 +786,12 @@ Votre extraction sera utilisée pour le traitement automatisé des écritures co
         """Extrait les informations sur les parties (fournisseur, client)"""
         parties = {}
         
-        # Recherche du fournisseur
-        fournisseur_patterns = [
-            r'(?:fournisseur|vendeur|émetteur|supplier)[^\n:]*?[:]\s*([^\n]+)',
-            r'(?:de|from)[:]?\s*([A-Z][A-Za-z\s]{2,40}(?:SARL|SA|SAS|Inc\.?|LLC|Ltd\.?)?)'
-        ]
-        
-        # Recherche du client
-        client_patterns = [
-            r'(?:client|acheteur|destinataire|customer)[^\n:]*?[:]\s*([^\n]+)',
-            r'(?:à|facturer à|facturé à|to)[:]?\s*([A-Z][A-Za-z\s]{2,40}(?:SARL|SA|SAS|Inc\.?|LLC|Ltd\.?)?)'
-        ]
-        
-        # Recherche du fournisseur
-        for pattern in fournisseur_patterns:
-            match = re.search(pattern, text)
-            if match and match.group(1):
-                parties["fournisseur"] = match.group(1).strip()
-                break
-                
-        # Recherche du client
-        for pattern in client_patterns:
-            match = re.search(pattern, text)
-            if match and match.group(1):
-                parties["client"] = match.group(1).strip()
-                break
+        for partie, patterns in PARTIES_PATTERNS.items():
+            for pattern in patterns:
+                match = pattern.search(text)
+                if match and match.group(1):
+                    parties[partie] = match.group(1).strip()
+                    break
                 
         return parties
 
@@ -972,11 +877,13 @@ Votre extraction sera utilisée pour le traitement automatisé des écritures co
 
     def _process_excel(self, file_path):
         """
-        Process Excel files (XLSX, XLS) by extracting data and converting to structured text.
+        Process Excel files (XLSX, XLS) into a token-budgeted digest.
+        Each sheet is summarized deterministically (header row, column types, totals,
+        date ranges, counterparties, outliers, sample rows) instead of being dumped as text.
         """
         extraction_details = {
             "format": file_path.split('.')[-1].lower(),
-            "processing_method": "pandas",
+            "processing_method": "pandas_digest",
             "sheet_info": []
         }
         
@@ -987,8 +894,8 @@ Votre extraction sera utilisée pour le traitement automatisé des écritures co
             # Read Excel file
             excel_data = pd.read_excel(file_path, sheet_name=None)  # Read all sheets
             
-            # Process each sheet
-            all_text = []
+            # Summarize each sheet
+            summaries = []
             
             for sheet_name, df in excel_data.items():
                 sheet_start_time = time.time()
@@ -1004,54 +911,32 @@ Votre extraction sera utilisée pour le traitement automatisé des écritures co
                     "potential_document_type": "unknown"
                 }
                 
-                # Convert the sheet to a formatted text representation
-                header = f"--- SHEET: {sheet_name} ({rows} rows, {cols} columns) ---\n\n"
-                
                 # Handle empty dataframes
                 if df.empty:
-                    sheet_text = header + "[Empty Sheet]"
                     sheet_info["is_empty"] = True
                 else:
-                    # Replace NaN values with empty string for better text representation
-                    df_clean = df.fillna("")
-                    
-                    # Try to detect if this is a specific type of accounting document
-                    sheet_info["potential_document_type"] = self._detect_excel_document_type(df_clean)
-                    
-                    # Convert the DataFrame to a clean string representation
-                    try:
-                        # First try to use pandas built-in to_string
-                        sheet_content = df_clean.to_string(index=False)
-                    except Exception:
-                        # Fallback to a more manual approach if that fails
-                        cols = df_clean.columns.tolist()
-                        rows_text = [" | ".join(str(col) for col in cols)]
-                        rows_text.append("-" * len(rows_text[0]))
-                        
-                        for _, row in df_clean.iterrows():
-                            rows_text.append(" | ".join(str(val) for val in row.values))
-                        
-                        sheet_content = "\n".join(rows_text)
-                    
-                    sheet_text = header + sheet_content
-                
-                all_text.append(sheet_text)
+                    summary = self.tabular_summarizer.summarize_dataframe(df, str(sheet_name))
+                    summaries.append(summary)
+                    sheet_info["potential_document_type"] = summary.document_type
+                    sheet_info["summary"] = summary.to_dict()
                 
                 # Record processing time for this sheet
                 sheet_info["processing_time_seconds"] = time.time() - sheet_start_time
                 extraction_details["sheet_info"].append(sheet_info)
             
-            full_text = "\n\n".join(all_text)
+            full_text = self.tabular_summarizer.build_digest(summaries)
             
             # Add overall processing details
             extraction_details["processing_time_seconds"] = time.time() - start_time
             extraction_details["total_sheets"] = len(excel_data)
             extraction_details["characters_extracted"] = len(full_text)
+            extraction_details["digest_tokens"] = estimate_tokens(full_text)
             extraction_details["status"] = "success"
             
-            print(f"Successfully extracted {len(full_text)} characters from {len(excel_data)} sheets in {extraction_details['processing_time_seconds']:.2f} seconds")
+            print(f"Built a {extraction_details['digest_tokens']}-token digest from {len(excel_data)} sheets in {extraction_details['processing_time_seconds']:.2f} seconds")
             
-            # If it seems like a financial document, try to extract structured financial data
+            # If it seems like a financial document, keep the structured financial data
+            # alongside the digest (it is not sent to the LLM, the digest already covers it)
             financial_sheets = [s for s in extraction_details["sheet_info"] 
                               if s["potential_document_type"] != "unknown"]
             
@@ -1060,8 +945,6 @@ Votre extraction sera utilisée pour le traitement automatisé des écritures co
                 try:
                     financial_data = self._extract_financial_data_from_excel(excel_data)
                     extraction_details["financial_data_extracted"] = financial_data
-                    full_text += "\n\n--- EXTRACTED FINANCIAL DATA ---\n\n"
-                    full_text += json.dumps(financial_data, indent=2)
                 except Exception as e:
                     print(f"Error extracting financial data: {e}")
                     extraction_details["financial_data_error"] = str(e)
@@ -1081,31 +964,7 @@ Votre extraction sera utilisée pour le traitement automatisé des écritures co
         """
         Attempts to detect what type of accounting document an Excel sheet represents.
         """
-        # Convert column names to lowercase string for easier matching
-        cols = [str(col).lower() for col in df.columns]
-        
-        # Check for invoice-related keywords in columns
-        invoice_keywords = ['facture', 'invoice', 'client', 'customer', 'montant', 'amount', 'total', 'tva', 'tax']
-        if any(keyword in ' '.join(cols) for keyword in invoice_keywords):
-            return "invoice"
-            
-        # Check for bank statement keywords
-        bank_keywords = ['relevé', 'statement', 'compte', 'account', 'débit', 'crédit', 'solde', 'balance']
-        if any(keyword in ' '.join(cols) for keyword in bank_keywords):
-            return "bank_statement"
-            
-        # Check for general ledger or journal
-        ledger_keywords = ['journal', 'écriture', 'entry', 'comptable', 'ledger']
-        if any(keyword in ' '.join(cols) for keyword in ledger_keywords):
-            return "general_ledger"
-            
-        # If there are date and amount columns, it might be some kind of financial record
-        date_cols = [col for col in cols if 'date' in col]
-        amount_cols = [col for col in cols if any(term in col for term in ['montant', 'amount', 'total', 'sum'])]
-        if date_cols and amount_cols:
-            return "financial_record"
-        
-        return "unknown"
+        return classify_headers(df.columns)
 
     def _extract_financial_data_from_excel(self, excel_data):
         """
@@ -1260,11 +1119,11 @@ Votre extraction sera utilisée pour le traitement automatisé des écritures co
 
     def _process_csv(self, file_path):
         """
-        Process CSV files by extracting data and converting to structured text.
+        Process CSV files into a token-budgeted digest (see _process_excel).
         """
         extraction_details = {
             "format": "csv",
-            "processing_method": "pandas",
+            "processing_method": "pandas_digest",
             "delimiter": None
         }
         
@@ -1292,47 +1151,27 @@ Votre extraction sera utilisée pour le traitement automatisé des écritures co
                 extraction_details["processing_time_seconds"] = time.time() - start_time
                 return "[Empty CSV File]", extraction_details
             
-            # Try to detect if this is a specific type of accounting document
-            extraction_details["potential_document_type"] = self._detect_csv_document_type(df)
-            
-            # Replace NaN values with empty string for better text representation
-            df_clean = df.fillna("")
-            
-            # Convert DataFrame to text
-            try:
-                # First try to use pandas built-in to_string
-                csv_text = df_clean.to_string(index=False)
-            except Exception:
-                # Fallback to a more manual approach if that fails
-                cols = df_clean.columns.tolist()
-                rows_text = [" | ".join(str(col) for col in cols)]
-                rows_text.append("-" * len(rows_text[0]))
-                
-                for _, row in df_clean.iterrows():
-                    rows_text.append(" | ".join(str(val) for val in row.values))
-                
-                csv_text = "\n".join(rows_text)
-            
-            # Add header
-            header = f"--- CSV DATA ({rows} rows, {cols} columns) ---\n\n"
-            full_text = header + csv_text
+            # Summarize the table instead of dumping it (header row is re-detected)
+            summary = self.tabular_summarizer.summarize_dataframe(df, "CSV")
+            extraction_details["potential_document_type"] = summary.document_type
+            extraction_details["summary"] = summary.to_dict()
+            full_text = self.tabular_summarizer.build_digest([summary])
             
             # Add overall processing details
             extraction_details["processing_time_seconds"] = time.time() - start_time
             extraction_details["characters_extracted"] = len(full_text)
+            extraction_details["digest_tokens"] = estimate_tokens(full_text)
             extraction_details["status"] = "success"
             
-            print(f"Successfully extracted {len(full_text)} characters from CSV in {extraction_details['processing_time_seconds']:.2f} seconds")
+            print(f"Built a {extraction_details['digest_tokens']}-token digest from CSV in {extraction_details['processing_time_seconds']:.2f} seconds")
             
-            # If it seems like a financial document, try to extract structured financial data
+            # If it seems like a financial document, keep the structured financial data
             if extraction_details["potential_document_type"] != "unknown":
                 print(f"Detected potential {extraction_details['potential_document_type']}. Extracting financial data...")
                 try:
                     # Reuse the Excel financial data extraction method
                     financial_data = self._extract_financial_data_from_excel({"Sheet1": df})
                     extraction_details["financial_data_extracted"] = financial_data
-                    full_text += "\n\n--- EXTRACTED FINANCIAL DATA ---\n\n"
-                    full_text += json.dumps(financial_data, indent=2)
                 except Exception as e:
                     print(f"Error extracting financial data: {e}")
                     extraction_details["financial_data_error"] = str(e)
@@ -1666,12 +1505,13 @@ Veuillez extraire uniquement les informations clairement mentionnées dans le te
 """
 
             # Get response from LLM
-            response = self.client.chat.completions.create(
-                model="gpt-4o-2024-08-06",
+            response = model_router().complete(
+                self.client, "dde.prompt_extraction",
                 messages=[
                     {"role": "system", "content": "Vous êtes un expert-comptable utilisant le système SYSCOHADA."},
                     {"role": "user", "content": extraction_prompt}
                 ],
+                validate=json_object(),
                 temperature=0.1,
                 max_tokens=800
             )
@@ -1679,7 +1519,7 @@ Veuillez extraire uniquement les informations clairement mentionnées dans le te
             # Log token usage
             self.token_counter.log_operation(
                 agent_name="DDEAgent",
-                model="gpt-4o-2024-08-06",
+                model=response.model,
                 input_text=extraction_prompt,
                 output_text=response.choices[0].message.content,
                 operation_id=operation_id,
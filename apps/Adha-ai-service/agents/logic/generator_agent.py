@@ -1,5 +1,6 @@
 # agents/logic/generator_agent.py
 from agents.llm_connectors.openai_connector import OpenAIConnector  # Exemple
+from agents.utils.model_router import has_content
 from typing import List, Optional
 
 class GeneratorAgent:
@@ -8,9 +9,11 @@ class GeneratorAgent:
         # Utiliser OpenAIConnector avec gpt-4 par défaut
         self.llm_connector = llm_connector or OpenAIConnector(model_name="gpt-4")
 
-    def generate(self, query: str, context: List[str] = None, max_tokens: int = 200, temperature: float = 0.7) -> Optional[List[str]]:
+    def generate(self, query: str, context: List[str] = None, max_tokens: int = 200, temperature: float = 0.7,
+                 site: str = "generator", validate=has_content) -> Optional[List[str]]:
         """
         Génère une réponse (proposition d'écriture) en fonction de la requête et du contexte fourni.
+        Le modèle est choisi par le routeur selon ``site`` ; ``validate`` décide de l'escalade vers gpt-4o.
         """
         debug_info = {"step": "start", "query": query, "context": context}
         print(f"Generator Agent generating for query: {query} with context: {context}")
@@ -28,7 +31,8 @@ class GeneratorAgent:
 
         try:
             print(f"Prompt sent to LLM: {prompt}")
-            response = self.llm_connector.generate_text(prompt, max_tokens=max_tokens, temperature=temperature)
+            response = self.llm_connector.generate_text(prompt, max_tokens=max_tokens, temperature=temperature,
+                                                        site=site, validate=validate)
             debug_info["step"] = "completed"
             debug_info["response"] = response
             print(f"Raw response received from LLM: {response}")
@@ -6,7 +6,6 @@ from typing import Dict, Any, List, Optional
 import re
 
 import tiktoken
-from openai import OpenAI
 from django.db.models import Q
 from django.contrib.auth.models import User
 from django.conf import settings
@@ -14,8 +13,9 @@ from sentence_transformers import SentenceTransformer
 
 from api.models import JournalEntry, ChatConversation, ChatMessage
 from agents.vector_databases.chromadb_connector import ChromaDBConnector
-from agents.logic.retriever_agent import RetrieverAgent
+from agents.utils.agent_pool import agent_pool
 from agents.utils.llm_tool_system import LLMToolSystem
+from agents.utils.model_router import has_content, model_router
 
 class HistoryAgent:
     """
@@ -23,7 +23,7 @@ class HistoryAgent:
     Permet d'interroger l'historique comptable et de maintenir le contexte des conversations.
     """
     def __init__(self, user_id=None, company_id=None, institution_id=None, customer_type='sme'):
-        self.client = OpenAI()
+        self.client = agent_pool.get("openai_client")
         self.user_id = user_id
         self.company_id = company_id
         self.institution_id = institution_id
@@ -477,7 +477,8 @@ class HistoryAgent:
             
             # --- Ajout RAG documentaire ---
             try:
-                retriever_agent = RetrieverAgent()
+                # Retriever partagé : le modèle d'embedding n'est chargé qu'une fois par processus
+                retriever_agent = agent_pool.get("retriever")
                 rag_docs = retriever_agent.retrieve_adha_context(prompt, top_k=3)
                 if rag_docs:
                     rag_context = '\n\n'.join(rag_docs)
@@ -498,10 +499,13 @@ class HistoryAgent:
             debug_info["full_prompt"] = messages
             
             # Appeler le modèle de langage avec les outils de calcul
+            # (modèle économique pour les échanges courts, gpt-4o si la réponse est vide ou en erreur)
             try:
-                response = self.client.chat.completions.create(
-                    model="gpt-4o-2024-08-06",
+                router = model_router()
+                response = router.complete(
+                    self.client, "history.chat",
                     messages=messages,
+                    validate=has_content,
                     tools=self.tool_system.get_openai_function_definitions(),
                     tool_choice="auto",  # Le LLM décide quand utiliser les outils
                     temperature=0.7,
@@ -536,9 +540,10 @@ class HistoryAgent:
                         messages.append(tool_message)
                     
                     # Demander au LLM de formuler une réponse finale avec les résultats des calculs
-                    final_response = self.client.chat.completions.create(
-                        model="gpt-4o-2024-08-06",
+                    final_response = router.complete(
+                        self.client, "history.chat",
                         messages=messages,
+                        validate=has_content,
                         temperature=0.7,
                         max_tokens=1500
                     )
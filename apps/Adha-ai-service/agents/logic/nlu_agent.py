@@ -1,10 +1,11 @@
-from agents.logic.generator_agent import GeneratorAgent
+from agents.utils.agent_pool import agent_pool
+from agents.utils.model_router import json_object
 
 class NLUAgent:
     def __init__(self):
         # Initialisation du modèle NLU (par exemple, chargement d'un modèle pré-entraîné)
         print("NLU Agent initialized")
-        self.generator = GeneratorAgent()  # Utilisation du GeneratorAgent pour interagir avec le LLM
+        self.generator = agent_pool.get("generator")  # Utilisation du GeneratorAgent pour interagir avec le LLM
 
     def process(self, text):
         """
@@ -18,7 +19,8 @@ class NLUAgent:
         try:
             # Appel au LLM pour analyser le texte
             prompt = f"Analyse ce texte pour identifier l'intention et les entités : {text}"
-            response, llm_debug_info = self.generator.generate(prompt)
+            # Classification d'intention : modèle économique, gpt-4o si la réponse n'a pas d'intention
+            response, llm_debug_info = self.generator.generate(prompt, site="nlu.intent", validate=json_object("intent"))
             debug_info["llm_response"] = response
             debug_info["llm_debug_info"] = llm_debug_info
 
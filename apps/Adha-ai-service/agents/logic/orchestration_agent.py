@@ -2,8 +2,9 @@ import asyncio
 import time
 import traceback
 from typing import Dict, List, Any, Optional
-from concurrent.futures import ThreadPoolExecutor
 import uuid
+from agents.utils.agent_pool import agent_pool
+from agents.utils.pipeline_executor import CPU, LLM, get_pipeline_executor
 
 class OrchestrationAgent:
     """
@@ -14,7 +15,8 @@ class OrchestrationAgent:
         """Initialise l'agent d'orchestration."""
         print("OrchestrationAgent initialized")
         self.tasks = {}
-        self.executor = ThreadPoolExecutor(max_workers=4)
+        # Exécuteur partagé par tout le processus, limité par classe de ressource
+        self.executor = get_pipeline_executor()
         self.pipeline_stats = {
             "total_requests": 0,
             "successful_requests": 0,
@@ -22,6 +24,13 @@ class OrchestrationAgent:
             "avg_processing_time": 0
         }
 
+    def _run_in_executor(self, resource, func, *args):
+        """
+        Exécute ``func`` dans l'exécuteur partagé dès qu'un jeton de ``resource`` est
+        disponible, en conservant le contexte de l'appel (AgentContext).
+        """
+        return self.executor.run(resource, func, *args)
+
     async def process_document(self, file=None, prompt=None, intention=None, entities=None):
         """
         Coordonne le traitement d'un document ou d'un prompt texte.
@@ -35,10 +44,6 @@ class OrchestrationAgent:
         Returns:
             dict: Résultat du traitement incluant les écritures générées.
         """
-        from agents.logic.dde_agent import DDEAgent
-        from agents.logic.aa_agent import AAgent
-        from agents.logic.ccc_agent import CCCAgent
-        
         task_id = str(uuid.uuid4())
         start_time = time.time()
         
@@ -57,15 +62,11 @@ class OrchestrationAgent:
             self.tasks[task_id]["current_step"] = "data_extraction"
             
             # Exécution de l'extraction dans un thread pour les opérations I/O
-            dde_agent = DDEAgent()
+            dde_agent = agent_pool.get("dde")
             if file:
-                extracted_data = await asyncio.get_event_loop().run_in_executor(
-                    self.executor, lambda: dde_agent.process(file)
-                )
+                extracted_data = await self._run_in_executor(LLM, dde_agent.process, file)
             else:
-                extracted_data = await asyncio.get_event_loop().run_in_executor(
-                    self.executor, lambda: dde_agent.process_prompt(prompt)
-                )
+                extracted_data = await self._run_in_executor(LLM, dde_agent.process_prompt, prompt)
             
             if 'error' in extracted_data:
                 self.tasks[task_id]["status"] = "error"
@@ -77,18 +78,18 @@ class OrchestrationAgent:
             self.tasks[task_id]["progress"] = 40
             self.tasks[task_id]["current_step"] = "data_analysis"
             
-            aa_agent = AAgent()
-            analysis_result = await asyncio.get_event_loop().run_in_executor(
-                self.executor, lambda: aa_agent.process(intention, entities or {}, extracted_data)
+            aa_agent = agent_pool.get("aa")
+            analysis_result = await self._run_in_executor(
+                LLM, aa_agent.process, intention, entities or {}, extracted_data
             )
             
             # Phase 3: Vérification de la cohérence et conformité (CCCAgent)
             self.tasks[task_id]["progress"] = 70
             self.tasks[task_id]["current_step"] = "verification"
             
-            ccc_agent = CCCAgent()
-            verification_results = await asyncio.get_event_loop().run_in_executor(
-                self.executor, lambda: ccc_agent.verify(analysis_result.get("proposals", []))
+            ccc_agent = agent_pool.get("ccc")
+            verification_results = await self._run_in_executor(
+                CPU, ccc_agent.verify, analysis_result.get("proposals", [])
             )
             
             # Phase 4: Finalisation du résultat
@@ -136,6 +137,9 @@ class OrchestrationAgent:
     async def process_batch(self, documents, intention=None):
         """
         Traite un lot de documents en parallèle.
+
+        Tous les documents sont lancés mais leur exécution est bornée par les
+        limites de ressources de l'exécuteur partagé (voir get_pipeline_stats).
         
         Args:
             documents: Liste de documents à traiter.
@@ -176,9 +180,10 @@ class OrchestrationAgent:
         Récupère les statistiques du pipeline de traitement.
         
         Returns:
-            dict: Statistiques du pipeline.
+            dict: Statistiques du pipeline, dont la profondeur des files d'attente
+            et les temps d'attente par ressource.
         """
-        return self.pipeline_stats
+        return {**self.pipeline_stats, "executor": self.executor.stats()}
 
     def cancel_task(self, task_id):
         """
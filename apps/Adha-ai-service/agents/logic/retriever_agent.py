@@ -19,7 +19,8 @@ except ImportError:
 
 from typing import List
 import os
-from openai import OpenAI
+from agents.utils.agent_pool import agent_pool
+from agents.utils.resilience import resilient
 from langchain.vectorstores import Chroma
 from langchain.embeddings import SentenceTransformerEmbeddings
 
@@ -87,9 +88,9 @@ class RetrieverAgent:
             embedding_function=SentenceTransformerEmbeddings(model_name="all-mpnet-base-v2"),
             persist_directory=adha_embeddings_path
         )
-        self.adha_retriever = self.adha_vectorstore.as_retriever(search_kwargs={"k": 3})
+        self.adha_retriever = resilient(self.adha_vectorstore.as_retriever(search_kwargs={"k": 3}), "chroma")
 
-        self.client = OpenAI()  # Pour les requêtes au LLM
+        self.client = agent_pool.get("openai_client")  # Pour les requêtes au LLM (client partagé, limité)
 
     def retrieve_adha_context(self, query: str, top_k: int = 3) -> List[str]:
         """Récupère les documents contextuels pertinents via LangChain/Chroma."""
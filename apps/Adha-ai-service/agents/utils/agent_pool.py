@@ -0,0 +1,233 @@
+"""
+Process-wide pool of the document pipeline agents (DDE, AA, CCC) and of the
+heavy objects they depend on (OpenAI client, retriever with its embedding
+model, generator).
+
+Agents used to be built for every document, which reloaded the sentence
+transformer, re-read config/config.yaml and created new HTTP clients each time.
+They are now stateless with respect to a request: anything that belongs to one
+call (token counter, company, user...) travels in an ``AgentContext`` that the
+agents read through ``current_context()``.
+
+Usage::
+
+    from agents.utils.agent_pool import agent_pool, agent_context
+
+    with agent_context(token_counter=token_counter, company_id=company_id):
+        data = agent_pool.get("dde").process(file_path)
+
+Work handed to an executor must be wrapped with ``context.run`` (or
+``contextvars.copy_context().run``) because ``run_in_executor`` does not copy
+context variables to the worker thread.
+"""
+import contextvars
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "../../config/config.yaml")
+
+
+@dataclass(frozen=True)
+class AgentContext:
+    """Per-call state that used to live on the agent instances."""
+    token_counter: Any = None
+    request_id: Optional[str] = None
+    company_id: Optional[str] = None
+    institution_id: Optional[str] = None
+    user_id: Optional[str] = None
+    # LLM priority class of the call ("chat", "default", "batch"), see rate_limiter
+    priority: Optional[str] = None
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    def run(self, func: Callable, *args, **kwargs):
+        """Runs ``func`` with this context active (used for executor threads)."""
+        token = _current.set(self)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+
+
+_EMPTY_CONTEXT = AgentContext()
+_current: contextvars.ContextVar = contextvars.ContextVar("agent_context", default=_EMPTY_CONTEXT)
+
+
+def current_context() -> AgentContext:
+    """Returns the context of the call in progress (an empty context outside of any call)."""
+    return _current.get()
+
+
+@contextmanager
+def agent_context(**values):
+    """
+    Activates an ``AgentContext`` for the duration of the block. Values not given
+    are inherited from the enclosing context.
+    """
+    context = replace(current_context(), **values)
+    token = _current.set(context)
+    try:
+        yield context
+    finally:
+        _current.reset(token)
+
+
+@lru_cache(maxsize=None)
+def load_config(path: str = CONFIG_PATH) -> Dict[str, Any]:
+    """Reads config/config.yaml once per process."""
+    import yaml
+    with open(path, "r") as config_file:
+        return yaml.safe_load(config_file) or {}
+
+
+class ContextTokenCounterMixin:
+    """
+    Gives a pooled agent a ``token_counter`` that follows the current call: the
+    counter of the active ``AgentContext`` when there is one, otherwise a counter
+    owned by the agent for the current thread (created on first use).
+
+    TokenCounter is not thread-safe: the fallback counter is per thread, so the
+    Kafka lanes and batch workers that call agents without a counter of their own
+    never share one between concurrent calls.
+    """
+    _token_limit = None
+
+    def _thread_counters(self) -> threading.local:
+        # dict.setdefault is atomic: every thread gets the same threading.local
+        return self.__dict__.setdefault("_token_counters", threading.local())
+
+    @property
+    def token_counter(self):
+        counter = current_context().token_counter
+        if counter is not None:
+            return counter
+        counters = self._thread_counters()
+        if getattr(counters, "default", None) is None:
+            from agents.utils.token_manager import get_token_counter
+            counters.default = get_token_counter(self._token_limit)
+        return counters.default
+
+    @token_counter.setter
+    def token_counter(self, counter):
+        self._thread_counters().default = counter
+
+
+class AgentPool:
+    """
+    Lazily built, thread-safe process singletons.
+
+    Each entry is created by its factory on first use and then shared by every
+    request of the process. ``reset`` drops entries (tests, or after a fork when
+    a client must not be shared with the parent).
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._registry_lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        with self._registry_lock:
+            self._factories[name] = factory
+            self._locks.setdefault(name, threading.Lock())
+            self._instances.pop(name, None)
+
+    def get(self, name: str):
+        self._check_fork()
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        try:
+            lock = self._locks[name]
+        except KeyError:
+            raise KeyError(f"Unknown pooled agent '{name}'") from None
+        with lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                logger.info("Building pooled agent '%s'", name)
+                instance = self._factories[name]()
+                self._instances[name] = instance
+        return instance
+
+    def is_built(self, name: str) -> bool:
+        return name in self._instances
+
+    def warm_up(self, *names: str):
+        """Builds the given entries (all of them by default), e.g. at worker start."""
+        for name in names or tuple(self._factories):
+            self.get(name)
+
+    def reset(self, *names: str):
+        with self._registry_lock:
+            for name in names or tuple(self._instances):
+                self._instances.pop(name, None)
+
+    def _check_fork(self):
+        # HTTP clients and model handles must not be shared with a parent process
+        pid = os.getpid()
+        if pid != self._pid:
+            with self._registry_lock:
+                if pid != self._pid:
+                    self._instances.clear()
+                    self._pid = pid
+
+
+def _build_openai_client():
+    # Fair turn of the tenant, then budget shared by all processes, then breaker and bulkhead
+    from openai import OpenAI
+    from agents.utils.fair_scheduler import fair_scheduled
+    from agents.utils.rate_limiter import rate_limited
+    from agents.utils.resilience import resilient
+    return fair_scheduled(rate_limited(resilient(OpenAI(), "openai")))
+
+
+def _build_config_openai_client():
+    # The DDE agent authenticates with the key of config/config.yaml
+    from openai import OpenAI
+    from agents.utils.fair_scheduler import fair_scheduled
+    from agents.utils.rate_limiter import rate_limited
+    from agents.utils.resilience import resilient
+    return fair_scheduled(rate_limited(resilient(OpenAI(api_key=load_config().get("OPENAI_API_KEY")), "openai")))
+
+
+def _build_retriever():
+    from agents.logic.retriever_agent import RetrieverAgent
+    return RetrieverAgent()
+
+
+def _build_generator():
+    from agents.logic.generator_agent import GeneratorAgent
+    return GeneratorAgent()
+
+
+def _build_dde():
+    from agents.logic.dde_agent import DDEAgent
+    return DDEAgent()
+
+
+def _build_aa():
+    from agents.logic.aa_agent import AAgent
+    return AAgent()
+
+
+def _build_ccc():
+    from agents.logic.ccc_agent import CCCAgent
+    return CCCAgent()
+
+
+agent_pool = AgentPool()
+agent_pool.register("openai_client", _build_openai_client)
+agent_pool.register("config_openai_client", _build_config_openai_client)
+agent_pool.register("retriever", _build_retriever)
+agent_pool.register("generator", _build_generator)
+agent_pool.register("dde", _build_dde)
+agent_pool.register("aa", _build_aa)
+agent_pool.register("ccc", _build_ccc)
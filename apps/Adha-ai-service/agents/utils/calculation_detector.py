@@ -8,6 +8,52 @@ import math
 from decimal import Decimal, getcontext
 from typing import Dict, List, Any, Optional, Tuple
 from agents.utils.calculation_helper import CalculationHelper
+from agents.utils.extraction_patterns import compile_any
+
+
+# Patterns pour détecter les calculs, fusionnés en une seule alternance compilée à l'import :
+# une seule passe sur le prompt au lieu d'une recherche par pattern.
+CALCULATION_PATTERN = compile_any([
+    # Opérations arithmétiques directes
+    r'\d{1,15}(?:\.\d{1,15})?[ \t]{0,5}[\+\-\*\/][ \t]{0,5}\d',
+    
+    # Mots-clés de calcul en français
+    r'\b(?:calcul|calculer|additionner|addition|soustraire|soustraction)\b',
+    r'\b(?:multiplier|multiplication|diviser|division|total|somme)\b',
+    r'\b(?:différence|produit|quotient|résultat|moyenne)\b',
+    
+    # Termes comptables spécifiques
+    r'\b(?:TVA|HT|TTC|taux|pourcentage|%)\b',
+    r'\b(?:débit|crédit|solde|balance|équilibre)\b',
+    r'\b(?:amortissement|provision|charge|produit)\b',
+    
+    # Formulations de questions de calcul (bornées à 200 caractères sur la même ligne)
+    r'(?:combien|quel\s+est|quelle\s+est).{0,200}?(?:total|somme|montant)',
+    r'(?:résultat|montant|total).{0,200}?[\+\-\*\/]',
+    
+    # Calculs de TVA spécifiques
+    r'\d{1,15}(?:\.\d{1,15})?[ \t]{0,5}%[ \t]{0,5}(?:de|sur)[ \t]{0,5}\d',
+    r'(?:HT|TTC)[ \t]{0,5}(?:de|à|=)[ \t]{0,5}\d',
+], re.IGNORECASE)
+
+# Extraction des nombres : montants en euros, puis pourcentages, puis nombres simples.
+# Un seul finditer ; chaque nombre n'est compté qu'une fois, dans sa catégorie.
+NUMBER_PATTERN = re.compile(
+    r'(?P<currency>\d{1,15}(?:\.\d{1,15})?)[ \t]{0,5}(?:euros?|€|EUR)'
+    r'|(?P<percent>\d{1,15}(?:\.\d{1,15})?)[ \t]{0,5}(?:%|pour\s+cent|pourcent)'
+    r'|(?P<number>\d{1,15}(?:[\.,]\d{1,15})?)'
+)
+NUMBER_KINDS = ('currency', 'percent', 'number')
+
+TYPE_TVA_PATTERN = re.compile(r'\btva\b|ht|ttc')
+TYPE_ACCOUNTING_PATTERN = re.compile(r'débit|crédit|balance|solde')
+TYPE_PERCENTAGE_PATTERN = re.compile(r'%|pourcentage|taux')
+OPERATOR_PATTERN = re.compile(r'[\+\-\*\/]')
+TVA_RATE_PATTERN = re.compile(r'(\d{1,15}(?:\.\d{1,15})?)[ \t]{0,5}%')
+HT_PATTERN = re.compile(r'\bht\b|hors.{0,5}taxe', re.IGNORECASE)
+ARITHMETIC_PATTERN = re.compile(r'(\d{1,15}(?:\.\d{1,15})?)[ \t]{0,5}([\+\-\*\/])[ \t]{0,5}(\d{1,15}(?:\.\d{1,15})?)')
+PERCENT_OF_PATTERN = re.compile(r'(\d{1,15}(?:\.\d{1,15})?)[ \t]{0,5}%[ \t]{0,5}(?:de|sur)[ \t]{0,5}(\d{1,15}(?:\.\d{1,15})?)')
+
 
 class CalculationDetector:
     """
@@ -18,36 +64,9 @@ class CalculationDetector:
     def __init__(self):
         self.calc_helper = CalculationHelper(precision=2)
         
-        # Patterns pour détecter les calculs
-        self.calculation_patterns = [
-            # Opérations arithmétiques directes
-            r'\d+(?:\.\d+)?\s*[\+\-\*\/]\s*\d+(?:\.\d+)?',
-            
-            # Mots-clés de calcul en français
-            r'\b(?:calcul|calculer|additionner|addition|soustraire|soustraction)\b',
-            r'\b(?:multiplier|multiplication|diviser|division|total|somme)\b',
-            r'\b(?:différence|produit|quotient|résultat|moyenne)\b',
-            
-            # Termes comptables spécifiques
-            r'\b(?:TVA|HT|TTC|taux|pourcentage|%)\b',
-            r'\b(?:débit|crédit|solde|balance|équilibre)\b',
-            r'\b(?:amortissement|provision|charge|produit)\b',
-            
-            # Formulations de questions de calcul
-            r'(?:combien|quel\s+est|quelle\s+est).*(?:total|somme|montant)',
-            r'(?:quel\s+est\s+le\s+)?(?:résultat|montant|total).*[\+\-\*\/]',
-            
-            # Calculs de TVA spécifiques
-            r'(?:TVA\s+de\s+)?(\d+(?:\.\d+)?)\s*%\s*(?:de|sur)\s*(\d+(?:\.\d+)?)',
-            r'(?:prix\s+)?(?:HT|TTC)\s*(?:de|à|=)\s*(\d+(?:\.\d+)?)',
-        ]
-        
-        # Patterns pour extraire les nombres et opérations
-        self.number_patterns = [
-            r'(\d+(?:\.\d+)?)\s*(?:euros?|€|EUR)',
-            r'(\d+(?:\.\d+)?)\s*(?:%|pour\s+cent|pourcent)',
-            r'(\d+(?:[\.,]\d+)?)',  # Nombres avec virgule ou point
-        ]
+        # Patterns précompilés au niveau du module (voir CALCULATION_PATTERN / NUMBER_PATTERN)
+        self.calculation_pattern = CALCULATION_PATTERN
+        self.number_pattern = NUMBER_PATTERN
         
         # Opérations TVA courantes
         self.tva_rates = {
@@ -67,14 +86,7 @@ class CalculationDetector:
         Returns:
             bool: True si un calcul est détecté, False sinon
         """
-        prompt_lower = prompt.lower()
-        
-        # Vérifier chaque pattern de calcul
-        for pattern in self.calculation_patterns:
-            if re.search(pattern, prompt_lower, re.IGNORECASE):
-                return True
-        
-        return False
+        return self.calculation_pattern.search(prompt) is not None
     
     def extract_and_calculate(self, prompt: str) -> Dict[str, Any]:
         """
@@ -113,13 +125,13 @@ class CalculationDetector:
         """Identifie le type de calcul demandé."""
         prompt_lower = prompt.lower()
         
-        if re.search(r'\btva\b|ht|ttc', prompt_lower):
+        if TYPE_TVA_PATTERN.search(prompt_lower):
             return 'tva'
-        elif re.search(r'débit|crédit|balance|solde', prompt_lower):
+        elif TYPE_ACCOUNTING_PATTERN.search(prompt_lower):
             return 'accounting'
-        elif re.search(r'%|pourcentage|taux', prompt_lower):
+        elif TYPE_PERCENTAGE_PATTERN.search(prompt_lower):
             return 'percentage'
-        elif re.search(r'[\+\-\*\/]', prompt):
+        elif OPERATOR_PATTERN.search(prompt):
             return 'arithmetic'
         else:
             return 'generic'
@@ -131,7 +143,7 @@ class CalculationDetector:
             
             # Extraire le taux de TVA
             tva_rate = Decimal('20')  # Taux par défaut
-            tva_match = re.search(r'(\d+(?:\.\d+)?)\s*%', prompt)
+            tva_match = TVA_RATE_PATTERN.search(prompt)
             if tva_match:
                 tva_rate = Decimal(tva_match.group(1))
             
@@ -139,7 +151,7 @@ class CalculationDetector:
                 base_amount = numbers[0]
                 
                 # Déterminer si c'est HT ou TTC
-                if re.search(r'\bht\b|hors.{0,5}taxe', prompt, re.IGNORECASE):
+                if HT_PATTERN.search(prompt):
                     # Montant HT donné, calculer TTC et TVA
                     ht = base_amount
                     tva_amount = self.calc_helper.multiply(ht, tva_rate / 100)
@@ -175,7 +187,7 @@ class CalculationDetector:
         """Effectue des calculs arithmétiques simples."""
         try:
             # Extraire l'expression arithmétique
-            expr_match = re.search(r'(\d+(?:\.\d+)?)\s*([\+\-\*\/])\s*(\d+(?:\.\d+)?)', prompt)
+            expr_match = ARITHMETIC_PATTERN.search(prompt)
             
             if expr_match:
                 num1 = Decimal(expr_match.group(1))
@@ -244,7 +256,7 @@ class CalculationDetector:
         """Calcule les pourcentages."""
         try:
             # Pattern pour "X% de Y"
-            percent_match = re.search(r'(\d+(?:\.\d+)?)\s*%\s*(?:de|sur)\s*(\d+(?:\.\d+)?)', prompt)
+            percent_match = PERCENT_OF_PATTERN.search(prompt)
             
             if percent_match:
                 percentage = Decimal(percent_match.group(1))
@@ -303,18 +315,20 @@ class CalculationDetector:
             return {'type': 'generic', 'success': False, 'error': str(e)}
     
     def _extract_numbers(self, text: str) -> List[Decimal]:
-        """Extrait tous les nombres du texte."""
-        numbers = []
+        """
+        Extrait tous les nombres du texte.
+        
+        Les montants en euros viennent en premier, puis les pourcentages, puis les
+        autres nombres ; chaque occurrence n'est comptée qu'une seule fois.
+        """
+        buckets = {kind: [] for kind in NUMBER_KINDS}
         
-        # Chercher tous les nombres dans le texte
-        for pattern in self.number_patterns:
-            matches = re.findall(pattern, text)
-            for match in matches:
-                try:
-                    # Normaliser le nombre (remplacer virgule par point)
-                    normalized = match.replace(',', '.')
-                    numbers.append(Decimal(normalized))
-                except:
-                    continue
+        for match in self.number_pattern.finditer(text):
+            kind = match.lastgroup
+            try:
+                # Normaliser le nombre (remplacer virgule par point)
+                buckets[kind].append(Decimal(match.group(kind).replace(',', '.')))
+            except Exception:
+                continue
         
-        return numbers
+        return [number for kind in NUMBER_KINDS for number in buckets[kind]]
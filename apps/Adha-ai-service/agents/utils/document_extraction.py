@@ -2,13 +2,15 @@
 Utility for extracting structured data from accounting documents with precise field extraction.
 """
 import re
-import numpy as np
-import pandas as pd
-from decimal import Decimal, ROUND_HALF_UP
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 from datetime import datetime
 from dataclasses import dataclass, field
 from typing import List, Dict, Any, Optional, Tuple
 import logging
+from agents.utils.extraction_patterns import (
+    NUMBER, SIGNED_NUMBER, compile_any, first_group, iter_lines, parse_item_line, parse_price_line,
+    to_decimal,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +21,151 @@ except ImportError:
     logger.warning("OpenCV (cv2) not installed. Some document image processing features will be unavailable.")
     cv2 = None
 
+
+def _compile_all(patterns, flags=re.IGNORECASE):
+    return tuple(re.compile(p, flags) for p in patterns)
+
+
+# All extraction patterns are compiled once at import. Ordered tuples keep their
+# first-match-wins priority; keyword checks are merged into single alternations.
+_DOCUMENT_TYPE_PATTERN = re.compile(
+    r'(?P<invoice>facture|invoice)|(?P<receipt>reçu|receipt|ticket de caisse)'
+    r'|(?P<bank_statement>relevé|statement|bancaire|bank|compte)',
+    re.IGNORECASE,
+)
+
+_REFERENCE_PATTERNS = _compile_all([
+    r'facture\s+(?:no|n[°o])?\s*[:#]?\s*([A-Z0-9][-A-Z0-9/]{0,40})',
+    r'(?:référence|ref)[\s:]{0,10}([A-Z0-9][-A-Z0-9/]{0,40})',
+    r'(?:invoice|document)\s+(?:no|number)[:\s]{0,10}([A-Z0-9][-A-Z0-9/]{0,40})',
+    r'(?:no|n°)[:\s]{0,10}([A-Z0-9][-A-Z0-9/]{0,40})',
+])
+
+_DATE_NUMERIC = r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})'
+_DATE_TEXTUAL = r'(\d{1,2}[ \t]{1,5}[a-zA-Zéû]{3,12}[ \t]{1,5}\d{2,4})'
+
+_DATE_PATTERNS = _compile_all([
+    r'(?:date|émis\s+le|émission)[\s:]{0,10}' + _DATE_NUMERIC,
+    r'(?:date|émis\s+le|émission)[\s:]{0,10}' + _DATE_TEXTUAL,
+])
+
+_DUE_DATE_PATTERNS = _compile_all([
+    r'(?:échéance|due date|date limite|à payer avant le)[\s:]{0,10}' + _DATE_NUMERIC,
+    r'(?:échéance|due date|date limite|à payer avant le)[\s:]{0,10}' + _DATE_TEXTUAL,
+])
+
+_NUMERIC_DATE = re.compile(r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}')
+_DATE_SEPARATOR = re.compile(r'[/-]')
+
+# Party names stop at a digit, end of line or contact details; capped at 120 characters
+_PARTY_NAME = r'([A-Z][^\n\r:]{0,120}?)'
+
+_SUPPLIER_PATTERNS = _compile_all([
+    r'(?:fournisseur|vendeur|émetteur|from)[\s:]{0,10}' + _PARTY_NAME + r'(?=\d|\n|tél|\r|tel|fax|email|e-mail)',
+    r'(?:supplier|seller|from)[\s:]{0,10}' + _PARTY_NAME + r'(?=\d|\n|tel|\r|téléphone|fax|email|e-mail)',
+])
+
+_SUPPLIER_ID_PATTERNS = _compile_all([
+    r'(?:RCCM|RC|REGISTRE DE COMMERCE|REGISTRE DU COMMERCE)[\s:]{0,10}([A-Z0-9][-A-Z0-9/]{0,40})',
+    r'(?:NINEA|SIRET|SIREN|ID TVA|VAT)[\s:]{0,10}([A-Z0-9][-A-Z0-9/]{0,40})',
+    r'(?:tax id|id fiscal)[\s:]{0,10}([A-Z0-9][-A-Z0-9/]{0,40})',
+])
+
+_CLIENT_PATTERNS = _compile_all([
+    r'(?:client|acheteur|destinataire|adressé à|customer|bill to)[\s:]{0,10}' + _PARTY_NAME + r'(?=\d|\n|tél|\r|tel|fax|email|e-mail)',
+    r'(?:livré à|ship to|deliver to)[\s:]{0,10}' + _PARTY_NAME + r'(?=\d|\n|tel|\r|téléphone|fax|email|e-mail)',
+])
+
+_CLIENT_ID_PATTERNS = _compile_all([
+    r'(?:client)[\s:]{0,10}(?:no|n[°o])?[\s:]{0,10}([A-Z0-9][-A-Z0-9/]{0,40})',
+    r'(?:customer)[\s:]{0,10}(?:no|number)?[\s:]{0,10}([A-Z0-9][-A-Z0-9/]{0,40})',
+])
+
+_CURRENCY_PATTERNS = _compile_all([
+    r'(?:currency|devise|monnaie)[\s:]{0,10}([A-Z]{3}|[€$£])',
+    r'(?:montant|amount)[\s:]{0,10}[\d ,.]{1,30}?[ \t]{0,5}([A-Z]{3}|[€$£])',
+    NUMBER + r'[ \t]{0,5}(FCFA|EUR|USD)',
+])
+_FCFA_AMOUNT = re.compile(r'\d[ \t]{0,5}FCFA', re.IGNORECASE)
+_EUR_AMOUNT = re.compile(r'€[ \t]{0,5}\d|\d[ \t]{0,5}€')
+_USD_AMOUNT = re.compile(r'\$[ \t]{0,5}\d|\d[ \t]{0,5}\$')
+
+_SUBTOTAL_PATTERNS = _compile_all([
+    r'(?:sous[\s-]?total|total\s+h\.?t\.?|montant\s+h\.?t\.?|total\s+hors\s+taxe)[\s:]{0,10}(' + NUMBER + ')',
+    r'(?:sub[\s-]?total|amount\s+before\s+tax)[\s:]{0,10}(' + NUMBER + ')',
+])
+
+_TAX_TOTAL_PATTERNS = _compile_all([
+    r'(?:total\s+tva|montant\s+tva|tva)[\s:]{0,10}(' + NUMBER + ')',
+    r'(?:total\s+tax|vat\s+amount|vat)[\s:]{0,10}(' + NUMBER + ')',
+])
+
+_TOTAL_PATTERNS = _compile_all([
+    r'(?:total\s+ttc|montant\s+ttc|montant\s+total|total\s+général|total\s+à\s+payer)[\s:]{0,10}(' + NUMBER + ')',
+    r'(?:total\s+amount|grand\s+total|amount\s+due|total\s+due)[\s:]{0,10}(' + NUMBER + ')',
+    r'(?:total)[\s:]{0,10}(' + NUMBER + ')',
+])
+
+_PAYMENT_METHODS = [
+    'virement', 'chèque', 'espèces', 'carte bancaire', 'carte de crédit',
+    'transfer', 'check', 'cash', 'credit card', 'bank card', 'mobile money'
+]
+_PAYMENT_METHOD_PATTERNS = _compile_all([
+    r'(?:mode\s+de\s+(?:paiement|règlement)|payment\s+method)[\s:]{0,10}([^\n\r]*)',
+    r'(?:payé\s+par|règlement\s+par|paid\s+by|payment\s+by)[\s:]{0,10}([^\n\r]*)',
+])
+_PAYMENT_KEYWORD_PATTERN = re.compile(
+    r'\b(' + '|'.join(re.escape(m) for m in _PAYMENT_METHODS) + r')\b', re.IGNORECASE
+)
+
+_IBAN_PATTERN = re.compile(r'(?:iban)[\s:]{0,10}([A-Z0-9 ]{1,42})', re.IGNORECASE)
+_BIC_PATTERN = re.compile(r'(?:bic|swift)[\s:]{0,10}([A-Z0-9 ]{1,20})', re.IGNORECASE)
+_ACCOUNT_PATTERN = re.compile(r'(?:compte|account|n°\s+compte)[\s:]{0,10}(\d{1,40})', re.IGNORECASE)
+_CHECK_PATTERN = re.compile(r'(?:chèque|cheque|check)[\s:]{0,10}(?:n°|num|number)?[\s:]{0,10}(\d{1,20})', re.IGNORECASE)
+
+_STATEMENT_REFERENCE_PATTERNS = _compile_all([
+    r'(?:relevé|statement|extrait)[\s:]{0,10}(?:n°|no|num|number)?[\s:]{0,10}([A-Z0-9][-A-Z0-9/]{0,40})',
+    r'(?:réf|ref|reference)[\s:]{0,10}([A-Z0-9][-A-Z0-9/]{0,40})',
+])
+
+_STATEMENT_PERIOD_PATTERNS = _compile_all([
+    r'(?:période|period|du)[\s:]{0,10}([\d/]{1,10})[\s-]{0,5}(?:au|to)[\s:]{0,10}([\d/]{1,10})',
+    r'(?:relevé|statement)[\s:]{0,10}(?:du|from)[\s:]{0,10}([\d/]{1,10})[\s-]{0,5}(?:au|to)[\s:]{0,10}([\d/]{1,10})',
+])
+
+_ACCOUNT_HOLDER_PATTERNS = _compile_all([
+    r'(?:titulaire|account holder|compte de)[\s:]{0,10}([^\n\r]*)',
+    r'(?:client|customer)[\s:]{0,10}([^\n\r]*)',
+])
+
+_ACCOUNT_NUMBER_PATTERNS = _compile_all([
+    r'(?:compte n°|account number|n° de compte|numéro de compte)[\s:]{0,10}([A-Z0-9 ]{1,42})',
+    r'(?:iban)[\s:]{0,10}([A-Z0-9 ]{1,42})',
+])
+
+# Date, then a description of at most 200 characters, then the (signed) amount
+_TRANSACTION_PATTERN = re.compile(
+    r'(\d{1,2}[/-]\d{1,2}(?:[/-]\d{2,4})?)[ \t]{0,10}([^\n\r\d]{0,200}?)(' + SIGNED_NUMBER + ')'
+)
+
+_OPENING_BALANCE_PATTERNS = _compile_all([
+    r'(?:solde\s+(?:initial|précédent|ancien)|balance\s+brought\s+forward|opening\s+balance)[\s:]{0,10}(' + SIGNED_NUMBER + ')',
+    r'(?:solde\s+au|balance\s+at)[\s:]{0,10}\d{1,2}[/-]\d{1,2}[/-]\d{2,4}[\s:]{0,10}(' + SIGNED_NUMBER + ')',
+])
+
+_CLOSING_BALANCE_PATTERNS = _compile_all([
+    r'(?:solde\s+(?:final|nouveau|actuel)|balance\s+carried\s+forward|closing\s+balance)[\s:]{0,10}(' + SIGNED_NUMBER + ')',
+    r'(?:nouveau\s+solde|new\s+balance)[\s:]{0,10}(' + SIGNED_NUMBER + ')',
+])
+
+# Amounts next to a currency; a single alternation so the text is scanned once
+_CURRENCY_AMOUNT_PATTERN = compile_any([
+    r'(' + NUMBER + r')[ \t]{0,5}(?:FCFA|EUR|USD|€|\$)',
+    r'(?:€|\$)[ \t]{0,5}(' + NUMBER + ')',
+    r'(' + NUMBER + r')[ \t]{0,5}(?:F|XOF|XAF)',
+], re.IGNORECASE)
+_DECIMAL_AMOUNT_PATTERN = re.compile(r'(?<!\d)(\d{1,15}[,.]\d{2})(?!\d)')
+
 @dataclass
 class DocumentItem:
     """A class representing a line item in an invoice or document."""
@@ -132,20 +279,16 @@ class DocumentExtractor:
         return document_data
     
     def _detect_document_type(self, text: str) -> str:
-        """Detect the type of document based on keywords."""
-        text_lower = text.lower()
-        
-        # Check for invoice indicators
-        if re.search(r'facture|invoice', text_lower):
-            return "invoice"
-        
-        # Check for receipt indicators
-        if re.search(r'reçu|receipt|ticket de caisse', text_lower):
-            return "receipt"
-        
-        # Check for bank statement indicators
-        if re.search(r'relevé|statement|bancaire|bank|compte', text_lower):
-            return "bank_statement"
+        """Detect the type of document based on keywords (invoice > receipt > bank statement)."""
+        found = set()
+        for match in _DOCUMENT_TYPE_PATTERN.finditer(text):
+            found.add(match.lastgroup)
+            if match.lastgroup == "invoice":
+                break
+        
+        for document_type in ("invoice", "receipt", "bank_statement"):
+            if document_type in found:
+                return document_type
             
         return "unknown"
     
@@ -235,36 +378,19 @@ class DocumentExtractor:
     
     def _extract_reference(self, text: str) -> str:
         """Extract document reference number."""
-        patterns = [
-            r'facture\s+(?:no|n[°o])?\s*[:#]?\s*([A-Z0-9][-A-Z0-9/]*)',
-            r'(?:référence|ref)[\s:]*([A-Z0-9][-A-Z0-9/]*)',
-            r'(?:invoice|document)\s+(?:no|number)[:\s]*([A-Z0-9][-A-Z0-9/]*)',
-            r'(?:no|n°)[:\s]*([A-Z0-9][-A-Z0-9/]*)',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return match.group(1).strip()
-                
-        return ""
+        return first_group(_REFERENCE_PATTERNS, text)
     
     def _extract_date(self, text: str) -> str:
         """Extract document date."""
-        patterns = [
-            r'(?:date|émis\s+le|émission)[\s:]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-            r'(?:date|émis\s+le|émission)[\s:]*(\d{1,2}\s+[a-zA-Zéû]+\s+\d{2,4})'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in _DATE_PATTERNS:
+            match = pattern.search(text)
             if match:
                 date_str = match.group(1).strip()
                 # Try to standardize date format to DD/MM/YYYY
                 try:
                     # Handle various formats
-                    if re.match(r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}', date_str):
-                        parts = re.split(r'[/-]', date_str)
+                    if _NUMERIC_DATE.match(date_str):
+                        parts = _DATE_SEPARATOR.split(date_str)
                         if len(parts[2]) == 2:
                             parts[2] = '20' + parts[2]
                         return f"{parts[0].zfill(2)}/{parts[1].zfill(2)}/{parts[2]}"
@@ -288,283 +414,152 @@ class DocumentExtractor:
     
     def _extract_due_date(self, text: str) -> str:
         """Extract payment due date."""
-        patterns = [
-            r'(?:échéance|due date|date limite|à payer avant le)[\s:]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-            r'(?:échéance|due date|date limite|à payer avant le)[\s:]*(\d{1,2}\s+[a-zA-Zéû]+\s+\d{2,4})'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return match.group(1).strip()
-                
-        return ""
+        return first_group(_DUE_DATE_PATTERNS, text)
     
     def _extract_supplier(self, text: str) -> str:
         """Extract supplier name."""
-        patterns = [
-            r'(?:fournisseur|vendeur|émetteur|from)[\s:]*([A-Z][^\n\r:]*?)(?=\d|\n|tél|\r|tel|fax|email|e-mail)',
-            r'(?:supplier|seller|from)[\s:]*([A-Z][^\n\r:]*?)(?=\d|\n|tel|\r|téléphone|fax|email|e-mail)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return match.group(1).strip()
-                
-        return ""
+        return first_group(_SUPPLIER_PATTERNS, text)
     
     def _extract_supplier_id(self, text: str) -> str:
         """Extract supplier identification (tax ID, registration number)."""
-        patterns = [
-            r'(?:RCCM|RC|REGISTRE DE COMMERCE|REGISTRE DU COMMERCE)[\s:]*([A-Z0-9][-A-Z0-9/]*)',
-            r'(?:NINEA|SIRET|SIREN|ID TVA|VAT)[\s:]*([A-Z0-9][-A-Z0-9/]*)',
-            r'(?:tax id|id fiscal)[\s:]*([A-Z0-9][-A-Z0-9/]*)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return match.group(1).strip()
-                
-        return ""
+        return first_group(_SUPPLIER_ID_PATTERNS, text)
     
     def _extract_client(self, text: str) -> str:
         """Extract client name."""
-        patterns = [
-            r'(?:client|acheteur|destinataire|adressé à|customer|bill to)[\s:]*([A-Z][^\n\r:]*?)(?=\d|\n|tél|\r|tel|fax|email|e-mail)',
-            r'(?:livré à|ship to|deliver to)[\s:]*([A-Z][^\n\r:]*?)(?=\d|\n|tel|\r|téléphone|fax|email|e-mail)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return match.group(1).strip()
-                
-        return ""
+        return first_group(_CLIENT_PATTERNS, text)
     
     def _extract_client_id(self, text: str) -> str:
         """Extract client identification."""
-        patterns = [
-            r'(?:client)[\s:]*(?:no|n[°o])?[\s:]*([A-Z0-9][-A-Z0-9/]*)',
-            r'(?:customer)[\s:]*(?:no|number)?[\s:]*([A-Z0-9][-A-Z0-9/]*)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return match.group(1).strip()
-                
-        return ""
+        return first_group(_CLIENT_ID_PATTERNS, text)
     
     def _extract_currency(self, text: str) -> str:
         """Extract currency used in the document."""
-        patterns = [
-            r'(?:currency|devise|monnaie)[\s:]*([A-Z]{3}|[€$£])',
-            r'(?:montant|amount)[\s:]*[\d\s,.]+\s*([A-Z]{3}|[€$£])',
-            r'(\d+(?:[\s,.]\d+)*)\s*(FCFA|EUR|USD)'
-        ]
-        
         currencies_map = {
             '€': 'EUR',
             '$': 'USD',
             '£': 'GBP'
         }
         
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in _CURRENCY_PATTERNS:
+            match = pattern.search(text)
             if match:
                 currency = match.group(1).strip()
                 return currencies_map.get(currency, currency)
         
         # Look for currency symbols with amounts
-        if re.search(r'\d+\s*FCFA', text, re.IGNORECASE):
+        if _FCFA_AMOUNT.search(text):
             return 'FCFA'
-        if re.search(r'€\s*\d+', text) or re.search(r'\d+\s*€', text):
+        if _EUR_AMOUNT.search(text):
             return 'EUR'
-        if re.search(r'\$\s*\d+', text) or re.search(r'\d+\s*\$', text):
+        if _USD_AMOUNT.search(text):
             return 'USD'
             
         return "FCFA"  # Default currency for SYSCOHADA
     
     def _extract_items(self, text: str) -> List[DocumentItem]:
-        """Extract line items from the document."""
+        """
+        Extract line items from the document.
+
+        Each line is tokenized once (see extraction_patterns.parse_item_line) instead of
+        running several backtracking table regexes over the whole text.
+        """
         items = []
         
-        # First approach: Try to locate a table structure
-        table_patterns = [
-            # Look for a standard layout with description, quantity, unit price, tax, amount
-            r'(?P<description>[^\n\r]+?)\s+(?P<quantity>\d+(?:,\d+)?)\s+(?P<unit_price>\d+(?:[\s,.]\d+)*)\s+(?P<tax_rate>\d+(?:,\d+)?%?)?\s+(?P<amount>\d+(?:[\s,.]\d+)*)',
-            # Simpler pattern without tax
-            r'(?P<quantity>\d+(?:,\d+)?)\s+(?P<description>[^\n\r]+?)\s+(?P<unit_price>\d+(?:[\s,.]\d+)*)\s+(?P<amount>\d+(?:[\s,.]\d+)*)',
-            # Description followed by numbers
-            r'(?P<description>[^\d\n\r:;]{5,}?)[\s:]*(?P<quantity>\d+(?:[,.]\d+)?)\s*(?:x|pcs|unités?|units?)[\s:]*(?P<unit_price>\d+(?:[\s,.]\d+)*)'
-        ]
-        
-        # Try each pattern
-        for pattern in table_patterns:
-            matches = list(re.finditer(pattern, text, re.MULTILINE))
-            if matches:
-                for match in matches:
-                    item = DocumentItem()
-                    d = match.groupdict()
-                    
-                    # Process description
-                    item.description = d.get('description', '').strip()
-                    if len(item.description) > 5:  # Ensure reasonable description length
-                        
-                        # Process quantity
-                        if 'quantity' in d and d['quantity']:
-                            try:
-                                item.quantity = Decimal(d['quantity'].replace(',', '.'))
-                            except:
-                                item.quantity = Decimal('1')
-                        else:
-                            item.quantity = Decimal('1')
-                        
-                        # Process unit price
-                        if 'unit_price' in d and d['unit_price']:
-                            try:
-                                item.unit_price = Decimal(d['unit_price'].replace(' ', '').replace(',', '.'))
-                            except:
-                                continue  # Skip if can't parse unit price
-                        else:
-                            continue  # Skip if no unit price
-                        
-                        # Process tax rate
-                        if 'tax_rate' in d and d['tax_rate']:
-                            try:
-                                tax_str = d['tax_rate'].replace(',', '.').strip()
-                                if tax_str.endswith('%'):
-                                    tax_str = tax_str[:-1]
-                                item.tax_rate = Decimal(tax_str)
-                            except:
-                                item.tax_rate = Decimal('18.0')  # Default OHADA VAT
-                        else:
-                            item.tax_rate = Decimal('18.0')  # Default OHADA VAT
-                        
-                        # Process amount (if available)
-                        if 'amount' in d and d['amount']:
-                            try:
-                                item.amount = Decimal(d['amount'].replace(' ', '').replace(',', '.'))
-                            except:
-                                item.amount = item.calculate_amount()
-                        else:
-                            item.amount = item.calculate_amount()
-                        
-                        # Calculate tax amount
-                        item.tax_amount = item.calculate_tax()
-                        
-                        items.append(item)
+        for line in iter_lines(text):
+            d = parse_item_line(line)
+            if not d:
+                continue
+
+            item = DocumentItem()
+            
+            # Process description
+            item.description = d['description'].strip()
+            if len(item.description) <= 5:  # Ensure reasonable description length
+                continue
+                
+            # Process quantity
+            try:
+                item.quantity = Decimal(d['quantity'].replace(',', '.'))
+            except (InvalidOperation, ValueError):
+                item.quantity = Decimal('1')
+            
+            # Process unit price
+            unit_price = to_decimal(d['unit_price'])
+            if unit_price is None:
+                continue  # Skip if can't parse unit price
+            item.unit_price = unit_price
+            
+            # Process tax rate
+            tax_rate = to_decimal(d['tax_rate']) if d['tax_rate'] else None
+            item.tax_rate = tax_rate if tax_rate is not None else Decimal('18.0')  # Default OHADA VAT
+            
+            # Process amount (if available)
+            amount = to_decimal(d['amount']) if d['amount'] else None
+            item.amount = amount if amount is not None else item.calculate_amount()
+            
+            # Calculate tax amount
+            item.tax_amount = item.calculate_tax()
+            
+            items.append(item)
         
-        # If we couldn't find items, try a different approach: look for common item patterns
+        # If we couldn't find items, try a different approach: look for descriptions followed by prices
         if not items:
-            # Look for descriptions followed by prices
-            desc_price_pattern = r'([A-Za-z][\w\s\-\'\"]{5,}?)[\s:]*(\d+(?:[\s,.]\d+)*)'
-            matches = list(re.finditer(desc_price_pattern, text))
-            
-            for i, match in enumerate(matches):
-                if i < len(matches) - 1:  # Not the last match
-                    description = match.group(1).strip()
-                    price_str = match.group(2).replace(' ', '').replace(',', '.')
-                    
-                    try:
-                        price = Decimal(price_str)
-                        # If price seems reasonable (not a date or page number)
-                        if price > 0 and price < 1000000:
-                            item = DocumentItem(
-                                description=description,
-                                quantity=Decimal('1'),
-                                unit_price=price,
-                                amount=price,
-                                tax_rate=Decimal('18.0'),
-                                tax_amount=(price * Decimal('0.18')).quantize(Decimal('0.01'))
-                            )
-                            items.append(item)
-                    except:
-                        continue
+            for line in iter_lines(text):
+                d = parse_price_line(line)
+                if not d:
+                    continue
+                price = to_decimal(d['price'])
+                # If price seems reasonable (not a date or page number)
+                if price is not None and 0 < price < 1000000:
+                    items.append(DocumentItem(
+                        description=d['description'],
+                        quantity=Decimal('1'),
+                        unit_price=price,
+                        amount=price,
+                        tax_rate=Decimal('18.0'),
+                        tax_amount=(price * Decimal('0.18')).quantize(Decimal('0.01'))
+                    ))
         
         return items
     
-    def _extract_subtotal(self, text: str) -> Decimal:
-        """Extract subtotal (before tax) amount."""
-        patterns = [
-            r'(?:sous[\s-]?total|total\s+h\.?t\.?|montant\s+h\.?t\.?|total\s+hors\s+taxe)[\s:]*(\d+(?:[\s,.]\d+)*)',
-            r'(?:sub[\s-]?total|amount\s+before\s+tax)[\s:]*(\d+(?:[\s,.]\d+)*)'
-        ]
-        
+    def _extract_amount(self, patterns, text: str) -> Decimal:
+        """Return the amount captured by the first matching pattern, or 0."""
         for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+            match = pattern.search(text)
             if match:
-                amount_str = match.group(1).replace(' ', '').replace(',', '.')
-                try:
-                    return Decimal(amount_str)
-                except:
-                    continue
+                amount = to_decimal(match.group(1))
+                if amount is not None:
+                    return amount
                 
         return Decimal('0')
     
+    def _extract_subtotal(self, text: str) -> Decimal:
+        """Extract subtotal (before tax) amount."""
+        return self._extract_amount(_SUBTOTAL_PATTERNS, text)
+    
     def _extract_tax_total(self, text: str) -> Decimal:
         """Extract total tax amount."""
-        patterns = [
-            r'(?:total\s+tva|montant\s+tva|tva)[\s:]*(\d+(?:[\s,.]\d+)*)',
-            r'(?:total\s+tax|vat\s+amount|vat)[\s:]*(\d+(?:[\s,.]\d+)*)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                amount_str = match.group(1).replace(' ', '').replace(',', '.')
-                try:
-                    return Decimal(amount_str)
-                except:
-                    continue
-                
-        return Decimal('0')
+        return self._extract_amount(_TAX_TOTAL_PATTERNS, text)
     
     def _extract_total(self, text: str) -> Decimal:
         """Extract total amount (including tax)."""
-        patterns = [
-            r'(?:total\s+ttc|montant\s+ttc|montant\s+total|total\s+général|total\s+à\s+payer)[\s:]*(\d+(?:[\s,.]\d+)*)',
-            r'(?:total\s+amount|grand\s+total|amount\s+due|total\s+due)[\s:]*(\d+(?:[\s,.]\d+)*)',
-            r'(?:total)[\s:]*(\d+(?:[\s,.]\d+)*)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                amount_str = match.group(1).replace(' ', '').replace(',', '.')
-                try:
-                    return Decimal(amount_str)
-                except:
-                    continue
-                
-        return Decimal('0')
+        return self._extract_amount(_TOTAL_PATTERNS, text)
     
     def _extract_payment_method(self, text: str) -> str:
         """Extract payment method."""
-        patterns = [
-            r'(?:mode\s+de\s+(?:paiement|règlement)|payment\s+method)[\s:]*([^\n\r]*)',
-            r'(?:payé\s+par|règlement\s+par|paid\s+by|payment\s+by)[\s:]*([^\n\r]*)'
-        ]
-        
-        payment_methods = [
-            'virement', 'chèque', 'espèces', 'carte bancaire', 'carte de crédit', 
-            'transfer', 'check', 'cash', 'credit card', 'bank card', 'mobile money'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in _PAYMENT_METHOD_PATTERNS:
+            match = pattern.search(text)
             if match:
                 method = match.group(1).strip().lower()
-                for payment_method in payment_methods:
+                for payment_method in _PAYMENT_METHODS:
                     if payment_method in method:
                         return payment_method
                 return method
                 
-        # Look for payment method keywords directly
-        for payment_method in payment_methods:
-            if re.search(r'\b' + payment_method + r'\b', text, re.IGNORECASE):
+        # Look for payment method keywords directly, in a single pass over the text
+        found = {m.group(1).lower() for m in _PAYMENT_KEYWORD_PATTERN.finditer(text)}
+        for payment_method in _PAYMENT_METHODS:
+            if payment_method in found:
                 return payment_method
                 
         return ""
@@ -574,22 +569,22 @@ class DocumentExtractor:
         details = {}
         
         # Extract IBAN
-        iban_match = re.search(r'(?:iban)[\s:]*([A-Z0-9\s]+)', text, re.IGNORECASE)
+        iban_match = _IBAN_PATTERN.search(text)
         if iban_match:
             details['iban'] = iban_match.group(1).strip().replace(' ', '')
             
         # Extract BIC/SWIFT
-        bic_match = re.search(r'(?:bic|swift)[\s:]*([A-Z0-9\s]+)', text, re.IGNORECASE)
+        bic_match = _BIC_PATTERN.search(text)
         if bic_match:
             details['bic'] = bic_match.group(1).strip().replace(' ', '')
             
         # Extract bank account number
-        account_match = re.search(r'(?:compte|account|n°\s+compte)[\s:]*(\d+)', text, re.IGNORECASE)
+        account_match = _ACCOUNT_PATTERN.search(text)
         if account_match:
             details['account_number'] = account_match.group(1).strip()
             
         # Extract check number
-        check_match = re.search(r'(?:chèque|cheque|check)[\s:]*(?:n°|num|number)?[\s:]*(\d+)', text, re.IGNORECASE)
+        check_match = _CHECK_PATTERN.search(text)
         if check_match:
             details['check_number'] = check_match.group(1).strip()
             
@@ -597,27 +592,12 @@ class DocumentExtractor:
     
     def _extract_statement_reference(self, text: str) -> str:
         """Extract bank statement reference number."""
-        patterns = [
-            r'(?:relevé|statement|extrait)[\s:]*(?:n°|no|num|number)?[\s:]*([A-Z0-9][-A-Z0-9/]*)',
-            r'(?:réf|ref|reference)[\s:]*([A-Z0-9][-A-Z0-9/]*)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return match.group(1).strip()
-                
-        return ""
+        return first_group(_STATEMENT_REFERENCE_PATTERNS, text)
     
     def _extract_statement_period(self, text: str) -> str:
         """Extract bank statement period."""
-        patterns = [
-            r'(?:période|period|du)[\s:]*([\d/]+)[\s-]*(?:au|to)[\s:]*([\d/]+)',
-            r'(?:relevé|statement)[\s:]*(?:du|from)[\s:]*([\d/]+)[\s-]*(?:au|to)[\s:]*([\d/]+)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in _STATEMENT_PERIOD_PATTERNS:
+            match = pattern.search(text)
             if match:
                 return f"{match.group(1).strip()} - {match.group(2).strip()}"
                 
@@ -625,13 +605,8 @@ class DocumentExtractor:
     
     def _extract_account_holder(self, text: str) -> str:
         """Extract account holder name."""
-        patterns = [
-            r'(?:titulaire|account holder|compte de)[\s:]*([^\n\r]*)',
-            r'(?:client|customer)[\s:]*([^\n\r]*)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in _ACCOUNT_HOLDER_PATTERNS:
+            match = pattern.search(text)
             if match:
                 return match.group(1).strip()
                 
@@ -639,13 +614,8 @@ class DocumentExtractor:
     
     def _extract_account_number(self, text: str) -> str:
         """Extract bank account number."""
-        patterns = [
-            r'(?:compte n°|account number|n° de compte|numéro de compte)[\s:]*([A-Z0-9\s]+)',
-            r'(?:iban)[\s:]*([A-Z0-9\s]+)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in _ACCOUNT_NUMBER_PATTERNS:
+            match = pattern.search(text)
             if match:
                 return match.group(1).strip().replace(' ', '')
                 
@@ -656,107 +626,48 @@ class DocumentExtractor:
         transactions = []
         
         # Look for date-description-amount patterns commonly found in bank statements
-        transaction_pattern = r'(\d{1,2}[/-]\d{1,2}(?:[/-]\d{2,4})?)[\s]*([^\n\r\d]*)[\s]*([+-]?\d+(?:[\s,.]\d+)*)'
-        
-        matches = re.finditer(transaction_pattern, text, re.MULTILINE)
-        for match in matches:
+        for match in _TRANSACTION_PATTERN.finditer(text):
             date = match.group(1).strip()
             description = match.group(2).strip()
-            amount_str = match.group(3).replace(' ', '').replace(',', '.')
+            amount = to_decimal(match.group(3))
             
-            try:
-                amount = Decimal(amount_str)
+            # Skip if this doesn't look like a transaction (too small amount or suspicious description)
+            if amount is None or abs(amount) < 1 or len(description) < 3:
+                continue
                 
-                # Skip if this doesn't look like a transaction (too small amount or suspicious description)
-                if abs(amount) < 1 or len(description) < 3:
-                    continue
-                    
-                transaction = DocumentItem()
-                transaction.description = f"{date} - {description}"
+            transaction = DocumentItem()
+            transaction.description = f"{date} - {description}"
+            transaction.quantity = Decimal('1')
+            transaction.unit_price = abs(amount)
+            transaction.amount = abs(amount)
                 
-                if amount >= 0:
-                    transaction.quantity = Decimal('1')
-                    transaction.unit_price = amount
-                    transaction.amount = amount
-                else:
-                    transaction.quantity = Decimal('1')
-                    transaction.unit_price = abs(amount)
-                    transaction.amount = abs(amount)
-                    
-                transactions.append(transaction)
-            except:
-                continue
+            transactions.append(transaction)
                 
         return transactions
     
     def _extract_opening_balance(self, text: str) -> Decimal:
         """Extract opening balance from bank statement."""
-        patterns = [
-            r'(?:solde\s+(?:initial|précédent|ancien)|balance\s+brought\s+forward|opening\s+balance)[\s:]*([+-]?\d+(?:[\s,.]\d+)*)',
-            r'(?:solde\s+au|balance\s+at)[\s:]*\d{1,2}[/-]\d{1,2}[/-]\d{2,4}[\s:]*([+-]?\d+(?:[\s,.]\d+)*)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                amount_str = match.group(1).replace(' ', '').replace(',', '.')
-                try:
-                    return Decimal(amount_str)
-                except:
-                    continue
-                
-        return Decimal('0')
+        return self._extract_amount(_OPENING_BALANCE_PATTERNS, text)
     
     def _extract_closing_balance(self, text: str) -> Decimal:
         """Extract closing balance from bank statement."""
-        patterns = [
-            r'(?:solde\s+(?:final|nouveau|actuel)|balance\s+carried\s+forward|closing\s+balance)[\s:]*([+-]?\d+(?:[\s,.]\d+)*)',
-            r'(?:nouveau\s+solde|new\s+balance)[\s:]*([+-]?\d+(?:[\s,.]\d+)*)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                amount_str = match.group(1).replace(' ', '').replace(',', '.')
-                try:
-                    return Decimal(amount_str)
-                except:
-                    continue
-                
-        return Decimal('0')
+        return self._extract_amount(_CLOSING_BALANCE_PATTERNS, text)
     
     def _extract_all_amounts(self, text: str) -> List[Decimal]:
         """Extract all monetary amounts from text."""
         amounts = []
         
         # Look for amounts with currency symbols
-        amount_patterns = [
-            r'(\d+(?:[\s,.]\d+)*)\s*(?:FCFA|EUR|USD|€|\$)',
-            r'(?:€|\$)\s*(\d+(?:[\s,.]\d+)*)',
-            r'(\d+(?:[\s,.]\d+)*)\s*(?:F|XOF|XAF)'  # Common for FCFA currencies
-        ]
+        for match in _CURRENCY_AMOUNT_PATTERN.finditer(text):
+            amount = to_decimal(next(group for group in match.groups() if group))
+            if amount is not None:
+                amounts.append(amount)
         
-        for pattern in amount_patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE)
-            for match in matches:
-                amount_str = match.group(1).replace(' ', '').replace(',', '.')
-                try:
-                    amount = Decimal(amount_str)
-                    amounts.append(amount)
-                except:
-                    continue
-        
-        # If no amounts found with currency, try numbers that look like monetary values
+        # If no amounts found with currency, try numbers that look like monetary values (2 decimals)
         if not amounts:
-            number_matches = re.finditer(r'(\d+(?:[,.]\d{2}))', text)
-            for match in number_matches:
-                amount_str = match.group(1).replace(',', '.')
-                try:
-                    amount = Decimal(amount_str)
-                    # Only include if it looks like a monetary amount (has 2 decimal places)
-                    if str(amount).endswith('.00') or len(str(amount).split('.')[-1]) == 2:
-                        amounts.append(amount)
-                except:
-                    continue
+            for match in _DECIMAL_AMOUNT_PATTERN.finditer(text):
+                amount = to_decimal(match.group(1))
+                if amount is not None:
+                    amounts.append(amount)
                     
         return amounts
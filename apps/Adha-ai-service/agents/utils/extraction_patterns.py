@@ -0,0 +1,321 @@
+"""
+Shared, pre-compiled regular expressions and a line tokenizer for document extraction.
+
+Every pattern in this module is compiled once at import time and written so that the
+work done per starting position is bounded: repetitions that could otherwise scan to the
+end of the text (``\\d+(?:[\\s,.]\\d+)*``, lazy ``[^\\d]*?``, ``.*``) are capped, and
+overlapping quantifiers (``[^\\n\\d]*[\\s]*``) are removed. A full ``finditer`` over the
+text is therefore linear in its length, even on adversarial OCR output.
+
+Invoice line items are no longer matched with multi-group table regexes. Instead each
+line is split into whitespace tokens and the trailing run of numeric tokens is mapped to
+quantity / unit price / tax rate / amount, which is linear and also handles French
+thousands separators ("12 500") by checking ``quantity * unit_price`` against the amount.
+"""
+import re
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Building blocks ---------------------------------------------------------------------
+
+# Generic number as found in OCR text: up to 7 groups separated by a space, tab,
+# no-break space, comma or dot ("12 500", "1.234,56"). Digit runs are bounded and must
+# not be preceded or followed by another digit so a long digit run cannot be split.
+NUMBER = r'(?<!\d)\d{1,15}(?:[ \t\u00a0,.]\d{1,15}){0,6}(?!\d)'
+
+# Same with an optional sign, for bank statements and balances
+SIGNED_NUMBER = r'[+-]?' + NUMBER
+
+# Monetary amount with thousands groups and an optional decimal part ("1 234,56")
+AMOUNT = r'\d{1,3}(?:[ \.,]\d{3}){0,6}(?:[,.]\d{1,3})?'
+
+# Keyword followed by a separator ("Total HT : ", "TVA 18% ") before the value
+GAP = r'[^\d\n]{0,40}?'
+
+CURRENCY_TOKENS = frozenset({
+    'FCFA', 'CFA', 'F', 'FC', 'CDF', 'XOF', 'XAF', 'EUR', 'EURO', 'EUROS', 'USD', '€', '$', '£',
+})
+
+QUANTITY_MARKERS = frozenset({'x', 'X', '×', 'pcs', 'pc', 'unité', 'unités', 'unit', 'units'})
+
+
+def compile_any(patterns: Sequence[str], flags: int = 0) -> re.Pattern:
+    """
+    Merge a list of patterns into one compiled alternation.
+
+    Only valid when callers need "does any pattern match" or "all matches of any
+    pattern"; ordered first-match-wins lists must keep their individual patterns.
+    """
+    return re.compile('|'.join(f'(?:{p})' for p in patterns), flags)
+
+
+def first_group(patterns: Sequence[re.Pattern], text: str, group: int = 1) -> str:
+    """Return the stripped capture of the first pattern (in priority order) that matches."""
+    for pattern in patterns:
+        match = pattern.search(text)
+        if match and match.group(group):
+            return match.group(group).strip()
+    return ""
+
+
+def to_decimal(value: str) -> Optional[Decimal]:
+    """Convert an extracted numeric token to Decimal ("12 500" -> 12500, "18%" -> 18)."""
+    cleaned = value.replace(' ', '').replace('\xa0', '').replace('\t', '').rstrip('%')
+    if ',' in cleaned and '.' in cleaned:
+        # Whichever separator comes last is the decimal separator
+        if cleaned.rfind(',') > cleaned.rfind('.'):
+            cleaned = cleaned.replace('.', '').replace(',', '.')
+        else:
+            cleaned = cleaned.replace(',', '')
+    else:
+        cleaned = cleaned.replace(',', '.')
+    try:
+        return Decimal(cleaned)
+    except (InvalidOperation, ValueError):
+        return None
+
+
+# Line tokenizer ------------------------------------------------------------------------
+
+_NUMERIC_TOKEN = re.compile(r'[+-]?\d{1,15}(?:[.,]\d{1,15}){0,4}%?')
+_INTEGER_TOKEN = re.compile(r'\d{1,6}(?:,\d{1,3})?')
+_THOUSANDS_TAIL = re.compile(r'\d{3}(?:[.,]\d{1,2})?')
+_THOUSANDS_HEAD = re.compile(r'\d{1,3}(?: \d{3})*')
+_SUMMARY_LINE = re.compile(
+    r'(?:sous[\s-]?total|sub[\s-]?total|total|tva|vat|montant|net\s+à\s+payer|amount|solde|balance)\b',
+    re.IGNORECASE,
+)
+
+# Item lines with more trailing numbers than this are treated as noise (tables of figures)
+MAX_NUMERIC_TOKENS = 8
+
+
+def iter_lines(text: str) -> Iterator[str]:
+    """Yield the non-empty, stripped lines of a text."""
+    for line in text.splitlines():
+        line = line.strip()
+        if line:
+            yield line
+
+
+def is_summary_line(description: str) -> bool:
+    """True for total/VAT/balance lines, which must not be read as line items."""
+    return _SUMMARY_LINE.match(description) is not None
+
+
+def _split_trailing_numbers(tokens: List[str]) -> Tuple[List[str], List[str]]:
+    """Split tokens into (head, trailing numeric run), skipping currency tokens in the run."""
+    numbers: List[str] = []
+    index = len(tokens)
+    while index > 0:
+        token = tokens[index - 1]
+        if token.upper() in CURRENCY_TOKENS or token in CURRENCY_TOKENS:
+            index -= 1
+            continue
+        if _NUMERIC_TOKEN.fullmatch(token):
+            numbers.append(token)
+            index -= 1
+            continue
+        break
+    numbers.reverse()
+    return tokens[:index], numbers
+
+
+def _groupings(numbers: List[str]) -> List[List[str]]:
+    """
+    Enumerate the ways a numeric run can be read once thousands groups are considered,
+    "2 12 500 25 000" -> [2, 12, 500, 25, 000], [2, 12 500, 25 000], ...
+
+    The run is capped at MAX_NUMERIC_TOKENS so this stays bounded per line.
+    """
+    results = [[numbers[0]]]
+    for token in numbers[1:]:
+        extended = []
+        for grouping in results:
+            extended.append(grouping + [token])
+            if _THOUSANDS_TAIL.fullmatch(token) and _THOUSANDS_HEAD.fullmatch(grouping[-1]):
+                extended.append(grouping[:-1] + [f'{grouping[-1]} {token}'])
+        results = extended
+    # Fewest merges first, so an already consistent plain reading wins
+    results.sort(key=len, reverse=True)
+    return results
+
+
+def _consistent(quantity: str, unit_price: str, amount: str, tax_rate: Optional[str] = None) -> bool:
+    """Check that quantity * unit price matches the amount, before or after tax."""
+    qty, price, total = to_decimal(quantity), to_decimal(unit_price), to_decimal(amount)
+    if qty is None or price is None or total is None or total <= 0:
+        return False
+    expected = qty * price
+    tolerance = max(Decimal('0.01'), total * Decimal('0.01'))
+    if abs(expected - total) <= tolerance:
+        return True
+    if tax_rate is not None:
+        rate = to_decimal(tax_rate)
+        if rate is not None and abs(expected * (1 + rate / 100) - total) <= tolerance:
+            return True
+    return False
+
+
+def _plausible_tax(token: str) -> bool:
+    rate = to_decimal(token)
+    return token.endswith('%') or (rate is not None and 0 <= rate <= 100)
+
+
+def parse_item_line(line: str) -> Optional[Dict[str, Optional[str]]]:
+    """
+    Tokenize one invoice line into description, quantity, unit price, tax rate and amount.
+
+    Recognised layouts:
+        <description> <qty> <unit price> [<tax rate>] <amount>
+        <qty> <description> <unit price> <amount>
+        <description> <qty> x|pcs|unités <unit price> [<amount>]
+
+    Returns None when the line does not look like an item.
+    """
+    tokens = line.split()
+    if len(tokens) < 2:
+        return None
+
+    head, numbers = _split_trailing_numbers(tokens)
+    if not head or not numbers or len(numbers) > MAX_NUMERIC_TOKENS:
+        return None
+
+    # "<description> <qty> x <unit price>"
+    if len(head) >= 3 and head[-1] in QUANTITY_MARKERS and _NUMERIC_TOKEN.fullmatch(head[-2]):
+        description = ' '.join(head[:-2])
+        if is_summary_line(description):
+            return None
+        for grouping in _groupings(numbers):
+            if len(grouping) == 1:
+                return {'description': description, 'quantity': head[-2],
+                        'unit_price': grouping[0], 'tax_rate': None, 'amount': None}
+            if len(grouping) == 2 and _consistent(head[-2], grouping[0], grouping[1]):
+                return {'description': description, 'quantity': head[-2],
+                        'unit_price': grouping[0], 'tax_rate': None, 'amount': grouping[1]}
+        return None
+
+    # "<qty> <description> <unit price> <amount>"
+    if len(head) >= 2 and _INTEGER_TOKEN.fullmatch(head[0]):
+        description = ' '.join(head[1:])
+        if is_summary_line(description):
+            return None
+        for grouping in _groupings(numbers):
+            if len(grouping) == 2 and _consistent(head[0], grouping[0], grouping[1]):
+                return {'description': description, 'quantity': head[0],
+                        'unit_price': grouping[0], 'tax_rate': None, 'amount': grouping[1]}
+
+    # "<description> <qty> <unit price> [<tax rate>] <amount>"
+    description = ' '.join(head)
+    if is_summary_line(description):
+        return None
+    candidates = _groupings(numbers)
+    for grouping in candidates:
+        if len(grouping) == 3 and _consistent(grouping[0], grouping[1], grouping[2]):
+            return {'description': description, 'quantity': grouping[0],
+                    'unit_price': grouping[1], 'tax_rate': None, 'amount': grouping[2]}
+        if (len(grouping) == 4 and _plausible_tax(grouping[2])
+                and _consistent(grouping[0], grouping[1], grouping[3], grouping[2])):
+            return {'description': description, 'quantity': grouping[0],
+                    'unit_price': grouping[1], 'tax_rate': grouping[2], 'amount': grouping[3]}
+
+    # No consistent reading: keep the literal columns when they have a table shape
+    if len(numbers) == 3 and _INTEGER_TOKEN.fullmatch(numbers[0]):
+        return {'description': description, 'quantity': numbers[0],
+                'unit_price': numbers[1], 'tax_rate': None, 'amount': numbers[2]}
+    if len(numbers) == 4 and _INTEGER_TOKEN.fullmatch(numbers[0]) and _plausible_tax(numbers[2]):
+        return {'description': description, 'quantity': numbers[0],
+                'unit_price': numbers[1], 'tax_rate': numbers[2], 'amount': numbers[3]}
+    return None
+
+
+def parse_price_line(line: str) -> Optional[Dict[str, str]]:
+    """
+    Tokenize a "<description> <price>" line, used when no item table was found.
+
+    The description must start with a letter and the whole trailing run must read as a
+    single amount ("Frais de dossier 12 500").
+    """
+    tokens = line.split()
+    head, numbers = _split_trailing_numbers(tokens)
+    if not head or not numbers or len(numbers) > MAX_NUMERIC_TOKENS:
+        return None
+    description = ' '.join(head).rstrip(':').strip()
+    if len(description) < 6 or not description[0].isalpha() or is_summary_line(description):
+        return None
+    merged = [g for g in _groupings(numbers) if len(g) == 1]
+    if not merged:
+        return None
+    return {'description': description, 'price': merged[0][0]}
+
+
+# DDE agent helpers (_extraire_*) ---------------------------------------------------------
+
+_CURRENCY = r'(?:€|EUR|EURO|EUROS|F|FCFA|XOF|\$|USD)'
+
+# Amount followed or preceded by a currency. Kept as two patterns: a single alternation
+# would consume "100 €" and miss the prefixed form in "100 € 200".
+MONTANT_PATTERNS = (
+    re.compile(r'(' + AMOUNT + r')\s{0,5}' + _CURRENCY, re.IGNORECASE),
+    re.compile(_CURRENCY + r'\s{0,5}(' + AMOUNT + r')', re.IGNORECASE),
+)
+DECIMAL_COMMA = re.compile(r'(\d+)[,](\d+)')
+THOUSANDS_DOT = re.compile(r'(\d+)[.](\d{3})')
+
+# Key amounts (HT, TVA, TTC), searched on lower-cased text in priority order
+MONTANTS_CLES_PATTERNS = {
+    "montant_ht": (
+        re.compile(r'(?:montant|prix|total)\s+(?:ht|h\.t\.|hors\s+taxe)' + GAP + r'(' + AMOUNT + ')'),
+        re.compile(r'(?:ht|h\.t\.|hors\s+taxe)' + GAP + r'[:]?\s{0,5}(' + AMOUNT + ')'),
+    ),
+    "montant_tva": (
+        re.compile(r'(?:tva|taxe)' + GAP + r'(' + AMOUNT + ')'),
+    ),
+    "montant_ttc": (
+        re.compile(r'(?:montant|prix|total)\s+(?:ttc|t\.t\.c\.|toutes\s+taxes)' + GAP + r'(' + AMOUNT + ')'),
+        re.compile(r'(?:ttc|t\.t\.c\.|toutes\s+taxes)' + GAP + r'[:]?\s{0,5}(' + AMOUNT + ')'),
+    ),
+}
+
+# Numeric and textual dates merged into one alternation (the full and abbreviated month
+# lists used to match "12 mars 2024" twice)
+DATE_PATTERN = re.compile(
+    r'(\d{1,2}[/\-\.]\d{1,2}[/\-\.]\d{2,4})'
+    r'|(\d{1,2}[ \t]{1,5}(?:janvier|février|mars|avril|mai|juin|juillet|août|septembre|octobre|novembre|décembre'
+    r'|janv|févr|avr|juil|sept|oct|nov|déc)\.?[ \t]{1,5}\d{2,4})',
+    re.IGNORECASE,
+)
+DATE_CONTEXT_PATTERN = re.compile(
+    r'(?P<facture>facture|fact\.)|(?P<livraison>livraison|livré)'
+    r'|(?P<paiement>paiement|échéance|règlement)|(?P<commande>commande)',
+    re.IGNORECASE,
+)
+DATE_CONTEXT_PRIORITY = ("facture", "livraison", "paiement", "commande")
+
+_REF_VALUE = r'[:]?\s{0,5}([A-Z0-9][A-Z0-9\-_/]{2,20})'
+REFERENCE_PATTERNS = {
+    "facture": (
+        re.compile(r'(?:facture|fact\.?|invoice)\s{0,5}(?:n[o°]\.?|numéro|ref\.?)' + _REF_VALUE, re.IGNORECASE),
+        re.compile(r'(?:n[o°]\.?|numéro|ref\.?)\s{0,5}(?:facture|fact\.?)' + _REF_VALUE, re.IGNORECASE),
+    ),
+    "commande": (
+        re.compile(r'(?:commande|cmd\.?|purchase order|order)\s{0,5}(?:n[o°]\.?|numéro|ref\.?)' + _REF_VALUE, re.IGNORECASE),
+        re.compile(r'(?:n[o°]\.?|numéro|ref\.?)\s{0,5}(?:commande|cmd\.?)' + _REF_VALUE, re.IGNORECASE),
+    ),
+    "client": (
+        re.compile(r'(?:client|customer)\s{0,5}(?:n[o°]\.?|numéro|ref\.?|id)' + _REF_VALUE, re.IGNORECASE),
+        re.compile(r'(?:n[o°]\.?|numéro|ref\.?|id)\s{0,5}(?:client|customer)' + _REF_VALUE, re.IGNORECASE),
+    ),
+}
+
+_COMPANY_NAME = r'([A-Z][A-Za-z\s]{2,40}(?:SARL|SA|SAS|Inc\.?|LLC|Ltd\.?)?)'
+PARTIES_PATTERNS = {
+    "fournisseur": (
+        re.compile(r'(?:fournisseur|vendeur|émetteur|supplier)[^\n:]{0,80}?[:]\s{0,20}([^\n]+)'),
+        re.compile(r'(?:de|from)[:]?\s{0,5}' + _COMPANY_NAME),
+    ),
+    "client": (
+        re.compile(r'(?:client|acheteur|destinataire|customer)[^\n:]{0,80}?[:]\s{0,20}([^\n]+)'),
+        re.compile(r'(?:à|facturer à|facturé à|to)[:]?\s{0,5}' + _COMPANY_NAME),
+    ),
+}
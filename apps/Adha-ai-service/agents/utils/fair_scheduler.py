@@ -0,0 +1,306 @@
+"""
+Fair sharing of the LLM capacity of a process between tenants (companies and
+financial institutions).
+
+Calls used to reach OpenAI first come, first served: a company uploading 500
+documents filled every slot and the other tenants waited behind its backlog.
+``FairScheduler`` sits between the callers and the OpenAI client. At most
+``capacity`` calls are in flight; when all slots are taken, callers queue per
+tenant and freed slots are handed out by weighted deficit round-robin (DRR):
+on each round a tenant earns ``quantum * weight`` credits and spends the
+estimated tokens of its calls, so tenants get capacity in proportion to their
+weights whatever their backlog, and a tenant with one call waits for at most
+one round.
+
+Weights come from the subscription plan of the company (``Company.subscription_plan``,
+``PLAN_WEIGHTS``); the tenant of a call comes from its ``AgentContext``.
+
+Usage::
+
+    from agents.utils.fair_scheduler import fair_scheduled
+
+    client = fair_scheduled(rate_limited(OpenAI()))  # callers queue fairly
+
+    with fair_scheduler().slot("company:42", cost=1200):
+        call_openai()
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from agents.utils.agent_pool import AgentContext, current_context
+from agents.utils.rate_limiter import LIMITED_CALLS, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+FREE = 'free'
+STANDARD = 'standard'
+PREMIUM = 'premium'
+ENTERPRISE = 'enterprise'
+
+# Share of the LLM capacity per subscription plan (FAIR_SCHEDULER_WEIGHT_<PLAN> overrides)
+PLAN_WEIGHTS = {FREE: 1.0, STANDARD: 2.0, PREMIUM: 4.0, ENTERPRISE: 8.0}
+
+# Tenant of the calls made outside of any company or institution
+SHARED_TENANT = 'shared'
+
+WEIGHT_CACHE_SECONDS = 300
+
+
+class FairQueueTimeout(Exception):
+    """The call waited longer than ``max_wait`` for a slot."""
+
+
+class _Waiter:
+    __slots__ = ('tenant', 'cost', 'event', 'granted', 'queued_at')
+
+    def __init__(self, tenant: str, cost: float):
+        self.tenant = tenant
+        self.cost = cost
+        self.event = threading.Event()
+        self.granted = False
+        self.queued_at = time.monotonic()
+
+
+class FairScheduler:
+    """
+    ``capacity`` slots shared by tenants with weighted deficit round-robin.
+
+    The scheduler is work-conserving: while slots are free a call goes through
+    at once, whoever makes it; queues only form when the process is saturated.
+    """
+
+    def __init__(self, capacity: int = 16, quantum: float = 2000.0,
+                 weight_of: Optional[Callable[[str], float]] = None, max_wait: Optional[float] = None):
+        self.capacity = capacity
+        self.quantum = quantum
+        self.weight_of = weight_of or (lambda tenant: 1.0)
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._queues: Dict[str, deque] = {}
+        self._weights: Dict[str, float] = {}
+        self._deficits: Dict[str, float] = {}
+        # Tenants with queued calls, in round-robin order (the first one has the turn)
+        self._active: deque = deque()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def _tenant_stats(self, tenant: str) -> Dict[str, float]:
+        stats = self._stats.get(tenant)
+        if stats is None:
+            stats = self._stats[tenant] = {'granted': 0, 'queued': 0, 'wait_seconds': 0.0, 'max_wait_ms': 0.0,
+                                           'timeouts': 0}
+        return stats
+
+    def acquire(self, tenant: str, cost: float = 1.0, timeout: Optional[float] = None):
+        """Blocks until ``tenant`` gets a slot; ``release`` must follow."""
+        weight = max(0.001, float(self.weight_of(tenant)))
+        timeout = self.max_wait if timeout is None else timeout
+        with self._lock:
+            stats = self._tenant_stats(tenant)
+            if self.in_flight < self.capacity and not self._active:
+                self.in_flight += 1
+                stats['granted'] += 1
+                return
+            waiter = _Waiter(tenant, cost)
+            queue = self._queues.get(tenant)
+            if queue is None:
+                queue = self._queues[tenant] = deque()
+                self._weights[tenant] = weight
+                self._deficits[tenant] = 0.0 if self._active else self.quantum * weight
+                self._active.append(tenant)
+            queue.append(waiter)
+            stats['queued'] += 1
+            self._dispatch()
+
+        if not waiter.event.wait(timeout):
+            with self._lock:
+                if not waiter.granted:
+                    self._withdraw(waiter)
+                    stats['timeouts'] += 1
+                    raise FairQueueTimeout(f"No LLM slot for tenant {tenant} within {timeout}s")
+        waited = time.monotonic() - waiter.queued_at
+        with self._lock:
+            stats['wait_seconds'] += waited
+            stats['max_wait_ms'] = max(stats['max_wait_ms'], round(waited * 1000, 3))
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, tenant: str, cost: float = 1.0, timeout: Optional[float] = None):
+        self.acquire(tenant, cost, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _dispatch(self):
+        """Hands the free slots to the queued calls (called with the lock held)."""
+        while self.in_flight < self.capacity and self._active:
+            tenant = self._active[0]
+            queue = self._queues[tenant]
+            head = queue[0]
+            if self._deficits[tenant] >= head.cost:
+                self._deficits[tenant] -= head.cost
+                queue.popleft()
+                self.in_flight += 1
+                head.granted = True
+                self._stats[tenant]['granted'] += 1
+                head.event.set()
+                if not queue:
+                    self._retire(tenant)
+            else:
+                # Turn over: the next tenant earns its quantum
+                self._active.rotate(-1)
+                following = self._active[0]
+                self._deficits[following] += self.quantum * self._weights[following]
+
+    def _retire(self, tenant: str):
+        # An idle tenant does not keep credits for later (DRR)
+        had_turn = self._active[0] == tenant
+        self._active.remove(tenant)
+        del self._queues[tenant], self._deficits[tenant], self._weights[tenant]
+        if had_turn and self._active:
+            following = self._active[0]
+            self._deficits[following] += self.quantum * self._weights[following]
+
+    def _withdraw(self, waiter: _Waiter):
+        queue = self._queues.get(waiter.tenant)
+        if queue is None:
+            return
+        queue.remove(waiter)
+        if not queue:
+            self._retire(waiter.tenant)
+        self._dispatch()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'capacity': self.capacity,
+                'in_flight': self.in_flight,
+                'waiting': {tenant: len(queue) for tenant, queue in self._queues.items()},
+                'tenants': {tenant: dict(stats) for tenant, stats in self._stats.items()},
+            }
+
+
+def tenant_of(context: AgentContext) -> str:
+    """Tenant key of a call: its company, else its institution, else the shared tenant."""
+    if context.company_id:
+        return f"company:{context.company_id}"
+    if context.institution_id:
+        return f"institution:{context.institution_id}"
+    return SHARED_TENANT
+
+
+def plan_weight(plan: Optional[str]) -> float:
+    plan = plan or STANDARD
+    default = PLAN_WEIGHTS.get(plan, PLAN_WEIGHTS[STANDARD])
+    return float(os.environ.get(f"FAIR_SCHEDULER_WEIGHT_{plan.upper()}", default))
+
+
+class PlanWeights:
+    """Weight of a tenant from the plan of its company, cached ``ttl`` seconds."""
+
+    def __init__(self, ttl: float = WEIGHT_CACHE_SECONDS, lookup: Optional[Callable[[str], Optional[str]]] = None):
+        self.ttl = ttl
+        self.lookup = lookup or self._company_plan
+        self._cache: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _company_plan(company_id: str) -> Optional[str]:
+        from api.models import Company
+        return Company.objects.filter(pk=company_id).values_list('subscription_plan', flat=True).first()
+
+    def __call__(self, tenant: str) -> float:
+        if tenant == SHARED_TENANT:
+            return plan_weight(FREE)
+        if not tenant.startswith('company:'):
+            # Institutions are not Company rows: standard plan unless overridden
+            return plan_weight(os.environ.get('FAIR_SCHEDULER_INSTITUTION_PLAN', STANDARD))
+        now = time.monotonic()
+        cached = self._cache.get(tenant)
+        if cached and cached[1] > now:
+            return cached[0]
+        try:
+            weight = plan_weight(self.lookup(tenant.split(':', 1)[1]))
+        except Exception as e:
+            logger.warning("Could not read the plan of %s, standard weight used: %s", tenant, e)
+            weight = plan_weight(STANDARD)
+        with self._lock:
+            self._cache[tenant] = (weight, now + self.ttl)
+        return weight
+
+
+class FairScheduledClient:
+    """
+    Wraps an OpenAI client: ``chat.completions.create``, ``completions.create``
+    and ``embeddings.create`` wait for a slot of the tenant of the call.
+    """
+
+    def __init__(self, target, scheduler: Optional[FairScheduler] = None, path=()):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_scheduler', scheduler)
+        object.__setattr__(self, '_path', path)
+
+    def __getattr__(self, name: str):
+        value = getattr(self._target, name)
+        path = self._path + (name,)
+        if path in LIMITED_CALLS:
+            return self._scheduled(value)
+        if isinstance(value, (str, bytes, int, float, bool, type(None), list, tuple, dict, set)) or callable(value):
+            return value
+        return FairScheduledClient(value, self._scheduler, path)
+
+    def __setattr__(self, name: str, value):
+        setattr(self._target, name, value)
+
+    def _scheduled(self, create):
+        def scheduled_create(*args, **kwargs):
+            scheduler = self._scheduler or fair_scheduler()
+            with scheduler.slot(tenant_of(current_context()), cost=estimate_tokens(kwargs)):
+                return create(*args, **kwargs)
+
+        return scheduled_create
+
+    def __repr__(self):
+        return f"<fair scheduled {self._target!r}>"
+
+
+_scheduler: Optional[FairScheduler] = None
+_scheduler_pid: Optional[int] = None
+_scheduler_lock = threading.Lock()
+
+
+def fair_scheduler() -> FairScheduler:
+    """
+    Scheduler of the process, configured by LLM_FAIR_CAPACITY, LLM_FAIR_QUANTUM,
+    LLM_FAIR_MAX_WAIT and FAIR_SCHEDULER_WEIGHT_<PLAN>.
+    """
+    global _scheduler, _scheduler_pid
+    if _scheduler is None or _scheduler_pid != os.getpid():
+        with _scheduler_lock:
+            if _scheduler is None or _scheduler_pid != os.getpid():
+                max_wait = float(os.environ.get('LLM_FAIR_MAX_WAIT', 300))
+                _scheduler = FairScheduler(
+                    capacity=int(os.environ.get('LLM_FAIR_CAPACITY', 16)),
+                    quantum=float(os.environ.get('LLM_FAIR_QUANTUM', 2000)),
+                    weight_of=PlanWeights(),
+                    max_wait=max_wait or None,
+                )
+                _scheduler_pid = os.getpid()
+    return _scheduler
+
+
+def fair_scheduled(client, scheduler: Optional[FairScheduler] = None):
+    """Proxy of an OpenAI client whose calls queue fairly per tenant."""
+    if client is None or isinstance(client, FairScheduledClient):
+        return client
+    return FairScheduledClient(client, scheduler)
@@ -0,0 +1,344 @@
+"""
+Tiered model routing: a cheap model first, the strong model when needed.
+
+Every LLM call of the agents used ``gpt-4o-2024-08-06`` (``gpt-4`` in places),
+including intent classification and simple journal proposals. ``ModelRouter``
+picks a tier per call site from the complexity of the input (prompt length,
+document type, SYSCOHADA template matched or not):
+
+- the ``fast`` tier (``gpt-4o-mini``) serves the simple calls; its answer is
+  checked by the validator of the call (``StructureValidator`` and ``CCCAgent``
+  for journal entries) and the call is sent again to the strong tier only if
+  the check or the call fails;
+- the ``strong`` tier (``gpt-4o-2024-08-06``) serves the complex calls directly.
+
+Calls, tokens, cost and latency are tracked per tier, escalations per call site
+(``ModelRouter.stats``). ``run_routing_replay`` in api.kafka.load_harness
+replays traffic on stub models and reports the escalation rate.
+
+Usage::
+
+    from agents.utils.model_router import journal_entries, model_router
+
+    response = model_router().complete(client, "aa.entries", messages, validate=journal_entries,
+                                       template_matched=True, temperature=0.1)
+
+Configuration: MODEL_ROUTING (``off`` sends everything to the strong tier),
+MODEL_TIER_FAST, MODEL_TIER_STRONG.
+"""
+import ast
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from agents.utils.agent_pool import agent_pool
+from agents.utils.fair_scheduler import FairQueueTimeout
+from agents.utils.rate_limiter import RateLimitTimeout
+from agents.utils.resilience import BulkheadFullError, CircuitOpenError
+from agents.utils.structure_validator import StructureValidator
+
+logger = logging.getLogger(__name__)
+
+FAST = 'fast'
+STRONG = 'strong'
+
+DEFAULT_MODELS = {FAST: 'gpt-4o-mini', STRONG: 'gpt-4o-2024-08-06'}
+
+# USD per million tokens (input, output); the longest matching prefix of the model is used
+PRICES_PER_MILLION = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4-turbo': (10.00, 30.00),
+    'gpt-4': (30.00, 60.00),
+    'gpt-3.5-turbo': (0.50, 1.50),
+}
+
+# Capacity errors of the shared OpenAI client: the strong tier would hit them too
+NOT_ESCALATED = (CircuitOpenError, BulkheadFullError, RateLimitTimeout, FairQueueTimeout)
+
+LATENCY_SAMPLES = 10_000
+
+Validator = Callable[[Any], Tuple[bool, List[str]]]
+
+
+@dataclass(frozen=True)
+class CallSite:
+    """
+    When a call site may use the fast tier: prompts up to ``fast_max_tokens``
+    (twice as many when a template matched), of the ``fast_doc_types`` only
+    when set, and only with a matched template when ``template_required``.
+    """
+    fast_max_tokens: int
+    fast_doc_types: Optional[frozenset] = None
+    template_required: bool = False
+
+
+CALL_SITES = {
+    # AAgent
+    'aa.classify': CallSite(fast_max_tokens=2000),
+    'aa.entries': CallSite(fast_max_tokens=1500, template_required=True),
+    'aa.document_entries': CallSite(fast_max_tokens=2500, fast_doc_types=frozenset({'invoice', 'receipt', 'prompt'})),
+    # HistoryAgent.chat
+    'history.chat': CallSite(fast_max_tokens=1500),
+    # NLUAgent and the other users of GeneratorAgent
+    'nlu.intent': CallSite(fast_max_tokens=2000),
+    'generator': CallSite(fast_max_tokens=1500),
+    # DDEAgent, text only (vision calls stay on the strong tier)
+    'dde.summary': CallSite(fast_max_tokens=3000),
+    'dde.prompt_extraction': CallSite(fast_max_tokens=1500),
+}
+
+
+def prompt_tokens(messages: Iterable[Dict[str, Any]]) -> int:
+    """Prompt tokens of a call (about 4 characters per token, as rate_limiter)."""
+    return sum(len(str(_field(message, 'content') or '')) // 4 + 4 for message in messages)
+
+
+def price(model: str, prompt: int, completion: int) -> float:
+    """Cost in USD of a call, 0 for an unknown model."""
+    prefixes = [prefix for prefix in PRICES_PER_MILLION if model and model.startswith(prefix)]
+    if not prefixes:
+        return 0.0
+    input_price, output_price = PRICES_PER_MILLION[max(prefixes, key=len)]
+    return (prompt * input_price + completion * output_price) / 1_000_000
+
+
+def _field(item, name: str):
+    # Messages are dicts, or message objects of a previous response (tool calls)
+    return item.get(name) if isinstance(item, dict) else getattr(item, name, None)
+
+
+def _json_in(content: Optional[str]):
+    if not content:
+        raise ValueError("Empty answer")
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        match = re.search(r'\{[\s\S]*\}', content)
+        if not match:
+            raise ValueError("No JSON object in the answer")
+        return json.loads(match.group(0))
+
+
+def has_content(message) -> Tuple[bool, List[str]]:
+    """The answer has text, or asks for tool calls."""
+    if (_field(message, 'content') or '').strip() or _field(message, 'tool_calls'):
+        return True, []
+    return False, ["Empty answer"]
+
+
+def one_of(labels: Iterable[str]) -> Validator:
+    """The answer is one of ``labels`` (classification)."""
+    labels = {label.lower() for label in labels}
+
+    def validate(message):
+        answer = (_field(message, 'content') or '').strip().strip('."\'').lower()
+        return (True, []) if answer in labels else (False, [f"Unknown label: {answer[:50]}"])
+
+    return validate
+
+
+def json_object(*keys: str) -> Validator:
+    """The answer is a JSON object (or a Python dict literal) holding ``keys``."""
+    def validate(message):
+        content = _field(message, 'content')
+        try:
+            data = _json_in(content)
+        except ValueError:
+            try:
+                data = ast.literal_eval((content or '').strip())
+            except (ValueError, SyntaxError) as e:
+                return False, [f"Invalid JSON: {e}"]
+        if not isinstance(data, dict):
+            return False, ["The answer is not an object"]
+        missing = [key for key in keys if key not in data]
+        return (False, [f"Missing keys: {', '.join(missing)}"]) if missing else (True, [])
+
+    return validate
+
+
+def journal_entries(message) -> Tuple[bool, List[str]]:
+    """
+    Journal entry proposals: each one has the structure of StructureValidator
+    and CCCAgent finds them coherent without having to force the balance.
+    """
+    try:
+        data = _json_in(_field(message, 'content'))
+    except ValueError as e:
+        return False, [str(e)]
+    proposals = data.get('proposals') if isinstance(data, dict) else None
+    if not proposals or not isinstance(proposals, list):
+        return False, ["No proposal"]
+    errors = []
+    for proposal in proposals:
+        errors.extend(StructureValidator.validate_entry_proposal(proposal)[1])
+    if errors:
+        return False, errors
+    verification = agent_pool.get("ccc").verify(proposals)
+    if not verification.get('is_coherent') or verification.get('has_forced_balance'):
+        return False, verification.get('errors') or verification.get('warnings') or ["Incoherent entries"]
+    return True, []
+
+
+def _tier_stats() -> Dict[str, Any]:
+    return {'calls': 0, 'errors': 0, 'rejected': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cost_usd': 0.0}
+
+
+class ModelRouter:
+    """Routes the calls of the agents between the fast and the strong model."""
+
+    def __init__(self, models: Optional[Dict[str, str]] = None, sites: Optional[Dict[str, CallSite]] = None,
+                 enabled: bool = True):
+        self.models = dict(DEFAULT_MODELS, **(models or {}))
+        self.sites = dict(CALL_SITES, **(sites or {}))
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._tiers = {FAST: _tier_stats(), STRONG: _tier_stats()}
+        self._latencies = {FAST: deque(maxlen=LATENCY_SAMPLES), STRONG: deque(maxlen=LATENCY_SAMPLES)}
+        self._sites: Dict[str, Dict[str, int]] = {}
+        # What the answered calls would have cost on the strong model only
+        self._strong_only_cost = 0.0
+
+    def choose(self, site: str, messages: List[Dict[str, Any]], doc_type: Optional[str] = None,
+               template_matched: Optional[bool] = None) -> str:
+        """Tier of a call; unknown call sites use the strong tier."""
+        policy = self.sites.get(site)
+        if not self.enabled or policy is None:
+            return STRONG
+        if policy.template_required and not template_matched:
+            return STRONG
+        if policy.fast_doc_types is not None and doc_type not in policy.fast_doc_types:
+            return STRONG
+        limit = policy.fast_max_tokens * (2 if template_matched else 1)
+        return FAST if prompt_tokens(messages) <= limit else STRONG
+
+    def complete(self, client, site: str, messages: List[Dict[str, Any]], validate: Optional[Validator] = None,
+                 doc_type: Optional[str] = None, template_matched: Optional[bool] = None, **kwargs):
+        """
+        ``client.chat.completions.create`` on the tier chosen for the call. An
+        answer of the fast tier rejected by ``validate`` (or a failed call) is
+        asked again to the strong tier. ``model`` is set by the router.
+        """
+        tier = self.choose(site, messages, doc_type, template_matched)
+        site_stats = self._site_stats(site)
+        if tier == FAST:
+            try:
+                response = self._call(client, FAST, messages, kwargs)
+            except NOT_ESCALATED:
+                raise
+            except Exception as e:
+                reasons = [f"{type(e).__name__}: {e}"]
+            else:
+                accepted, reasons = validate(response.choices[0].message) if validate else (True, [])
+                if accepted:
+                    with self._lock:
+                        site_stats['fast'] += 1
+                        self._strong_only_cost += price(self.models[STRONG], *_usage(response))
+                    return response
+                with self._lock:
+                    self._tiers[FAST]['rejected'] += 1
+            logger.info("Escalating %s to %s: %s", site, self.models[STRONG], '; '.join(reasons)[:200])
+            with self._lock:
+                site_stats['escalated'] += 1
+        else:
+            with self._lock:
+                site_stats['strong'] += 1
+        response = self._call(client, STRONG, messages, kwargs)
+        with self._lock:
+            self._strong_only_cost += price(self.models[STRONG], *_usage(response))
+        return response
+
+    def _site_stats(self, site: str) -> Dict[str, int]:
+        with self._lock:
+            stats = self._sites.get(site)
+            if stats is None:
+                stats = self._sites[site] = {'calls': 0, 'fast': 0, 'strong': 0, 'escalated': 0}
+            stats['calls'] += 1
+            return stats
+
+    def _call(self, client, tier: str, messages, kwargs):
+        model = self.models[tier]
+        started = time.perf_counter()
+        try:
+            response = client.chat.completions.create(model=model, messages=messages, **kwargs)
+        except Exception:
+            with self._lock:
+                self._tiers[tier]['calls'] += 1
+                self._tiers[tier]['errors'] += 1
+            raise
+        latency = time.perf_counter() - started
+        prompt, completion = _usage(response)
+        with self._lock:
+            stats = self._tiers[tier]
+            stats['calls'] += 1
+            stats['prompt_tokens'] += prompt
+            stats['completion_tokens'] += completion
+            stats['cost_usd'] += price(getattr(response, 'model', None) or model, prompt, completion)
+            self._latencies[tier].append(latency)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tiers = {}
+            for tier, stats in self._tiers.items():
+                latencies = sorted(self._latencies[tier])
+                tiers[tier] = dict(stats, model=self.models[tier], cost_usd=round(stats['cost_usd'], 6),
+                                   latency_ms=_percentiles(latencies))
+            sites = {site: dict(stats) for site, stats in self._sites.items()}
+            strong_only_cost = self._strong_only_cost
+        attempted = sum(stats['fast'] + stats['escalated'] for stats in sites.values())
+        escalated = sum(stats['escalated'] for stats in sites.values())
+        calls = sum(stats['calls'] for stats in sites.values())
+        return {
+            'calls': calls,
+            'tiers': tiers,
+            'sites': sites,
+            # Share of the calls tried on the fast tier that had to go to the strong one
+            'escalation_rate': round(escalated / attempted, 4) if attempted else 0.0,
+            'escalated_share_of_calls': round(escalated / calls, 4) if calls else 0.0,
+            'cost_usd': round(sum(tier['cost_usd'] for tier in tiers.values()), 6),
+            'strong_only_cost_usd': round(strong_only_cost, 6),
+        }
+
+
+def _usage(response) -> Tuple[int, int]:
+    usage = getattr(response, 'usage', None)
+    return (getattr(usage, 'prompt_tokens', 0) or 0), (getattr(usage, 'completion_tokens', 0) or 0)
+
+
+def _percentiles(ordered: List[float]) -> Dict[str, Optional[float]]:
+    if not ordered:
+        return {'p50': None, 'p95': None, 'max': None}
+
+    def at(percentile):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * percentile))] * 1000, 3)
+
+    return {'p50': at(0.50), 'p95': at(0.95), 'max': round(ordered[-1] * 1000, 3)}
+
+
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+
+def build_model_router() -> ModelRouter:
+    return ModelRouter(
+        models={FAST: os.environ.get('MODEL_TIER_FAST', DEFAULT_MODELS[FAST]),
+                STRONG: os.environ.get('MODEL_TIER_STRONG', DEFAULT_MODELS[STRONG])},
+        enabled=os.environ.get('MODEL_ROUTING', 'on').lower() not in ('off', '0', 'false', 'no'),
+    )
+
+
+def model_router() -> ModelRouter:
+    """Router of the process, configured by MODEL_ROUTING, MODEL_TIER_FAST and MODEL_TIER_STRONG."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = build_model_router()
+    return _router
@@ -0,0 +1,288 @@
+"""
+Process-wide executor of the document pipeline with one concurrency gate per
+resource class.
+
+Every OrchestrationAgent used to own a ThreadPoolExecutor(max_workers=4) and
+process_batch gathered all documents at once, so concurrent batches multiplied
+the threads and the parallel LLM calls. Work is now submitted to a single
+executor, and only once a permit of its resource class has been obtained:
+
+- ``cpu``: rendering / parsing done in Python (PDF pages, spreadsheets, checks);
+- ``llm``: calls to the OpenAI API;
+- ``db``: database writes (``gated(DB)`` on the writes of the batch store).
+
+Waiting happens in the gates (FIFO queues), never in executor threads, so the
+executor only needs as many threads as there are permits. Each gate keeps queue
+depth, in-flight count and wait-time statistics (``stats()``), also exported to
+Prometheus when prometheus_client is available.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CPU = "cpu"
+LLM = "llm"
+DB = "db"
+
+DEFAULT_LIMITS = {CPU: max(2, os.cpu_count() or 2), LLM: 8, DB: 4}
+WAIT_SAMPLES = 2048
+
+try:
+    from prometheus_client import Gauge, Histogram
+
+    QUEUE_DEPTH = Gauge(
+        'adha_ai_pipeline_queue_depth',
+        'Pipeline tasks waiting for a resource permit',
+        ['resource'], multiprocess_mode='livesum'
+    )
+    IN_FLIGHT = Gauge(
+        'adha_ai_pipeline_in_flight',
+        'Pipeline tasks holding a resource permit',
+        ['resource'], multiprocess_mode='livesum'
+    )
+    WAIT_TIME = Histogram(
+        'adha_ai_pipeline_wait_seconds',
+        'Time spent waiting for a resource permit',
+        ['resource']
+    )
+except ImportError:  # pragma: no cover - prometheus_client absent
+    QUEUE_DEPTH = IN_FLIGHT = WAIT_TIME = None
+
+
+def _percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ResourceGate:
+    """
+    Counting semaphore usable from threads and from any event loop.
+
+    A waiter is a concurrent.futures.Future resolved when a permit is handed
+    over to it, which keeps the queue FIFO and independent of the event loop of
+    the caller (views run their own loops).
+    """
+
+    def __init__(self, name: str, limit: int):
+        if limit < 1:
+            raise ValueError(f"Resource '{name}' needs at least one permit")
+        self.name = name
+        self.limit = limit
+        self._available = limit
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.max_in_flight = 0
+        self.max_queue_depth = 0
+        self.wait_samples = deque(maxlen=WAIT_SAMPLES)
+
+    @property
+    def in_flight(self) -> int:
+        return self.limit - self._available
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _request(self) -> Future:
+        future = Future()
+        with self._lock:
+            if self._available > 0 and not self._waiters:
+                self._available -= 1
+                self._granted()
+                future.set_result(True)
+            else:
+                self._waiters.append(future)
+                self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+                if QUEUE_DEPTH is not None:
+                    QUEUE_DEPTH.labels(self.name).inc()
+        return future
+
+    def _granted(self):
+        # Called with the lock held, once a permit is assigned
+        self.acquired += 1
+        self.max_in_flight = max(self.max_in_flight, self.limit - self._available)
+        if IN_FLIGHT is not None:
+            IN_FLIGHT.labels(self.name).inc()
+
+    def _withdraw(self, future: Future) -> bool:
+        """Removes a waiter that gave up; returns False if it already owns a permit."""
+        with self._lock:
+            try:
+                self._waiters.remove(future)
+            except ValueError:
+                # Already dequeued by release(): skipped if cancelled, granted otherwise
+                return future.cancelled()
+            if QUEUE_DEPTH is not None:
+                QUEUE_DEPTH.labels(self.name).dec()
+            return True
+
+    def _record_wait(self, started: float):
+        waited = time.perf_counter() - started
+        self.wait_samples.append(waited)
+        if WAIT_TIME is not None:
+            WAIT_TIME.labels(self.name).observe(waited)
+
+    def release(self):
+        with self._lock:
+            if IN_FLIGHT is not None:
+                IN_FLIGHT.labels(self.name).dec()
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if QUEUE_DEPTH is not None:
+                    QUEUE_DEPTH.labels(self.name).dec()
+                if waiter.set_running_or_notify_cancel():
+                    # The permit goes straight to the next waiter
+                    self._granted()
+                    waiter.set_result(True)
+                    return
+            self._available += 1
+
+    def acquire(self, timeout: Optional[float] = None):
+        started = time.perf_counter()
+        future = self._request()
+        try:
+            future.result(timeout)
+        except BaseException:
+            if not self._withdraw(future):
+                self.release()
+            raise
+        self._record_wait(started)
+
+    async def acquire_async(self):
+        started = time.perf_counter()
+        future = self._request()
+        try:
+            await asyncio.wrap_future(future)
+        except BaseException:
+            # Cancelled while waiting: give the permit back if it was already handed over
+            if not self._withdraw(future):
+                self.release()
+            raise
+        self._record_wait(started)
+
+    @contextmanager
+    def hold(self, timeout: Optional[float] = None):
+        self.acquire(timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        samples = list(self.wait_samples)
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "acquired": self.acquired,
+            "max_in_flight": self.max_in_flight,
+            "max_queue_depth": self.max_queue_depth,
+            "wait_p50": _percentile(samples, 0.50),
+            "wait_p99": _percentile(samples, 0.99),
+            "wait_max": max(samples) if samples else 0.0,
+        }
+
+
+class PipelineExecutor:
+    """Single thread pool shared by the pipeline, gated per resource class."""
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None, max_workers: Optional[int] = None):
+        limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.gates = {name: ResourceGate(name, limit) for name, limit in limits.items()}
+        # Tasks only enter the pool with a permit: one thread per permit is enough
+        self.max_workers = max_workers or sum(limits.values())
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                            thread_name_prefix="adha-pipeline")
+
+    def gate(self, resource: str) -> ResourceGate:
+        try:
+            return self.gates[resource]
+        except KeyError:
+            raise KeyError(f"Unknown pipeline resource '{resource}'") from None
+
+    async def run(self, resource: str, func: Callable, *args, **kwargs):
+        """
+        Awaits a permit of ``resource`` then runs ``func`` in the shared pool,
+        with the context variables of the caller (AgentContext...).
+        """
+        gate = self.gate(resource)
+        await gate.acquire_async()
+        try:
+            context = contextvars.copy_context()
+            future = self._executor.submit(context.run, func, *args, **kwargs)
+            return await asyncio.wrap_future(future)
+        finally:
+            gate.release()
+
+    def call(self, resource: str, func: Callable, *args, **kwargs):
+        """Synchronous variant: runs ``func`` in the calling thread under a permit."""
+        with self.gate(resource).hold():
+            return func(*args, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "resources": {name: gate.stats() for name, gate in self.gates.items()},
+        }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+def _configured_limits() -> Dict[str, int]:
+    """Limits from the Django settings when configured, else from the environment."""
+    names = {CPU: "PIPELINE_CPU_CONCURRENCY", LLM: "PIPELINE_LLM_CONCURRENCY", DB: "PIPELINE_DB_CONCURRENCY"}
+    try:
+        from django.conf import settings
+        configured = settings.configured
+    except ImportError:
+        configured = False
+    limits = {}
+    for resource, name in names.items():
+        value = getattr(settings, name, None) if configured else os.environ.get(name)
+        if value:
+            limits[resource] = int(value)
+    return limits
+
+
+_executor: Optional[PipelineExecutor] = None
+_executor_pid: Optional[int] = None
+_executor_lock = threading.Lock()
+
+
+def get_pipeline_executor() -> PipelineExecutor:
+    """Returns the executor of the current process (rebuilt after a fork)."""
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = PipelineExecutor(_configured_limits())
+                _executor_pid = os.getpid()
+                logger.info("Pipeline executor: %s", {n: g.limit for n, g in _executor.gates.items()})
+    return _executor
+
+
+def gated(resource: str):
+    """
+    Decorator: each call runs in the calling thread under a permit of
+    ``resource`` of the process executor (see ``PipelineExecutor.call``).
+    """
+    def decorator(func: Callable):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return get_pipeline_executor().call(resource, func, *args, **kwargs)
+        return wrapper
+    return decorator
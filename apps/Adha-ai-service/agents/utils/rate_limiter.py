@@ -0,0 +1,431 @@
+"""
+OpenAI rate limiter shared by every process of the service (gunicorn workers,
+Kafka consumers, batch workers).
+
+Each API key has two token buckets, refilled continuously: requests per minute
+(``OPENAI_RPM_LIMIT``) and tokens per minute (``OPENAI_TPM_LIMIT``). They live
+in Redis and are updated by one Lua script per call, so all processes draw on
+the same budget; when Redis is unreachable the limiter falls back to buckets
+local to the process, sized to ``1 / OPENAI_RATE_LIMIT_PROCESSES`` of the budget.
+
+A call reserves its estimated tokens (prompt + ``max_tokens``) before going
+out and reconciles them with ``usage.total_tokens`` afterwards, which gives
+the difference back to the bucket (or takes the excess).
+
+Priority classes keep headroom for interactive work: a class may only draw
+while the bucket stays above its reserve (a fraction of the budget), so chat
+still goes through when batch ingestion has drained the bucket down to it.
+The class of a call comes from ``AgentContext.priority``.
+
+Usage::
+
+    from agents.utils.rate_limiter import openai_limiter, rate_limited
+
+    client = rate_limited(OpenAI())  # chat.completions / embeddings are limited
+
+    reservation = openai_limiter().acquire(1200, priority="batch")
+    response = call_openai()
+    reservation.reconcile(response.usage.total_tokens)
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from agents.utils.agent_pool import current_context
+
+try:
+    import redis
+except ImportError:  # redis-py missing: buckets local to the process
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+CHAT = 'chat'
+DEFAULT = 'default'
+BATCH = 'batch'
+
+# Fraction of the budget a class must leave in the bucket
+PRIORITY_RESERVES = {CHAT: 0.0, DEFAULT: 0.1, BATCH: 0.3}
+
+# Completion estimate when the call sets no max_tokens
+DEFAULT_COMPLETION_TOKENS = 512
+
+# Paths of the client methods that consume the budget
+LIMITED_CALLS = {('chat', 'completions', 'create'), ('completions', 'create'), ('embeddings', 'create')}
+
+TAKE_SCRIPT = """
+local function refill(key, cap, rate, now)
+    local state = redis.call('HMGET', key, 'level', 'ts')
+    local level = tonumber(state[1]) or cap
+    local ts = tonumber(state[2]) or now
+    return math.min(cap, level + math.max(0, now - ts) * rate)
+end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local req_cap, req_rate = tonumber(ARGV[1]), tonumber(ARGV[2])
+local tok_cap, tok_rate = tonumber(ARGV[3]), tonumber(ARGV[4])
+local tokens, reserve, ttl = tonumber(ARGV[5]), tonumber(ARGV[6]), tonumber(ARGV[7])
+local requests = refill(KEYS[1], req_cap, req_rate, now)
+local budget = refill(KEYS[2], tok_cap, tok_rate, now)
+local req_floor, tok_floor = req_cap * reserve, tok_cap * reserve
+local need = math.min(tokens, tok_cap - tok_floor)
+local wait = 0
+if requests - 1 < req_floor then wait = (req_floor + 1 - requests) / req_rate end
+if budget - need < tok_floor then wait = math.max(wait, (tok_floor + need - budget) / tok_rate) end
+if wait == 0 then
+    requests = requests - 1
+    budget = budget - tokens
+end
+redis.call('HSET', KEYS[1], 'level', requests, 'ts', now)
+redis.call('HSET', KEYS[2], 'level', budget, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], ttl)
+redis.call('PEXPIRE', KEYS[2], ttl)
+return tostring(wait)
+"""
+
+ADJUST_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local cap, rate, delta, ttl = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'level', 'ts')
+local level = tonumber(state[1]) or cap
+local ts = tonumber(state[2]) or now
+level = math.min(cap, level + math.max(0, now - ts) * rate + delta)
+redis.call('HSET', KEYS[1], 'level', level, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], ttl)
+return tostring(level)
+"""
+
+
+class RateLimitTimeout(Exception):
+    """The budget did not allow the call within the caller's timeout."""
+
+
+@dataclass(frozen=True)
+class Budget:
+    """Requests and tokens allowed per ``period`` seconds for one API key."""
+    name: str
+    requests: float
+    tokens: float
+    period: float = 60.0
+
+    @property
+    def request_rate(self) -> float:
+        return self.requests / self.period
+
+    @property
+    def token_rate(self) -> float:
+        return self.tokens / self.period
+
+    def share(self, processes: int) -> 'Budget':
+        return Budget(self.name, self.requests / processes, self.tokens / processes, self.period)
+
+
+class LocalBucketStore:
+    """Buckets of this process only (fallback, tests, single-process deployments)."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._buckets: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def _refill(self, key: str, capacity: float, rate: float, now: float) -> float:
+        level, updated = self._buckets.get(key, (capacity, now))
+        return min(capacity, level + max(0.0, now - updated) * rate)
+
+    def take(self, budget: Budget, tokens: float, reserve: float) -> float:
+        with self._lock:
+            now = self.clock()
+            requests = self._refill(f"{budget.name}:requests", budget.requests, budget.request_rate, now)
+            available = self._refill(f"{budget.name}:tokens", budget.tokens, budget.token_rate, now)
+            request_floor, token_floor = budget.requests * reserve, budget.tokens * reserve
+            # A call larger than the bucket goes through once the bucket is full
+            need = min(tokens, budget.tokens - token_floor)
+            wait = 0.0
+            if requests - 1 < request_floor:
+                wait = (request_floor + 1 - requests) / budget.request_rate
+            if available - need < token_floor:
+                wait = max(wait, (token_floor + need - available) / budget.token_rate)
+            if wait == 0:
+                requests -= 1
+                available -= tokens
+            self._buckets[f"{budget.name}:requests"] = [requests, now]
+            self._buckets[f"{budget.name}:tokens"] = [available, now]
+            return wait
+
+    def adjust(self, budget: Budget, delta: float):
+        with self._lock:
+            now = self.clock()
+            key = f"{budget.name}:tokens"
+            level = self._refill(key, budget.tokens, budget.token_rate, now)
+            self._buckets[key] = [min(budget.tokens, level + delta), now]
+
+
+class RedisBucketStore:
+    """Buckets shared through Redis, each update being one atomic Lua script."""
+
+    def __init__(self, client, prefix: str = 'ratelimit'):
+        self.client = client
+        self.prefix = prefix
+        self._take = client.register_script(TAKE_SCRIPT)
+        self._adjust = client.register_script(ADJUST_SCRIPT)
+
+    def _keys(self, budget: Budget):
+        # Hash tag: both keys of a budget on the same cluster slot
+        return [f"{self.prefix}:{{{budget.name}}}:requests", f"{self.prefix}:{{{budget.name}}}:tokens"]
+
+    def _ttl_ms(self, budget: Budget) -> int:
+        return int(budget.period * 2000)
+
+    def take(self, budget: Budget, tokens: float, reserve: float) -> float:
+        wait = self._take(keys=self._keys(budget), args=[
+            budget.requests, budget.request_rate, budget.tokens, budget.token_rate,
+            tokens, reserve, self._ttl_ms(budget),
+        ])
+        return float(wait)
+
+    def adjust(self, budget: Budget, delta: float):
+        self._adjust(keys=self._keys(budget)[1:], args=[
+            budget.tokens, budget.token_rate, delta, self._ttl_ms(budget),
+        ])
+
+
+class Reservation:
+    """Tokens taken for one call; ``reconcile`` settles them with the real usage."""
+
+    def __init__(self, limiter: 'RateLimiter', tokens: int, priority: str, waited: float):
+        self.limiter = limiter
+        self.tokens = tokens
+        self.priority = priority
+        self.waited = waited
+        self.reconciled = False
+
+    def reconcile(self, actual_tokens: Optional[int]):
+        if self.reconciled or actual_tokens is None:
+            return
+        self.reconciled = True
+        if actual_tokens != self.tokens:
+            self.limiter.adjust(self.tokens - actual_tokens)
+
+
+class RateLimiter:
+    """
+    Requests and tokens budget with priority classes.
+
+    ``store`` holds the shared buckets (``RedisBucketStore``); on a store error
+    the limiter uses ``fallback`` (local buckets, ``fallback_processes`` sharing
+    the budget) for ``fallback_seconds`` before trying the store again.
+    """
+
+    def __init__(self, budget: Budget, store=None, fallback: Optional[LocalBucketStore] = None,
+                 priorities: Optional[Dict[str, float]] = None, max_wait: float = 60.0,
+                 fallback_processes: int = 1, fallback_seconds: float = 5.0):
+        self.budget = budget
+        self.store = store
+        self.fallback = fallback or LocalBucketStore()
+        self.priorities = dict(PRIORITY_RESERVES, **(priorities or {}))
+        self.max_wait = max_wait
+        self.fallback_budget = budget.share(max(1, fallback_processes))
+        self.fallback_seconds = fallback_seconds
+        self._store_down_until = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'acquired': 0, 'waited': 0, 'wait_seconds': 0.0, 'timeouts': 0, 'fallbacks': 0,
+                      'reconciled_tokens': 0, 'throttled': 0}
+
+    def _count(self, name: str, value=1):
+        with self._lock:
+            self.stats[name] += value
+
+    def _attempt(self, tokens: int, reserve: float) -> float:
+        if self.store is not None and time.monotonic() >= self._store_down_until:
+            try:
+                return self.store.take(self.budget, tokens, reserve)
+            except Exception as e:
+                logger.warning("Rate limiter store unavailable, using local buckets for %ss: %s",
+                               self.fallback_seconds, e)
+                self._store_down_until = time.monotonic() + self.fallback_seconds
+                self._count('fallbacks')
+        if self.store is None:
+            return self.fallback.take(self.budget, tokens, reserve)
+        return self.fallback.take(self.fallback_budget, tokens, reserve)
+
+    def adjust(self, delta: float):
+        """Gives ``delta`` tokens back to the bucket (takes them when negative)."""
+        self._count('reconciled_tokens', delta)
+        if self.store is not None and time.monotonic() >= self._store_down_until:
+            try:
+                self.store.adjust(self.budget, delta)
+                return
+            except Exception as e:
+                logger.warning("Rate limiter store unavailable, adjustment kept locally: %s", e)
+                self._store_down_until = time.monotonic() + self.fallback_seconds
+        self.fallback.adjust(self.budget if self.store is None else self.fallback_budget, delta)
+
+    def _priority(self, priority: Optional[str]):
+        priority = priority or current_context().priority or DEFAULT
+        if priority not in self.priorities:
+            priority = DEFAULT
+        return priority, self.priorities[priority]
+
+    def _granted(self, tokens: int, priority: str, started: float) -> Reservation:
+        waited = time.monotonic() - started
+        with self._lock:
+            self.stats['acquired'] += 1
+            if waited > 0.001:
+                self.stats['waited'] += 1
+                self.stats['wait_seconds'] += waited
+        return Reservation(self, tokens, priority, waited)
+
+    def _next_sleep(self, wait: float, started: float, timeout: float) -> float:
+        if time.monotonic() + wait - started > timeout:
+            self._count('timeouts')
+            raise RateLimitTimeout(f"OpenAI budget '{self.budget.name}' exhausted for more than {timeout}s")
+        # Jitter: processes woken together do not all retry at the same instant
+        return min(wait, 1.0) * random.uniform(1.0, 1.1)
+
+    def acquire(self, tokens: int, priority: Optional[str] = None, timeout: Optional[float] = None) -> Reservation:
+        """Blocks until the budget allows one request of ``tokens`` tokens."""
+        priority, reserve = self._priority(priority)
+        timeout = self.max_wait if timeout is None else timeout
+        started = time.monotonic()
+        while True:
+            wait = self._attempt(tokens, reserve)
+            if wait <= 0:
+                return self._granted(tokens, priority, started)
+            time.sleep(self._next_sleep(wait, started, timeout))
+
+    async def acquire_async(self, tokens: int, priority: Optional[str] = None,
+                            timeout: Optional[float] = None) -> Reservation:
+        """Variant of ``acquire`` for the asyncio runtime (the store call itself is short)."""
+        priority, reserve = self._priority(priority)
+        timeout = self.max_wait if timeout is None else timeout
+        started = time.monotonic()
+        while True:
+            wait = self._attempt(tokens, reserve)
+            if wait <= 0:
+                return self._granted(tokens, priority, started)
+            await asyncio.sleep(self._next_sleep(wait, started, timeout))
+
+
+def estimate_tokens(kwargs: Dict[str, Any]) -> int:
+    """Tokens a call will be charged, from its arguments (about 4 characters per token)."""
+    if 'messages' in kwargs:
+        prompt = sum(len(str(message.get('content') or '')) // 4 + 4 for message in kwargs['messages'])
+        completion = kwargs.get('max_tokens') or kwargs.get('max_completion_tokens') or DEFAULT_COMPLETION_TOKENS
+        return prompt + completion * kwargs.get('n', 1)
+    if 'input' in kwargs:
+        inputs = kwargs['input'] if isinstance(kwargs['input'], list) else [kwargs['input']]
+        return sum(len(str(text)) // 4 + 1 for text in inputs)
+    prompt = len(str(kwargs.get('prompt', ''))) // 4
+    return prompt + (kwargs.get('max_tokens') or DEFAULT_COMPLETION_TOKENS)
+
+
+# Types returned as they are by the proxy
+_PLAIN = (str, bytes, int, float, bool, type(None), list, tuple, dict, set)
+
+
+class RateLimitedClient:
+    """
+    Wraps an OpenAI client: ``chat.completions.create``, ``completions.create``
+    and ``embeddings.create`` reserve their tokens first and reconcile them
+    with the usage of the response.
+    """
+
+    def __init__(self, target, limiter: Optional[RateLimiter] = None, path=()):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_limiter', limiter)
+        object.__setattr__(self, '_path', path)
+
+    def __getattr__(self, name: str):
+        value = getattr(self._target, name)
+        path = self._path + (name,)
+        if path in LIMITED_CALLS:
+            return self._limited(value)
+        if isinstance(value, _PLAIN) or callable(value):
+            return value
+        return RateLimitedClient(value, self._limiter, path)
+
+    def __setattr__(self, name: str, value):
+        setattr(self._target, name, value)
+
+    def _limited(self, create):
+        def limited_create(*args, **kwargs):
+            limiter = self._limiter or openai_limiter()
+            reservation = limiter.acquire(estimate_tokens(kwargs))
+            try:
+                response = create(*args, **kwargs)
+            except Exception as e:
+                if getattr(e, 'status_code', None) == 429:
+                    limiter._count('throttled')
+                    logger.warning("OpenAI returned 429 despite the rate limiter: %s", e)
+                raise
+            usage = getattr(response, 'usage', None)
+            reservation.reconcile(getattr(usage, 'total_tokens', None))
+            return response
+
+        return limited_create
+
+    def __repr__(self):
+        return f"<rate limited {self._target!r}>"
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_pid: Optional[int] = None
+_limiter_lock = threading.Lock()
+
+
+def _redis_store() -> Optional[RedisBucketStore]:
+    if os.environ.get('OPENAI_RATE_LIMIT_BACKEND', 'redis').lower() != 'redis':
+        return None
+    if redis is None:
+        logger.warning("redis-py is not installed, OpenAI rate limits are enforced per process")
+        return None
+    url = os.environ.get('OPENAI_RATE_LIMIT_REDIS_URL') or os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    return RedisBucketStore(redis.Redis.from_url(url, socket_timeout=0.5))
+
+
+def build_openai_limiter() -> RateLimiter:
+    """
+    Limiter configured by OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT,
+    OPENAI_RATE_LIMIT_BACKEND (redis | local), OPENAI_RATE_LIMIT_PROCESSES,
+    OPENAI_RATE_LIMIT_MAX_WAIT and OPENAI_RATE_LIMIT_RESERVE_<CLASS>.
+    """
+    budget = Budget(
+        'openai',
+        requests=float(os.environ.get('OPENAI_RPM_LIMIT', 3000)),
+        tokens=float(os.environ.get('OPENAI_TPM_LIMIT', 250000)),
+    )
+    priorities = {
+        name: float(os.environ.get(f"OPENAI_RATE_LIMIT_RESERVE_{name.upper()}", reserve))
+        for name, reserve in PRIORITY_RESERVES.items()
+    }
+    return RateLimiter(
+        budget,
+        store=_redis_store(),
+        priorities=priorities,
+        max_wait=float(os.environ.get('OPENAI_RATE_LIMIT_MAX_WAIT', 60)),
+        fallback_processes=int(os.environ.get('OPENAI_RATE_LIMIT_PROCESSES', 1)),
+    )
+
+
+def openai_limiter() -> RateLimiter:
+    """Limiter of the process (rebuilt after a fork: its local buckets belong to the parent)."""
+    global _limiter, _limiter_pid
+    if _limiter is None or _limiter_pid != os.getpid():
+        with _limiter_lock:
+            if _limiter is None or _limiter_pid != os.getpid():
+                _limiter = build_openai_limiter()
+                _limiter_pid = os.getpid()
+    return _limiter
+
+
+def rate_limited(client, limiter: Optional[RateLimiter] = None):
+    """Proxy of an OpenAI client drawing on ``limiter`` (the process limiter by default)."""
+    if client is None or isinstance(client, RateLimitedClient):
+        return client
+    return RateLimitedClient(client, limiter)
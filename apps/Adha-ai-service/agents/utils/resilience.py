@@ -0,0 +1,526 @@
+"""
+Circuit breakers and bulkheads for the outbound dependencies of the service
+(OpenAI, customer-service, Chroma, Hugging Face, admin-service, Kafka).
+
+Each dependency has one ``Dependency`` per process, shared by every thread:
+
+- a ``CircuitBreaker`` whose counters and state transitions are guarded by a
+  lock; once tripped it fails calls immediately instead of letting them wait
+  for a dependency that is down. With ``RESILIENCE_SHARED_STATE=redis`` a trip
+  is published in Redis, so the other workers stop calling as well. A 4xx
+  answer other than 429 (``client_error``) is not counted as a failure;
+- a ``Bulkhead`` limiting the concurrent calls, so a slow dependency holds at
+  most ``max_concurrent`` threads and further calls are rejected at once;
+- an optional call timeout: the call runs on the dependency's own executor
+  (``max_concurrent`` threads, no more) and the caller gets ``CallTimeoutError``
+  when it takes too long. A call that hangs keeps its bulkhead slot until it
+  really returns.
+
+Usage::
+
+    from agents.utils.resilience import dependency, resilient
+
+    response = dependency("customer_service").call(requests.get, url, timeout=5)
+    client = resilient(OpenAI(), "openai")  # every method call goes through it
+
+Limits come from the environment, e.g. ``RESILIENCE_OPENAI_MAX_CONCURRENT``,
+``RESILIENCE_OPENAI_CALL_TIMEOUT``, ``RESILIENCE_OPENAI_FAILURE_THRESHOLD``,
+``RESILIENCE_OPENAI_RESET_TIMEOUT`` and ``RESILIENCE_OPENAI_MAX_WAIT``.
+"""
+import contextvars
+import inspect
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+
+try:
+    import redis
+except ImportError:  # redis-py missing: breaker state stays local to the process
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'CLOSED'
+OPEN = 'OPEN'
+HALF_OPEN = 'HALF_OPEN'
+
+# Defaults per dependency, overridden by RESILIENCE_<NAME>_<SETTING>
+DEFAULTS: Dict[str, Dict[str, float]] = {
+    'openai': {'max_concurrent': 50, 'call_timeout': 120.0, 'failure_threshold': 5, 'reset_timeout': 30.0},
+    'customer_service': {'max_concurrent': 20, 'call_timeout': 5.0, 'failure_threshold': 5, 'reset_timeout': 15.0},
+    'chroma': {'max_concurrent': 16, 'call_timeout': 10.0, 'failure_threshold': 5, 'reset_timeout': 15.0},
+    'huggingface': {'max_concurrent': 10, 'call_timeout': 60.0, 'failure_threshold': 5, 'reset_timeout': 30.0},
+    'admin_service': {'max_concurrent': 4, 'call_timeout': 30.0, 'failure_threshold': 3, 'reset_timeout': 30.0},
+    'kafka': {'max_concurrent': 0, 'call_timeout': 0, 'failure_threshold': 5, 'reset_timeout': 60.0},
+}
+FALLBACK = {'max_concurrent': 10, 'call_timeout': 30.0, 'failure_threshold': 5, 'reset_timeout': 30.0}
+
+
+class CircuitOpenError(Exception):
+    """The breaker of the dependency is open: the call was not attempted."""
+
+
+class BulkheadFullError(Exception):
+    """Every slot of the dependency is busy: the call was not attempted."""
+
+
+class CallTimeoutError(TimeoutError):
+    """The dependency did not answer within the call timeout."""
+
+
+def client_error(error: BaseException) -> bool:
+    """
+    True for a 4xx answer other than 429 (``status_code`` of openai's
+    ``APIStatusError``, ``response.status_code`` of requests' ``HTTPError``):
+    the request is at fault, not the dependency.
+    """
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return isinstance(status, int) and 400 <= status < 500 and status != 429
+
+
+class RedisBreakerState:
+    """
+    Trips shared between worker processes: one key per dependency holding the
+    time until which the breaker stays open (expiring with it). Redis errors are
+    logged and ignored, the breaker then behaves as a local one.
+    """
+
+    def __init__(self, client, prefix: str = 'resilience:breaker:'):
+        self.client = client
+        self.prefix = prefix
+
+    def open_until(self, name: str) -> float:
+        try:
+            value = self.client.get(self.prefix + name)
+        except Exception as e:
+            logger.warning("Could not read shared breaker state of '%s': %s", name, e)
+            return 0.0
+        return float(value) if value else 0.0
+
+    def trip(self, name: str, until: float):
+        ttl_ms = max(1, int((until - time.time()) * 1000))
+        try:
+            self.client.set(self.prefix + name, repr(until), px=ttl_ms)
+        except Exception as e:
+            logger.warning("Could not share the trip of breaker '%s': %s", name, e)
+
+    def reset(self, name: str):
+        try:
+            self.client.delete(self.prefix + name)
+        except Exception as e:
+            logger.warning("Could not reset shared breaker state of '%s': %s", name, e)
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker.
+
+    CLOSED: calls go through, ``failure_threshold`` consecutive failures trip it.
+    OPEN: calls fail with ``CircuitOpenError`` until ``timeout`` seconds elapse.
+    HALF_OPEN: ``half_open_max_calls`` trial calls; a success closes the
+    breaker, a failure opens it again for ``timeout`` seconds.
+
+    Errors matching ``excluded_exceptions`` or the ``excluded`` predicate (e.g.
+    ``client_error``) show that the dependency answered: they count as a
+    success, never as a failure.
+
+    With ``shared_state`` (``RedisBreakerState``) a trip is published to the
+    other processes, which read it at most every ``sync_interval`` seconds.
+    """
+
+    def __init__(self, failure_threshold: int = 5, timeout: float = 60, name: str = 'default',
+                 half_open_max_calls: int = 1, shared_state: Optional[RedisBreakerState] = None,
+                 sync_interval: float = 1.0, excluded_exceptions: Tuple[Type[BaseException], ...] = (),
+                 excluded: Optional[Callable[[BaseException], bool]] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.timeout = timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.shared_state = shared_state
+        self.sync_interval = sync_interval
+        self.excluded_exceptions = excluded_exceptions
+        self.excluded = excluded
+        self.failures = 0
+        self.next_attempt = 0.0
+        self.trips = 0
+        self._state = CLOSED
+        self._trials = 0
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def _sync(self, now: float):
+        """Adopts a trip published by another process (outside of the lock: Redis round trip)."""
+        if self.shared_state is None or self._state != CLOSED or now - self._synced_at < self.sync_interval:
+            return
+        self._synced_at = now
+        until = self.shared_state.open_until(self.name)
+        if until > now:
+            with self._lock:
+                if self._state == CLOSED:
+                    logger.warning("Circuit breaker '%s' opened by another worker", self.name)
+                    self._state = OPEN
+                    self.next_attempt = until
+
+    def allow(self) -> bool:
+        """True when a call may be attempted now (takes a trial slot when half-open)."""
+        now = time.time()
+        self._sync(now)
+        with self._lock:
+            if self._state == OPEN:
+                if now < self.next_attempt:
+                    return False
+                self._state = HALF_OPEN
+                self._trials = 0
+            if self._state == HALF_OPEN:
+                if self._trials >= self.half_open_max_calls:
+                    return False
+                self._trials += 1
+            return True
+
+    def cancel(self):
+        """Gives back the trial slot taken by ``allow`` for a call that was not attempted."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._trials > 0:
+                self._trials -= 1
+
+    def is_open(self) -> bool:
+        """
+        True when a call must not be attempted now. Goes through ``allow``: once
+        the retry delay has elapsed the breaker turns half-open and the caller
+        holds the trial slot, so the outcome must be reported with
+        ``record_success`` / ``record_failure``.
+        """
+        return not self.allow()
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self._state == CLOSED:
+                return
+            self._state = CLOSED
+        logger.info("Circuit breaker '%s' closed", self.name)
+        if self.shared_state is not None:
+            self.shared_state.reset(self.name)
+
+    def record_failure(self, error: Optional[BaseException] = None):
+        if error is not None and (isinstance(error, self.excluded_exceptions)
+                                  or (self.excluded is not None and self.excluded(error))):
+            self.record_success()
+            return
+        with self._lock:
+            self.failures += 1
+            if self._state == CLOSED and self.failures < self.failure_threshold:
+                return
+            # Threshold reached, failed trial, or a failure while open: the delay starts again
+            tripped = self._state != OPEN
+            self._state = OPEN
+            self.next_attempt = time.time() + self.timeout
+            if tripped:
+                self.trips += 1
+            until = self.next_attempt
+        if tripped:
+            logger.warning("Circuit breaker '%s' opened for %ss after %s failures",
+                           self.name, self.timeout, self.failures)
+        if self.shared_state is not None:
+            self.shared_state.trip(self.name, until)
+
+    def call(self, operation: Callable, *args, **kwargs):
+        """Runs ``operation`` through the breaker (``CircuitOpenError`` when open)."""
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit breaker '{self.name}' is OPEN")
+        try:
+            result = operation(*args, **kwargs)
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+    async def execute(self, operation: Callable, *args, **kwargs):
+        """Async variant of ``call``; ``operation`` may return an awaitable."""
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit breaker '{self.name}' is OPEN")
+        try:
+            result = operation(*args, **kwargs)
+            if inspect.isawaitable(result):
+                result = await result
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {'state': self._state, 'failures': self.failures, 'trips': self.trips,
+                'retry_at': self.next_attempt if self._state == OPEN else None}
+
+
+class Bulkhead:
+    """
+    At most ``max_concurrent`` calls at once; a call that finds no slot waits
+    ``max_wait`` seconds (0: not at all) then fails with ``BulkheadFullError``.
+    """
+
+    def __init__(self, max_concurrent: int = 10, max_wait: float = 0.0, name: str = 'default'):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+        self.rejected = 0
+
+    def acquire(self):
+        acquired = (self._slots.acquire(timeout=self.max_wait) if self.max_wait > 0
+                    else self._slots.acquire(blocking=False))
+        with self._lock:
+            if not acquired:
+                self.rejected += 1
+                raise BulkheadFullError(f"Bulkhead '{self.name}' is full ({self.max_concurrent} calls in flight)")
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'max_concurrent': self.max_concurrent, 'in_flight': self.in_flight,
+                'peak': self.peak, 'rejected': self.rejected}
+
+
+class Dependency:
+    """Breaker, bulkhead and call timeout of one outbound dependency."""
+
+    def __init__(self, name: str, breaker: Optional[CircuitBreaker] = None, bulkhead: Optional[Bulkhead] = None,
+                 call_timeout: Optional[float] = None):
+        self.name = name
+        self.breaker = breaker or CircuitBreaker(name=name)
+        self.bulkhead = bulkhead
+        self.call_timeout = call_timeout or None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.counts = {'calls': 0, 'succeeded': 0, 'failed': 0, 'timeouts': 0, 'rejected': 0, 'short_circuited': 0}
+
+    def _count(self, outcome: str):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    workers = self.bulkhead.max_concurrent if self.bulkhead else 32
+                    self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"resilience-{self.name}")
+        return self._executor
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """
+        Calls ``fn(*args, **kwargs)`` under the bulkhead, the breaker and the
+        call timeout. Raises ``BulkheadFullError``, ``CircuitOpenError`` or
+        ``CallTimeoutError`` without waiting on the dependency.
+        """
+        self._count('calls')
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            raise CircuitOpenError(f"Circuit breaker '{self.name}' is OPEN")
+        if self.bulkhead is not None:
+            try:
+                self.bulkhead.acquire()
+            except BulkheadFullError:
+                self.breaker.cancel()
+                self._count('rejected')
+                raise
+        if self.call_timeout is None:
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self._failed(e)
+                raise
+            finally:
+                self._release()
+            self._succeeded()
+            return result
+
+        # The slot stays taken until the call really returns, even after a timeout
+        future = self.executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        future.add_done_callback(lambda _: self._release())
+        try:
+            result = future.result(timeout=self.call_timeout)
+        except FutureTimeoutError:
+            self._count('timeouts')
+            self._failed(None)
+            raise CallTimeoutError(f"'{self.name}' did not answer within {self.call_timeout}s") from None
+        except Exception as e:
+            self._failed(e)
+            raise
+        self._succeeded()
+        return result
+
+    def _release(self):
+        if self.bulkhead is not None:
+            self.bulkhead.release()
+
+    def _succeeded(self):
+        self._count('succeeded')
+        self.breaker.record_success()
+
+    def _failed(self, error: Optional[BaseException]):
+        self._count('failed')
+        self.breaker.record_failure(error)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.counts)
+        stats['breaker'] = self.breaker.stats()
+        stats['bulkhead'] = self.bulkhead.stats() if self.bulkhead else None
+        stats['call_timeout'] = self.call_timeout
+        return stats
+
+
+# Types returned as they are by ``resilient`` proxies
+_PLAIN = (str, bytes, int, float, bool, type(None), list, tuple, dict, set)
+
+
+class ResilientProxy:
+    """
+    Wraps a client so that each of its method calls, at any depth
+    (``client.chat.completions.create``), goes through ``dependency.call``.
+    """
+
+    def __init__(self, target, dependency: Dependency):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_dependency', dependency)
+
+    def __getattr__(self, name: str):
+        value = getattr(self._target, name)
+        if isinstance(value, _PLAIN) or inspect.isclass(value):
+            return value
+        if inspect.isroutine(value):
+            dependency = self._dependency
+
+            def guarded(*args, **kwargs):
+                return dependency.call(value, *args, **kwargs)
+
+            guarded.__name__ = getattr(value, '__name__', name)
+            guarded.__doc__ = getattr(value, '__doc__', None)
+            return guarded
+        return ResilientProxy(value, self._dependency)
+
+    def __setattr__(self, name: str, value):
+        setattr(self._target, name, value)
+
+    def __repr__(self):
+        return f"<resilient {self._dependency.name} {self._target!r}>"
+
+
+def _setting(name: str, key: str) -> float:
+    value = os.environ.get(f"RESILIENCE_{name.upper()}_{key.upper()}")
+    if value is not None:
+        return float(value)
+    return float(DEFAULTS.get(name, FALLBACK).get(key, 0))
+
+
+_shared_state: Optional[RedisBreakerState] = None
+_shared_state_loaded = False
+
+
+def shared_breaker_state() -> Optional[RedisBreakerState]:
+    """Redis state shared by the breakers when ``RESILIENCE_SHARED_STATE=redis``, else None."""
+    global _shared_state, _shared_state_loaded
+    if not _shared_state_loaded:
+        _shared_state_loaded = True
+        if os.environ.get('RESILIENCE_SHARED_STATE', '').lower() == 'redis':
+            if redis is None:
+                logger.warning("RESILIENCE_SHARED_STATE=redis but redis-py is not installed, breakers stay local")
+            else:
+                url = os.environ.get('RESILIENCE_REDIS_URL') or os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+                _shared_state = RedisBreakerState(redis.Redis.from_url(url, socket_timeout=0.5))
+    return _shared_state
+
+
+def build_dependency(name: str) -> Dependency:
+    """Dependency configured from ``DEFAULTS`` and the ``RESILIENCE_<NAME>_*`` variables."""
+    breaker = CircuitBreaker(
+        failure_threshold=int(_setting(name, 'failure_threshold')),
+        timeout=_setting(name, 'reset_timeout'),
+        name=name,
+        shared_state=shared_breaker_state(),
+        # A rejected request (bad input, expired key, context too long) is not an outage
+        excluded=client_error,
+    )
+    max_concurrent = int(_setting(name, 'max_concurrent'))
+    bulkhead = Bulkhead(max_concurrent, max_wait=_setting(name, 'max_wait'), name=name) if max_concurrent > 0 else None
+    return Dependency(name, breaker, bulkhead, call_timeout=_setting(name, 'call_timeout'))
+
+
+class DependencyRegistry:
+    """One ``Dependency`` per name and per process (rebuilt after a fork)."""
+
+    def __init__(self, factory: Callable[[str], Dependency] = build_dependency):
+        self.factory = factory
+        self._dependencies: Dict[str, Dependency] = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def get(self, name: str) -> Dependency:
+        if self._pid != os.getpid():
+            # Locks and executor threads of the parent are unusable in the child
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._dependencies = {}
+                    self._pid = os.getpid()
+        dependency = self._dependencies.get(name)
+        if dependency is None:
+            with self._lock:
+                dependency = self._dependencies.get(name)
+                if dependency is None:
+                    dependency = self._dependencies[name] = self.factory(name)
+        return dependency
+
+    def register(self, dependency: Dependency):
+        with self._lock:
+            self._dependencies[dependency.name] = dependency
+
+    def reset(self, *names: str):
+        with self._lock:
+            for name in names or tuple(self._dependencies):
+                self._dependencies.pop(name, None)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: dependency.stats() for name, dependency in list(self._dependencies.items())}
+
+
+registry = DependencyRegistry()
+
+
+def dependency(name: str) -> Dependency:
+    """Shared ``Dependency`` of the process for ``name``."""
+    return registry.get(name)
+
+
+def resilient(client, name: str):
+    """Proxy of ``client`` whose method calls go through ``dependency(name)``."""
+    if client is None or isinstance(client, ResilientProxy):
+        return client
+    return ResilientProxy(client, dependency(name))
@@ -0,0 +1,300 @@
+"""
+Deterministic SYSCOHADA journal entries for common documents, without the LLM.
+
+``AAgent`` sent every document to the LLM, even a plain purchase invoice whose
+entry is fully given by the ``achat_marchandises`` template. The templates of
+``AAgent._load_syscohada_templates`` are compiled once into rules whose
+accounts come from ``AccountingKnowledgeRDC`` (expense / revenue and
+counterparty accounts of the operation, VAT accounts of the chart).
+``SyscohadaRulesEngine.propose`` matches the extracted document (type,
+counterparty, tax lines, totals) against these rules and returns a balanced
+entry when its confidence reaches ``min_confidence``; otherwise it returns
+None and the caller falls through to the LLM.
+
+Usage::
+
+    engine = SyscohadaRulesEngine(templates)
+    result = engine.propose(extracted_data, intent)  # None: use the LLM
+
+Configuration: SYSCOHADA_FAST_PATH (``off`` disables the fast path),
+SYSCOHADA_FAST_PATH_MIN_CONFIDENCE (0.8).
+"""
+import logging
+import os
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional
+
+from financial_engine.knowledge_bases.accounting_rdc import AccountingKnowledgeRDC
+
+logger = logging.getLogger(__name__)
+
+PURCHASE = 'purchase'
+SALE = 'sale'
+
+# Templates of AAgent that a single document settles, with their AccountingKnowledgeRDC operation
+RULE_OPERATIONS = {
+    'achat_marchandises': ('EXPENSE', PURCHASE),
+    'vente_marchandises': ('SALE', SALE),
+}
+
+JOURNAL_CODES = {'purchases': 'AC', 'sales': 'VE', 'financial': 'BQ'}
+CASH_JOURNAL = 'CA'
+CASH_ACCOUNT = '571000'
+CASH_PAYMENTS = ('espèces', 'especes', 'cash', 'caisse', 'liquide')
+
+# VAT rates other than those of AccountingKnowledgeRDC (OHADA default of DocumentExtractor)
+EXTRA_TAX_RATES = (Decimal('18'), Decimal('5'))
+TAX_RATE_TOLERANCE = Decimal('0.5')
+CENT = Decimal('0.01')
+
+DEFAULT_MIN_CONFIDENCE = 0.8
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    """Accounts and journal of a template, resolved in the chart of AccountingKnowledgeRDC."""
+    name: str
+    direction: str
+    main_account: str
+    counterparty_account: str
+    tax_account: Optional[str]
+    journal: str
+    description: str
+    account_names: Dict[str, str] = field(hash=False, compare=False)
+
+
+@dataclass
+class RuleMatch:
+    rule: Optional[CompiledRule]
+    confidence: float
+    reasons: List[str]
+    proposal: Optional[Dict[str, Any]] = None
+
+
+def _resolve_account(code: str, chart: Dict[str, Any]) -> Optional[str]:
+    """Account of the chart for a template code: ``601`` -> ``601000``, ``4456`` -> ``445000``."""
+    prefix = str(code)
+    while prefix:
+        padded = prefix.ljust(6, '0')
+        if padded in chart:
+            return padded
+        candidates = sorted(account for account in chart if account.startswith(prefix))
+        if candidates:
+            return candidates[0]
+        prefix = prefix[:-1]
+    return None
+
+
+def compile_rules(templates: Dict[str, Dict[str, Any]], knowledge: AccountingKnowledgeRDC) -> Dict[str, CompiledRule]:
+    """Rules of the templates in ``RULE_OPERATIONS``, keyed by template name."""
+    bank = knowledge.get_account_mapping_for_operation('PAYMENT')['credit_account']
+    rules = {}
+    for name, (operation, direction) in RULE_OPERATIONS.items():
+        template = templates.get(name)
+        mapping = knowledge.get_account_mapping_for_operation(operation)
+        if not template or not mapping:
+            continue
+        # The expense or revenue account is the main line, the other one the counterparty
+        accounts = (mapping['debit_account'], mapping['credit_account'])
+        main = next(account for account in accounts if account[0] in '67')
+        counterparty = next(account for account in accounts if account != main)
+        tax_codes = [line['compte'] for side in ('debit', 'credit') for line in template.get(side, [])
+                     if str(line['compte']).startswith('44')]
+        tax = _resolve_account(tax_codes[0], knowledge.syscohada_accounts) if tax_codes else None
+        names = {account: knowledge.get_account_name(account)
+                 for account in (main, counterparty, tax, CASH_ACCOUNT, bank) if account}
+        rules[name] = CompiledRule(name, direction, main, counterparty, tax,
+                                   JOURNAL_CODES.get(mapping['journal_type'], 'OD'), mapping['description'], names)
+    return rules
+
+
+def _decimal(value) -> Decimal:
+    try:
+        return Decimal(str(value)) if value not in (None, '') else Decimal('0')
+    except InvalidOperation:
+        return Decimal('0')
+
+
+def _same_party(name, company_name: str) -> bool:
+    return ' '.join(str(name or '').lower().split()) == company_name
+
+
+def _direction(extracted_data: Dict[str, Any], company_name: Optional[str]) -> Optional[str]:
+    """PURCHASE / SALE of a document from the tenant company, None when it cannot be told."""
+    company_name = ' '.join(str(company_name or '').lower().split())
+    if not company_name:
+        return None
+    is_client = _same_party(extracted_data.get('client'), company_name)
+    is_supplier = _same_party(extracted_data.get('supplier'), company_name)
+    if is_client != is_supplier:
+        return PURCHASE if is_client else SALE
+    # A receipt usually names its issuer only: issued by another party, it was paid by the company
+    if (extracted_data.get('document_type') == 'receipt' and not is_supplier
+            and extracted_data.get('supplier') and not extracted_data.get('client')):
+        return PURCHASE
+    return None
+
+
+class SyscohadaRulesEngine:
+    """Balanced entries of purchase / sale invoices and receipts from compiled templates."""
+
+    def __init__(self, templates: Dict[str, Dict[str, Any]], knowledge: Optional[AccountingKnowledgeRDC] = None,
+                 min_confidence: Optional[float] = None):
+        self.knowledge = knowledge or AccountingKnowledgeRDC()
+        self.rules = compile_rules(templates, self.knowledge)
+        self.enabled = os.environ.get('SYSCOHADA_FAST_PATH', 'on').lower() not in ('off', '0', 'false', 'no')
+        self.min_confidence = (min_confidence if min_confidence is not None else
+                               float(os.environ.get('SYSCOHADA_FAST_PATH_MIN_CONFIDENCE', DEFAULT_MIN_CONFIDENCE)))
+        self.tax_rates = sorted({rate for name, rate in self.knowledge.tax_rates.items()
+                                 if name.startswith('tva') and rate > 0} | set(EXTRA_TAX_RATES))
+        self.bank_account = self.knowledge.get_account_mapping_for_operation('PAYMENT')['credit_account']
+        self._lock = threading.Lock()
+        self._stats = {'documents': 0, 'matched': 0, 'fallthrough': 0}
+        self._fallthrough_reasons = Counter()
+
+    def propose(self, extracted_data: Dict[str, Any], intent: Optional[str] = None,
+                company_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Result in the format of AAgent.process (``proposals``, ``confidence``,
+        ``informations_manquantes``, ``regles_appliquees``), or None when the
+        document must go to the LLM. ``company_name`` is the tenant company,
+        used to tell a purchase from a sale when the intent does not.
+        """
+        if not self.enabled:
+            return None
+        match = self.match(extracted_data, intent, company_name)
+        accepted = match.proposal is not None and match.confidence >= self.min_confidence
+        with self._lock:
+            self._stats['documents'] += 1
+            self._stats['matched' if accepted else 'fallthrough'] += 1
+            if not accepted:
+                self._fallthrough_reasons.update(match.reasons[:1] or ['low confidence'])
+        if not accepted:
+            return None
+        rule = match.rule
+        return {
+            'proposals': [match.proposal],
+            'confidence': match.confidence,
+            'informations_manquantes': match.reasons,
+            'regles_appliquees': [
+                f"Modèle SYSCOHADA {rule.name}",
+                f"Comptes {', '.join(sorted(rule.account_names))} (AccountingKnowledgeRDC)",
+            ],
+            'processing_method': 'syscohada_rules',
+            'token_usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+        }
+
+    def match(self, extracted_data: Dict[str, Any], intent: Optional[str] = None,
+              company_name: Optional[str] = None) -> RuleMatch:
+        """Best rule for a document with its confidence and the reasons that lowered it."""
+        document_type = extracted_data.get('document_type')
+        intent = str(intent or '').lower()
+        penalties: List[tuple] = []
+
+        if document_type not in ('invoice', 'receipt'):
+            return RuleMatch(None, 0.0, [f"Pas de modèle pour le type de document {document_type}"])
+        if 'vente' in intent:
+            direction = SALE
+        elif 'achat' in intent:
+            direction = PURCHASE
+        else:
+            # Generic intent (ecriture_simple...): the tenant company is the client of a purchase
+            # and the supplier of a sale, receipts included; without it the direction is left to the LLM
+            direction = _direction(extracted_data, company_name)
+            if direction is None:
+                return RuleMatch(None, 0.0, ["Sens du document inconnu (achat ou vente)"])
+            penalties.append((0.05, "Sens du document déduit de l'entreprise"))
+        rule = next((rule for rule in self.rules.values() if rule.direction == direction), None)
+        if rule is None:
+            return RuleMatch(None, 0.0, [f"Pas de modèle compilé pour {direction}"])
+
+        total = _decimal(extracted_data.get('total'))
+        subtotal = _decimal(extracted_data.get('subtotal'))
+        tax = _decimal(extracted_data.get('tax_total'))
+        if total <= 0:
+            return RuleMatch(rule, 0.0, ["Montant total introuvable"])
+        if subtotal > 0 and abs(subtotal + tax - total) > CENT:
+            # The stated tax line does not add up (often the rate read as the amount): derive it
+            tax = total - subtotal
+            if tax < 0:
+                return RuleMatch(rule, 0.0, ["Sous-total supérieur au total"])
+            penalties.append((0.05, "Montant de TVA recalculé (total - sous-total)"))
+        elif subtotal <= 0:
+            subtotal = total - tax
+        if tax > 0:
+            rate = tax / subtotal * 100 if subtotal > 0 else Decimal('100')
+            if not any(abs(rate - known) <= TAX_RATE_TOLERANCE for known in self.tax_rates):
+                penalties.append((0.3, f"Taux de TVA inhabituel ({rate:.1f}%)"))
+        if tax > 0 and not rule.tax_account:
+            return RuleMatch(rule, 0.0, ["Pas de compte de TVA pour ce modèle"])
+
+        amounts = [_decimal(item.get('amount')) for item in extracted_data.get('items') or [] if item.get('amount')]
+        if amounts and subtotal > 0 and abs(sum(amounts) - subtotal) > CENT * len(amounts):
+            penalties.append((0.2, "Les lignes ne correspondent pas au sous-total"))
+
+        counterparty = extracted_data.get('supplier' if direction == PURCHASE else 'client') or ''
+        if not counterparty:
+            penalties.append((0.2 if document_type == 'invoice' else 0.05,
+                              "Fournisseur non identifié" if direction == PURCHASE else "Client non identifié"))
+        if not extracted_data.get('date'):
+            penalties.append((0.15, "Date du document manquante"))
+        if not extracted_data.get('reference'):
+            penalties.append((0.05, "Référence du document manquante"))
+
+        confidence = round(max(0.0, 1.0 - sum(penalty for penalty, _ in penalties)), 2)
+        reasons = [reason for _, reason in sorted(penalties, key=lambda penalty: -penalty[0])]
+        proposal = self._entry(rule, extracted_data, subtotal, tax, total, counterparty, document_type)
+        return RuleMatch(rule, confidence, reasons, proposal)
+
+    def _entry(self, rule: CompiledRule, data: Dict[str, Any], subtotal: Decimal, tax: Decimal, total: Decimal,
+               counterparty: str, document_type: str) -> Optional[Dict[str, Any]]:
+        reference = data.get('reference') or ''
+        items = data.get('items') or []
+        subject = items[0].get('description') if items else None
+        suffix = ' - '.join(part for part in (f"Facture {reference}" if reference else '', counterparty) if part)
+
+        # A receipt is settled at once: treasury instead of the supplier / client account
+        settlement, journal = rule.counterparty_account, rule.journal
+        if document_type == 'receipt':
+            cash = (data.get('payment_method') or '').lower() in CASH_PAYMENTS
+            settlement, journal = (CASH_ACCOUNT, CASH_JOURNAL) if cash else (self.bank_account, JOURNAL_CODES['financial'])
+            suffix = ' - '.join(part for part in (f"Reçu {reference}" if reference else '', counterparty) if part)
+
+        def line(account, amount, label):
+            return {'compte': account, 'montant': float(amount.quantize(CENT)), 'libelle': f"{label} - {suffix}" if suffix else label}
+
+        nature = "Achat" if rule.direction == PURCHASE else "Vente"
+        title = f"{nature} {subject}" if subject else rule.description
+        main = [line(rule.main_account, subtotal, title)]
+        if tax > 0:
+            side = "déductible" if rule.direction == PURCHASE else "collectée"
+            main.append(line(rule.tax_account, tax, f"TVA {side}"))
+        other = [line(settlement, total, rule.account_names.get(settlement, settlement))]
+        debit, credit = (main, other) if rule.direction == PURCHASE else (other, main)
+
+        validation = self.knowledge.validate_journal_entry({
+            'date': data.get('date') or '-',
+            'description': title,
+            'lines': [{'account_code': entry['compte'], 'debit': entry['montant'], 'credit': 0} for entry in debit]
+                     + [{'account_code': entry['compte'], 'debit': 0, 'credit': entry['montant']} for entry in credit],
+        })
+        if not validation['is_valid']:
+            logger.warning("Rule %s produced an invalid entry: %s", rule.name, validation['errors'])
+            return None
+        return {
+            'description': title + (f" - {counterparty}" if counterparty else ''),
+            'date': data.get('date') or '',
+            'journal': journal,
+            'piece_reference': reference,
+            'debit': debit,
+            'credit': credit,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            documents = self._stats['documents']
+            return dict(self._stats, bypass_rate=round(self._stats['matched'] / documents, 4) if documents else 0.0,
+                        fallthrough_reasons=dict(self._fallthrough_reasons.most_common(10)))
@@ -0,0 +1,419 @@
+"""
+Deterministic summarizer for tabular uploads (Excel sheets, CSV files).
+
+Instead of sending stringified sheets to the LLM, the DDE agent builds a compact
+digest per sheet: detected header row, column types, date ranges, totals, top
+counterparties, outliers and a handful of representative rows. The digest is
+rendered under a fixed token budget so the prompt size no longer grows with the
+number of rows in the workbook.
+"""
+import math
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = 1200
+CHARS_PER_TOKEN = 4  # Same rough approximation as the TokenCounter fallback
+
+INVOICE_KEYWORDS = ['facture', 'invoice', 'client', 'customer', 'montant', 'amount', 'total', 'tva', 'tax']
+BANK_KEYWORDS = ['relevé', 'statement', 'compte', 'account', 'débit', 'crédit', 'solde', 'balance']
+LEDGER_KEYWORDS = ['journal', 'écriture', 'entry', 'comptable', 'ledger']
+AMOUNT_KEYWORDS = ['montant', 'amount', 'total', 'sum', 'débit', 'debit', 'crédit', 'credit', 'prix', 'valeur', 'solde']
+COUNTERPARTY_KEYWORDS = ['client', 'customer', 'fournisseur', 'supplier', 'vendor', 'tiers',
+                         'bénéficiaire', 'beneficiaire', 'partenaire', 'company', 'société']
+
+_NUMBER_RE = re.compile(r'^[-+]?\(?\d[\d\s .,\']*\)?$')
+_CURRENCY_RE = re.compile(r'\s*(?:fcfa|xof|xaf|cdf|fc|usd|eur|\$|€|f)\s*$', re.IGNORECASE)
+_DATE_FORMATS = ('%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%Y-%m-%d', '%Y/%m/%d', '%d/%m/%y', '%Y-%m-%d %H:%M:%S')
+_TOTAL_ROW_RE = re.compile(r'^\s*(?:sous[\s-]?)?total|^\s*(?:sub[\s-]?)?total|^\s*grand\s+total', re.IGNORECASE)
+_UNNAMED_RE = re.compile(r'^unnamed:\s*\d+$', re.IGNORECASE)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate, consistent with the TokenCounter fallback."""
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN)) if text else 0
+
+
+def classify_headers(headers: Sequence[Any]) -> str:
+    """
+    Guess the accounting document type represented by a table from its headers.
+    """
+    joined = ' '.join(str(h).lower() for h in headers)
+    if any(keyword in joined for keyword in INVOICE_KEYWORDS):
+        return "invoice"
+    if any(keyword in joined for keyword in BANK_KEYWORDS):
+        return "bank_statement"
+    if any(keyword in joined for keyword in LEDGER_KEYWORDS):
+        return "general_ledger"
+
+    cols = [str(h).lower() for h in headers]
+    date_cols = [col for col in cols if 'date' in col]
+    amount_cols = [col for col in cols if any(term in col for term in ['montant', 'amount', 'total', 'sum'])]
+    if date_cols and amount_cols:
+        return "financial_record"
+    return "unknown"
+
+
+def _is_empty(value: Any) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, float) and math.isnan(value):
+        return True
+    if isinstance(value, str) and (not value.strip() or _UNNAMED_RE.match(value.strip())):
+        return True
+    # pandas NaT / NA expose a failing equality with themselves
+    try:
+        return value != value
+    except Exception:
+        return False
+
+
+def parse_number(value: Any) -> Optional[float]:
+    """Parse a cell as a number, accepting '1 234,56', '1,234.56', '(120)' or '12 500 FC'."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        number = float(value)
+        return None if math.isnan(number) else number
+    if not isinstance(value, str):
+        return None
+
+    text = _CURRENCY_RE.sub('', value.strip())
+    if not text or not _NUMBER_RE.match(text):
+        return None
+    negative = text.startswith('-') or (text.startswith('(') and text.endswith(')'))
+    text = text.strip('()+-').replace(' ', '').replace('\xa0', '').replace("'", '')
+
+    if ',' in text and '.' in text:
+        # The right-most separator is the decimal one
+        if text.rfind(',') > text.rfind('.'):
+            text = text.replace('.', '').replace(',', '.')
+        else:
+            text = text.replace(',', '')
+    elif ',' in text:
+        head, _, tail = text.rpartition(',')
+        text = text.replace(',', '') if len(tail) == 3 and head.replace(',', '').isdigit() else head.replace(',', '') + '.' + tail
+    elif text.count('.') > 1:
+        text = text.replace('.', '')
+
+    try:
+        number = float(text)
+    except ValueError:
+        return None
+    return -number if negative else number
+
+
+def parse_date(value: Any) -> Optional[date]:
+    """Parse a cell as a date (datetime objects, pandas Timestamps or common string formats)."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if not isinstance(value, str):
+        return None
+    text = value.strip()
+    if len(text) < 6 or len(text) > 19 or not text[0].isdigit():
+        return None
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _format_amount(value: float) -> str:
+    if value == int(value):
+        return f"{int(value):,}".replace(',', ' ')
+    return f"{value:,.2f}".replace(',', ' ')
+
+
+def _short(value: Any, width: int = 30) -> str:
+    if _is_empty(value):
+        return ""
+    if isinstance(value, datetime):
+        text = value.strftime('%Y-%m-%d')
+    elif isinstance(value, float) and value == int(value):
+        text = str(int(value))
+    else:
+        text = str(value).replace('\n', ' ').strip()
+    return text if len(text) <= width else text[:width - 1] + '…'
+
+
+@dataclass
+class ColumnProfile:
+    """Statistics gathered for a single column."""
+    name: str
+    kind: str = "empty"  # number, date, text, empty
+    non_empty: int = 0
+    distinct: int = 0
+    total: Optional[float] = None
+    minimum: Optional[Any] = None
+    maximum: Optional[Any] = None
+
+
+@dataclass
+class SheetSummary:
+    """Deterministic summary of one table."""
+    sheet_name: str
+    header_row: int = 0
+    row_count: int = 0
+    column_count: int = 0
+    headers: List[str] = field(default_factory=list)
+    columns: List[ColumnProfile] = field(default_factory=list)
+    document_type: str = "unknown"
+    amount_column: Optional[str] = None
+    counterparty_column: Optional[str] = None
+    stated_totals: Dict[str, float] = field(default_factory=dict)
+    top_counterparties: List[Tuple[str, float, int]] = field(default_factory=list)
+    outliers: List[Dict[str, Any]] = field(default_factory=list)
+    sample_rows: List[List[str]] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializable form stored in the extraction details."""
+        return {
+            "sheet_name": self.sheet_name,
+            "header_row": self.header_row,
+            "rows": self.row_count,
+            "columns": self.column_count,
+            "document_type": self.document_type,
+            "amount_column": self.amount_column,
+            "counterparty_column": self.counterparty_column,
+            "column_types": {c.name: c.kind for c in self.columns},
+            "totals": {c.name: c.total for c in self.columns if c.kind == "number"},
+            "date_ranges": {
+                c.name: [c.minimum.isoformat(), c.maximum.isoformat()]
+                for c in self.columns if c.kind == "date" and c.minimum is not None
+            },
+            "stated_totals": self.stated_totals,
+            "top_counterparties": [
+                {"name": name, "amount": amount, "count": count}
+                for name, amount, count in self.top_counterparties
+            ],
+            "outliers": self.outliers,
+        }
+
+    def render_sections(self) -> List[str]:
+        """Digest sections, most important first, so that budgeting can drop the tail."""
+        sections = [f"--- SHEET DIGEST: {self.sheet_name} ({self.row_count} rows, {self.column_count} columns, "
+                    f"type: {self.document_type}) ---"]
+
+        col_desc = ", ".join(f"{c.name} [{c.kind}]" for c in self.columns if c.kind != "empty")
+        sections.append(f"Columns: {col_desc}")
+
+        totals = [f"{c.name}={_format_amount(c.total)}" for c in self.columns if c.kind == "number" and c.total is not None]
+        if totals:
+            line = "Computed totals: " + ", ".join(totals)
+            if self.stated_totals:
+                line += " | Stated totals: " + ", ".join(f"{k}={_format_amount(v)}" for k, v in self.stated_totals.items())
+            sections.append(line)
+
+        ranges = [f"{c.name}: {c.minimum.isoformat()} -> {c.maximum.isoformat()}"
+                  for c in self.columns if c.kind == "date" and c.minimum is not None]
+        if ranges:
+            sections.append("Date ranges: " + "; ".join(ranges))
+
+        if self.top_counterparties:
+            parties = "; ".join(f"{name} ({_format_amount(amount)}, {count} lines)"
+                                for name, amount, count in self.top_counterparties)
+            sections.append(f"Top counterparties ({self.counterparty_column}): {parties}")
+
+        if self.outliers:
+            items = "; ".join(f"row {o['row']} {o['column']}={_format_amount(o['value'])}" for o in self.outliers)
+            sections.append(f"Outliers: {items}")
+
+        if self.sample_rows:
+            lines = [" | ".join(self.headers)] + [" | ".join(r) for r in self.sample_rows]
+            sections.append(f"Sample rows ({len(self.sample_rows)} of {self.row_count}):\n" + "\n".join(lines))
+        return sections
+
+
+class TabularSummarizer:
+    """Builds deterministic, token-budgeted digests of spreadsheets."""
+
+    def __init__(self, token_budget: int = DEFAULT_TOKEN_BUDGET, sample_rows: int = 5,
+                 top_n: int = 5, header_scan_rows: int = 10, outlier_threshold: float = 3.5):
+        self.token_budget = token_budget
+        self.sample_rows = sample_rows
+        self.top_n = top_n
+        self.header_scan_rows = header_scan_rows
+        self.outlier_threshold = outlier_threshold
+
+    def summarize_dataframe(self, df, sheet_name: str = "Sheet1") -> SheetSummary:
+        """Summarize a pandas DataFrame, re-detecting the header when pandas picked the wrong row."""
+        rows = [list(df.columns)] + df.values.tolist()
+        return self.summarize_rows(rows, sheet_name)
+
+    def summarize_rows(self, rows: Sequence[Sequence[Any]], sheet_name: str = "Sheet1") -> SheetSummary:
+        """Summarize a table given as raw rows (header not yet identified)."""
+        rows = [list(r) for r in rows if any(not _is_empty(v) for v in r)]
+        summary = SheetSummary(sheet_name=sheet_name)
+        if not rows:
+            return summary
+
+        header_idx = self._detect_header_row(rows)
+        width = max(len(r) for r in rows)
+        raw_headers = rows[header_idx] + [None] * (width - len(rows[header_idx]))
+        headers = [str(h).strip() if not _is_empty(h) else f"col_{i + 1}" for i, h in enumerate(raw_headers)]
+        body = [r + [None] * (width - len(r)) for r in rows[header_idx + 1:]]
+
+        data_rows, total_rows = [], []
+        for index, row in enumerate(body):
+            is_total = any(isinstance(v, str) and _TOTAL_ROW_RE.match(v) for v in row)
+            (total_rows if is_total else data_rows).append((index, row))
+
+        summary.header_row = header_idx
+        summary.headers = headers
+        summary.row_count = len(data_rows)
+        summary.column_count = width
+        summary.columns = [self._profile_column(name, [row[i] for _, row in data_rows])
+                           for i, name in enumerate(headers)]
+        summary.document_type = classify_headers(headers)
+        summary.amount_column = self._pick_amount_column(summary.columns)
+        summary.counterparty_column = self._pick_counterparty_column(summary.columns, len(data_rows))
+
+        for _, row in total_rows:
+            for i, column in enumerate(summary.columns):
+                number = parse_number(row[i]) if column.kind == "number" else None
+                if number is not None:
+                    summary.stated_totals[column.name] = number
+
+        amount_idx = headers.index(summary.amount_column) if summary.amount_column else None
+        if amount_idx is not None:
+            summary.outliers = self._find_outliers(data_rows, amount_idx, summary.amount_column)
+            if summary.counterparty_column:
+                party_idx = headers.index(summary.counterparty_column)
+                summary.top_counterparties = self._top_counterparties(data_rows, party_idx, amount_idx)
+        summary.sample_rows = self._sample(data_rows, amount_idx, summary.outliers)
+        return summary
+
+    def build_digest(self, summaries: Sequence[SheetSummary], token_budget: Optional[int] = None) -> str:
+        """
+        Render the summaries into a single digest that never exceeds the token budget.
+        The budget is shared between sheets; lower-priority sections are dropped first.
+        """
+        budget = token_budget or self.token_budget
+        summaries = [s for s in summaries if s.row_count or s.headers]
+        if not summaries:
+            return "[Empty workbook]"
+
+        per_sheet = max(budget // len(summaries), 1)
+        parts = []
+        for summary in summaries:
+            rendered = ""
+            for section in summary.render_sections():
+                candidate = f"{rendered}\n{section}" if rendered else section
+                if estimate_tokens(candidate) > per_sheet:
+                    break
+                rendered = candidate
+            if not rendered:
+                rendered = summary.render_sections()[0][:per_sheet * CHARS_PER_TOKEN]
+            parts.append(rendered)
+
+        digest = "\n\n".join(parts)
+        max_chars = budget * CHARS_PER_TOKEN
+        return digest if len(digest) <= max_chars else digest[:max_chars]
+
+    def _detect_header_row(self, rows: List[List[Any]]) -> int:
+        """The header is the early row with the most textual, non-numeric cells."""
+        best_idx, best_score = 0, -1
+        for idx, row in enumerate(rows[:self.header_scan_rows]):
+            labels = [v for v in row if isinstance(v, str) and not _is_empty(v)
+                      and parse_number(v) is None and parse_date(v) is None]
+            score = len(labels)
+            if score > best_score:
+                best_idx, best_score = idx, score
+        return best_idx
+
+    def _profile_column(self, name: str, values: List[Any]) -> ColumnProfile:
+        profile = ColumnProfile(name=name)
+        present = [v for v in values if not _is_empty(v)]
+        profile.non_empty = len(present)
+        if not present:
+            return profile
+
+        numbers = [n for n in (parse_number(v) for v in present) if n is not None]
+        dates = [d for d in (parse_date(v) for v in present) if d is not None]
+        if len(dates) >= 0.8 * len(present) and len(dates) >= len(numbers):
+            profile.kind = "date"
+            profile.minimum, profile.maximum = min(dates), max(dates)
+        elif len(numbers) >= 0.8 * len(present):
+            profile.kind = "number"
+            profile.total = round(sum(numbers), 2)
+            profile.minimum, profile.maximum = min(numbers), max(numbers)
+        else:
+            profile.kind = "text"
+        profile.distinct = len({str(v) for v in present})
+        return profile
+
+    def _pick_amount_column(self, columns: List[ColumnProfile]) -> Optional[str]:
+        numeric = [c for c in columns if c.kind == "number"]
+        if not numeric:
+            return None
+        named = [c for c in numeric if any(k in c.name.lower() for k in AMOUNT_KEYWORDS)]
+        candidates = named or numeric
+        return max(candidates, key=lambda c: abs(c.total or 0)).name
+
+    def _pick_counterparty_column(self, columns: List[ColumnProfile], row_count: int) -> Optional[str]:
+        text_cols = [c for c in columns if c.kind == "text"]
+        for column in text_cols:
+            if any(k in column.name.lower() for k in COUNTERPARTY_KEYWORDS):
+                return column.name
+        # Otherwise a text column that repeats values (names) rather than free-form labels
+        for column in text_cols:
+            if 2 <= column.distinct <= max(2, row_count // 2):
+                return column.name
+        return None
+
+    def _top_counterparties(self, data_rows, party_idx: int, amount_idx: int) -> List[Tuple[str, float, int]]:
+        totals: Dict[str, List[float]] = {}
+        for _, row in data_rows:
+            party = row[party_idx]
+            if _is_empty(party):
+                continue
+            bucket = totals.setdefault(str(party).strip(), [0.0, 0])
+            bucket[0] += parse_number(row[amount_idx]) or 0.0
+            bucket[1] += 1
+        ranked = sorted(totals.items(), key=lambda item: abs(item[1][0]), reverse=True)[:self.top_n]
+        return [(_short(name), round(amount, 2), int(count)) for name, (amount, count) in ranked]
+
+    def _find_outliers(self, data_rows, amount_idx: int, column_name: str) -> List[Dict[str, Any]]:
+        """Robust z-score on the median absolute deviation, top entries by magnitude."""
+        values = [(index, parse_number(row[amount_idx])) for index, row in data_rows]
+        values = [(index, v) for index, v in values if v is not None]
+        if len(values) < 5:
+            return []
+        ordered = sorted(v for _, v in values)
+        median = ordered[len(ordered) // 2]
+        mad = sorted(abs(v - median) for v in ordered)[len(ordered) // 2]
+        if mad == 0:
+            return []
+        scored = [(abs(v - median) / (1.4826 * mad), index, v) for index, v in values]
+        flagged = sorted((s for s in scored if s[0] > self.outlier_threshold), reverse=True)[:self.top_n]
+        return [{"row": index + 1, "column": column_name, "value": value, "score": round(score, 1)}
+                for score, index, value in flagged]
+
+    def _sample(self, data_rows, amount_idx: Optional[int], outliers: List[Dict[str, Any]]) -> List[List[str]]:
+        """First rows, last row, the median-amount row and the top outlier."""
+        if not data_rows or self.sample_rows <= 0:
+            return []
+        picks = [0, 1, len(data_rows) - 1]
+        if amount_idx is not None:
+            by_amount = sorted(range(len(data_rows)),
+                               key=lambda i: parse_number(data_rows[i][1][amount_idx]) or 0.0)
+            picks.append(by_amount[len(by_amount) // 2])
+        if outliers:
+            picks.extend(pos for pos, (index, _) in enumerate(data_rows) if index + 1 == outliers[0]["row"])
+
+        chosen = []
+        for pos in picks:
+            if 0 <= pos < len(data_rows) and pos not in chosen:
+                chosen.append(pos)
+            if len(chosen) >= self.sample_rows:
+                break
+        return [[_short(v) for v in data_rows[pos][1]] for pos in sorted(chosen)]
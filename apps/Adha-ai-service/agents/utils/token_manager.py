@@ -1,7 +1,6 @@
 import os
 import time
 import tiktoken
-from openai import OpenAI
 from django.utils import timezone
 from django.db import transaction
 from api.models import TokenUsage, Company, UserProfile
@@ -13,7 +12,6 @@ class TokenCounter:
     def __init__(self, token_limit=None):
         self.token_limit = token_limit
         self.tokens_used = 0
-        self.client = OpenAI()
         self.usage_data = {
             "prompt_tokens": 0,
             "completion_tokens": 0,
@@ -21,6 +19,12 @@ class TokenCounter:
             "operations": 0
         }
         
+    @property
+    def client(self):
+        """Shared OpenAI client (one per process instead of one per counter)."""
+        from agents.utils.agent_pool import agent_pool
+        return agent_pool.get("openai_client")
+
     def num_tokens_from_string(self, string, model="gpt-4"):
         """Returns the number of tokens in a text string."""
         try:
@@ -3,6 +3,8 @@ import chromadb
 from chromadb.config import Settings
 from django.conf import settings
 
+from agents.utils.resilience import resilient
+
 class ChromaDBConnector:
     """
     Classe pour interagir avec ChromaDB, une base de données vectorielle.
@@ -19,13 +21,14 @@ class ChromaDBConnector:
         
         try:
             # Initialiser le client ChromaDB
-            self.client = chromadb.PersistentClient(
+            # Appels au client et aux collections sous disjoncteur et bulkhead ("chroma")
+            self.client = resilient(chromadb.PersistentClient(
                 path=persist_directory,
                 settings=Settings(
                     anonymized_telemetry=False,
                     allow_reset=True
                 )
-            )
+            ), "chroma")
             
             print(f"ChromaDB initialized with persistence directory: {persist_directory}")
         except Exception as e:
@@ -41,11 +44,11 @@ class ChromaDBConnector:
                 print("ChromaDB client not initialized")
                 return None
                 
-            return self.client.get_or_create_collection(
+            return resilient(self.client.get_or_create_collection(
                 name=name,
                 embedding_function=embedding_function,
                 metadata=metadata or {"description": f"Collection {name} for comptable_ia_api"}
-            )
+            ), "chroma")
         except Exception as e:
             print(f"Error getting or creating collection {name}: {e}")
             return None
@@ -59,7 +59,7 @@ class AdhaEventsProducer:
                 }
             }
             
-            self.producer.send(self.base_topic, event)
+            self.producer.publish(self.base_topic, event)
             
         except Exception as e:
             print(f"Error publishing AI response event: {str(e)}")
@@ -100,7 +100,7 @@ class AdhaEventsProducer:
                 }
             }
             
-            self.producer.send(self.base_topic, event)
+            self.producer.publish(self.base_topic, event)
             
         except Exception as e:
             print(f"Error publishing calculation event: {str(e)}")
@@ -136,7 +136,7 @@ class AdhaEventsProducer:
                 }
             }
             
-            self.producer.send('security-audit-events', event)
+            self.producer.publish('security-audit-events', event)
             
         except Exception as e:
             print(f"Error publishing isolation audit event: {str(e)}")
@@ -170,7 +170,7 @@ class AdhaEventsProducer:
                 }
             }
             
-            self.producer.send('performance-metrics', event)
+            self.producer.publish('performance-metrics', event)
             
         except Exception as e:
             print(f"Error publishing performance metrics: {str(e)}")
@@ -0,0 +1,358 @@
+"""
+Runtime asyncio des consumers Kafka pour les handlers limités par les I/O.
+
+Un handler de chat ou d'analyse passe l'essentiel de son temps à attendre
+OpenAI ou un service HTTP ; avec RobustKafkaConsumer, chaque thread worker ne
+traite qu'un message à la fois. ``AsyncKafkaConsumer`` fait tourner des
+handlers coroutines dans une seule boucle d'événements, sans thread
+supplémentaire :
+
+- client pluggable au sous-ensemble d'aiokafka (``start`` / ``getmany`` /
+  ``commit`` / ``stop``, ``pause`` / ``resume``) : ``AIOKafkaConsumer`` par
+  défaut, ``AsyncInMemoryConsumer`` du broker en mémoire pour les tests ;
+- des centaines de messages en cours par processus, bornés par
+  ``async_max_in_flight`` : au-delà, les partitions sont mises en pause
+  (voir flow_control) ;
+- ordre par clé : les messages d'une même clé (entreprise, institution) sont
+  traités l'un après l'autre par une tâche dédiée, les clés différentes en
+  parallèle ;
+- commits au moins une fois : offsets commités par lot une fois leur message
+  et tous les précédents de la partition terminés (PartitionOffsetTracker),
+  limités aux partitions encore assignées ; au rebalance, les partitions
+  révoquées sont drainées et commitées puis oubliées (``CommitOnRevoke``) ;
+- arrêt coopératif : ``stop()`` (thread-safe, utilisable dans un gestionnaire
+  de signal) arrête la lecture, laisse finir les messages en cours pendant
+  ``drain_timeout``, commite leurs offsets puis ferme le client ;
+- ``BoundedLLM`` limite les appels LLM simultanés du processus
+  (``llm_max_concurrency``), quel que soit le nombre de messages en cours.
+
+Les handlers synchrones sont acceptés mais bloquent la boucle : ils doivent
+rester courts.
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+from . import message_codec
+from .consumer_metrics import ConsumerMetrics
+from .flow_control import FlowController
+from .keyed_worker_pool import PartitionOffsetTracker
+from .robust_kafka_client import KafkaConfig, MessageStandardizer, RobustKafkaConsumer, kafka_config
+
+try:
+    from aiokafka import AIOKafkaConsumer
+    from aiokafka.abc import ConsumerRebalanceListener
+except ImportError:
+    # aiokafka absent : client injecté (broker en mémoire, voir in_memory_broker)
+    AIOKafkaConsumer = None
+    ConsumerRebalanceListener = object
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedLLM:
+    """
+    Client LLM asynchrone (``AsyncOpenAI`` ou équivalent) dont les appels
+    ``chat.completions.create`` simultanés sont limités à ``limit``.
+    """
+
+    def __init__(self, client, limit: Optional[int] = None):
+        self.client = client
+        self.limit = limit or kafka_config.llm_max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.stats = {'calls': 0, 'in_flight': 0, 'peak_in_flight': 0, 'waited': 0}
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Créé à la première utilisation, dans la boucle qui l'utilise
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        return self._semaphore
+
+    async def create(self, **kwargs):
+        if self.semaphore.locked():
+            self.stats['waited'] += 1
+        async with self.semaphore:
+            self.stats['calls'] += 1
+            self.stats['in_flight'] += 1
+            self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], self.stats['in_flight'])
+            try:
+                return await self.client.chat.completions.create(**kwargs)
+            finally:
+                self.stats['in_flight'] -= 1
+
+
+class CommitOnRevoke(ConsumerRebalanceListener):
+    """
+    Écouteur de rebalance d'AsyncKafkaConsumer : avant que le groupe ne
+    réattribue une partition, ses messages en cours sont terminés, ses offsets
+    commités, puis elle est oubliée (positions en attente et suivi).
+    """
+
+    def __init__(self, consumer: 'AsyncKafkaConsumer'):
+        self.consumer = consumer
+
+    async def on_partitions_revoked(self, revoked):
+        await self.consumer._on_partitions_revoked(list(revoked))
+
+    async def on_partitions_assigned(self, assigned):
+        logger.info(f"Async consumer {self.consumer.group_id}: partitions assigned: {list(assigned)}")
+
+
+class AsyncKafkaConsumer:
+    """
+    Consumer Kafka asyncio : handlers coroutines, ordre par clé, messages en
+    cours bornés, commits par lot et arrêt coopératif (voir le module).
+    """
+
+    def __init__(self, topics: List[str], group_id: str, client=None, config: Optional[KafkaConfig] = None,
+                 max_in_flight: Optional[int] = None, resume_in_flight: Optional[int] = None,
+                 drain_timeout: float = 30.0):
+        self.config = config or kafka_config
+        self.topics = topics
+        self.group_id = group_id
+        self.client = client
+        self.max_in_flight = max_in_flight or self.config.async_max_in_flight
+        self.resume_in_flight = resume_in_flight if resume_in_flight is not None else min(
+            self.config.async_resume_in_flight, self.max_in_flight // 2)
+        self.drain_timeout = drain_timeout
+        self.handlers: Dict[str, Callable] = {}
+        self.error_handler: Optional[Callable] = None
+        self.tracker = PartitionOffsetTracker()
+        self.metrics = ConsumerMetrics(group_id)
+        self.flow: Optional[FlowController] = None
+        self.last_poll_at: Optional[float] = None  # Dernier tour de la boucle de poll (epoch, s)
+        self.stats = {'commits': 0, 'failed_commits': 0, 'cancelled': 0}
+        self._keys: Dict[Any, deque] = {}  # Clé -> messages en attente de sa tâche
+        self._tasks = set()
+        self._pending: Dict[Any, int] = {}  # Positions terminées pas encore commitées
+        self._completed_seen = 0
+        self._last_commit = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._progress: Optional[asyncio.Event] = None
+        self._stop_requested = False
+
+    def register_handler(self, topic: str, handler: Callable):
+        """Enregistre un handler (coroutine de préférence) pour un topic"""
+        self.handlers[topic] = handler
+
+    def register_error_handler(self, handler: Callable):
+        """Enregistre un handler d'erreur (exception, enregistrement), coroutine ou non"""
+        self.error_handler = handler
+
+    def _create_client(self):
+        if AIOKafkaConsumer is None:
+            raise RuntimeError("aiokafka is not installed and no client was provided")
+        # Topics souscrits dans run() avec l'écouteur de rebalance
+        return AIOKafkaConsumer(
+            bootstrap_servers=','.join(self.config.brokers),
+            client_id=f"{self.config.client_id}-async-consumer",
+            group_id=self.group_id,
+            value_deserializer=message_codec.decode,
+            auto_offset_reset='earliest',
+            enable_auto_commit=False,
+            max_poll_records=self.config.max_poll_records,
+        )
+
+    @property
+    def in_flight(self) -> int:
+        """Enregistrements reçus et pas encore terminés"""
+        return self.tracker.in_flight()
+
+    def start_consuming(self):
+        """Point d'entrée bloquant (processus consumer, voir consumer_supervisor)"""
+        asyncio.run(self.run())
+
+    async def run(self):
+        """Boucle de lecture jusqu'à ``stop()``, puis drain, commit final et fermeture du client"""
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._progress = asyncio.Event()
+        if self._stop_requested:
+            self._stopping.set()
+        if self.client is None:
+            self.client = self._create_client()
+        self.client.subscribe(self.topics, listener=CommitOnRevoke(self))
+        await self.client.start()
+        self.flow = FlowController(self.client, self.max_in_flight, self.resume_in_flight, name='async')
+        logger.info(f"Async consumer {self.group_id} started for topics: {self.topics}")
+        try:
+            while not self._stopping.is_set():
+                self.last_poll_at = time.time()
+                if self.flow.update(self.in_flight):
+                    await self._wait_for_progress()
+                    timeout_ms = 0
+                else:
+                    timeout_ms = self.config.poll_timeout_ms
+                batch = await self._getmany(timeout_ms)
+                for tp, records in batch.items():
+                    for record in records:
+                        self.tracker.track(tp, record.offset)
+                        self._dispatch(tp, record)
+                await self._maybe_commit()
+        finally:
+            await self._drain()
+            await self._commit()
+            await self.client.stop()
+            logger.info(f"Async consumer {self.group_id} stopped")
+
+    async def _getmany(self, timeout_ms: int):
+        # Réveillé par stop() sans attendre la fin du timeout
+        getmany = asyncio.ensure_future(
+            self.client.getmany(timeout_ms=timeout_ms, max_records=self.config.max_poll_records))
+        stopping = asyncio.ensure_future(self._stopping.wait())
+        await asyncio.wait([getmany, stopping], return_when=asyncio.FIRST_COMPLETED)
+        stopping.cancel()
+        if not getmany.done():
+            getmany.cancel()
+            return {}
+        return getmany.result()
+
+    async def _wait_for_progress(self):
+        """Partitions en pause : attend qu'un message se termine (ou le timeout de poll)"""
+        self._progress.clear()
+        try:
+            await asyncio.wait_for(self._progress.wait(), self.config.poll_timeout_ms / 1000.0)
+        except asyncio.TimeoutError:
+            pass
+
+    def _dispatch(self, tp, record):
+        key = RobustKafkaConsumer._routing_key(record)
+        waiting = self._keys.get(key)
+        if waiting is not None:
+            # Une tâche sert déjà cette clé : le message passera après les précédents
+            waiting.append((tp, record))
+            return
+        self._keys[key] = deque([(tp, record)])
+        task = asyncio.create_task(self._serve_key(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _serve_key(self, key):
+        waiting = self._keys[key]
+        try:
+            while waiting:
+                tp, record = waiting[0]
+                await self._process(record)
+                waiting.popleft()
+                self.tracker.complete(tp, record.offset)
+                self._progress.set()
+        finally:
+            del self._keys[key]
+
+    async def _process(self, record):
+        topic = record.topic
+        handler = self.handlers.get(topic)
+        if handler is None:
+            logger.warning(f"No handler registered for topic: {topic}")
+            return
+        message = MessageStandardizer.convert_from_typescript(record.value)
+        if not RobustKafkaConsumer._validate_message(message):
+            logger.warning(f"Invalid message format from {topic}")
+            return
+        message['metadata'].setdefault('kafka_topic', topic)
+        started = time.perf_counter()
+        try:
+            result = handler(message)
+            if inspect.isawaitable(result):
+                await result
+            self.metrics.observe(topic, handler, 1, time.perf_counter() - started)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.metrics.observe(topic, handler, 1, time.perf_counter() - started, failed=True)
+            logger.error(f"Error processing message from {topic}: {str(e)}")
+            if self.error_handler:
+                try:
+                    result = self.error_handler(e, record)
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception as handler_error:
+                    logger.error(f"Error handler failed for message from {topic}: {str(handler_error)}")
+
+    def _collect(self):
+        for tp, position in self.tracker.committable().items():
+            if position > self._pending.get(tp, -1):
+                self._pending[tp] = position
+
+    async def _maybe_commit(self):
+        self._collect()
+        if not self._pending:
+            return
+        due = time.monotonic() - self._last_commit >= self.config.commit_interval_ms / 1000.0
+        if due or self.tracker.completed - self._completed_seen >= self.config.commit_batch_size:
+            await self._commit()
+
+    async def _commit(self):
+        self._collect()
+        offsets, self._pending = self._pending, {}
+        self._completed_seen = self.tracker.completed
+        self._last_commit = time.monotonic()
+        # Une partition réattribuée ne se commite plus : son nouveau propriétaire la relit
+        assigned = set(self.client.assignment())
+        offsets = {tp: position for tp, position in offsets.items() if tp in assigned}
+        if not offsets:
+            return
+        try:
+            await self.client.commit(offsets)
+            self.stats['commits'] += 1
+        except Exception as e:
+            self.stats['failed_commits'] += 1
+            # Le commit suivant couvrira ces offsets
+            for tp, position in offsets.items():
+                if position > self._pending.get(tp, -1):
+                    self._pending[tp] = position
+            logger.warning(f"Offset commit failed, will retry: {str(e)}")
+
+    async def _on_partitions_revoked(self, revoked):
+        """Termine les messages en cours des partitions révoquées (``drain_timeout``), commite, oublie"""
+        if not revoked:
+            return
+        deadline = time.monotonic() + self.drain_timeout
+        while any(self.tracker.in_flight(tp) for tp in revoked) and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        await self._commit()
+        self.tracker.forget(revoked)
+        for tp in revoked:
+            self._pending.pop(tp, None)
+        logger.info(f"Async consumer {self.group_id}: partitions revoked after commit: {revoked}")
+
+    async def _drain(self):
+        """Laisse finir les messages en cours ; au-delà de ``drain_timeout``, ils seront relus"""
+        if not self._tasks:
+            return
+        logger.info(f"Async consumer {self.group_id}: draining {self.in_flight} messages in flight")
+        _, pending = await asyncio.wait(list(self._tasks), timeout=self.drain_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            self.stats['cancelled'] += len(pending)
+            await asyncio.wait(pending)
+            logger.warning(f"Async consumer {self.group_id}: {len(pending)} keys still busy after "
+                           f"{self.drain_timeout}s, their messages will be redelivered")
+
+    def stop(self):
+        """Arrêt coopératif, depuis la boucle, un autre thread ou un gestionnaire de signal"""
+        self._stop_requested = True
+        if self._loop is not None and self._stopping is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    def health_check(self) -> Dict[str, Any]:
+        return {
+            'status': 'healthy' if self._stopping is not None and not self._stopping.is_set() else 'stopped',
+            'last_poll_at': self.last_poll_at,
+            'topics': self.topics,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'active_keys': len(self._keys),
+            'stats': dict(self.stats),
+            'backpressure': self.flow.snapshot() if self.flow else None,
+            'metrics': self.metrics.snapshot(),
+        }
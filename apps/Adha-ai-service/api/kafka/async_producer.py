@@ -0,0 +1,236 @@
+"""
+Producer Kafka non bloquant.
+
+``send`` dépose le message dans le buffer du client Kafka et rend la main sans
+attendre le broker : le client regroupe les envois (``linger_ms``,
+``batch_size``), les compresse (lz4 / zstd) et les résultats arrivent par
+callbacks. L'idempotence est activée, ce qui garde l'ordre par partition avec
+plusieurs requêtes en vol (au lieu d'une seule). Un message non délivré (envoi
+refusé ou acquittement en erreur) est écrit dans le spool local
+(delivery_spool) et renvoyé par ``replay_spool`` : au démarrage puis
+périodiquement par un thread dédié (``start_replay``), ou à la demande
+(commande ``replay_kafka_spool``).
+"""
+
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from . import message_codec
+from .delivery_spool import DeliverySpool
+
+try:
+    from kafka import KafkaProducer
+except ImportError:
+    # kafka-python absent (tests avec le broker en mémoire, voir in_memory_broker)
+    KafkaProducer = None
+
+logger = logging.getLogger(__name__)
+
+# Préférence de compression, puis repli si la bibliothèque de codec manque
+_COMPRESSION_FALLBACK = ['lz4', 'zstd', 'snappy', 'gzip']
+
+
+def available_compression(preferred: str) -> Optional[str]:
+    """Codec utilisable par kafka-python, en partant de ``preferred``."""
+    if not preferred or preferred == 'none':
+        return None
+    try:
+        from kafka import codec
+    except ImportError:
+        return preferred
+    checks = {
+        'lz4': codec.has_lz4, 'zstd': getattr(codec, 'has_zstd', lambda: False),
+        'snappy': codec.has_snappy, 'gzip': codec.has_gzip,
+    }
+    candidates = [preferred] + [name for name in _COMPRESSION_FALLBACK if name != preferred]
+    for name in candidates:
+        if name in checks and checks[name]():
+            if name != preferred:
+                logger.warning(f"Kafka compression '{preferred}' unavailable, using '{name}'")
+            return name
+    return None
+
+
+class AsyncKafkaProducer:
+    """
+    Producer asynchrone : ``send`` est non bloquant, les livraisons sont suivies
+    par callbacks et les échecs vont dans le spool local.
+
+    ``on_delivery`` / ``on_failure`` permettent d'observer les résultats
+    (circuit breaker, métriques) ; ils sont appelés depuis le thread d'I/O du
+    client Kafka et doivent rester rapides.
+    """
+
+    def __init__(self, config, producer=None, spool: Optional[DeliverySpool] = None,
+                 bootstrap_servers=None, value_serializer=None):
+        self.config = config
+        self.bootstrap_servers = bootstrap_servers or config.brokers
+        # Callable ou kafka.serializer.Serializer (sérialisation par topic, voir shared_producer)
+        self.value_serializer = value_serializer or message_codec.dumps
+        self.spool = spool or DeliverySpool(config.producer_spool_path)
+        self.on_delivery: Optional[Callable[[Any], Any]] = None
+        self.on_failure: Optional[Callable[[Exception], Any]] = None
+        self.stats = {'sent': 0, 'delivered': 0, 'failed': 0, 'spooled': 0, 'replayed': 0}
+        self._producer = producer
+        self._lock = threading.Lock()
+        self._replay_lock = threading.Lock()  # Un seul renvoi à la fois (mêmes lignes du spool)
+        self._replay_thread: Optional[threading.Thread] = None
+        self._replay_stop = threading.Event()
+
+    @property
+    def producer(self):
+        if self._producer is None:
+            with self._lock:
+                if self._producer is None:
+                    self._producer = self._create_producer()
+        return self._producer
+
+    def _create_producer(self):
+        options = dict(
+            bootstrap_servers=self.bootstrap_servers,
+            client_id=self.config.client_id,
+            value_serializer=self.value_serializer,
+            key_serializer=lambda k: k.encode('utf-8') if isinstance(k, str) else k,
+            acks='all',
+            retries=self.config.retries,
+            request_timeout_ms=self.config.request_timeout,
+            retry_backoff_ms=self.config.retry_config['initial_retry_time'],
+            linger_ms=self.config.producer_linger_ms,
+            batch_size=self.config.producer_batch_size,
+            compression_type=available_compression(self.config.producer_compression),
+            # Borne le temps passé dans send() quand le buffer est plein ou le broker absent
+            max_block_ms=self.config.producer_max_block_ms,
+        )
+        try:
+            producer = KafkaProducer(
+                enable_idempotence=True, max_in_flight_requests_per_connection=5, **options
+            )
+        except AssertionError:
+            # kafka-python < 2.1 ne connaît pas enable_idempotence : une requête en vol garde l'ordre
+            logger.warning("Kafka producer idempotence unsupported, limiting in-flight requests to 1")
+            producer = KafkaProducer(max_in_flight_requests_per_connection=1, **options)
+        logger.info(f"Async Kafka producer initialized with brokers: {self.bootstrap_servers} "
+                    f"(linger {self.config.producer_linger_ms}ms, "
+                    f"compression {options['compression_type']})")
+        return producer
+
+    def send(self, topic: str, value: Any, key=None, headers: Optional[list] = None):
+        """
+        Envoie un message sans attendre le broker.
+
+        Returns:
+            Le future du client Kafka, ou None si le message a été directement spoolé
+        """
+        self._count('sent')
+        try:
+            future = self.producer.send(topic, value=value, key=key, headers=headers)
+        except Exception as e:
+            self._on_failed(topic, value, key, headers, e)
+            return None
+        future.add_callback(self._on_delivered)
+        future.add_errback(self._on_failed, topic, value, key, headers)
+        return future
+
+    def spool_message(self, topic: str, value: Any, key=None, headers: Optional[list] = None,
+                      error: Optional[str] = None):
+        """Conserve un message sans tenter l'envoi (circuit ouvert)"""
+        self.spool.append(topic, value, key=key, headers=headers, error=error)
+        self._count('spooled')
+
+    def _on_delivered(self, record_metadata):
+        self._count('delivered')
+        if self.on_delivery:
+            self.on_delivery(record_metadata)
+
+    def _on_failed(self, topic, value, key, headers, exception):
+        self._count('failed')
+        logger.error(f"Kafka delivery to {topic} failed, message spooled: {str(exception)}")
+        try:
+            self.spool_message(topic, value, key, headers, error=str(exception))
+        except Exception as spool_error:
+            logger.critical(f"Failed to spool undelivered message for {topic}: {str(spool_error)}")
+        if self.on_failure:
+            self.on_failure(exception)
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def replay_spool(self, limit: int = 500, timeout: float = 30) -> int:
+        """
+        Renvoie les messages du spool ; seuls les messages acquittés en sont retirés.
+
+        Returns:
+            int: nombre de messages renvoyés
+        """
+        with self._replay_lock:
+            return self._replay(limit, timeout)
+
+    def _replay(self, limit: int, timeout: float) -> int:
+        pending = self.spool.pending(limit)
+        futures = []
+        for row_id, topic, value, key, headers in pending:
+            try:
+                futures.append((row_id, self.producer.send(topic, value=value, key=key, headers=headers or None)))
+            except Exception as e:
+                logger.warning(f"Spool replay interrupted: {str(e)}")
+                break
+        if not futures:
+            return 0
+        self.producer.flush(timeout=timeout)
+        delivered = [row_id for row_id, future in futures if future.succeeded()]
+        self.spool.remove(delivered)
+        self._count('replayed', len(delivered))
+        logger.info(f"Replayed {len(delivered)}/{len(pending)} spooled Kafka messages")
+        return len(delivered)
+
+    def start_replay(self, interval: float, replay: Optional[Callable[[], int]] = None):
+        """
+        Renvoie le spool tout de suite puis toutes les ``interval`` secondes,
+        dans un thread dédié, quand il n'est pas vide. ``replay`` remplace
+        ``replay_spool`` (par exemple pour passer par le circuit breaker).
+        Sans effet si ``interval`` est nul ou le thread déjà lancé.
+        """
+        if interval <= 0 or self._replay_thread is not None:
+            return
+        self._replay_stop.clear()
+        self._replay_thread = threading.Thread(
+            target=self._replay_loop, args=(interval, replay or self.replay_spool),
+            name='kafka-spool-replay', daemon=True
+        )
+        self._replay_thread.start()
+
+    def _replay_loop(self, interval: float, replay: Callable[[], int]):
+        while True:
+            try:
+                if len(self.spool):
+                    replay()
+            except Exception as e:
+                logger.error(f"Spool replay failed: {str(e)}")
+            if self._replay_stop.wait(interval):
+                return
+
+    def stop_replay(self, timeout: Optional[float] = None):
+        if self._replay_thread is not None:
+            self._replay_stop.set()
+            self._replay_thread.join(timeout)
+            self._replay_thread = None
+
+    def flush(self, timeout: Optional[float] = None):
+        if self._producer is not None:
+            self._producer.flush(timeout=timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        """Vide le buffer (messages en linger) puis ferme le client"""
+        self.stop_replay(timeout)
+        if self._producer is not None:
+            self._producer.flush(timeout=timeout)
+            self._producer.close(timeout=timeout)
+            self._producer = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        stats['spool_size'] = len(self.spool)
+        return stats
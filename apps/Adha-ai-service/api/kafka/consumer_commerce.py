@@ -4,6 +4,7 @@ from kafka import KafkaConsumer
 import os
 from api.services.accounting_processor import process_business_operation
 from api.kafka.producer_accounting import send_journal_entry_to_accounting
+from api.kafka.idempotency import IdempotencyGuard, idempotency_key
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +24,9 @@ def start_commerce_consumer():
         value_deserializer=lambda x: json.loads(x.decode('utf-8'))
     )
 
+    # Même registre que le consommateur unifié : une opération n'est traitée qu'une fois
+    idempotency = IdempotencyGuard()
+
     logger.info("Commerce operations consumer started. Waiting for messages...")
 
     for message in consumer:
@@ -35,6 +39,13 @@ def start_commerce_consumer():
             logger.error(f"Missing clientId in operation {operation_data.get('id', 'unknown')}, skipping")
             continue
             
+        key = idempotency_key(operation_data, message.topic)
+        record = idempotency.claim(key) if key else None
+        if record is not None:
+            # Écriture déjà générée et publiée par l'autre consommateur
+            logger.info(f"Operation {operation_data.get('id', 'unknown')} already handled ({record.get('state')}), skipping")
+            continue
+            
         # Transformer en écriture comptable
         try:
             journal_entry = process_business_operation(operation_data)
@@ -43,10 +54,16 @@ def start_commerce_consumer():
             if journal_entry:
                 send_journal_entry_to_accounting(journal_entry)
                 logger.info(f"Sent journal entry to accounting for operation {operation_data.get('id', 'unknown')}")
+                if key:
+                    idempotency.complete(key, {"type": "accounting_response", "journal_entry": journal_entry})
             else:
                 logger.warning(f"No journal entry generated for operation {operation_data.get('id', 'unknown')}")
+                if key:
+                    idempotency.release(key)
         except Exception as e:
             logger.error(f"Error processing operation {operation_data.get('id', 'unknown')}: {str(e)}")
+            if key:
+                idempotency.release(key)
 
 if __name__ == "__main__":
     # Pour les tests locaux
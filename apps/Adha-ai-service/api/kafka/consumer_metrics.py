@@ -0,0 +1,196 @@
+"""
+Métriques des consumers Kafka.
+
+- Lag par topic/partition (offset de fin moins offset commité du groupe),
+  relevé en arrière-plan toutes les ``KAFKA_LAG_INTERVAL_S`` secondes par un
+  client dédié (un KafkaConsumer n'est pas utilisable depuis deux threads) :
+  rien n'est calculé par message.
+- Enregistrements consommés par topic (débit : ``rate()`` côté Prometheus,
+  fenêtre glissante dans ``snapshot()``).
+- Latence des handlers, par handler.
+- Retries et envois en DLQ (RetryScheduler).
+
+Les métriques passent par prometheus_client quand il est installé ; en mode
+multiprocessus (``PROMETHEUS_MULTIPROC_DIR``), les processus des consumers
+écrivent dans le même répertoire que les workers gunicorn et la vue
+``/metrics/`` agrège le tout (voir adha_ai_service.metrics).
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+LATENCY_SAMPLES = 1024
+THROUGHPUT_WINDOW_S = 60
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram
+
+    CONSUMER_LAG = Gauge(
+        'adha_ai_kafka_consumer_lag',
+        'Records not yet committed by the consumer group (end offset - committed offset)',
+        ['group', 'topic', 'partition'], multiprocess_mode='livemax'
+    )
+    CONSUMED_RECORDS = Counter(
+        'adha_ai_kafka_consumed_records_total',
+        'Records handed to a consumer handler, by outcome',
+        ['group', 'topic', 'outcome']
+    )
+    HANDLER_LATENCY = Histogram(
+        'adha_ai_kafka_handler_seconds',
+        'Time spent in a consumer handler call (one message or one batch)',
+        ['group', 'topic', 'handler'],
+        buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+    )
+    RETRIED_MESSAGES = Counter(
+        'adha_ai_kafka_retried_messages_total',
+        'Messages republished on a retry topic',
+        ['topic', 'tier']
+    )
+    DEAD_LETTERED_MESSAGES = Counter(
+        'adha_ai_kafka_dead_lettered_messages_total',
+        'Messages sent to the dead letter queue',
+        ['topic', 'reason']
+    )
+except ImportError:  # pragma: no cover - prometheus_client absent
+    CONSUMER_LAG = CONSUMED_RECORDS = HANDLER_LATENCY = RETRIED_MESSAGES = DEAD_LETTERED_MESSAGES = None
+
+
+def mark_process_dead(pid: Optional[int] = None):
+    """Retire les jauges d'un processus arrêté des agrégats multiprocessus"""
+    if CONSUMER_LAG is not None and os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+
+def handler_name(handler: Callable) -> str:
+    return getattr(handler, '__qualname__', None) or type(handler).__name__
+
+
+def record_retry(topic: str, tier: str):
+    if RETRIED_MESSAGES is not None:
+        RETRIED_MESSAGES.labels(topic=topic, tier=tier).inc()
+
+
+def record_dead_letter(topic: str, reason: str):
+    if DEAD_LETTERED_MESSAGES is not None:
+        DEAD_LETTERED_MESSAGES.labels(topic=str(topic), reason=reason).inc()
+
+
+class ConsumerMetrics:
+    """Compteurs, latences et lag d'un groupe de consommateurs (processus courant)"""
+
+    def __init__(self, group_id: str):
+        self.group_id = group_id
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = defaultdict(lambda: {'processed': 0, 'failed': 0})
+        self._latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES))
+        self._recent: Dict[str, deque] = defaultdict(deque)  # (instant, enregistrements)
+        self.lag: Dict[Any, int] = {}
+        self.lag_updated_at: Optional[float] = None
+
+    def observe(self, topic: str, handler: Callable, records: int, seconds: float, failed: bool = False):
+        """Un appel de handler : ``records`` enregistrements traités en ``seconds``"""
+        outcome = 'failed' if failed else 'processed'
+        name = handler_name(handler)
+        now = time.monotonic()
+        with self._lock:
+            self._counts[topic][outcome] += records
+            self._latencies[name].append(seconds)
+            recent = self._recent[topic]
+            recent.append((now, records))
+            while recent and recent[0][0] < now - THROUGHPUT_WINDOW_S:
+                recent.popleft()
+        if CONSUMED_RECORDS is not None:
+            CONSUMED_RECORDS.labels(group=self.group_id, topic=topic, outcome=outcome).inc(records)
+            HANDLER_LATENCY.labels(group=self.group_id, topic=topic, handler=name).observe(seconds)
+
+    def set_lag(self, lag: Dict[Any, int]):
+        with self._lock:
+            self.lag = dict(lag)
+            self.lag_updated_at = time.time()
+        if CONSUMER_LAG is not None:
+            for tp, value in lag.items():
+                CONSUMER_LAG.labels(group=self.group_id, topic=tp.topic, partition=str(tp.partition)).set(value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            topics = {}
+            for topic, counts in self._counts.items():
+                recent = [(at, n) for at, n in self._recent[topic] if at >= now - THROUGHPUT_WINDOW_S]
+                span = max(now - recent[0][0], 1.0) if recent else 1.0
+                topics[topic] = dict(counts, records_per_sec=round(sum(n for _, n in recent) / span, 2))
+            handlers = {}
+            for name, samples in self._latencies.items():
+                ordered = sorted(samples)
+                handlers[name] = {
+                    'p50_ms': round(ordered[len(ordered) // 2] * 1000, 3),
+                    'p99_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3),
+                }
+            lag = {f"{tp.topic}:{tp.partition}": value for tp, value in self.lag.items()}
+        return {
+            'group': self.group_id,
+            'topics': topics,
+            'handlers': handlers,
+            'lag': lag,
+            'total_lag': sum(lag.values()),
+            'lag_updated_at': self.lag_updated_at,
+        }
+
+
+class LagMonitor:
+    """
+    Relève le lag d'un groupe en arrière-plan. ``client`` suit l'API de
+    KafkaConsumer (partitions_for_topic, end_offsets, committed) ; il est créé
+    par ``client_factory`` dans le thread du moniteur et n'est utilisé que là.
+    """
+
+    def __init__(self, metrics: ConsumerMetrics, topics: Iterable[str], client_factory: Callable[[], Any],
+                 interval: Optional[float] = None):
+        self.metrics = metrics
+        self.topics = list(topics)
+        self.client_factory = client_factory
+        self.interval = interval if interval is not None else float(os.environ.get('KAFKA_LAG_INTERVAL_S', 15))
+        self._client = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"{self.metrics.group_id}-lag", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning(f"Lag polling failed for group {self.metrics.group_id}: {str(e)}")
+            self._stopped.wait(self.interval)
+        if self._client is not None and hasattr(self._client, 'close'):
+            self._client.close()
+
+    def poll(self) -> Dict[Any, int]:
+        """Un relevé : offsets de fin et offsets commités de toutes les partitions"""
+        from .in_memory_broker import TopicPartition
+
+        if self._client is None:
+            self._client = self.client_factory()
+        partitions = [TopicPartition(topic, partition) for topic in self.topics
+                      for partition in sorted(self._client.partitions_for_topic(topic) or ())]
+        if not partitions:
+            return {}
+        end_offsets = self._client.end_offsets(partitions)
+        lag = {tp: max(0, end_offsets.get(tp, 0) - (self._client.committed(tp) or 0)) for tp in partitions}
+        self.metrics.set_lag(lag)
+        return lag
+
+    def stop(self, timeout: float = 5):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
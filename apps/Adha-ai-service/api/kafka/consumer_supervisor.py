@@ -0,0 +1,297 @@
+"""
+Supervision des consumers Kafka en processus séparés.
+
+Chaque groupe de consumers (``ConsumerGroup`` : une classe de consumer et un
+nombre de processus) tourne dans ses propres processus : les handlers
+gourmands en CPU (Excel, embeddings, extraction par regex) ne se disputent
+plus le GIL, et le plantage d'un handler n'emporte que son processus. Les
+processus d'un même groupe partagent le group id Kafka et se répartissent
+les partitions.
+
+Le superviseur :
+- redémarre un processus terminé avec un délai croissant (remis à zéro après
+  un fonctionnement prolongé) ;
+- surveille la santé : chaque processus publie à intervalle régulier l'état
+  de son consumer (``health_check()``), dont l'heure du dernier tour de sa
+  boucle de poll (``last_poll_at``) ; une boucle bloquée depuis plus de
+  ``health_timeout`` fait arrêter puis redémarrer le processus ;
+- à SIGTERM / SIGINT, transmet SIGTERM aux processus : chacun arrête sa
+  boucle de poll, termine les messages en file et commite leurs offsets
+  (``stop()`` du consumer), puis est tué après ``drain_timeout`` ;
+- agrège les états publiés par les processus d'un groupe (``status()``) ; les
+  métriques Prometheus des processus sont agrégées par ``/metrics/``
+  (répertoire multiprocessus), les jauges d'un processus terminé sont retirées.
+"""
+
+import importlib
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from .consumer_metrics import mark_process_dead
+
+logger = logging.getLogger(__name__)
+
+
+class ConsumerGroup:
+    """
+    Groupe de consumers supervisé.
+
+    Args:
+        name: nom du groupe (CONSUMER_PROCESSES_<NAME> fixe le nombre de processus)
+        factory: classe du consumer, ``module:Classe``
+        run: méthode bloquante qui fait tourner le consumer
+        processes: nombre de processus par défaut
+    """
+
+    def __init__(self, name: str, factory: str, run: str = 'start_consuming', processes: int = 1):
+        self.name = name
+        self.factory = factory
+        self.run = run
+        self.processes = max(1, int(os.environ.get(f"CONSUMER_PROCESSES_{name.upper()}", processes)))
+
+    def __repr__(self):
+        return f"ConsumerGroup({self.name!r}, {self.factory!r}, processes={self.processes})"
+
+
+def load(path: str):
+    """Objet désigné par ``module:attribut``"""
+    module_name, _, attribute = path.partition(':')
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def _run_consumer(group: ConsumerGroup, index: int, heartbeat, reports, report_interval: float):
+    """Point d'entrée d'un processus consumer"""
+    # Le superviseur transmet l'arrêt : Ctrl-C dans le terminal ne doit pas couper le drain
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Les rapports non lus ne doivent pas bloquer la sortie du processus
+    reports.cancel_join_thread()
+    stopping = threading.Event()
+    consumer = load(group.factory)()
+
+    def stop(signum=None, frame=None):
+        if not stopping.is_set():
+            stopping.set()
+            logger.info(f"Consumer {group.name}-{index} draining before exit")
+            consumer.stop()
+
+    signal.signal(signal.SIGTERM, stop)
+
+    def report():
+        while not stopping.is_set():
+            try:
+                health = consumer.health_check() if hasattr(consumer, 'health_check') else {'status': 'healthy'}
+                # Battement : dernier tour de la boucle de poll (maintenant tant qu'elle n'a pas démarré)
+                heartbeat.value = health.get('last_poll_at') or time.time()
+                reports.put_nowait((group.name, index, os.getpid(), health))
+            except queue.Full:
+                pass
+            except Exception as e:
+                # Pas de battement : le superviseur redémarrera le processus s'il ne répond plus
+                logger.warning(f"Health check failed for consumer {group.name}-{index}: {str(e)}")
+            stopping.wait(report_interval)
+
+    threading.Thread(target=report, name=f"{group.name}-{index}-health", daemon=True).start()
+    getattr(consumer, group.run)()
+    # Sortie sans demande d'arrêt : considérée comme un plantage
+    raise SystemExit(0 if stopping.is_set() else 1)
+
+
+class _Slot:
+    """Un processus d'un groupe, redémarré à la même place"""
+
+    def __init__(self, group: ConsumerGroup, index: int, delay: float):
+        self.group = group
+        self.index = index
+        self.process = None
+        self.heartbeat = None
+        self.started_at = 0.0
+        self.restart_at: Optional[float] = 0.0
+        self.delay = delay
+        self.restarts = 0
+        self.health: Dict[str, Any] = {}
+
+    @property
+    def name(self) -> str:
+        return f"{self.group.name}-{self.index}"
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+
+class ConsumerSupervisor:
+    """Lance, surveille et arrête les processus des groupes de consumers"""
+
+    def __init__(self, groups: Iterable[ConsumerGroup], health_timeout: Optional[float] = None,
+                 report_interval: Optional[float] = None, drain_timeout: Optional[float] = None,
+                 restart_delay: float = 1.0, max_restart_delay: float = 60.0, start_method: Optional[str] = None):
+        self.groups = list(groups)
+        self.health_timeout = health_timeout if health_timeout is not None else float(
+            os.environ.get('CONSUMER_HEALTH_TIMEOUT_S', 120))
+        self.report_interval = report_interval if report_interval is not None else float(
+            os.environ.get('CONSUMER_REPORT_INTERVAL_S', 10))
+        self.drain_timeout = drain_timeout if drain_timeout is not None else float(
+            os.environ.get('CONSUMER_DRAIN_TIMEOUT_S', 30))
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        # fork : les processus héritent de la configuration Django du superviseur
+        self.context = multiprocessing.get_context(
+            start_method or os.environ.get('CONSUMER_START_METHOD', 'fork'))
+        self.reports = self.context.Queue(maxsize=1000)
+        self.slots: List[_Slot] = [
+            _Slot(group, index, restart_delay) for group in self.groups for index in range(group.processes)
+        ]
+        self._stopping = threading.Event()
+
+    def start(self):
+        for slot in self.slots:
+            self._spawn(slot)
+        logger.info(f"Supervising {len(self.slots)} consumer processes: "
+                    f"{', '.join(f'{group.name} x{group.processes}' for group in self.groups)}")
+
+    def _spawn(self, slot: _Slot):
+        slot.heartbeat = self.context.Value('d', time.time())
+        slot.process = self.context.Process(
+            target=_run_consumer, name=slot.name,
+            args=(slot.group, slot.index, slot.heartbeat, self.reports, self.report_interval)
+        )
+        slot.process.start()
+        slot.started_at = time.time()
+        slot.restart_at = None
+        slot.health = {}
+        logger.info(f"Consumer process {slot.name} started (pid {slot.process.pid})")
+
+    def _collect_reports(self):
+        slots = {(slot.group.name, slot.index): slot for slot in self.slots}
+        while True:
+            try:
+                name, index, pid, health = self.reports.get_nowait()
+            except queue.Empty:
+                return
+            slot = slots.get((name, index))
+            if slot and slot.process is not None and slot.process.pid == pid:
+                slot.health = health
+
+    def check(self):
+        """Un tour de supervision : santé, processus terminés, redémarrages dus"""
+        self._collect_reports()
+        now = time.time()
+        for slot in self.slots:
+            if slot.alive():
+                if now - slot.heartbeat.value > self.health_timeout:
+                    logger.error(f"Consumer process {slot.name} has not polled for "
+                                 f"{now - slot.heartbeat.value:.0f}s, restarting it")
+                    self._terminate([slot])
+                continue
+            if slot.restart_at is None:
+                self._exited(slot, now)
+            if now >= slot.restart_at and not self._stopping.is_set():
+                slot.restarts += 1
+                self._spawn(slot)
+
+    def _exited(self, slot: _Slot, now: float):
+        """Processus terminé : retrait de ses métriques, redémarrage planifié avec délai croissant"""
+        mark_process_dead(slot.process.pid)
+        if now - slot.started_at > self.max_restart_delay:
+            slot.delay = self.restart_delay
+        logger.error(f"Consumer process {slot.name} exited with code {slot.process.exitcode}, "
+                     f"restarting in {slot.delay:.1f}s")
+        slot.restart_at = now + slot.delay
+        slot.delay = min(slot.delay * 2, self.max_restart_delay)
+
+    def run(self, interval: float = 1.0):
+        """Supervise jusqu'à SIGTERM / SIGINT (thread principal), puis draine les processus"""
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: self._stopping.set())
+        self.start()
+        try:
+            while not self._stopping.wait(interval):
+                self.check()
+        finally:
+            self.shutdown()
+
+    def stop(self):
+        self._stopping.set()
+
+    def shutdown(self):
+        """SIGTERM à tous les processus : drain et commit, puis kill après ``drain_timeout``"""
+        self._stopping.set()
+        alive = [slot for slot in self.slots if slot.alive()]
+        logger.info(f"Draining {len(alive)} consumer processes")
+        self._terminate(alive)
+        for slot in alive:
+            mark_process_dead(slot.process.pid)
+        logger.info("All consumer processes stopped")
+
+    def _terminate(self, slots: List[_Slot]):
+        for slot in slots:
+            slot.process.terminate()
+        deadline = time.time() + self.drain_timeout
+        for slot in slots:
+            slot.process.join(max(0.0, deadline - time.time()))
+            if slot.process.is_alive():
+                logger.warning(f"Consumer process {slot.name} did not drain in {self.drain_timeout}s, killing it")
+                slot.process.kill()
+                slot.process.join()
+
+    def status(self) -> Dict[str, Any]:
+        """Processus par groupe et état agrégé de leurs consumers"""
+        self._collect_reports()
+        now = time.time()
+        groups = {}
+        for group in self.groups:
+            slots = [slot for slot in self.slots if slot.group is group]
+            groups[group.name] = {
+                'processes': [
+                    {
+                        'index': slot.index,
+                        'pid': slot.process.pid if slot.process else None,
+                        'alive': slot.alive(),
+                        'restarts': slot.restarts,
+                        'uptime_s': round(now - slot.started_at, 1) if slot.alive() else 0,
+                        'heartbeat_age_s': round(now - slot.heartbeat.value, 1) if slot.heartbeat else None,
+                    }
+                    for slot in slots
+                ],
+                'alive': sum(slot.alive() for slot in slots),
+                'health': merge_health([slot.health for slot in slots if slot.health]),
+            }
+        return groups
+
+
+# Valeurs non additives : latences, instants, seuils et pics (maximum des processus)
+_MAX_SUFFIXES = ('_ms', '_at')
+_MAX_PREFIXES = ('max_', 'peak_')
+_MAX_KEYS = {'priority', 'weight'}
+
+
+def merge_health(reports: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Agrège les états de plusieurs processus : compteurs additionnés, latences
+    et seuils au maximum, statut ``unhealthy`` si un processus l'est, autres
+    valeurs du premier rapport.
+    """
+    if not reports:
+        return {}
+    merged: Dict[str, Any] = {}
+    for key in reports[0]:
+        values = [report[key] for report in reports if key in report]
+        first = values[0]
+        if key == 'status':
+            merged[key] = 'unhealthy' if 'unhealthy' in values else first
+        elif isinstance(first, dict):
+            merged[key] = merge_health([value for value in values if isinstance(value, dict)])
+        elif isinstance(first, (int, float)) and not isinstance(first, bool):
+            numbers = [value for value in values if isinstance(value, (int, float))]
+            if key in _MAX_KEYS or key.endswith(_MAX_SUFFIXES) or key.startswith(_MAX_PREFIXES):
+                merged[key] = max(numbers)
+            else:
+                merged[key] = sum(numbers)
+        else:
+            merged[key] = first
+    return merged
@@ -5,11 +5,12 @@ Synchronise en temps réel les données utilisateur/institution depuis le custom
 import json
 import logging
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, List, Callable, Optional
 from django.core.cache import cache
 from django.conf import settings
 
 from api.kafka.robust_kafka_client import RobustKafkaConsumer, StandardKafkaTopics, kafka_config
+from api.kafka.membership_index import COMPANY, INSTITUTION, group_members, membership_index
 
 logger = logging.getLogger(__name__)
 
@@ -17,9 +18,12 @@ class CustomerDataConsumer:
     """
     Consumer Kafka dédié à la synchronisation des données utilisateur/institution
     depuis le customer-service pour maintenir l'isolation des données à jour.
+    
+    ``consumer_factory`` crée le client Kafka (topics, group_id), par exemple le
+    broker en mémoire du banc de charge (voir load_harness).
     """
     
-    def __init__(self):
+    def __init__(self, consumer_factory: Optional[Callable[[List[str], str], Any]] = None):
         self.topics = [
             'customer.user.updated',
             'customer.user.created', 
@@ -27,24 +31,22 @@ class CustomerDataConsumer:
             'customer.company.updated',
             'user.login'  # Événement de connexion pour sync immédiate
         ]
+        self.consumer_factory = consumer_factory
         self.consumer = None
         self.cache_ttl = 3600  # 1 heure de cache
+        self._membership = None
+    
+    @property
+    def membership(self):
+        """Index des utilisateurs par société/institution (ensembles Redis natifs)"""
+        if self._membership is None:
+            self._membership = membership_index(cache, self.cache_ttl)
+        return self._membership
         
     def start_consuming(self):
         """Démarre la consommation des événements de synchronisation."""
         try:
-            self.consumer = RobustKafkaConsumer(
-                config=kafka_config,
-                topics=self.topics,
-                group_id='adha-ai-customer-sync'
-            )
-            
-            # Enregistrer les handlers spécifiques
-            for topic in self.topics:
-                self.consumer.register_handler(topic, self._handle_customer_event)
-            
-            self.consumer.register_error_handler(self._handle_error)
-            
+            self.consumer = self._create_consumer()
             logger.info(f"Customer data consumer started for topics: {self.topics}")
             self.consumer.start_consuming()
             
@@ -52,6 +54,40 @@ class CustomerDataConsumer:
             logger.exception(f"Error starting customer data consumer: {str(e)}")
             raise
     
+    def _create_consumer(self) -> RobustKafkaConsumer:
+        """Crée le consumer des topics de synchronisation, handlers enregistrés"""
+        group_id = 'adha-ai-customer-sync'
+        consumer = RobustKafkaConsumer(
+            config=kafka_config,
+            topics=self.topics,
+            group_id=group_id,
+            consumer=self.consumer_factory(self.topics, group_id) if self.consumer_factory else None
+        )
+        
+        # Enregistrer les handlers spécifiques
+        for topic in self.topics:
+            consumer.register_handler(topic, self._handle_customer_event)
+            consumer.register_batch_handler(topic, self._handle_customer_events)
+        
+        consumer.register_error_handler(self._handle_error)
+        return consumer
+    
+    def stop(self):
+        """Arrête la boucle de poll : les messages en file sont terminés et leurs offsets commités."""
+        if self.consumer:
+            self.consumer.stop()
+        logger.info("Customer data consumer stopped")
+    
+    def health_check(self) -> Dict[str, Any]:
+        """État du consumer (supervision des processus, voir consumer_supervisor)"""
+        consumer = self.consumer
+        return {
+            'status': 'healthy' if consumer else 'starting',
+            'last_poll_at': consumer.last_poll_at if consumer else None,
+            'topics': self.topics,
+            'consumers': {'main': consumer.metrics.snapshot()} if consumer else {},
+        }
+    
     def _handle_customer_event(self, message: Dict[str, Any]):
         """Route les événements vers les handlers appropriés."""
         try:
@@ -72,41 +108,77 @@ class CustomerDataConsumer:
         except Exception as e:
             logger.error(f"Error handling customer event: {str(e)}")
             
+    def _handle_customer_events(self, messages: List[Dict[str, Any]]):
+        """
+        Traite un lot d'événements. Les mises à jour utilisateur consécutives
+        sont regroupées : anciens contextes lus et nouveaux écrits en un
+        aller-retour chacun (get_many / set_many), index société/institution
+        mis à jour en un pipeline SADD/SREM. Les autres événements passent par
+        le traitement unitaire, après écriture des mises à jour qui les précèdent.
+        """
+        contexts = {}
+        for message in messages:
+            event_type = message.get('type', '')
+            if 'user' not in event_type:
+                self._flush_user_contexts(contexts)
+                self._handle_customer_event(message)
+                continue
+            
+            isolation_context = self._user_isolation_context(message.get('data', message))
+            if isolation_context:
+                contexts[f"user_context_{isolation_context['user_id']}"] = isolation_context
+        self._flush_user_contexts(contexts)
+    
+    def _flush_user_contexts(self, contexts: Dict[str, Any]):
+        """
+        Écrit les contextes accumulés, puis les vide. Un utilisateur qui a
+        changé de société ou d'institution est retiré de l'ancien index.
+        """
+        if not contexts:
+            return
+        try:
+            previous = cache.get_many(list(contexts))
+            cache.set_many(dict(contexts), self.cache_ttl)
+            added = group_members(contexts.values())
+            removed = {
+                owner: user_ids - added.get(owner, set())
+                for owner, user_ids in group_members(previous.values()).items()
+            }
+            self.membership.update(added, removed)
+            logger.info(f"Updated isolation context for {len(contexts)} users in one batch")
+        except Exception as e:
+            logger.error(f"Error handling user events batch: {str(e)}")
+        finally:
+            contexts.clear()
+    
+    def _user_isolation_context(self, data: Dict[str, Any]):
+        """Contexte d'isolation d'un événement utilisateur (None sans user_id)."""
+        user_id = data.get('id') or data.get('user_id')
+        if not user_id:
+            logger.warning("User event without user_id")
+            return None
+        
+        return {
+            'user_id': user_id,
+            'company_id': data.get('company', {}).get('id') if data.get('company') else None,
+            'financial_institution_id': data.get('financialInstitution', {}).get('id') if data.get('financialInstitution') else None,
+            'customer_type': 'institution' if data.get('financialInstitution') else 'sme',
+            'permissions': data.get('permissions', []),
+            'last_sync': datetime.utcnow().isoformat(),
+            'sync_source': 'kafka_user_event'
+        }
+    
     def _handle_user_event(self, event_type: str, data: Dict[str, Any]):
         """Traite les événements utilisateur."""
         try:
-            user_id = data.get('id') or data.get('user_id')
-            if not user_id:
-                logger.warning("User event without user_id")
-                return
-            
             # Construire le contexte d'isolation mis à jour
-            isolation_context = {
-                'user_id': user_id,
-                'company_id': data.get('company', {}).get('id') if data.get('company') else None,
-                'financial_institution_id': data.get('financialInstitution', {}).get('id') if data.get('financialInstitution') else None,
-                'customer_type': 'institution' if data.get('financialInstitution') else 'sme',
-                'permissions': data.get('permissions', []),
-                'last_sync': datetime.utcnow().isoformat(),
-                'sync_source': 'kafka_user_event'
-            }
-            
-            # Mettre à jour le cache d'isolation
-            cache_key = f"user_context_{user_id}"
-            cache.set(cache_key, isolation_context, self.cache_ttl)
-            
-            # Cache additionnel pour les recherches par company/institution
-            if isolation_context['company_id']:
-                company_cache_key = f"company_users_{isolation_context['company_id']}"
-                company_users = cache.get(company_cache_key, set())
-                company_users.add(str(user_id))
-                cache.set(company_cache_key, company_users, self.cache_ttl)
+            isolation_context = self._user_isolation_context(data)
+            if not isolation_context:
+                return
+            user_id = isolation_context['user_id']
             
-            if isolation_context['financial_institution_id']:
-                institution_cache_key = f"institution_users_{isolation_context['financial_institution_id']}"
-                institution_users = cache.get(institution_cache_key, set())
-                institution_users.add(str(user_id))
-                cache.set(institution_cache_key, institution_users, self.cache_ttl)
+            # Cache d'isolation et index par company/institution
+            self._flush_user_contexts({f"user_context_{user_id}": isolation_context})
             
             logger.info(f"Updated isolation context for user {user_id}: {isolation_context['customer_type']}")
             
@@ -135,12 +207,7 @@ class CustomerDataConsumer:
             cache.set(cache_key, institution_data, self.cache_ttl)
             
             # Invalider le cache des utilisateurs de cette institution pour forcer la resync
-            institution_users_key = f"institution_users_{institution_id}"
-            institution_users = cache.get(institution_users_key, set())
-            
-            for user_id in institution_users:
-                user_cache_key = f"user_context_{user_id}"
-                cache.delete(user_cache_key)  # Forcer la resync au prochain accès
+            self.membership.invalidate_users(INSTITUTION, institution_id)
             
             logger.info(f"Updated institution data for {institution_id}")
             
@@ -169,12 +236,7 @@ class CustomerDataConsumer:
             cache.set(cache_key, company_data, self.cache_ttl)
             
             # Invalider le cache des utilisateurs de cette société pour forcer la resync
-            company_users_key = f"company_users_{company_id}"
-            company_users = cache.get(company_users_key, set())
-            
-            for user_id in company_users:
-                user_cache_key = f"user_context_{user_id}"
-                cache.delete(user_cache_key)  # Forcer la resync au prochain accès
+            self.membership.invalidate_users(COMPANY, company_id)
             
             logger.info(f"Updated company data for {company_id}")
             
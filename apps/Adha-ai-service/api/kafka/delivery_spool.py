@@ -0,0 +1,97 @@
+"""
+Spool local durable des messages Kafka non délivrés.
+
+Quand un envoi échoue (buffer plein, broker injoignable, acquittement en
+erreur), le producer asynchrone écrit le message dans une base SQLite locale
+au lieu de le perdre ; ``AsyncKafkaProducer.replay_spool`` le renvoie une fois
+le broker revenu. La base est en WAL avec ``synchronous=FULL`` : un message
+accepté par le spool survit à un arrêt brutal du processus.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS spooled_message (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    topic TEXT NOT NULL,
+    message_key TEXT,
+    value TEXT NOT NULL,
+    headers TEXT NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL
+)
+"""
+
+
+class DeliverySpool:
+    """File SQLite des messages à renvoyer (thread-safe, connexion recréée après fork)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=FULL')
+            connection.execute(_SCHEMA)
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def append(self, topic: str, value: Any, key=None, headers: Optional[list] = None,
+               error: Optional[str] = None):
+        """Conserve un message non délivré"""
+        if isinstance(key, bytes):
+            key = key.decode('utf-8', 'replace')
+        encoded_headers = json.dumps([[name, (data or b'').hex()] for name, data in headers or ()])
+        with self._lock:
+            self._connect().execute(
+                'INSERT INTO spooled_message (topic, message_key, value, headers, error, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (topic, key, json.dumps(value, ensure_ascii=False, default=str), encoded_headers,
+                 error, time.time()),
+            )
+
+    def pending(self, limit: int = 500) -> List[Tuple[int, str, Any, Optional[str], list]]:
+        """Messages en attente, du plus ancien au plus récent : (id, topic, value, clé, headers)"""
+        with self._lock:
+            rows = self._connect().execute(
+                'SELECT id, topic, value, message_key, headers FROM spooled_message ORDER BY id LIMIT ?',
+                (limit,),
+            ).fetchall()
+        return [
+            (row_id, topic, json.loads(value), key,
+             [(name, bytes.fromhex(data)) for name, data in json.loads(headers)])
+            for row_id, topic, value, key, headers in rows
+        ]
+
+    def remove(self, ids: Iterable[int]):
+        ids = list(ids)
+        if not ids:
+            return
+        with self._lock:
+            self._connect().executemany('DELETE FROM spooled_message WHERE id = ?', [(i,) for i in ids])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connect().execute('SELECT COUNT(*) FROM spooled_message').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
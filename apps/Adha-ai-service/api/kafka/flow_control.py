@@ -0,0 +1,114 @@
+"""
+Contre-pression des consumers Kafka par pause des partitions.
+
+Quand les handlers ralentissent (latence LLM), la boucle de poll ne doit ni
+accumuler les enregistrements en mémoire, ni se bloquer sur une file de
+worker pleine : sans appel à ``poll()`` pendant ``max.poll.interval.ms``, le
+membre est exclu du groupe et les partitions sont réattribuées (tempête de
+rebalances). ``FlowController`` surveille le travail en cours (enregistrements
+reçus et pas encore terminés) et la file de worker la plus longue :
+
+- au-dessus du seuil haut, toutes les partitions assignées sont mises en pause ;
+- sous le seuil bas, elles reprennent (sauf celles qui attendent l'échéance
+  d'un retry, voir retry_topics).
+
+Partitions en pause, la boucle continue d'appeler ``poll()`` : le membre reste
+vivant dans le groupe mais ne reçoit plus rien. Au plus un poll
+(``max_poll_records``) arrive après le franchissement du seuil haut ; les
+files des workers ont cette marge, ``submit`` ne bloque donc pas la boucle.
+
+Avec des voies de priorité (voir priority_lanes), chaque voie a son
+contrôleur, limité aux partitions qui l'alimentent (``partitions``) : un
+arriéré d'analyses ne met pas en pause les partitions des messages de chat.
+
+Toutes les méthodes doivent être appelées depuis le thread de poll.
+"""
+
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FlowController:
+    """Pause / reprise des partitions assignées selon le travail en cours"""
+
+    def __init__(self, consumer, high_watermark: int, low_watermark: int,
+                 queue_high_watermark: Optional[int] = None, queue_low_watermark: Optional[int] = None,
+                 partitions: Optional[Callable[[], Iterable[Any]]] = None, name: str = 'default'):
+        if low_watermark >= high_watermark:
+            raise ValueError("low_watermark must be lower than high_watermark")
+        self.consumer = consumer
+        self.name = name
+        # Partitions contrôlées (toutes les partitions assignées par défaut)
+        self.partitions = partitions or consumer.assignment
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.queue_high_watermark = queue_high_watermark
+        self.queue_low_watermark = queue_low_watermark if queue_low_watermark is not None else (
+            queue_high_watermark // 2 if queue_high_watermark else None
+        )
+        self.paused = False
+        self._paused_at: Optional[float] = None
+        self.stats = {'pauses': 0, 'resumes': 0, 'paused_seconds': 0.0, 'peak_in_flight': 0}
+
+    def _saturated(self, in_flight: int, queue_depth: int) -> bool:
+        return in_flight >= self.high_watermark or (
+            self.queue_high_watermark is not None and queue_depth >= self.queue_high_watermark
+        )
+
+    def _drained(self, in_flight: int, queue_depth: int) -> bool:
+        return in_flight <= self.low_watermark and (
+            self.queue_low_watermark is None or queue_depth <= self.queue_low_watermark
+        )
+
+    def update(self, in_flight: int, queue_depth: int = 0,
+               held: Callable[[], Iterable[Any]] = tuple) -> bool:
+        """
+        Applique les seuils avant un poll.
+
+        Args:
+            in_flight: enregistrements reçus et pas encore terminés
+            queue_depth: longueur de la file de worker la plus chargée
+            held: partitions à laisser en pause à la reprise (retries pas encore dus)
+
+        Returns:
+            bool: True si les partitions sont en pause
+        """
+        self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], in_flight)
+        if self.paused:
+            if self._drained(in_flight, queue_depth):
+                self._resume(set(held()))
+            else:
+                # Partitions assignées par un rebalance depuis la pause
+                self._pause_assignment()
+        elif self._saturated(in_flight, queue_depth):
+            self.paused = True
+            self._paused_at = time.monotonic()
+            self.stats['pauses'] += 1
+            self._pause_assignment()
+            logger.info(f"Backpressure ({self.name}): {in_flight} records in flight, deepest worker queue "
+                        f"{queue_depth}: partitions paused")
+        return self.paused
+
+    def held_partitions(self) -> set:
+        """Partitions que ce contrôleur garde en pause"""
+        return set(self.partitions()) if self.paused else set()
+
+    def _pause_assignment(self):
+        partitions = set(self.partitions()) - set(self.consumer.paused())
+        if partitions:
+            self.consumer.pause(*partitions)
+
+    def _resume(self, held):
+        partitions = set(self.partitions()) - held
+        if partitions:
+            self.consumer.resume(*partitions)
+        self.paused = False
+        self.stats['resumes'] += 1
+        self.stats['paused_seconds'] += time.monotonic() - self._paused_at
+        logger.info(f"Backpressure ({self.name}) released: partitions resumed")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(self.stats, paused=self.paused, paused_seconds=round(self.stats['paused_seconds'], 3))
@@ -0,0 +1,216 @@
+"""
+Consommation idempotente : registre des messages déjà traités.
+
+Un message peut être relu (rebalance, redémarrage avant commit, retry) et une
+même opération commerciale peut arriver par plusieurs consumers. Avant tout
+traitement coûteux (appels LLM, écriture comptable), le consumer réserve la
+clé d'idempotence du message : identifiant de l'opération commerciale pour
+``commerce.operation.*``, identifiant du message sinon.
+
+- Réservation (``claim``) : ajout atomique de la clé (SET NX dans Redis, via
+  le cache Django) à l'état ``processing``, avec un TTL court.
+- Fin du traitement (``complete``) : la clé passe à l'état ``done`` avec le
+  résultat produit, conservée ``KAFKA_DEDUP_TTL`` secondes (7 jours par
+  défaut). Un doublon republie ce résultat sans le recalculer.
+- Échec (``release``) : la clé est libérée pour que le retry retraite.
+
+Un doublon reçu pendant qu'un autre worker traite encore la clé passe par les
+topics de retry : si le premier traitement a abouti entre-temps, le retry ne
+fait que republier son résultat ; si le processus est mort, la réservation
+expire (``KAFKA_DEDUP_PROCESSING_TTL``) avant le dernier retry.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROCESSING = 'processing'
+DONE = 'done'
+
+KEY_PREFIX = 'kafka:processed:'
+
+COMMERCE_OPERATION_PREFIX = 'commerce.operation.'
+
+
+def idempotency_key(message: Dict[str, Any], topic: Optional[str] = None) -> Optional[str]:
+    """
+    Clé d'idempotence d'un message : l'opération commerciale pour les topics
+    commerce (même clé quel que soit le consumer ou l'enveloppe), le message sinon.
+    """
+    metadata = message.get('metadata') or {}
+    topic = topic or metadata.get('kafka_topic') or ''
+    if topic.startswith(COMMERCE_OPERATION_PREFIX):
+        data = message.get('data') if isinstance(message.get('data'), dict) else message
+        operation_id = data.get('id') or data.get('operationId') or data.get('operation_id')
+        if operation_id:
+            return f"{KEY_PREFIX}{topic}:{operation_id}"
+    message_id = message.get('id')
+    return f"{KEY_PREFIX}message:{message_id}" if message_id else None
+
+
+class InMemoryIdempotencyStore:
+    """
+    Registre en mémoire du processus, même interface que le cache Django
+    (tests, exécution sans Redis). Les TTL sont respectés à la lecture.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        return entry
+
+    @staticmethod
+    def _expiry(timeout):
+        return None if timeout is None else time.monotonic() + timeout
+
+    def add(self, key: str, value: Any, timeout: Optional[float] = None) -> bool:
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            self._entries[key] = (value, self._expiry(timeout))
+            return True
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._live(key)
+        return default if entry is None else entry[0]
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        with self._lock:
+            entries = {key: self._live(key) for key in keys}
+        return {key: entry[0] for key, entry in entries.items() if entry is not None}
+
+    def set(self, key: str, value: Any, timeout: Optional[float] = None):
+        with self._lock:
+            self._entries[key] = (value, self._expiry(timeout))
+
+    def set_many(self, data: Dict[str, Any], timeout: Optional[float] = None):
+        with self._lock:
+            for key, value in data.items():
+                self._entries[key] = (value, self._expiry(timeout))
+        return []
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+def default_store():
+    """Cache Django (Redis) quand Django est configuré, registre en mémoire sinon"""
+    try:
+        from django.conf import settings
+        if settings.configured:
+            from django.core.cache import cache
+            return cache
+    except ImportError:
+        pass
+    logger.warning("Django cache unavailable, using an in-process idempotency store")
+    return InMemoryIdempotencyStore()
+
+
+class IdempotencyGuard:
+    """Réservation, fin et libération des clés d'idempotence (voir le module)"""
+
+    def __init__(self, store=None, ttl: Optional[int] = None, processing_ttl: Optional[int] = None):
+        self._store = store
+        self.ttl = ttl or int(os.environ.get('KAFKA_DEDUP_TTL', 7 * 24 * 3600))
+        self.processing_ttl = processing_ttl or int(os.environ.get('KAFKA_DEDUP_PROCESSING_TTL', 600))
+        self._lock = threading.Lock()
+        self.stats = {'claimed': 0, 'duplicates': 0, 'in_flight': 0, 'released': 0}
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = default_store()
+        return self._store
+
+    def claim(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Réserve ``key``. Registre indisponible : le message est traité (un
+        doublon vaut mieux qu'un message perdu).
+
+        Returns:
+            None si la clé est réservée pour l'appelant (traitement à faire),
+            sinon l'enregistrement existant (``state`` processing ou done, ``result``)
+        """
+        try:
+            return self._claim(key)
+        except Exception as e:
+            logger.error(f"Idempotency store unavailable, processing {key} without claim: {str(e)}")
+            return None
+
+    def _claim(self, key: str) -> Optional[Dict[str, Any]]:
+        record = {'state': PROCESSING, 'at': time.time()}
+        if self.store.add(key, record, self.processing_ttl):
+            self._count('claimed')
+            return None
+        existing = self.store.get(key)
+        if existing is None:
+            # Réservation expirée entre les deux appels : nouvelle tentative
+            if self.store.add(key, record, self.processing_ttl):
+                self._count('claimed')
+                return None
+            existing = {'state': PROCESSING}
+        self._count('duplicates' if existing.get('state') == DONE else 'in_flight')
+        return existing
+
+    def claim_many(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Réserve plusieurs clés (un lot) : une lecture groupée, puis un ajout par
+        clé absente. Une clé répétée n'est réservée qu'une fois.
+
+        Returns:
+            Les enregistrements existants, par clé ; les autres clés sont réservées
+        """
+        try:
+            existing = self.store.get_many(keys)
+        except Exception as e:
+            logger.error(f"Idempotency store unavailable, processing {len(keys)} messages without claim: {str(e)}")
+            return {}
+        for key in dict.fromkeys(keys):
+            if key in existing:
+                self._count('duplicates' if existing[key].get('state') == DONE else 'in_flight')
+                continue
+            record = self.claim(key)
+            if record is not None:
+                existing[key] = record
+        return existing
+
+    def complete(self, key: str, result: Any = None):
+        """Marque ``key`` comme traitée, avec le résultat à republier pour les doublons"""
+        try:
+            self.store.set(key, {'state': DONE, 'at': time.time(), 'result': result}, self.ttl)
+        except Exception as e:
+            logger.error(f"Failed to record {key} as processed: {str(e)}")
+
+    def complete_many(self, results: Dict[str, Any]):
+        if not results:
+            return
+        now = time.time()
+        try:
+            self.store.set_many({key: {'state': DONE, 'at': now, 'result': result}
+                                 for key, result in results.items()}, self.ttl)
+        except Exception as e:
+            logger.error(f"Failed to record {len(results)} messages as processed: {str(e)}")
+
+    def release(self, key: str):
+        """Libère une réservation après un échec (le retry retraitera le message)"""
+        self.store.delete(key)
+        self._count('released')
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
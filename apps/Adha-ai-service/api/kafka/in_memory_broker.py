@@ -0,0 +1,362 @@
+"""
+Broker Kafka en mémoire pour les tests et les bancs d'essai locaux.
+
+Reproduit le sous-ensemble de kafka-python utilisé par le service : topics
+partitionnés (partition choisie par hachage de la clé), offsets commités par
+groupe de consommateurs, ``poll()`` par lots, ``commit()`` / ``commit_async()``
+(appliqué au poll suivant, comme kafka-python), écouteur de rebalance,
+``pause()`` / ``resume()``, ``end_offsets()``, producteur avec ``send()`` /
+``flush()``, et le sous-ensemble d'aiokafka utilisé par le runtime asyncio
+(``AsyncInMemoryConsumer``). ``commit_latency`` simule l'aller-retour d'un
+commit synchrone vers le broker ; ``max_poll_interval_ms`` compte les exclusions du groupe
+qu'aurait provoquées un trop long intervalle entre deux polls. Un consommateur
+reprend à l'offset commité par son groupe, ce qui permet de vérifier la
+sémantique « au moins une fois ».
+"""
+
+import asyncio
+import threading
+import time
+import zlib
+from collections import namedtuple
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    from kafka.structs import TopicPartition, OffsetAndMetadata
+except ImportError:
+    TopicPartition = namedtuple('TopicPartition', ['topic', 'partition'])
+    OffsetAndMetadata = namedtuple('OffsetAndMetadata', ['offset', 'metadata'])
+
+ConsumerRecord = namedtuple(
+    'ConsumerRecord', ['topic', 'partition', 'offset', 'timestamp', 'key', 'value', 'headers']
+)
+
+
+def partition_for_key(key, partitions: int) -> int:
+    """Partition d'une clé (stable d'un processus à l'autre, contrairement à hash())."""
+    if key is None:
+        return 0
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    return zlib.crc32(key) % partitions
+
+
+class InMemoryBroker:
+    """Journal partitionné par topic, partagé par les producteurs et consommateurs de test."""
+
+    def __init__(self, partitions: int = 3):
+        self.default_partitions = partitions
+        self._logs: Dict[str, List[List[ConsumerRecord]]] = {}
+        self._committed: Dict[str, Dict[Any, int]] = {}
+        self._condition = threading.Condition()
+
+    def create_topic(self, topic: str, partitions: Optional[int] = None):
+        with self._condition:
+            if topic not in self._logs:
+                self._logs[topic] = [[] for _ in range(partitions or self.default_partitions)]
+
+    def partitions_for(self, topic: str) -> int:
+        self.create_topic(topic)
+        return len(self._logs[topic])
+
+    def produce(self, topic: str, value: Any, key=None, headers: Optional[list] = None,
+                partition: Optional[int] = None) -> ConsumerRecord:
+        self.create_topic(topic)
+        with self._condition:
+            log = self._logs[topic]
+            if partition is None:
+                partition = partition_for_key(key, len(log))
+            record = ConsumerRecord(topic, partition, len(log[partition]), int(time.time() * 1000),
+                                    key, value, list(headers or []))
+            log[partition].append(record)
+            self._condition.notify_all()
+        return record
+
+    def end_offsets(self, topic: str) -> Dict[TopicPartition, int]:
+        self.create_topic(topic)
+        with self._condition:
+            return {TopicPartition(topic, p): len(log) for p, log in enumerate(self._logs[topic])}
+
+    def committed(self, group_id: str, tp) -> Optional[int]:
+        with self._condition:
+            return self._committed.get(group_id, {}).get(TopicPartition(*tp))
+
+    def commit(self, group_id: str, offsets: Dict[Any, Any]):
+        with self._condition:
+            group = self._committed.setdefault(group_id, {})
+            for tp, position in offsets.items():
+                offset = getattr(position, 'offset', position)
+                group[TopicPartition(*tp)] = offset
+
+    def consumer(self, *topics: str, group_id: str, **options) -> 'InMemoryConsumer':
+        return InMemoryConsumer(self, topics, group_id, **options)
+
+    def async_consumer(self, *topics: str, group_id: str, **options) -> 'AsyncInMemoryConsumer':
+        return AsyncInMemoryConsumer(InMemoryConsumer(self, topics, group_id, **options))
+
+    def producer(self) -> 'InMemoryProducer':
+        return InMemoryProducer(self)
+
+    def records(self, topic: str) -> List[ConsumerRecord]:
+        """Tous les enregistrements d'un topic, partition par partition."""
+        self.create_topic(topic)
+        with self._condition:
+            return [record for log in self._logs[topic] for record in log]
+
+    def fetch(self, tp, offset: int, limit: int) -> List[ConsumerRecord]:
+        with self._condition:
+            return self._logs[tp.topic][tp.partition][offset:offset + limit]
+
+    def wait_for_records(self, timeout: float):
+        with self._condition:
+            self._condition.wait(timeout)
+
+
+class _SentFuture:
+    """Résultat d'envoi déjà acquitté (API FutureRecordMetadata de kafka-python)."""
+
+    def __init__(self, record: ConsumerRecord):
+        self.record = record
+        self.exception = None
+
+    def get(self, timeout: Optional[float] = None) -> ConsumerRecord:
+        return self.record
+
+    def add_callback(self, fn, *args, **kwargs):
+        fn(*args, self.record, **kwargs)
+        return self
+
+    def add_errback(self, fn, *args, **kwargs):
+        return self
+
+    def succeeded(self) -> bool:
+        return True
+
+    def failed(self) -> bool:
+        return False
+
+
+class InMemoryProducer:
+    """Producteur compatible avec l'API KafkaProducer (send / flush / close)."""
+
+    def __init__(self, broker: InMemoryBroker):
+        self.broker = broker
+        self.sent = 0
+        self.flushes = 0
+
+    def send(self, topic: str, value: Any = None, key=None, headers: Optional[list] = None,
+             partition: Optional[int] = None) -> _SentFuture:
+        self.sent += 1
+        return _SentFuture(self.broker.produce(topic, value, key=key, headers=headers, partition=partition))
+
+    def flush(self, timeout: Optional[float] = None):
+        self.flushes += 1
+
+    def close(self, timeout: Optional[float] = None):
+        pass
+
+
+class InMemoryConsumer:
+    """Consommateur compatible avec l'API KafkaConsumer utilisée par RobustKafkaConsumer."""
+
+    def __init__(self, broker: InMemoryBroker, topics: Iterable[str], group_id: str,
+                 max_poll_records: int = 500, value_deserializer=None, commit_latency: float = 0.0,
+                 max_poll_interval_ms: Optional[int] = None):
+        self.broker = broker
+        self.group_id = group_id
+        self.max_poll_records = max_poll_records
+        self.value_deserializer = value_deserializer
+        self.commit_latency = commit_latency
+        self.commits = 0
+        self.max_poll_interval_ms = max_poll_interval_ms
+        self.rebalances = 0
+        self.polls = 0
+        self.max_poll_gap_ms = 0.0
+        self._last_poll_end: Optional[float] = None
+        self.closed = False
+        self.listener = None
+        self._paused = set()
+        self._positions: Dict[TopicPartition, int] = {}
+        self._async_commits = []
+        self._revocations = []
+        self._assign(topics)
+
+    def _assign(self, topics: Iterable[str]):
+        for topic in topics:
+            for partition in range(self.broker.partitions_for(topic)):
+                tp = TopicPartition(topic, partition)
+                self._positions[tp] = self.broker.committed(self.group_id, tp) or 0
+
+    def subscribe(self, topics: Iterable[str], listener=None):
+        self._positions = {}
+        self._assign(topics)
+        self.listener = listener
+
+    def revoke(self, partitions: Iterable):
+        """Simule un rebalance : les partitions sont révoquées au prochain poll()."""
+        self._revocations.append([TopicPartition(*tp) for tp in partitions])
+
+    def _next_revocation(self) -> list:
+        return [tp for tp in self._revocations.pop(0) if tp in self._positions]
+
+    def _drop(self, revoked: Iterable):
+        for tp in revoked:
+            del self._positions[tp]
+            self._paused.discard(tp)
+
+    def assignment(self):
+        return set(self._positions)
+
+    def poll(self, timeout_ms: int = 0, max_records: Optional[int] = None) -> Dict[TopicPartition, list]:
+        self._check_poll_interval()
+        try:
+            return self._poll(timeout_ms, max_records)
+        finally:
+            self._last_poll_end = time.monotonic()
+
+    def _check_poll_interval(self):
+        """Comme le coordinateur Kafka : trop longtemps sans poll(), le membre quitte le groupe."""
+        self.polls += 1
+        if self._last_poll_end is None:
+            return
+        gap_ms = (time.monotonic() - self._last_poll_end) * 1000
+        self.max_poll_gap_ms = max(self.max_poll_gap_ms, gap_ms)
+        if self.max_poll_interval_ms is not None and gap_ms > self.max_poll_interval_ms:
+            self.rebalances += 1
+
+    def _poll(self, timeout_ms: int, max_records: Optional[int]) -> Dict[TopicPartition, list]:
+        self._complete_async_commits()
+        while self._revocations:
+            revoked = self._next_revocation()
+            if self.listener:
+                self.listener.on_partitions_revoked(revoked)
+            self._drop(revoked)
+        limit = max_records or self.max_poll_records
+        deadline = time.time() + timeout_ms / 1000.0
+        while True:
+            batch = self._fetch(limit)
+            remaining = deadline - time.time()
+            if batch or remaining <= 0:
+                return batch
+            self.broker.wait_for_records(min(remaining, 0.05))
+
+    def _fetch(self, limit: int) -> Dict[TopicPartition, list]:
+        batch = {}
+        for tp, position in self._positions.items():
+            if limit <= 0:
+                break
+            if tp in self._paused:
+                continue
+            records = self.broker.fetch(tp, position, limit)
+            if records:
+                if self.value_deserializer:
+                    records = [r._replace(value=self.value_deserializer(r.value)) for r in records]
+                batch[tp] = records
+                self._positions[tp] = position + len(records)
+                limit -= len(records)
+        return batch
+
+    def commit(self, offsets: Optional[Dict[Any, Any]] = None):
+        if self.commit_latency:
+            time.sleep(self.commit_latency)
+        self.broker.commit(self.group_id, offsets if offsets is not None else self._positions)
+        self.commits += 1
+
+    def commit_async(self, offsets: Optional[Dict[Any, Any]] = None, callback=None):
+        self._async_commits.append((dict(offsets if offsets is not None else self._positions), callback))
+
+    def _complete_async_commits(self):
+        commits, self._async_commits = self._async_commits, []
+        for offsets, callback in commits:
+            self.broker.commit(self.group_id, offsets)
+            self.commits += 1
+            if callback:
+                callback(offsets, None)
+
+    def committed(self, tp) -> Optional[int]:
+        return self.broker.committed(self.group_id, tp)
+
+    def partitions_for_topic(self, topic: str):
+        return set(range(self.broker.partitions_for(topic)))
+
+    def end_offsets(self, partitions: Iterable) -> Dict[TopicPartition, int]:
+        partitions = [TopicPartition(*tp) for tp in partitions]
+        ends = {}
+        for topic in {tp.topic for tp in partitions}:
+            ends.update(self.broker.end_offsets(topic))
+        return {tp: ends[tp] for tp in partitions}
+
+    def position(self, tp) -> int:
+        return self._positions[TopicPartition(*tp)]
+
+    def seek(self, tp, offset: int):
+        self._positions[TopicPartition(*tp)] = offset
+
+    def pause(self, *partitions):
+        self._paused.update(TopicPartition(*tp) for tp in partitions)
+
+    def resume(self, *partitions):
+        self._paused.difference_update(TopicPartition(*tp) for tp in partitions)
+
+    def paused(self):
+        return set(self._paused)
+
+    def close(self, autocommit: bool = False):
+        self._complete_async_commits()
+        self.closed = True
+
+
+class AsyncInMemoryConsumer:
+    """
+    Consommateur compatible avec l'API AIOKafkaConsumer utilisée par
+    AsyncKafkaConsumer (``getmany`` / ``commit`` coroutines). Sans thread :
+    l'attente de nouveaux enregistrements cède la boucle d'événements.
+    """
+
+    def __init__(self, consumer: InMemoryConsumer, wait_interval: float = 0.002):
+        self.consumer = consumer
+        self.wait_interval = wait_interval
+        self.listener = None
+
+    def subscribe(self, topics: Iterable[str], listener=None):
+        """Comme aiokafka : l'écouteur de rebalance a des méthodes coroutines."""
+        self.consumer.subscribe(topics)
+        self.listener = listener
+
+    async def start(self):
+        pass
+
+    async def getmany(self, timeout_ms: int = 0, max_records: Optional[int] = None) -> Dict[TopicPartition, list]:
+        deadline = time.monotonic() + timeout_ms / 1000.0
+        while True:
+            while self.consumer._revocations:
+                revoked = self.consumer._next_revocation()
+                if self.listener:
+                    await self.listener.on_partitions_revoked(revoked)
+                self.consumer._drop(revoked)
+            batch = self.consumer.poll(timeout_ms=0, max_records=max_records)
+            if batch or time.monotonic() >= deadline:
+                return batch
+            await asyncio.sleep(self.wait_interval)
+
+    async def commit(self, offsets: Optional[Dict[Any, Any]] = None):
+        if self.consumer.commit_latency:
+            await asyncio.sleep(self.consumer.commit_latency)
+        self.consumer.broker.commit(self.consumer.group_id,
+                                    offsets if offsets is not None else self.consumer._positions)
+        self.consumer.commits += 1
+
+    def assignment(self):
+        return self.consumer.assignment()
+
+    def pause(self, *partitions):
+        self.consumer.pause(*partitions)
+
+    def resume(self, *partitions):
+        self.consumer.resume(*partitions)
+
+    def paused(self):
+        return self.consumer.paused()
+
+    async def stop(self):
+        self.consumer.close()
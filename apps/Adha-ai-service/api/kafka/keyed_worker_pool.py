@@ -0,0 +1,166 @@
+"""
+Traitement parallèle des messages Kafka avec ordre garanti par clé.
+
+Chaque enregistrement est routé vers un worker selon sa clé (l'identifiant de
+l'entreprise) : les messages d'une même entreprise sont traités dans l'ordre par
+un seul worker, tandis que les entreprises différentes avancent en parallèle.
+Les files des workers sont bornées, ce qui freine la boucle de poll quand les
+handlers (appels LLM) sont plus lents que l'arrivée des messages.
+
+``PartitionOffsetTracker`` suit les offsets en cours par partition : seul le
+plus grand offset dont tous les prédécesseurs sont terminés peut être commité,
+un message lent ne peut donc pas être « sauté » en cas de redémarrage.
+"""
+
+import logging
+import queue
+import threading
+import zlib
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def worker_index(key, workers: int) -> int:
+    """Index du worker d'une clé (crc32 : stable, indépendant de PYTHONHASHSEED)."""
+    if key is None:
+        return 0
+    if not isinstance(key, bytes):
+        key = str(key).encode('utf-8')
+    return zlib.crc32(key) % workers
+
+
+class PartitionOffsetTracker:
+    """Offsets reçus / terminés par partition et prochain offset commitable."""
+
+    def __init__(self):
+        self._pending: Dict[Any, deque] = {}
+        self._done: Dict[Any, set] = {}
+        self._committable: Dict[Any, int] = {}
+        self._lock = threading.Lock()
+        self.completed = 0  # Messages libérés pour le commit (total)
+
+    def track(self, tp, offset: int):
+        """Enregistre un offset reçu (les offsets d'une partition arrivent croissants)."""
+        with self._lock:
+            self._pending.setdefault(tp, deque()).append(offset)
+            self._done.setdefault(tp, set())
+
+    def complete(self, tp, offset: int):
+        """Marque un offset terminé et avance la position commitable si possible."""
+        with self._lock:
+            pending = self._pending.get(tp)
+            if not pending:
+                return
+            done = self._done[tp]
+            done.add(offset)
+            advanced = None
+            while pending and pending[0] in done:
+                advanced = pending.popleft()
+                done.discard(advanced)
+                self.completed += 1
+            if advanced is not None:
+                # Kafka attend l'offset du prochain message à lire
+                self._committable[tp] = advanced + 1
+
+    def committable(self) -> Dict[Any, int]:
+        """Positions à commiter depuis le dernier appel (et les oublie)."""
+        with self._lock:
+            positions, self._committable = self._committable, {}
+            return positions
+
+    def in_flight(self, tp=None) -> int:
+        with self._lock:
+            if tp is not None:
+                return len(self._pending.get(tp, ()))
+            return sum(len(p) for p in self._pending.values())
+
+    def forget(self, partitions):
+        """Abandonne le suivi de partitions révoquées."""
+        with self._lock:
+            for tp in partitions:
+                self._pending.pop(tp, None)
+                self._done.pop(tp, None)
+                self._committable.pop(tp, None)
+
+
+class KeyedWorkerPool:
+    """
+    Pool de threads où chaque clé est toujours servie par le même worker.
+
+    ``submit`` bloque quand la file du worker est pleine (contre-pression) ;
+    ``on_done`` est appelé après le handler, qu'il ait réussi ou non.
+    """
+
+    def __init__(self, handler: Callable[[Any], Any], workers: int = 4, queue_size: int = 100,
+                 error_handler: Optional[Callable[[Exception, Any], Any]] = None,
+                 name: str = 'kafka-worker'):
+        self.handler = handler
+        self.error_handler = error_handler
+        self.workers = max(1, workers)
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(self.workers)]
+        self._threads = []
+        self.processed = [0] * self.workers
+        self.failed = [0] * self.workers
+        self.completed = 0
+        self._progress = threading.Condition()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, args=(index,), name=f"{name}-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, item, on_done: Optional[Callable[[], Any]] = None,
+               timeout: Optional[float] = None):
+        """Place ``item`` dans la file du worker de ``key`` (lève queue.Full après ``timeout``)."""
+        self._queues[worker_index(key, self.workers)].put((item, on_done), timeout=timeout)
+
+    def queue_depths(self):
+        return [q.qsize() for q in self._queues]
+
+    def wait_for_progress(self, completed: int, timeout: float) -> bool:
+        """Attend qu'un message se termine après la lecture ``completed`` (au plus ``timeout`` secondes)."""
+        with self._progress:
+            return self._progress.wait_for(lambda: self.completed != completed, timeout)
+
+    def _run(self, index: int):
+        work = self._queues[index]
+        while True:
+            entry = work.get()
+            if entry is _STOP:
+                return
+            item, on_done = entry
+            try:
+                self.handler(item)
+                self.processed[index] += 1
+            except Exception as e:
+                self.failed[index] += 1
+                logger.error(f"Worker {index}: error processing message: {str(e)}")
+                if self.error_handler:
+                    try:
+                        self.error_handler(e, item)
+                    except Exception as handler_error:
+                        logger.error(f"Worker {index}: error handler failed: {str(handler_error)}")
+            finally:
+                if on_done:
+                    on_done()
+                with self._progress:
+                    self.completed += 1
+                    self._progress.notify_all()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Termine les messages déjà en file puis arrête les workers."""
+        for work in self._queues:
+            work.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'workers': self.workers,
+            'queue_depths': self.queue_depths(),
+            'processed': sum(self.processed),
+            'failed': sum(self.failed),
+        }
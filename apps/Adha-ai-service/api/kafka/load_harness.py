@@ -0,0 +1,989 @@
+"""
+Banc de charge des consumers Kafka, sans Kafka ni OpenAI.
+
+Les consumers du service (``UnifiedConsumer``, ``CustomerDataConsumer``)
+tournent sur le broker en mémoire (voir in_memory_broker) avec leur pipeline
+réel : conversion des messages, voies de priorité, handlers par lot,
+idempotence, retries. Seuls les appels au LLM et les traitements métier du
+routeur sont simulés (``StubTaskRouter`` / ``StubLLM``, latence réglable).
+
+- ``TrafficGenerator`` : trafic synthétique réaliste (``commerce.operation.*``,
+  ``customer.*``, ``portfolio.*``, chat, statuts d'écritures) ;
+- ``read_traffic`` / ``write_traffic`` / ``capture`` : trafic capturé au
+  format JSONL, une ligne par enregistrement
+  ``{"topic", "key", "value", "timestamp"}`` (timestamp en ms) ;
+- ``replay`` : republie un trafic sur le broker, au rythme d'origine
+  accéléré de ``speed`` ou d'un bloc ;
+- ``StubLLM`` / ``AsyncStubLLM`` : clients OpenAI simulés ;
+- ``run_benchmark`` : messages par seconde et percentiles de latence
+  (publication -> fin du handler) d'un consumer ;
+- ``run_routing_replay`` : appels LLM des agents (chat, classification,
+  écritures) rejoués sur des modèles simulés à travers ``ModelRouter``,
+  avec la part d'appels escaladés vers le modèle fort, le coût et la latence
+  par niveau ;
+- ``run_fast_path_benchmark`` : écritures d'un corpus de documents
+  (``document_corpus``) par le chemin rapide SYSCOHADA de AAgent comparées
+  au tout-LLM : part des documents sans appel LLM, latence et jetons.
+
+Usage :
+    python -m api.kafka.load_harness --messages 2000 --llm-latency-ms 50
+    python -m api.kafka.load_harness --replay captured.jsonl --speed 10 --consumer unified
+    python -m api.kafka.load_harness --routing --fast-error-rate 0.1
+    python -m api.kafka.load_harness --fast-path --messages 500 --llm-latency-ms 800
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import wraps
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from .in_memory_broker import InMemoryBroker
+
+logger = logging.getLogger(__name__)
+
+TrafficRecord = namedtuple('TrafficRecord', ['topic', 'key', 'value', 'timestamp'])
+
+COMMERCE_OPERATION_CREATED = 'commerce.operation.created'
+COMMERCE_OPERATION_UPDATED = 'commerce.operation.updated'
+COMMERCE_OPERATION_DELETED = 'commerce.operation.deleted'
+CUSTOMER_USER_CREATED = 'customer.user.created'
+CUSTOMER_USER_UPDATED = 'customer.user.updated'
+CUSTOMER_COMPANY_UPDATED = 'customer.company.updated'
+CUSTOMER_INSTITUTION_UPDATED = 'customer.institution.updated'
+USER_LOGIN = 'user.login'
+PORTFOLIO_ANALYSIS_REQUEST = 'portfolio.analysis.request'
+ADHA_AI_EVENTS = 'adha-ai-events'
+ACCOUNTING_JOURNAL_STATUS = 'accounting.journal.status'
+
+# Répartition par défaut du trafic (poids relatifs)
+DEFAULT_MIX = {
+    COMMERCE_OPERATION_CREATED: 40,
+    COMMERCE_OPERATION_UPDATED: 4,
+    COMMERCE_OPERATION_DELETED: 1,
+    CUSTOMER_USER_UPDATED: 12,
+    CUSTOMER_USER_CREATED: 3,
+    CUSTOMER_COMPANY_UPDATED: 3,
+    CUSTOMER_INSTITUTION_UPDATED: 2,
+    USER_LOGIN: 10,
+    ADHA_AI_EVENTS: 12,
+    PORTFOLIO_ANALYSIS_REQUEST: 3,
+    ACCOUNTING_JOURNAL_STATUS: 10,
+}
+
+OPERATION_TYPES = ['SALE', 'PURCHASE', 'EXPENSE', 'INCOME', 'PAYMENT_RECEIVED', 'PAYMENT_SENT']
+ROLES = ['ADMIN', 'ACCOUNTANT', 'MANAGER', 'VIEWER']
+CHAT_QUESTIONS = [
+    "Quel est mon chiffre d'affaires du mois ?",
+    "Comment comptabiliser un achat de marchandises à crédit ?",
+    "Quelle est la trésorerie disponible de la société ?",
+    "Explique-moi le compte 411 du plan SYSCOHADA.",
+    "Quels clients ont des factures en retard ?",
+]
+
+
+class TrafficGenerator:
+    """
+    Trafic synthétique au format des services TypeScript (camelCase,
+    enveloppe ``id`` / ``data`` / ``metadata``), réparti entre ``companies``
+    entreprises, ``institutions`` institutions et ``users`` utilisateurs.
+    Même ``seed``, même trafic.
+    """
+
+    def __init__(self, seed: int = 0, mix: Optional[Dict[str, float]] = None, companies: int = 50,
+                 institutions: int = 10, users: int = 200, start: Optional[datetime] = None):
+        self.random = random.Random(seed)
+        self.mix = dict(mix or DEFAULT_MIX)
+        self.companies = [f"company-{n}" for n in range(companies)]
+        self.institutions = [f"institution-{n}" for n in range(institutions)]
+        self.users = [f"user-{n}" for n in range(users)]
+        self.clock = start or datetime(2025, 8, 4, 8, 0, 0)
+        self.generators: Dict[str, Callable[[], TrafficRecord]] = {
+            COMMERCE_OPERATION_CREATED: lambda: self.commerce_operation('created'),
+            COMMERCE_OPERATION_UPDATED: lambda: self.commerce_operation('updated'),
+            COMMERCE_OPERATION_DELETED: lambda: self.commerce_operation('deleted'),
+            CUSTOMER_USER_CREATED: lambda: self.customer_user('created'),
+            CUSTOMER_USER_UPDATED: lambda: self.customer_user('updated'),
+            CUSTOMER_COMPANY_UPDATED: self.customer_company,
+            CUSTOMER_INSTITUTION_UPDATED: self.customer_institution,
+            USER_LOGIN: self.user_login,
+            ADHA_AI_EVENTS: self.chat_message,
+            PORTFOLIO_ANALYSIS_REQUEST: self.portfolio_analysis_request,
+            ACCOUNTING_JOURNAL_STATUS: self.journal_status,
+        }
+        unknown = set(self.mix) - set(self.generators)
+        if unknown:
+            raise ValueError(f"No generator for topics: {', '.join(sorted(unknown))}")
+
+    def _id(self) -> str:
+        return str(uuid.UUID(int=self.random.getrandbits(128), version=4))
+
+    def _tick(self) -> datetime:
+        # Environ 50 événements par seconde en moyenne
+        self.clock += timedelta(milliseconds=self.random.expovariate(1 / 20.0))
+        return self.clock
+
+    def _envelope(self, topic: str, key: Optional[str], data: Dict[str, Any], source: str,
+                  event_type: Optional[str] = None) -> TrafficRecord:
+        at = self._tick()
+        value = {
+            'id': self._id(),
+            'type': event_type or topic,
+            'eventType': event_type or topic,
+            'data': data,
+            'metadata': {
+                'correlationId': self._id(),
+                'timestamp': at.isoformat() + 'Z',
+                'source': source,
+                'version': '1.0.0',
+                'retryCount': 0,
+            },
+        }
+        return TrafficRecord(topic, key, value, int(at.timestamp() * 1000))
+
+    def commerce_operation(self, event: str = 'created') -> TrafficRecord:
+        company_id = self.random.choice(self.companies)
+        operation_type = self.random.choice(OPERATION_TYPES)
+        amount = round(self.random.lognormvariate(11, 1.2), 2)  # ~60 000 CDF médian
+        data = {
+            'id': self._id(),
+            'type': operation_type,
+            'date': self.clock.isoformat() + 'Z',
+            'description': f"{operation_type.capitalize()} #{self.random.randint(1000, 99999)}",
+            'amountCdf': amount,
+            'companyId': company_id,
+            'clientId': company_id,
+            'relatedPartyId': f"party-{self.random.randint(1, 500)}",
+            'relatedPartyName': f"Partenaire {self.random.randint(1, 500)}",
+            'status': 'COMPLETED' if event != 'deleted' else 'CANCELLED',
+            'contextInfo': {'source': 'gestion_commerciale', 'mode': 'accounting'},
+        }
+        return self._envelope(f"commerce.operation.{event}", company_id, data, 'gestion_commerciale')
+
+    def customer_user(self, event: str = 'updated') -> TrafficRecord:
+        user_id = self.random.choice(self.users)
+        institution = self.random.random() < 0.2
+        data = {
+            'id': user_id,
+            'email': f"{user_id}@example.cd",
+            'name': f"Utilisateur {user_id.split('-')[1]}",
+            'role': self.random.choice(ROLES),
+            'permissions': self.random.sample(['read', 'write', 'accounting', 'portfolio', 'admin'], 2),
+        }
+        if institution:
+            data['financialInstitution'] = {'id': self.random.choice(self.institutions)}
+        else:
+            data['company'] = {'id': self.random.choice(self.companies)}
+        return self._envelope(f"customer.user.{event}", user_id, data, 'customer_service')
+
+    def customer_company(self) -> TrafficRecord:
+        company_id = self.random.choice(self.companies)
+        data = {'id': company_id, 'name': f"Société {company_id.split('-')[1]}", 'type': 'SME',
+                'status': self.random.choice(['active', 'active', 'suspended'])}
+        return self._envelope(CUSTOMER_COMPANY_UPDATED, company_id, data, 'customer_service')
+
+    def customer_institution(self) -> TrafficRecord:
+        institution_id = self.random.choice(self.institutions)
+        data = {'id': institution_id, 'name': f"Banque {institution_id.split('-')[1]}",
+                'type': self.random.choice(['BANK', 'MICROFINANCE']), 'status': 'active'}
+        return self._envelope(CUSTOMER_INSTITUTION_UPDATED, institution_id, data, 'customer_service')
+
+    def user_login(self) -> TrafficRecord:
+        user_id = self.random.choice(self.users)
+        data = {'userId': user_id, 'companyId': self.random.choice(self.companies), 'customerType': 'sme',
+                'permissions': ['read'], 'timestamp': self.clock.isoformat() + 'Z'}
+        return self._envelope(USER_LOGIN, user_id, data, 'auth_service')
+
+    def chat_message(self) -> TrafficRecord:
+        user_id = self.random.choice(self.users)
+        company_id = self.random.choice(self.companies)
+        data = {
+            'id': self._id(),
+            'conversationId': f"conversation-{self.random.randint(1, 100)}",
+            'userId': user_id,
+            'companyId': company_id,
+            'content': self.random.choice(CHAT_QUESTIONS),
+            'contextInfo': {'source': 'gestion_commerciale', 'mode': 'chat'},
+        }
+        return self._envelope(ADHA_AI_EVENTS, company_id, data, 'gestion_commerciale', 'adha.chat.message')
+
+    def portfolio_analysis_request(self) -> TrafficRecord:
+        institution_id = self.random.choice(self.institutions)
+        data = {
+            'id': self._id(),
+            'portfolioId': f"portfolio-{self.random.randint(1, 40)}",
+            'institutionId': institution_id,
+            'userId': self.random.choice(self.users),
+            'userRole': 'INSTITUTION_ADMIN',
+            'analysisTypes': self.random.sample(['FINANCIAL', 'RISK', 'MARKET', 'OPERATIONAL'], 2),
+            'contextInfo': {'source': 'portfolio_institution', 'mode': 'analysis', 'portfolioType': 'credit'},
+        }
+        return self._envelope(PORTFOLIO_ANALYSIS_REQUEST, institution_id, data, 'portfolio_institution')
+
+    def journal_status(self) -> TrafficRecord:
+        company_id = self.random.choice(self.companies)
+        data = {'journalEntryId': self._id(), 'companyId': company_id,
+                'status': self.random.choice(['POSTED', 'POSTED', 'POSTED', 'REJECTED'])}
+        return self._envelope(ACCOUNTING_JOURNAL_STATUS, company_id, data, 'accounting_service')
+
+    def records(self, count: int) -> Iterator[TrafficRecord]:
+        topics = list(self.mix)
+        weights = [self.mix[topic] for topic in topics]
+        for _ in range(count):
+            yield self.generators[self.random.choices(topics, weights)[0]]()
+
+
+def read_traffic(path: str) -> Iterator[TrafficRecord]:
+    """Trafic capturé (JSONL) ; lignes vides ignorées"""
+    with open(path, encoding='utf-8') as traffic:
+        for line in traffic:
+            if line.strip():
+                entry = json.loads(line)
+                yield TrafficRecord(entry['topic'], entry.get('key'), entry['value'], entry.get('timestamp'))
+
+
+def write_traffic(path: str, records: Iterable[TrafficRecord]) -> int:
+    written = 0
+    with open(path, 'w', encoding='utf-8') as traffic:
+        for record in records:
+            traffic.write(json.dumps({'topic': record.topic, 'key': record.key, 'value': record.value,
+                                      'timestamp': record.timestamp}, ensure_ascii=False) + '\n')
+            written += 1
+    return written
+
+
+def capture(consumer, path: str, limit: int, timeout: float = 60.0) -> int:
+    """
+    Enregistre au plus ``limit`` messages lus par ``consumer`` (KafkaConsumer
+    abonné et désérialisant en JSON, ou consumer en mémoire) pendant ``timeout``.
+    """
+    deadline = time.time() + timeout
+
+    def records():
+        captured = 0
+        while captured < limit and time.time() < deadline:
+            for batch in consumer.poll(timeout_ms=500, max_records=limit - captured).values():
+                for record in batch:
+                    key = record.key.decode('utf-8') if isinstance(record.key, bytes) else record.key
+                    yield TrafficRecord(record.topic, key, record.value, record.timestamp)
+                    captured += 1
+
+    return write_traffic(path, records())
+
+
+def replay(broker: InMemoryBroker, records: Iterable[TrafficRecord], speed: Optional[float] = None,
+           on_send: Optional[Callable[[TrafficRecord], Any]] = None) -> int:
+    """
+    Publie ``records`` sur ``broker``. Avec ``speed``, les écarts d'origine
+    entre enregistrements (timestamps) sont respectés, divisés par ``speed`` ;
+    sans, tout est publié d'un bloc.
+    """
+    sent = 0
+    first_timestamp = started = None
+    for record in records:
+        if speed and record.timestamp is not None:
+            if first_timestamp is None:
+                first_timestamp, started = record.timestamp, time.monotonic()
+            delay = (record.timestamp - first_timestamp) / 1000.0 / speed - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        if on_send:
+            on_send(record)
+        broker.produce(record.topic, record.value, key=record.key)
+        sent += 1
+    return sent
+
+
+class StubLLMError(Exception):
+    """Erreur simulée de l'API (429, 5xx)"""
+
+
+class StubRateLimitError(StubLLMError):
+    """Quota de requêtes ou de jetons dépassé (HTTP 429, comme openai.RateLimitError)"""
+    status_code = 429
+
+
+class StubLLM:
+    """
+    Client OpenAI simulé (``client.chat.completions.create``) : chaque appel
+    attend ``latency_ms`` (± ``jitter_ms``) comme un appel réseau, échoue avec
+    la probabilité ``error_rate`` et compte les jetons. Remplace le ``client``
+    d'un agent ou les traitements de ``StubTaskRouter``.
+
+    ``content`` est la réponse, ou une fonction ``(model, messages) -> str`` ;
+    ``model_latency_ms`` donne la latence par préfixe de modèle (niveaux du
+    routeur de modèles).
+
+    ``requests_per_minute`` / ``tokens_per_minute`` reproduisent les quotas
+    d'OpenAI (seaux rechargés en continu sur ``period`` secondes) : au-delà,
+    l'appel échoue aussitôt avec ``StubRateLimitError``. Comme l'API, le quota
+    de jetons est débité du prompt et de ``max_tokens`` à la réception.
+    """
+
+    def __init__(self, latency_ms: float = 200.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 completion_tokens: int = 150, seed: Optional[int] = None,
+                 content: str = "Réponse simulée de l'assistant.", requests_per_minute: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None, period: float = 60.0,
+                 model_latency_ms: Optional[Dict[str, float]] = None):
+        self.latency_ms = latency_ms
+        self.model_latency_ms = model_latency_ms or {}
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.completion_tokens = completion_tokens
+        self.content = content
+        self.random = random.Random(seed)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.period = period
+        self._quotas = {name: [limit, limit, time.monotonic()]
+                        for name, limit in (('requests', requests_per_minute), ('tokens', tokens_per_minute))
+                        if limit}
+        self.stats = {'calls': 0, 'errors': 0, 'rate_limited': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                      'peak_concurrency': 0}
+
+    def create(self, model: str = 'gpt-4o-mini', messages: Iterable[Dict[str, Any]] = (), **kwargs):
+        self._charge(messages, kwargs)
+        latency, failed = self._begin(model)
+        try:
+            time.sleep(latency)
+            return self._response(model, messages, failed)
+        finally:
+            self._end()
+
+    def _charge(self, messages: Iterable[Dict[str, Any]], kwargs: Dict[str, Any]):
+        if not self._quotas:
+            return
+        tokens = self._prompt_tokens(messages) + (kwargs.get('max_tokens') or self.completion_tokens)
+        with self._lock:
+            now = time.monotonic()
+            levels = {}
+            for name, (limit, level, updated) in self._quotas.items():
+                levels[name] = min(limit, level + (now - updated) * limit / self.period)
+            cost = {'requests': 1, 'tokens': tokens}
+            allowed = all(levels[name] >= cost[name] for name in levels)
+            for name, level in levels.items():
+                self._quotas[name][1:] = [level - cost[name] if allowed else level, now]
+            if not allowed:
+                self.stats['rate_limited'] += 1
+                raise StubRateLimitError('Simulated OpenAI error 429: rate limit reached')
+
+    @staticmethod
+    def _prompt_tokens(messages: Iterable[Dict[str, Any]]) -> int:
+        return sum(len(str(message.get('content', ''))) for message in messages) // 4 + 1
+
+    def _begin(self, model: Optional[str] = None):
+        prefixes = [prefix for prefix in self.model_latency_ms if model and model.startswith(prefix)]
+        base = self.model_latency_ms[max(prefixes, key=len)] if prefixes else self.latency_ms
+        with self._lock:
+            self._in_flight += 1
+            self.stats['calls'] += 1
+            self.stats['peak_concurrency'] = max(self.stats['peak_concurrency'], self._in_flight)
+            latency = max(0.0, base + self.random.uniform(-self.jitter_ms, self.jitter_ms))
+            return latency / 1000.0, self.random.random() < self.error_rate
+
+    def _end(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _response(self, model: str, messages: Iterable[Dict[str, Any]], failed: bool):
+        if failed:
+            with self._lock:
+                self.stats['errors'] += 1
+            raise StubLLMError('Simulated OpenAI error (rate limit)')
+        prompt_tokens = self._prompt_tokens(messages)
+        content = self.content(model, messages) if callable(self.content) else self.content
+        with self._lock:
+            self.stats['prompt_tokens'] += prompt_tokens
+            self.stats['completion_tokens'] += self.completion_tokens
+        return SimpleNamespace(
+            id=f"chatcmpl-stub-{self.stats['calls']}",
+            model=model,
+            choices=[SimpleNamespace(index=0, finish_reason='stop',
+                                     message=SimpleNamespace(role='assistant', content=content, tool_calls=None))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=self.completion_tokens,
+                                  total_tokens=prompt_tokens + self.completion_tokens),
+        )
+
+
+class AsyncStubLLM(StubLLM):
+    """Variante ``AsyncOpenAI`` de StubLLM : ``create`` est une coroutine (runtime asyncio)"""
+
+    async def create(self, model: str = 'gpt-4o-mini', messages: Iterable[Dict[str, Any]] = (), **kwargs):
+        self._charge(messages, kwargs)
+        latency, failed = self._begin(model)
+        try:
+            await asyncio.sleep(latency)
+            return self._response(model, messages, failed)
+        finally:
+            self._end()
+
+
+def _stub_task_router(llm: StubLLM, analysis_calls: int = 3):
+    """
+    TaskRouter au routage réel (voies, types de tâche) dont les traitements
+    sont simulés : un appel LLM par chat, ``analysis_calls`` par analyse de
+    portefeuille, écritures comptables et statuts sans LLM.
+    """
+    from api.services.task_router import TaskRouter
+
+    class StubTaskRouter(TaskRouter):
+        def process_chat_task(self, message):
+            response = llm.chat.completions.create(
+                model='gpt-4o-mini', messages=[{'role': 'user', 'content': message.get('content', '')}]
+            )
+            return {'type': 'chat_response', 'content': response.choices[0].message.content}
+
+        def process_portfolio_analysis_task(self, message):
+            for analysis_type in message.get('analysis_types') or ['FINANCIAL'] * analysis_calls:
+                llm.chat.completions.create(model='gpt-4o', messages=[{'role': 'user', 'content': analysis_type}])
+            return {'type': 'portfolio_analysis_response', 'portfolio_id': message.get('portfolio_id')}
+
+        def process_accounting_task(self, message):
+            return self.process_accounting_batch([message])[0]
+
+        def process_accounting_batch(self, messages):
+            return [{'type': 'accounting_response',
+                     'journal_entry': {'sourceId': message.get('id'), 'amount': message.get('amount_cdf')}}
+                    for message in messages]
+
+        def process_accounting_status_task(self, message):
+            return {'type': 'accounting_status_response', 'status': message.get('status')}
+
+    return StubTaskRouter()
+
+
+def _percentile(ordered: List[float], percentile: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * percentile))], 3)
+
+
+class LatencyProbe:
+    """
+    Latence de bout en bout par message : publication (``sent``) -> retour du
+    handler du consumer (``attach`` enveloppe les handlers enregistrés). Seul
+    le premier traitement d'un message compte.
+    """
+
+    def __init__(self):
+        self._sent: Dict[str, float] = {}
+        self._seen = set()
+        self._condition = threading.Condition()
+        self.latencies: Dict[str, List[float]] = {}
+        self.completed = 0
+        self.finished_at: Optional[float] = None
+
+    def sent(self, record: TrafficRecord):
+        message_id = record.value.get('id') if isinstance(record.value, dict) else None
+        if message_id:
+            with self._condition:
+                self._sent[message_id] = time.perf_counter()
+
+    def attach(self, consumer):
+        """Enveloppe les handlers d'un RobustKafkaConsumer ; renvoie le consumer"""
+        for topic, handler in list(consumer.message_handlers.items()):
+            consumer.message_handlers[topic] = self._wrap(handler, batch=False)
+        for topic, handler in list(consumer.batch_handlers.items()):
+            consumer.batch_handlers[topic] = self._wrap(handler, batch=True)
+        return consumer
+
+    def _wrap(self, handler, batch: bool):
+        @wraps(handler)
+        def probed(messages):
+            try:
+                return handler(messages)
+            finally:
+                self._done(messages if batch else [messages])
+        return probed
+
+    def _done(self, messages):
+        now = time.perf_counter()
+        with self._condition:
+            for message in messages:
+                message_id = message.get('id')
+                if message_id in self._seen:
+                    continue
+                self._seen.add(message_id)
+                started = self._sent.pop(message_id, None)
+                if started is not None:
+                    topic = message.get('metadata', {}).get('kafka_topic', 'unknown')
+                    self.latencies.setdefault(topic, []).append((now - started) * 1000)
+                self.completed += 1
+            self.finished_at = now
+            self._condition.notify_all()
+
+    def wait(self, count: int, timeout: float) -> bool:
+        with self._condition:
+            return self._condition.wait_for(lambda: self.completed >= count, timeout)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._condition:
+            everything = sorted(latency for latencies in self.latencies.values() for latency in latencies)
+            return {
+                'latency_ms': self._percentiles(everything),
+                'topics': {topic: dict(processed=len(latencies), **self._percentiles(sorted(latencies)))
+                           for topic, latencies in sorted(self.latencies.items())},
+            }
+
+    @staticmethod
+    def _percentiles(ordered: List[float]) -> Dict[str, Optional[float]]:
+        return {'p50': _percentile(ordered, 0.50), 'p95': _percentile(ordered, 0.95),
+                'p99': _percentile(ordered, 0.99), 'max': round(ordered[-1], 3) if ordered else None}
+
+
+def _consumer_factory(broker: InMemoryBroker):
+    from .robust_kafka_client import kafka_config
+
+    def create(topics, group_id):
+        return broker.consumer(*topics, group_id=group_id, max_poll_records=kafka_config.max_poll_records)
+    return create
+
+
+def _unified(broker: InMemoryBroker, probe: LatencyProbe, llm: StubLLM):
+    from .idempotency import IdempotencyGuard, InMemoryIdempotencyStore
+    from .retry_topics import RetryScheduler
+    from .unified_consumer import UnifiedConsumer
+
+    class ProbedUnifiedConsumer(UnifiedConsumer):
+        def _create_consumer(self, role):
+            return probe.attach(super()._create_consumer(role))
+
+    consumer = ProbedUnifiedConsumer(
+        consumer_factory=_consumer_factory(broker), router=_stub_task_router(llm),
+        retry_scheduler=RetryScheduler(producer=broker.producer()),
+        idempotency=IdempotencyGuard(store=InMemoryIdempotencyStore()),
+    )
+    return consumer, consumer.topics, consumer.start
+
+
+def _customer_data(broker: InMemoryBroker, probe: LatencyProbe, llm: StubLLM):
+    # Cache Django (Redis ou mémoire locale) : nécessite des settings configurés
+    from .customer_data_consumer import CustomerDataConsumer
+
+    class ProbedCustomerDataConsumer(CustomerDataConsumer):
+        def _create_consumer(self):
+            return probe.attach(super()._create_consumer())
+
+    consumer = ProbedCustomerDataConsumer(consumer_factory=_consumer_factory(broker))
+    return consumer, consumer.topics, consumer.start_consuming
+
+
+# Consumers du banc : (broker, sonde, LLM) -> (consumer, topics, méthode bloquante)
+CONSUMERS = {
+    'unified': _unified,
+    'customer_data': _customer_data,
+}
+
+
+def run_benchmark(consumer: str, records: Iterable[TrafficRecord], llm: Optional[StubLLM] = None,
+                  speed: Optional[float] = None, partitions: int = 6, timeout: float = 300.0) -> Dict[str, Any]:
+    """
+    Fait passer ``records`` (limités aux topics du consumer) par un consumer
+    sur un broker en mémoire. Sans ``speed``, le trafic est publié avant le
+    démarrage : le débit mesuré est celui du rattrapage d'un arriéré.
+
+    Returns:
+        Dict: messages, durée, messages par seconde, percentiles de latence
+        (globaux et par topic), appels au LLM simulé
+    """
+    llm = llm or StubLLM()
+    broker = InMemoryBroker(partitions=partitions)
+    probe = LatencyProbe()
+    instance, topics, run = CONSUMERS[consumer](broker, probe, llm)
+    selected = [record for record in records if record.topic in topics]
+
+    if not speed:
+        replay(broker, selected, on_send=probe.sent)
+    thread = threading.Thread(target=run, name=f"benchmark-{consumer}", daemon=True)
+    started = time.perf_counter()
+    thread.start()
+    if speed:
+        replay(broker, selected, speed=speed, on_send=probe.sent)
+    completed = probe.wait(len(selected), timeout)
+    instance.stop()
+    thread.join(30)
+    if not completed:
+        logger.warning(f"Benchmark {consumer}: {probe.completed}/{len(selected)} messages processed "
+                       f"in {timeout}s")
+
+    seconds = ((probe.finished_at or time.perf_counter()) - started)
+    return dict(
+        consumer=consumer,
+        messages=len(selected),
+        processed=probe.completed,
+        seconds=round(seconds, 3),
+        messages_per_sec=round(probe.completed / seconds, 1) if seconds > 0 else None,
+        llm=dict(llm.stats),
+        **probe.summary(),
+    )
+
+
+# Catégorie de AAgent.classify_operation attendue par type d'opération commerciale
+OPERATION_CATEGORIES = {
+    'SALE': 'vente_marchandises',
+    'PURCHASE': 'achat_marchandises',
+    'EXPENSE': 'autre',
+    'INCOME': 'autre',
+    'PAYMENT_RECEIVED': 'encaissement_client',
+    'PAYMENT_SENT': 'reglement_fournisseur',
+}
+ROUTING_CLASSIFY_PROMPT = "Vous êtes un expert-comptable SYSCOHADA. Classifiez cette opération."
+ROUTING_ENTRIES_PROMPT = "En tant qu'expert-comptable SYSCOHADA, générez les écritures comptables en JSON."
+
+
+class RoutedAnswers:
+    """
+    Réponses de ``StubLLM`` pour le rejeu du routage : catégorie, écritures
+    équilibrées ou réponse de chat. Le modèle économique (``fast_model``) se
+    trompe avec la probabilité ``fast_error_rate`` : catégorie inconnue,
+    écriture déséquilibrée ou réponse vide, que les validateurs rejettent.
+    """
+
+    def __init__(self, fast_model: str = 'gpt-4o-mini', fast_error_rate: float = 0.1, seed: int = 0):
+        self.fast_model = fast_model
+        self.fast_error_rate = fast_error_rate
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, model: str, messages: Iterable[Dict[str, Any]]) -> str:
+        messages = list(messages)
+        system = str(messages[0].get('content', '')) if messages else ''
+        text = str(messages[-1].get('content', '')) if messages else ''
+        with self._lock:
+            wrong = model.startswith(self.fast_model) and self.random.random() < self.fast_error_rate
+        if system == ROUTING_CLASSIFY_PROMPT:
+            operation = text.split('Opération ', 1)[-1].split(' ', 1)[0]
+            return 'operation_inconnue' if wrong else OPERATION_CATEGORIES.get(operation, 'autre')
+        if system == ROUTING_ENTRIES_PROMPT:
+            amount = float(text.rsplit('montant ', 1)[-1].split(' ', 1)[0])
+            credited = round(amount * 0.9, 2) if wrong else amount
+            return json.dumps({'proposals': [{
+                'description': text[:80], 'date': '04/08/2025', 'journal': 'OD',
+                'debit': [{'compte': '601', 'montant': amount, 'libelle': 'Opération'}],
+                'credit': [{'compte': '401', 'montant': credited, 'libelle': 'Contrepartie'}],
+            }], 'confidence': 0.9})
+        return '' if wrong else "Réponse simulée de l'assistant."
+
+
+def routing_calls(records: Iterable[TrafficRecord]) -> Iterator[Dict[str, Any]]:
+    """
+    Appels LLM des agents pour un trafic : un ``history.chat`` par message de
+    chat, ``aa.classify`` puis ``aa.entries`` par opération commerciale créée
+    ou modifiée (modèle d'écriture trouvé sauf pour la catégorie ``autre``).
+    """
+    from agents.utils.model_router import has_content, journal_entries, one_of
+
+    classify = one_of(set(OPERATION_CATEGORIES.values()))
+    for record in records:
+        data = (record.value.get('data') if isinstance(record.value, dict) else None) or {}
+        if record.topic == ADHA_AI_EVENTS:
+            yield dict(site='history.chat', validate=has_content, max_tokens=1500,
+                       messages=[{'role': 'user', 'content': data.get('content', '')}])
+        elif record.topic in (COMMERCE_OPERATION_CREATED, COMMERCE_OPERATION_UPDATED):
+            operation = data.get('type', '')
+            text = (f"Opération {operation} : {data.get('description', '')} avec {data.get('relatedPartyName', '')}, "
+                    f"montant {data.get('amountCdf', 0)} CDF")
+            yield dict(site='aa.classify', validate=classify, max_tokens=50,
+                       messages=[{'role': 'system', 'content': ROUTING_CLASSIFY_PROMPT},
+                                 {'role': 'user', 'content': text}])
+            yield dict(site='aa.entries', validate=journal_entries, max_tokens=1000, doc_type='prompt',
+                       template_matched=OPERATION_CATEGORIES.get(operation, 'autre') != 'autre',
+                       messages=[{'role': 'system', 'content': ROUTING_ENTRIES_PROMPT},
+                                 {'role': 'user', 'content': text}])
+
+
+def run_routing_replay(records: Iterable[TrafficRecord], llm: Optional[StubLLM] = None, router=None,
+                       workers: int = 16) -> Dict[str, Any]:
+    """
+    Rejoue les appels LLM d'un trafic à travers ``router`` (un ``ModelRouter``
+    neuf par défaut) sur ``llm``.
+
+    Returns:
+        Dict: statistiques du routeur (appels, coût et latence par niveau,
+        escalades par site, ``escalation_rate``) et durée du rejeu
+    """
+    from agents.utils.model_router import ModelRouter
+
+    router = router or ModelRouter()
+    llm = llm or StubLLM(latency_ms=0, content=RoutedAnswers(router.models['fast']))
+    calls = list(routing_calls(records))
+
+    def call(arguments):
+        arguments = dict(arguments)
+        router.complete(llm, arguments.pop('site'), arguments.pop('messages'), **arguments)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(call, calls))
+    return dict(router.stats(), seconds=round(time.perf_counter() - started, 3))
+
+
+def format_routing_report(report: Dict[str, Any]) -> str:
+    lines = [
+        f"routing: {report['calls']} calls in {report['seconds']}s, escalation rate {report['escalation_rate']:.1%} "
+        f"of the fast-tier calls ({report['escalated_share_of_calls']:.1%} of all calls), "
+        f"cost ${report['cost_usd']:.4f} vs ${report['strong_only_cost_usd']:.4f} on the strong model only"
+    ]
+    for tier, stats in report['tiers'].items():
+        latency = stats['latency_ms']
+        lines.append(f"  {tier} ({stats['model']}): {stats['calls']} calls, {stats['rejected']} rejected, "
+                     f"{stats['errors']} errors, ${stats['cost_usd']:.4f}, p50 {latency['p50']}ms p95 {latency['p95']}ms")
+    for site, stats in sorted(report['sites'].items()):
+        lines.append(f"  {site}: {stats['calls']} calls, fast {stats['fast']}, strong {stats['strong']}, "
+                     f"escalated {stats['escalated']}")
+    return '\n'.join(lines)
+
+
+
+# Corpus de documents du banc du chemin rapide SYSCOHADA : part de chaque type
+DOCUMENT_MIX = {
+    'purchase_invoice': 0.35,
+    'sale_invoice': 0.15,
+    'cash_receipt': 0.20,
+    'tax_rate_line': 0.10,
+    'inconsistent_totals': 0.10,
+    'bank_statement': 0.05,
+    'note': 0.05,
+}
+SUPPLIERS = ['Kivu Distribution SARL', 'Brasimba SA', 'Katanga Fournitures', 'Lubumbashi Matériaux', 'Congo Office']
+COMPANY_NAME = 'Wanzo Commerce'
+CLIENTS = ['Boutique Mama Neema', 'Hôtel du Lac', 'Pharmacie Tujenge', 'Ets Mukendi', 'Kinshasa Bureautique']
+ARTICLES = [('Riz 25kg', 45000), ('Huile 5L', 18000), ('Ciment 50kg', 32000), ('Ramette papier', 7500),
+            ('Savon carton', 21000), ('Tôle ondulée', 26000)]
+
+
+def _amount(value: int) -> str:
+    return f"{value:,}".replace(',', ' ')
+
+
+def document_corpus(count: int, seed: int = 0, mix: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """
+    Textes de documents (OCR) répartis selon ``mix`` (``DOCUMENT_MIX`` par
+    défaut), avec l'intention transmise à AAgent ; l'entreprise du tenant
+    (``COMPANY_NAME``) est le client des achats et le fournisseur des ventes.
+    Les cas difficiles sont inclus : ligne « TVA 16% » lue comme montant,
+    totaux incohérents, relevés bancaires et notes sans type reconnu.
+    """
+    rng = random.Random(seed)
+    mix = mix or DOCUMENT_MIX
+    kinds, weights = list(mix), list(mix.values())
+    documents = []
+    for number in range(1, count + 1):
+        kind = rng.choices(kinds, weights)[0]
+        date = (datetime(2025, 1, 1) + timedelta(days=rng.randrange(300))).strftime('%d/%m/%Y')
+        lines, subtotal = [], 0
+        for description, price in rng.sample(ARTICLES, rng.randint(1, 3)):
+            quantity = rng.randint(1, 12)
+            lines.append(f"{description} {quantity} {_amount(price)} {_amount(quantity * price)}")
+            subtotal += quantity * price
+        tax = subtotal * 16 // 100
+        supplier, client = rng.choice(SUPPLIERS), rng.choice(CLIENTS)
+        intent = None
+        if kind == 'sale_invoice':
+            supplier, client, intent = COMPANY_NAME, client, 'vente_marchandises'
+        elif kind != 'note':
+            client = COMPANY_NAME
+            intent = rng.choice([None, 'achat_marchandises', 'ecriture_simple'])
+
+        if kind in ('purchase_invoice', 'sale_invoice', 'tax_rate_line', 'inconsistent_totals'):
+            tax_line = f"TVA 16% : {_amount(tax)}" if kind == 'tax_rate_line' else f"TVA : {_amount(tax)}"
+            total = subtotal - tax if kind == 'inconsistent_totals' else subtotal + tax
+            text = '\n'.join([f"FACTURE N° FA-2025-{number:04d}", f"Date : {date}", f"Fournisseur : {supplier}",
+                              f"Client : {client}", "Désignation Qté PU Montant", *lines,
+                              f"Total HT : {_amount(subtotal)}", tax_line, f"Total TTC : {_amount(total)}"])
+        elif kind == 'cash_receipt':
+            text = '\n'.join([f"REÇU N° R-{number:04d}", f"Date : {date}", supplier, "Fournitures diverses",
+                              f"Total : {_amount(subtotal)} FC", "Payé en espèces"])
+        elif kind == 'bank_statement':
+            text = '\n'.join([f"RELEVÉ BANCAIRE N° RB-{number:04d}", f"Date : {date}", f"Virement {supplier} {_amount(subtotal)}",
+                              f"Solde : {_amount(subtotal * 3)}"])
+        else:
+            text = '\n'.join([f"Note interne du {date}", f"Avance sur frais de mission à {client} : {_amount(subtotal)} FC"])
+        documents.append({'kind': kind, 'text': text, 'intent': intent})
+    return documents
+
+
+def extracted_document(text: str) -> Dict[str, Any]:
+    """Données d'un texte extraites comme le fait DDEAgent (``DocumentExtractor``)."""
+    from agents.utils.document_extraction import DocumentExtractor
+
+    data = DocumentExtractor().extract_data(text)
+    number = lambda value: float(value) if value is not None else None
+    return {
+        'document_type': data.document_type, 'full_text': text, 'reference': data.reference, 'date': data.date,
+        'supplier': data.supplier_name, 'client': data.client_name, 'currency': data.currency,
+        'items': [{'description': item.description, 'quantity': number(item.quantity),
+                   'unit_price': number(item.unit_price), 'amount': number(item.amount),
+                   'tax_rate': number(item.tax_rate), 'tax_amount': number(item.tax_amount)} for item in data.items],
+        'subtotal': number(data.subtotal), 'tax_total': number(data.tax_total), 'total': number(data.total),
+        'payment_method': data.payment_method,
+    }
+
+
+def run_fast_path_benchmark(documents: Iterable[Dict[str, Any]], llm: Optional[StubLLM] = None, engine=None,
+                            workers: int = 8) -> Dict[str, Any]:
+    """
+    Écritures d'un corpus de documents, d'abord par le chemin rapide
+    (``SyscohadaRulesEngine`` puis LLM pour les documents refusés), puis tout
+    par le LLM (``aa.document_entries`` à travers un ``ModelRouter``).
+
+    Returns:
+        Dict: part des documents sans appel LLM (par type), latence de
+        production de l'écriture (hors extraction) et jetons des deux passes
+    """
+    from agents.logic.aa_agent import AAgent
+    from agents.utils.model_router import ModelRouter, journal_entries
+    from agents.utils.syscohada_rules import SyscohadaRulesEngine
+
+    engine = engine or SyscohadaRulesEngine(AAgent._load_syscohada_templates(None))
+    llm = llm or StubLLM(latency_ms=0, content=RoutedAnswers(fast_error_rate=0.0))
+    documents = [dict(document, data=extracted_document(document['text'])) for document in documents]
+
+    def llm_entries(router, document):
+        data = document['data']
+        router.complete(llm, 'aa.document_entries', max_tokens=1000, validate=journal_entries,
+                        doc_type=data['document_type'],
+                        messages=[{'role': 'system', 'content': ROUTING_ENTRIES_PROMPT},
+                                  {'role': 'user', 'content': f"{data['full_text']}\nmontant {data['total'] or 0} CDF"}])
+
+    def run(fast_path: bool):
+        router = ModelRouter()
+
+        def produce(document):
+            started = time.perf_counter()
+            bypassed = fast_path and engine.propose(document['data'], document['intent'],
+                                                    company_name=COMPANY_NAME) is not None
+            if not bypassed:
+                llm_entries(router, document)
+            return bypassed, (time.perf_counter() - started) * 1000
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(produce, documents))
+        stats = router.stats()
+        tokens = sum(tier['prompt_tokens'] + tier['completion_tokens'] for tier in stats['tiers'].values())
+        latencies = sorted(latency for _, latency in outcomes)
+        return outcomes, {'llm_calls': stats['calls'], 'tokens': tokens, 'cost_usd': stats['cost_usd'],
+                          'latency_ms': {'p50': _percentile(latencies, 0.50), 'p95': _percentile(latencies, 0.95),
+                                         'mean': round(sum(latencies) / len(latencies), 3) if latencies else None}}
+
+    outcomes, fast = run(fast_path=True)
+    _, baseline = run(fast_path=False)
+    kinds: Dict[str, Dict[str, int]] = {}
+    for document, (bypassed, _) in zip(documents, outcomes):
+        stats = kinds.setdefault(document['kind'], {'documents': 0, 'bypassed': 0})
+        stats['documents'] += 1
+        stats['bypassed'] += bypassed
+    bypassed = sum(bypassed for bypassed, _ in outcomes)
+    return {
+        'documents': len(documents),
+        'bypassed': bypassed,
+        'bypass_rate': round(bypassed / len(documents), 4) if documents else 0.0,
+        'kinds': kinds,
+        'fast_path': fast,
+        'llm_only': baseline,
+        'token_savings': round(1 - fast['tokens'] / baseline['tokens'], 4) if baseline['tokens'] else 0.0,
+        'fallthrough_reasons': engine.stats()['fallthrough_reasons'],
+    }
+
+
+def format_fast_path_report(report: Dict[str, Any]) -> str:
+    fast, baseline = report['fast_path'], report['llm_only']
+    lines = [
+        f"fast path: {report['bypassed']}/{report['documents']} documents without LLM ({report['bypass_rate']:.1%}), "
+        f"tokens {fast['tokens']} vs {baseline['tokens']} LLM only ({report['token_savings']:.1%} saved), "
+        f"mean latency {fast['latency_ms']['mean']}ms vs {baseline['latency_ms']['mean']}ms, "
+        f"p50 {fast['latency_ms']['p50']}ms vs {baseline['latency_ms']['p50']}ms"
+    ]
+    for kind, stats in report['kinds'].items():
+        lines.append(f"  {kind}: {stats['bypassed']}/{stats['documents']} without LLM")
+    for reason, count in report['fallthrough_reasons'].items():
+        lines.append(f"  sent to the LLM: {reason} ({count})")
+    return '\n'.join(lines)
+
+def format_report(report: Dict[str, Any]) -> str:
+    latency = report['latency_ms']
+    lines = [
+        f"{report['consumer']}: {report['processed']}/{report['messages']} messages in {report['seconds']}s "
+        f"({report['messages_per_sec']} msg/s), latency p50 {latency['p50']}ms p95 {latency['p95']}ms "
+        f"p99 {latency['p99']}ms max {latency['max']}ms, LLM calls {report['llm']['calls']}"
+    ]
+    for topic, stats in report['topics'].items():
+        lines.append(f"  {topic}: {stats['processed']} messages, p50 {stats['p50']}ms p99 {stats['p99']}ms")
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Benchmark of the Kafka consumers on an in-memory broker')
+    parser.add_argument('--consumer', choices=[*CONSUMERS, 'all'], default='all')
+    parser.add_argument('--messages', type=int, default=2000, help='Synthetic messages to generate')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--replay', help='Captured JSONL traffic to replay instead of synthetic traffic')
+    parser.add_argument('--speed', type=float, help='Replay at the original pace divided by SPEED '
+                                                    '(default: publish everything before starting)')
+    parser.add_argument('--llm-latency-ms', type=float, default=200.0)
+    parser.add_argument('--llm-jitter-ms', type=float, default=0.0)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--partitions', type=int, default=6)
+    parser.add_argument('--timeout', type=float, default=300.0)
+    parser.add_argument('--json', action='store_true', help='Print the reports as JSON')
+    parser.add_argument('--routing', action='store_true',
+                        help='Replay the LLM calls of the traffic through the model router instead')
+    parser.add_argument('--fast-latency-ms', type=float, default=None,
+                        help='Latency of the fast tier for --routing (default: a third of --llm-latency-ms)')
+    parser.add_argument('--fast-error-rate', type=float, default=0.1,
+                        help='Share of wrong answers of the fast tier for --routing')
+    parser.add_argument('--fast-path', action='store_true',
+                        help='Benchmark the SYSCOHADA fast path of AAgent on a corpus of MESSAGES documents')
+    options = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    if options.fast_path:
+        llm = StubLLM(options.llm_latency_ms, options.llm_jitter_ms, options.llm_error_rate, seed=options.seed,
+                      content=RoutedAnswers(fast_error_rate=options.fast_error_rate, seed=options.seed))
+        # Les agents et l'extracteur affichent leur progression : sortie masquée pendant le banc
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = run_fast_path_benchmark(document_corpus(options.messages, options.seed), llm=llm)
+        print(json.dumps(report, ensure_ascii=False) if options.json else format_fast_path_report(report))
+        return
+    if options.replay:
+        records = list(read_traffic(options.replay))
+    else:
+        records = list(TrafficGenerator(seed=options.seed).records(options.messages))
+    if options.routing:
+        from agents.utils.model_router import DEFAULT_MODELS, FAST, STRONG
+        fast_latency = options.llm_latency_ms / 3 if options.fast_latency_ms is None else options.fast_latency_ms
+        llm = StubLLM(options.llm_latency_ms, options.llm_jitter_ms, options.llm_error_rate, seed=options.seed,
+                      content=RoutedAnswers(DEFAULT_MODELS[FAST], options.fast_error_rate, options.seed),
+                      model_latency_ms={DEFAULT_MODELS[FAST]: fast_latency,
+                                        DEFAULT_MODELS[STRONG]: options.llm_latency_ms})
+        # CCCAgent affiche chaque vérification : sortie masquée pendant le rejeu
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = run_routing_replay(records, llm=llm)
+        print(json.dumps(report, ensure_ascii=False) if options.json else format_routing_report(report))
+        return
+    reports = []
+    for consumer in (CONSUMERS if options.consumer == 'all' else [options.consumer]):
+        llm = StubLLM(options.llm_latency_ms, options.llm_jitter_ms, options.llm_error_rate, seed=options.seed)
+        try:
+            reports.append(run_benchmark(consumer, records, llm=llm, speed=options.speed,
+                                         partitions=options.partitions, timeout=options.timeout))
+        except ImportError as e:
+            print(f"{consumer}: skipped ({e})")
+    for report in reports:
+        print(json.dumps(report, ensure_ascii=False) if options.json else format_report(report))
+
+
+if __name__ == '__main__':
+    main()
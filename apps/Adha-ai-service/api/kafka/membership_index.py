@@ -0,0 +1,178 @@
+"""
+Index des membres des sociétés et institutions (CustomerDataConsumer).
+
+Les utilisateurs d'une société (``company``) ou d'une institution
+(``institution``) sont conservés dans des ensembles Redis natifs : ajout et
+retrait par SADD / SREM, atomiques côté serveur (plus de lecture-modification-
+écriture d'un ``set`` Python sérialisé, qui perdait des mises à jour entre
+consumers concurrents). Les commandes d'un lot d'événements partent dans un
+seul pipeline.
+
+Invalidation :
+- des contextes d'une société ou institution : SMEMBERS puis UNLINK de tous
+  les contextes utilisateur en un seul pipeline ;
+- de tout l'index : les clés portent un numéro de version, ``invalidate_all``
+  l'incrémente et les anciens ensembles expirent d'eux-mêmes (TTL).
+
+Sans client Redis (cache Django local en développement), ``CacheMembershipIndex``
+garde le comportement précédent à travers le cache Django.
+"""
+
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+COMPANY = 'company'
+INSTITUTION = 'institution'
+
+VERSION_KEY = 'customer_membership_version'
+UNLINK_CHUNK = 1000
+
+Owner = Tuple[str, str]  # (COMPANY | INSTITUTION, identifiant)
+
+
+def user_context_key(user_id) -> str:
+    """Clé de cache du contexte d'isolation d'un utilisateur (lue par le middleware)"""
+    return f"user_context_{user_id}"
+
+
+def members_key(kind: str, owner_id, version=0) -> str:
+    return f"{kind}_users_v{version}_{owner_id}"
+
+
+def _text(value) -> str:
+    return value.decode('utf-8') if isinstance(value, bytes) else str(value)
+
+
+class RedisMembershipIndex:
+    """
+    Index sur des ensembles Redis. ``make_key`` applique le préfixe et la
+    version de clé du cache Django (les contextes utilisateur invalidés sont
+    ceux que le cache Django a écrits).
+    """
+
+    def __init__(self, client, ttl: int, make_key: Callable[[str], str] = str):
+        self.client = client
+        self.ttl = ttl
+        self.make_key = make_key
+
+    def version(self) -> int:
+        return int(self.client.get(self.make_key(VERSION_KEY)) or 0)
+
+    def _members_key(self, owner: Owner, version: int) -> str:
+        return self.make_key(members_key(owner[0], owner[1], version))
+
+    def update(self, added: Dict[Owner, Set[str]], removed: Optional[Dict[Owner, Set[str]]] = None):
+        """Ajoute et retire des membres : un pipeline pour tout le lot"""
+        removed = removed or {}
+        if not added and not removed:
+            return
+        version = self.version()
+        pipe = self.client.pipeline(transaction=False)
+        for owner, user_ids in removed.items():
+            if user_ids:
+                pipe.srem(self._members_key(owner, version), *user_ids)
+        for owner, user_ids in added.items():
+            if user_ids:
+                key = self._members_key(owner, version)
+                pipe.sadd(key, *user_ids)
+                pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def members(self, kind: str, owner_id) -> Set[str]:
+        key = self._members_key((kind, owner_id), self.version())
+        return {_text(user_id) for user_id in self.client.smembers(key)}
+
+    def invalidate_users(self, kind: str, owner_id) -> int:
+        """
+        Supprime les contextes d'isolation des membres (resynchronisés au
+        prochain accès) : UNLINK pipeliné, libération de la mémoire hors du
+        thread principal de Redis.
+
+        Returns:
+            int: nombre de contextes invalidés
+        """
+        user_ids = self.members(kind, owner_id)
+        if not user_ids:
+            return 0
+        keys = [self.make_key(user_context_key(user_id)) for user_id in user_ids]
+        pipe = self.client.pipeline(transaction=False)
+        for start in range(0, len(keys), UNLINK_CHUNK):
+            pipe.unlink(*keys[start:start + UNLINK_CHUNK])
+        pipe.execute()
+        return len(keys)
+
+    def invalidate_all(self) -> int:
+        """Abandonne tous les ensembles (nouvelle version de clés) ; ils expirent par TTL"""
+        return int(self.client.incr(self.make_key(VERSION_KEY)))
+
+
+class CacheMembershipIndex:
+    """Repli sans Redis : ensembles Python dans le cache Django (non atomique)"""
+
+    def __init__(self, cache, ttl: int):
+        self.cache = cache
+        self.ttl = ttl
+
+    def update(self, added: Dict[Owner, Set[str]], removed: Optional[Dict[Owner, Set[str]]] = None):
+        removed = removed or {}
+        keys = {owner: members_key(*owner) for owner in set(added) | set(removed)}
+        if not keys:
+            return
+        existing = self.cache.get_many(list(keys.values()))
+        updates = {}
+        for owner, key in keys.items():
+            members = set(existing.get(key, set()))
+            members -= removed.get(owner, set())
+            members |= added.get(owner, set())
+            updates[key] = members
+        self.cache.set_many(updates, self.ttl)
+
+    def members(self, kind: str, owner_id) -> Set[str]:
+        return set(self.cache.get(members_key(kind, owner_id), set()))
+
+    def invalidate_users(self, kind: str, owner_id) -> int:
+        user_ids = self.members(kind, owner_id)
+        self.cache.delete_many([user_context_key(user_id) for user_id in user_ids])
+        return len(user_ids)
+
+    def invalidate_all(self) -> int:
+        return 0
+
+
+def group_members(contexts: Iterable[dict]) -> Dict[Owner, Set[str]]:
+    """Membres par société et institution, d'après des contextes d'isolation"""
+    members = defaultdict(set)
+    for context in contexts:
+        if not isinstance(context, dict):
+            continue
+        if context.get('company_id'):
+            members[(COMPANY, str(context['company_id']))].add(str(context['user_id']))
+        if context.get('financial_institution_id'):
+            members[(INSTITUTION, str(context['financial_institution_id']))].add(str(context['user_id']))
+    return members
+
+
+def redis_client(cache):
+    """Client Redis brut derrière le cache Django, ou None (cache non Redis)"""
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        # django-redis absent, ou cache par défaut servi par le backend Redis de Django
+        pass
+    backend = getattr(cache, '_cache', None)
+    if backend is not None and hasattr(backend, 'get_client'):
+        # django.core.cache.backends.redis.RedisCache
+        return backend.get_client(write=True)
+    return None
+
+
+def membership_index(cache, ttl: int):
+    client = redis_client(cache)
+    if client is None:
+        logger.warning("No raw Redis client behind the Django cache, membership index kept in the cache")
+        return CacheMembershipIndex(cache, ttl)
+    return RedisMembershipIndex(client, ttl, make_key=cache.make_key)
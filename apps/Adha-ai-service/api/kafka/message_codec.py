@@ -0,0 +1,300 @@
+"""
+Codec des messages Kafka.
+
+- Conversion des clés camelCase (services TypeScript) <-> snake_case : chaque
+  clé n'est convertie par expression régulière qu'une fois, le résultat est
+  gardé dans un cache borné (``KAFKA_KEY_CACHE_SIZE`` clés par sens).
+- Schémas de messages (``MessageSchema``) : ils déclarent leurs champs et,
+  au besoin, des conversions de clés imposées ; les cartes de clés sont
+  précalculées et chargées dans les caches à l'enregistrement du schéma.
+- JSON rapide : orjson quand il est installé, module ``json`` sinon.
+- Encodage binaire optionnel, versionné par schéma : les champs du schéma sont
+  encodés par position (les clés ne sont plus répétées dans chaque message),
+  le nom et la version du schéma voyagent dans l'en-tête. ``decode`` reconnaît
+  les deux formats ; le binaire ne sert qu'aux topics lus par des services
+  Python (``KAFKA_BINARY_TOPICS``), les services TypeScript lisent du JSON.
+"""
+
+import json
+import logging
+import os
+import re
+import struct
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+KEY_CACHE_SIZE = int(os.environ.get('KAFKA_KEY_CACHE_SIZE', 10000))
+
+_FIRST_CAP = re.compile('(.)([A-Z][a-z]+)')
+_ALL_CAP = re.compile('([a-z0-9])([A-Z])')
+
+
+def camel_to_snake(name: str) -> str:
+    """Convertit camelCase en snake_case"""
+    return _ALL_CAP.sub(r'\1_\2', _FIRST_CAP.sub(r'\1_\2', name)).lower()
+
+
+def snake_to_camel(name: str) -> str:
+    """Convertit snake_case en camelCase"""
+    components = name.split('_')
+    return components[0] + ''.join(x.capitalize() for x in components[1:])
+
+
+class KeyCache(dict):
+    """
+    Conversions de clés déjà calculées. Borné : une fois plein, les nouvelles
+    clés sont converties sans être mémorisées (des clés arbitraires, par exemple
+    des identifiants utilisés comme clés, ne font pas grossir la mémoire).
+    Les cartes de clés des schémas sont toujours conservées.
+    """
+
+    def __init__(self, convert, maxsize: int = KEY_CACHE_SIZE):
+        super().__init__()
+        self.convert = convert
+        self.maxsize = maxsize
+
+    def __missing__(self, key):
+        converted = self.convert(key)
+        if len(self) < self.maxsize:
+            self[key] = converted
+        return converted
+
+    def preload(self, mapping: Dict[str, str]):
+        self.update(mapping)
+
+
+to_snake_keys = KeyCache(camel_to_snake)
+to_camel_keys = KeyCache(snake_to_camel)
+
+
+def _convert(data: Any, keys: KeyCache) -> Any:
+    if isinstance(data, dict):
+        return {keys[key]: _convert(value, keys) if isinstance(value, (dict, list)) else value
+                for key, value in data.items()}
+    if isinstance(data, list):
+        return [_convert(item, keys) if isinstance(item, (dict, list)) else item for item in data]
+    return data
+
+
+def to_snake_case(data: Any) -> Any:
+    """Clés camelCase -> snake_case, récursivement"""
+    return _convert(data, to_snake_keys)
+
+
+def to_camel_case(data: Any) -> Any:
+    """Clés snake_case -> camelCase, récursivement"""
+    return _convert(data, to_camel_keys)
+
+
+# JSON
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(value: Any, lenient: bool = False) -> bytes:
+        """Sérialise en JSON UTF-8 ; ``lenient`` convertit en texte ce que JSON ne connaît pas"""
+        try:
+            return orjson.dumps(value, default=str if lenient else None, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # Cas non gérés par orjson (entiers de plus de 64 bits...) : même résultat qu'avant
+            return json.dumps(value, ensure_ascii=False, default=str if lenient else None).encode('utf-8')
+
+    loads = orjson.loads
+else:
+    def dumps(value: Any, lenient: bool = False) -> bytes:
+        """Sérialise en JSON UTF-8 ; ``lenient`` convertit en texte ce que JSON ne connaît pas"""
+        return json.dumps(value, ensure_ascii=False, default=str if lenient else None).encode('utf-8')
+
+    def loads(data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+
+# Schémas
+
+Field = Union[str, Tuple[str, 'MessageSchema']]
+
+
+class MessageSchema:
+    """
+    Schéma d'un message : champs (clés telles qu'émises, en camelCase),
+    sous-schémas des champs objets et conversions de clés imposées.
+
+    Une nouvelle version ajoute ses champs à la fin ; les anciennes versions
+    restent enregistrées pour décoder les messages déjà produits.
+    """
+
+    MAX_FIELDS = 63  # présence des champs sur un entier de 64 bits (msgpack)
+
+    def __init__(self, name: str, version: int, fields: Iterable[Field],
+                 key_map: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.version = version
+        self.layout: List[Tuple[str, Optional['MessageSchema']]] = [
+            (field, None) if isinstance(field, str) else field for field in fields
+        ]
+        if len(self.layout) > self.MAX_FIELDS:
+            raise ValueError(f"Schema {name} v{version}: more than {self.MAX_FIELDS} fields")
+        self.field_names = frozenset(field for field, _ in self.layout)
+        self.to_snake = {field: camel_to_snake(field) for field, _ in self.layout}
+        self.to_snake.update(key_map or {})
+        self.to_camel = {snake: camel for camel, snake in self.to_snake.items()}
+
+    def key_maps(self) -> Iterable['MessageSchema']:
+        yield self
+        for _, nested in self.layout:
+            if nested is not None:
+                yield from nested.key_maps()
+
+    def encode(self, value: Dict[str, Any]) -> list:
+        """``[présence, valeurs des champs présents, autres clés]``"""
+        present, values, extras = 0, [], {}
+        for index, (field, nested) in enumerate(self.layout):
+            if field not in value:
+                continue
+            item = value[field]
+            if nested is not None:
+                if not isinstance(item, dict):
+                    extras[field] = item
+                    continue
+                item = nested.encode(item)
+            present |= 1 << index
+            values.append(item)
+        for key, item in value.items():
+            if key not in self.field_names:
+                extras[key] = item
+        return [present, values, extras or None]
+
+    def decode(self, encoded: list) -> Dict[str, Any]:
+        present, values, extras = encoded
+        result = {}
+        items = iter(values)
+        for index, (field, nested) in enumerate(self.layout):
+            if present >> index & 1:
+                item = next(items)
+                result[field] = nested.decode(item) if nested is not None else item
+        if extras:
+            result.update(extras)
+        return result
+
+
+_schemas: Dict[Tuple[str, int], MessageSchema] = {}
+_latest: Dict[str, MessageSchema] = {}
+
+
+def register_schema(schema: MessageSchema) -> MessageSchema:
+    """Enregistre un schéma et charge ses cartes de clés dans les caches de conversion"""
+    _schemas[(schema.name, schema.version)] = schema
+    if schema.name not in _latest or _latest[schema.name].version < schema.version:
+        _latest[schema.name] = schema
+    for part in schema.key_maps():
+        to_snake_keys.preload(part.to_snake)
+        to_camel_keys.preload(part.to_camel)
+    return schema
+
+
+def get_schema(name: str, version: Optional[int] = None) -> MessageSchema:
+    schema = _latest.get(name) if version is None else _schemas.get((name, version))
+    if schema is None:
+        raise KeyError(f"Unknown message schema: {name}" + (f" v{version}" if version else ''))
+    return schema
+
+
+# Encodage binaire : MAGIC, format du corps, longueur du nom, nom, version (2 octets)
+
+MAGIC = b'\xad'
+BODY_JSON = 0
+BODY_MSGPACK = 1
+
+
+def encode_binary(value: Dict[str, Any], schema: MessageSchema) -> bytes:
+    name = schema.name.encode('utf-8')
+    encoded = schema.encode(value)
+    if msgpack is not None:
+        body_format, body = BODY_MSGPACK, msgpack.packb(encoded, use_bin_type=True, default=str)
+    else:
+        body_format, body = BODY_JSON, dumps(encoded, lenient=True)
+    return MAGIC + struct.pack('>BB', body_format, len(name)) + name + struct.pack('>H', schema.version) + body
+
+
+def decode_binary(data: bytes) -> Dict[str, Any]:
+    body_format, name_length = struct.unpack_from('>BB', data, 1)
+    name = data[3:3 + name_length].decode('utf-8')
+    (version,) = struct.unpack_from('>H', data, 3 + name_length)
+    body = data[5 + name_length:]
+    if body_format == BODY_MSGPACK:
+        if msgpack is None:
+            raise ValueError(f"msgpack required to decode {name} v{version}")
+        encoded = msgpack.unpackb(body, raw=False)
+    else:
+        encoded = loads(body)
+    return get_schema(name, version).decode(encoded)
+
+
+def binary_serializer(schema: MessageSchema):
+    """Sérialiseur binaire d'un topic (SharedKafkaProducer.register_serializer)"""
+    def serialize(value: Any) -> bytes:
+        if isinstance(value, dict):
+            return encode_binary(value, schema)
+        return dumps(value)
+    return serialize
+
+
+def decode(data: Optional[bytes]) -> Any:
+    """Désérialiseur des consumers : binaire versionné ou JSON"""
+    if data is None:
+        return None
+    if data[:1] == MAGIC:
+        return decode_binary(data)
+    return loads(data)
+
+
+# Schémas des messages du service
+
+METADATA_SCHEMA = MessageSchema('metadata', 1, [
+    'correlationId', 'timestamp', 'source', 'version', 'retryCount', 'originalTopic', 'error',
+    'failedAt', 'dlqReason',
+])
+
+COMMERCE_OPERATION_SCHEMA = register_schema(MessageSchema('commerce.operation.created', 1, [
+    'id', 'eventType', 'type', 'timestamp',
+    ('data', MessageSchema('commerce.operation.data', 1, [
+        'id', 'operationId', 'type', 'companyId', 'clientId', 'date', 'createdAt', 'description',
+        'amountCdf', 'amountUsd', 'currency', 'exchangeRate', 'relatedPartyId', 'relatedPartyName',
+        'status', 'paymentMethod', 'reference', 'items', 'userId',
+    ])),
+    ('metadata', METADATA_SCHEMA),
+]))
+
+PORTFOLIO_ANALYSIS_REQUEST_SCHEMA = register_schema(MessageSchema('portfolio.analysis.request', 1, [
+    'id', 'portfolioId', 'institutionId', 'userId', 'userRole', 'analysisTypes', 'timestamp',
+    ('contextInfo', MessageSchema('portfolio.context', 1, [
+        'portfolioType', 'portfolio', 'totalOutstanding', 'nonPerformingLoans', 'averageInterestRate',
+        'loanCount', 'currency', 'period',
+    ])),
+    ('metadata', METADATA_SCHEMA),
+]))
+
+PORTFOLIO_ANALYSIS_RESPONSE_SCHEMA = register_schema(MessageSchema('portfolio.analysis.response', 1, [
+    'requestId', 'portfolioId', 'institutionId', 'timestamp', 'type', 'portfolioType', 'analyses',
+    'recommendations', 'error', 'metadata',
+]))
+
+ACCOUNTING_JOURNAL_ENTRY_SCHEMA = register_schema(MessageSchema('accounting.journal.entry', 1, [
+    'id', 'eventType',
+    ('data', MessageSchema('accounting.journal.entry.data', 1, [
+        'id', 'companyId', 'journalType', 'date', 'reference', 'description', 'lines', 'totalDebit',
+        'totalCredit', 'sourceId', 'sourceType', 'metadata',
+    ])),
+    ('metadata', METADATA_SCHEMA),
+]))
@@ -0,0 +1,149 @@
+"""
+Commit manuel des offsets Kafka (au moins une fois).
+
+Les offsets ne sont plus commités automatiquement par kafka-python : un offset
+n'est commité qu'une fois son message (et tous les précédents de la partition)
+traité, d'après ``PartitionOffsetTracker``. Pour amortir le coût des commits,
+les positions terminées sont accumulées puis commitées de façon asynchrone par
+lot, dès qu'un intervalle de temps ou un nombre de messages est atteint. Un
+commit synchrone est fait à la révocation de partitions et à l'arrêt.
+
+Toutes les méthodes qui touchent au consumer Kafka doivent être appelées depuis
+le thread de poll (kafka-python n'est pas thread-safe).
+"""
+
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+try:
+    from kafka import ConsumerRebalanceListener
+    from kafka.structs import OffsetAndMetadata
+except ImportError:
+    ConsumerRebalanceListener = object
+    from .in_memory_broker import OffsetAndMetadata
+
+logger = logging.getLogger(__name__)
+
+
+def offset_and_metadata(offset: int):
+    """OffsetAndMetadata compatible kafka-python 2.0 (2 champs) et 2.1+ (leader_epoch)."""
+    try:
+        return OffsetAndMetadata(offset, '', -1)
+    except TypeError:
+        return OffsetAndMetadata(offset, '')
+
+
+class OffsetCommitter:
+    """Commits par lot des offsets terminés, asynchrones en régime normal."""
+
+    def __init__(self, consumer, tracker, interval_ms: int = 5000, batch_size: int = 500):
+        self.consumer = consumer
+        self.tracker = tracker
+        self.interval = interval_ms / 1000.0
+        self.batch_size = batch_size
+        self._pending: Dict[Any, int] = {}
+        self._completed_seen = 0
+        self._last_commit = time.monotonic()
+        self.stats = {'async_commits': 0, 'sync_commits': 0, 'failed_commits': 0}
+
+    def _collect(self):
+        """Récupère les nouvelles positions terminées du tracker."""
+        for tp, position in self.tracker.committable().items():
+            if position > self._pending.get(tp, -1):
+                self._pending[tp] = position
+
+    @property
+    def _pending_messages(self) -> int:
+        return self.tracker.completed - self._completed_seen
+
+    def maybe_commit(self):
+        """À appeler à chaque tour de poll : commit asynchrone si un seuil est atteint."""
+        self._collect()
+        if not self._pending:
+            return
+        due = time.monotonic() - self._last_commit >= self.interval
+        if due or self._pending_messages >= self.batch_size:
+            self.commit_async()
+
+    def commit_async(self):
+        offsets = self._take()
+        if not offsets:
+            return
+        try:
+            self.consumer.commit_async(offsets, callback=self._on_commit)
+            self.stats['async_commits'] += 1
+        except Exception as e:
+            self._restore(offsets)
+            self.stats['failed_commits'] += 1
+            logger.warning(f"Async offset commit failed, will retry: {str(e)}")
+
+    def commit_sync(self, partitions: Optional[Iterable] = None):
+        """Commit synchrone (rebalance, arrêt) ; limité à ``partitions`` si fourni."""
+        self._collect()
+        offsets = self._take(partitions)
+        if not offsets:
+            return
+        try:
+            self.consumer.commit(offsets)
+            self.stats['sync_commits'] += 1
+        except Exception as e:
+            self.stats['failed_commits'] += 1
+            # Les messages seront relus par le prochain propriétaire de la partition
+            logger.error(f"Sync offset commit failed for {list(offsets)}: {str(e)}")
+
+    def forget(self, partitions: Iterable):
+        for tp in partitions:
+            self._pending.pop(tp, None)
+
+    def _take(self, partitions: Optional[Iterable] = None) -> Dict[Any, Any]:
+        if partitions is None:
+            selected, self._pending = self._pending, {}
+            self._completed_seen = self.tracker.completed
+        else:
+            selected = {tp: self._pending.pop(tp) for tp in list(partitions) if tp in self._pending}
+        self._last_commit = time.monotonic()
+        return {tp: offset_and_metadata(position) for tp, position in selected.items()}
+
+    def _restore(self, offsets: Dict[Any, Any]):
+        for tp, meta in offsets.items():
+            if meta.offset > self._pending.get(tp, -1):
+                self._pending[tp] = meta.offset
+
+    def _on_commit(self, offsets, response):
+        # kafka-python passe l'exception en cas d'échec ; le commit suivant couvrira ces offsets
+        if isinstance(response, Exception):
+            self.stats['failed_commits'] += 1
+            logger.warning(f"Async offset commit failed: {str(response)}")
+            self._restore(offsets)
+
+
+class CommitOnRevokeListener(ConsumerRebalanceListener):
+    """
+    Termine les messages en cours des partitions révoquées et commite leurs
+    offsets de façon synchrone avant que le groupe ne les réattribue.
+    """
+
+    def __init__(self, committer: OffsetCommitter, drain_timeout: float = 30.0,
+                 on_revoked: Optional[Callable[[Iterable], Any]] = None):
+        self.committer = committer
+        self.drain_timeout = drain_timeout
+        self.on_revoked = on_revoked
+
+    def on_partitions_revoked(self, revoked):
+        revoked = list(revoked)
+        if not revoked:
+            return
+        tracker = self.committer.tracker
+        deadline = time.monotonic() + self.drain_timeout
+        while any(tracker.in_flight(tp) for tp in revoked) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.committer.commit_sync(revoked)
+        tracker.forget(revoked)
+        self.committer.forget(revoked)
+        if self.on_revoked:
+            self.on_revoked(revoked)
+        logger.info(f"Partitions revoked after commit: {revoked}")
+
+    def on_partitions_assigned(self, assigned):
+        logger.info(f"Partitions assigned: {list(assigned)}")
@@ -0,0 +1,276 @@
+"""
+Voies de priorité pour les workers des consumers Kafka.
+
+Avec un seul ``KeyedWorkerPool``, une réponse de chat attend derrière les
+analyses de portefeuille arrivées avant elle (plusieurs minutes d'appels LLM).
+``PriorityLanePool`` sépare le travail en voies (``Lane``), une par type de
+tâche :
+
+- chaque voie a un nombre borné de handlers simultanés (``workers``) ;
+- un worker libre prend toujours la voie la plus prioritaire ayant du travail
+  prêt, puis, à priorité égale, celle qui a le moins consommé au regard de son
+  poids (partage équitable pondéré). Un travail de fond en cours n'est pas
+  interrompu : la préemption a lieu entre deux messages ;
+- par défaut, le pool a autant de threads que la somme des ``workers`` des
+  voies : une voie interactive n'attend jamais qu'un thread se libère d'une
+  analyse. Avec moins de threads, la priorité décide de l'ordre ;
+- l'ordre par clé (entreprise) est conservé à l'intérieur d'une voie ;
+- le délai de chaque message (attente + traitement) est comparé à l'objectif
+  de latence de sa voie (``slo_ms``) : percentiles et dépassements dans
+  ``stats()``.
+
+Le pool a l'interface de ``KeyedWorkerPool`` ; ``submit`` renvoie la voie du
+message, ce qui permet au consumer de ne mettre en pause que les partitions
+qui alimentent une voie saturée (voir RobustKafkaConsumer).
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from itertools import count
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .keyed_worker_pool import worker_index
+
+logger = logging.getLogger(__name__)
+
+LATENCY_SAMPLES = 1024
+
+
+class Lane:
+    """
+    Voie de traitement.
+
+    Args:
+        name: nom de la voie
+        priority: 0 pour l'interactif ; plus la valeur est haute, plus la voie attend
+        workers: handlers simultanés au plus
+        weight: part relative entre voies de même priorité
+        slo_ms: objectif de latence (attente + traitement), None sans objectif
+    """
+
+    def __init__(self, name: str, priority: int = 0, workers: int = 1, weight: float = 1.0,
+                 slo_ms: Optional[float] = None):
+        self.name = name
+        self.priority = priority
+        self.workers = max(1, workers)
+        self.weight = weight
+        self.slo_ms = slo_ms
+
+    def __repr__(self):
+        return (f"Lane({self.name!r}, priority={self.priority}, workers={self.workers}, "
+                f"weight={self.weight}, slo_ms={self.slo_ms})")
+
+
+class _LaneState:
+    def __init__(self, lane: Lane):
+        self.lane = lane
+        self.queues: Dict[int, deque] = {}  # Emplacement de clé -> messages en attente
+        self.busy = set()  # Emplacements dont un message est en cours
+        self.queued = 0
+        self.records = 0  # Enregistrements en attente ou en cours
+        self.running = 0
+        self.served = 0.0  # Travail servi rapporté au poids
+        self.processed = 0
+        self.failed = 0
+        self.slo_violations = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def ready(self) -> Optional[int]:
+        """Emplacement dont le message en tête est le plus ancien parmi les clés libres"""
+        if self.running >= self.lane.workers:
+            return None
+        ready = [(entries[0][0], slot) for slot, entries in self.queues.items()
+                 if entries and slot not in self.busy]
+        return min(ready)[1] if ready else None
+
+
+class PriorityLanePool:
+    """
+    Pool de threads partagé entre voies de priorité, ordre garanti par clé dans
+    une voie. ``classify`` donne la voie d'un élément soumis (voie ``default``
+    si le nom est inconnu) ; ``submit`` bloque quand la voie a ``queue_size``
+    éléments en attente.
+    """
+
+    def __init__(self, handler: Callable[[Any], Any], lanes: Iterable[Lane], classify: Callable[[Any], str],
+                 default: Optional[str] = None, threads: Optional[int] = None, queue_size: int = 100,
+                 error_handler: Optional[Callable[[Exception, Any], Any]] = None,
+                 name: str = 'kafka-worker'):
+        self.handler = handler
+        self.error_handler = error_handler
+        self.classify = classify
+        self.lanes: Dict[str, Lane] = {lane.name: lane for lane in lanes}
+        if not self.lanes:
+            raise ValueError("PriorityLanePool needs at least one lane")
+        self.default = default if default in self.lanes else next(iter(self.lanes))
+        self.workers = threads or sum(lane.workers for lane in self.lanes.values())
+        self.queue_size = queue_size
+        self.completed = 0
+        self._states = {lane_name: _LaneState(lane) for lane_name, lane in self.lanes.items()}
+        self._sequence = count()
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._threads = []
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{name}-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def lane_of(self, item) -> str:
+        try:
+            lane = self.classify(item)
+        except Exception as e:
+            logger.warning(f"Lane classification failed, using {self.default}: {str(e)}")
+            return self.default
+        return lane if lane in self._states else self.default
+
+    def submit(self, key, item, on_done: Optional[Callable[[], Any]] = None,
+               timeout: Optional[float] = None) -> str:
+        """
+        Place ``item`` dans sa voie (lève queue.Full après ``timeout`` si la voie est pleine).
+
+        Returns:
+            str: la voie du message
+        """
+        lane = self.lane_of(item)
+        state = self._states[lane]
+        records = len(item) if isinstance(item, list) else 1
+        with self._condition:
+            if not self._condition.wait_for(lambda: state.queued < self.queue_size, timeout):
+                raise queue.Full
+            if not state.queued and not state.running:
+                self._rejoin(state)
+            slot = worker_index(key, self.workers)
+            state.queues.setdefault(slot, deque()).append(
+                (next(self._sequence), item, on_done, records, time.monotonic())
+            )
+            state.queued += 1
+            state.records += records
+            self._condition.notify_all()
+        return lane
+
+    def _rejoin(self, state: _LaneState):
+        # Une voie restée inactive ne cumule pas de crédit : elle repart au niveau des voies actives
+        active = [other.served for other in self._states.values()
+                  if other is not state and other.lane.priority == state.lane.priority
+                  and (other.queued or other.running)]
+        if active:
+            state.served = max(state.served, min(active))
+
+    def queue_depths(self) -> List[int]:
+        return [state.queued for state in self._states.values()]
+
+    def queue_depth(self, lane: str) -> int:
+        return self._states[lane].queued
+
+    def in_flight(self, lane: str) -> int:
+        """Enregistrements d'une voie en attente ou en cours"""
+        return self._states[lane].records
+
+    def wait_for_progress(self, completed: int, timeout: float) -> bool:
+        """Attend qu'un message se termine après la lecture ``completed`` (au plus ``timeout`` secondes)."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.completed != completed, timeout)
+
+    def _next(self):
+        """Prochain message : voie prioritaire, puis la moins servie au regard de son poids"""
+        best = None
+        for state in self._states.values():
+            slot = state.ready()
+            if slot is None:
+                continue
+            rank = (state.lane.priority, state.served)
+            if best is None or rank < best[0]:
+                best = (rank, state, slot)
+        if best is None:
+            return None
+        _, state, slot = best
+        entries = state.queues[slot]
+        entry = entries.popleft()
+        if not entries:
+            del state.queues[slot]
+        state.busy.add(slot)
+        state.queued -= 1
+        state.running += 1
+        state.served += 1.0 / state.lane.weight
+        # Place libérée dans la voie pour submit
+        self._condition.notify_all()
+        return state, slot, entry
+
+    def _idle(self) -> bool:
+        return all(not state.queued and not state.running for state in self._states.values())
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    task = self._next()
+                    if task is not None or (self._stopping and self._idle()):
+                        break
+                    self._condition.wait()
+            if task is None:
+                return
+            state, slot, (_, item, on_done, records, enqueued_at) = task
+            failed = False
+            try:
+                self.handler(item)
+            except Exception as e:
+                failed = True
+                logger.error(f"Lane {state.lane.name}: error processing message: {str(e)}")
+                if self.error_handler:
+                    try:
+                        self.error_handler(e, item)
+                    except Exception as handler_error:
+                        logger.error(f"Lane {state.lane.name}: error handler failed: {str(handler_error)}")
+            finally:
+                if on_done:
+                    on_done()
+                latency_ms = (time.monotonic() - enqueued_at) * 1000
+                with self._condition:
+                    state.busy.discard(slot)
+                    state.running -= 1
+                    state.records -= records
+                    state.failed += failed
+                    state.processed += not failed
+                    state.latencies.append(latency_ms)
+                    if state.lane.slo_ms is not None and latency_ms > state.lane.slo_ms:
+                        state.slo_violations += 1
+                    self.completed += 1
+                    self._condition.notify_all()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Termine les messages déjà en file puis arrête les workers."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        lanes = {}
+        with self._condition:
+            for lane_name, state in self._states.items():
+                ordered = sorted(state.latencies)
+                lanes[lane_name] = {
+                    'priority': state.lane.priority,
+                    'workers': state.lane.workers,
+                    'queued': state.queued,
+                    'running': state.running,
+                    'processed': state.processed,
+                    'failed': state.failed,
+                    'p50_ms': round(ordered[len(ordered) // 2], 3) if ordered else None,
+                    'p99_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3)
+                    if ordered else None,
+                    'slo_ms': state.lane.slo_ms,
+                    'slo_violations': state.slo_violations,
+                }
+        return {
+            'workers': self.workers,
+            'queue_depths': self.queue_depths(),
+            'processed': sum(lane['processed'] for lane in lanes.values()),
+            'failed': sum(lane['failed'] for lane in lanes.values()),
+            'lanes': lanes,
+        }
@@ -1,14 +1,10 @@
-import json
-from kafka import KafkaProducer
-import os
+"""
+Envoi d'événements génériques par le producer partagé du processus, sans
+attente du broker ni flush par message (voir shared_producer).
+"""
 
-KAFKA_BROKER_URL = os.environ.get('KAFKA_BROKER_URL', 'localhost:9092')
+from .shared_producer import get_shared_producer
 
-producer = KafkaProducer(
-    bootstrap_servers=KAFKA_BROKER_URL,
-    value_serializer=lambda v: json.dumps(v).encode('utf-8')
-)
 
 def send_event(topic, event):
-    producer.send(topic, event)
-    producer.flush()
+    return get_shared_producer().send(topic, event)
@@ -4,7 +4,7 @@ retry automatique et standardisation des messages.
 """
 
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from datetime import datetime
 
 from .robust_kafka_client import (
@@ -19,6 +19,7 @@ logger = logging.getLogger(__name__)
 class AccountingProducer:
     """
     Producer spécialisé pour les événements comptables avec gestion robuste
+    (producer partagé du processus, voir shared_producer)
     """
     
     def __init__(self):
@@ -39,29 +40,30 @@ class AccountingProducer:
         Returns:
             bool: True si envoi réussi, False sinon
         """
+        return self.send_journal_entry(journal_entry, correlation_id)
+    
+    def send_journal_entry(
+        self,
+        journal_entry: Dict[str, Any],
+        correlation_id: Optional[str] = None
+    ) -> bool:
+        """
+        Variante synchrone de ``publish_journal_entry`` : l'envoi est non
+        bloquant, aucune boucle d'événements n'est nécessaire
+        
+        Returns:
+            bool: True si l'écriture a été confiée au producer, False sinon
+        """
         try:
             # Validation des données obligatoires
             if not self._validate_journal_entry(journal_entry):
                 logger.error("Invalid journal entry data")
                 return False
             
-            # Standardiser le message
-            event_data = {
-                'eventType': 'accounting.journal.entry',
-                'data': self._format_journal_entry(journal_entry),
-                'metadata': {
-                    'source': 'adha_ai',
-                    'correlationId': correlation_id,
-                    'timestamp': datetime.utcnow().isoformat() + 'Z',
-                    'version': '1.0.0'
-                }
-            }
-            
-            # Convertir au format TypeScript pour compatibilité
-            formatted_data = MessageStandardizer.convert_to_typescript(event_data)
+            formatted_data = self._build_event(journal_entry, correlation_id)
             
             # Envoyer le message
-            success = await self.producer.send_message(
+            success = self.producer.publish(
                 StandardKafkaTopics.ACCOUNTING_JOURNAL_ENTRY,
                 formatted_data,
                 key=journal_entry.get('companyId')
@@ -78,6 +80,53 @@ class AccountingProducer:
             logger.exception(f"Error publishing journal entry: {str(e)}")
             return False
     
+    def publish_journal_entries(
+        self,
+        journal_entries: List[Dict[str, Any]],
+        correlation_id: Optional[str] = None
+    ) -> int:
+        """
+        Publie un lot d'écritures comptables avec un seul flush du producer
+        
+        Args:
+            journal_entries: Écritures comptables à publier
+            correlation_id: ID de corrélation pour traçabilité
+            
+        Returns:
+            int: Nombre d'écritures acquittées par le broker
+        """
+        messages = [
+            (journal_entry.get('companyId'), self._build_event(journal_entry, correlation_id))
+            for journal_entry in journal_entries
+            if self._validate_journal_entry(journal_entry)
+        ]
+        if not messages:
+            return 0
+        
+        try:
+            sent = self.producer.send_batch(StandardKafkaTopics.ACCOUNTING_JOURNAL_ENTRY, messages)
+            logger.info(f"Journal entries sent: {sent}/{len(journal_entries)}")
+            return sent
+        except Exception as e:
+            logger.exception(f"Error publishing journal entries batch: {str(e)}")
+            return 0
+    
+    def _build_event(self, journal_entry: Dict[str, Any], correlation_id: Optional[str]) -> Dict[str, Any]:
+        """Construit l'événement standardisé (format TypeScript) d'une écriture"""
+        event_data = {
+            'eventType': 'accounting.journal.entry',
+            'data': self._format_journal_entry(journal_entry),
+            'metadata': {
+                'source': 'adha_ai',
+                'correlationId': correlation_id,
+                'timestamp': datetime.utcnow().isoformat() + 'Z',
+                'version': '1.0.0'
+            }
+        }
+        
+        # Convertir au format TypeScript pour compatibilité
+        return MessageStandardizer.convert_to_typescript(event_data)
+    
     def _validate_journal_entry(self, journal_entry: Dict[str, Any]) -> bool:
         """
         Valide les données d'une écriture comptable
@@ -125,13 +174,13 @@ def send_journal_entry_to_accounting(journal_entry):
     """
     Fonction legacy pour compatibilité - utilise le nouveau producer
     """
-    import asyncio
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        result = loop.run_until_complete(
-            accounting_producer.publish_journal_entry(journal_entry)
-        )
-        return result
-    finally:
-        loop.close()
+    return accounting_producer.send_journal_entry(journal_entry)
+
+# Nom utilisé par le TaskRouter
+publish_journal_entry = send_journal_entry_to_accounting
+
+def publish_journal_entries(journal_entries):
+    """
+    Publie un lot d'écritures (handlers Kafka par lot) : un seul flush
+    """
+    return accounting_producer.publish_journal_entries(journal_entries)
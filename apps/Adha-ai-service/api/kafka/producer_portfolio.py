@@ -4,32 +4,25 @@ Ce module est responsable d'envoyer les réponses d'analyse de portefeuille
 au service portfolio-institution.
 """
 
-import json
 import logging
 from typing import Dict, Any
-import os
-from kafka import KafkaProducer
-from kafka.errors import KafkaError
 
-logger = logging.getLogger(__name__)
+from .robust_kafka_client import StandardKafkaTopics
+from .shared_producer import get_shared_producer
 
-KAFKA_BROKER_URL = os.environ.get('KAFKA_BROKER_URL', 'localhost:9092')
+logger = logging.getLogger(__name__)
 
 class PortfolioProducer:
     """
-    Producteur Kafka pour les réponses d'analyse de portefeuille
+    Producteur Kafka pour les réponses d'analyse de portefeuille (producer
+    partagé du processus, sans attente de l'acquittement par réponse)
     """
     
     def __init__(self):
         """
         Initialise le producteur Kafka.
         """
-        self.producer = KafkaProducer(
-            bootstrap_servers=KAFKA_BROKER_URL,
-            value_serializer=lambda v: json.dumps(v).encode('utf-8'),
-            acks='all'
-        )
-        logger.info("Portfolio analysis producer initialized")
+        self.producer = get_shared_producer()
         
     def send_analysis_response(self, analysis_result: Dict[str, Any]) -> bool:
         """
@@ -48,27 +41,13 @@ class PortfolioProducer:
                 return False
                 
             request_id = analysis_result["requestId"]
-            topic = 'portfolio.analysis.response'
-            
-            # Envoyer le message
-            future = self.producer.send(
-                topic,
-                key=request_id.encode('utf-8') if request_id else None,
-                value=analysis_result
-            )
-            
-            # Attendre la confirmation d'envoi (bloquant)
-            record_metadata = future.get(timeout=10)
+            topic = StandardKafkaTopics.PORTFOLIO_ANALYSIS_RESPONSE
             
-            logger.info(
-                f"Analysis response for request {request_id} sent to topic {topic} "
-                f"[partition: {record_metadata.partition}, offset: {record_metadata.offset}]"
-            )
+            # Envoi non bloquant : un échec de livraison est conservé dans le spool local
+            queued = self.producer.publish(topic, analysis_result, key=request_id or None)
+            logger.info(f"Analysis response for request {request_id} {'queued' if queued else 'spooled'} for topic {topic}")
             
-            return True
-        except KafkaError as e:
-            logger.error(f"Error sending analysis response: {str(e)}")
-            return False
+            return queued
         except Exception as e:
             logger.exception(f"Unexpected error sending analysis response: {str(e)}")
             return False
@@ -90,36 +69,20 @@ class PortfolioProducer:
                 return False
                 
             request_id = chat_response["requestId"]
-            topic = 'portfolio.chat.response'
-            
-            # Envoyer le message
-            future = self.producer.send(
-                topic,
-                key=request_id.encode('utf-8') if request_id else None,
-                value=chat_response
-            )
+            topic = StandardKafkaTopics.PORTFOLIO_CHAT_RESPONSE
             
-            # Attendre la confirmation d'envoi (bloquant)
-            record_metadata = future.get(timeout=10)
+            # Envoi non bloquant : un échec de livraison est conservé dans le spool local
+            queued = self.producer.publish(topic, chat_response, key=request_id or None)
+            logger.info(f"Chat response for request {request_id} {'queued' if queued else 'spooled'} for topic {topic}")
             
-            logger.info(
-                f"Chat response for request {request_id} sent to topic {topic} "
-                f"[partition: {record_metadata.partition}, offset: {record_metadata.offset}]"
-            )
-            
-            return True
-        except KafkaError as e:
-            logger.error(f"Error sending chat response: {str(e)}")
-            return False
+            return queued
         except Exception as e:
             logger.exception(f"Unexpected error sending chat response: {str(e)}")
             return False
     
     def close(self):
-        """Ferme le producteur Kafka"""
-        if self.producer:
-            self.producer.close()
-            logger.info("Portfolio producer closed")
+        """Vide le buffer du producer partagé (fermé à l'arrêt du processus)"""
+        self.producer.flush()
 
 # Instance singleton du producteur
 portfolio_producer = PortfolioProducer()
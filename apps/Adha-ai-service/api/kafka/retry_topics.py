@@ -0,0 +1,199 @@
+"""
+Retries différés par paliers de topics (backoff exponentiel).
+
+Un message en échec est republié sur le topic de retry de son palier
+(``<topic>.retry.5s``, ``<topic>.retry.1m``, ``<topic>.retry.10m``) avec, dans
+ses en-têtes, le numéro de tentative et l'heure à laquelle il doit être
+retraité. Le consumer des topics de retry (RobustKafkaConsumer) met la
+partition en pause jusqu'à cette heure au lieu de dormir : le topic principal
+n'est jamais bloqué par une panne passagère (API LLM indisponible), et les
+paliers ne se bloquent pas entre eux. Après ``max_retries`` retries, le message
+part dans ``dlq.failed.messages``.
+"""
+
+import logging
+import re
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from .consumer_metrics import record_dead_letter, record_retry
+from .shared_producer import SharedKafkaProducer, get_shared_producer
+
+logger = logging.getLogger(__name__)
+
+RETRY_ATTEMPT_HEADER = 'x-retry-attempt'
+RETRY_DUE_HEADER = 'x-retry-due-ms'
+ORIGINAL_TOPIC_HEADER = 'x-original-topic'
+
+_UNITS = [('h', 3600), ('m', 60), ('s', 1), ('ms', 0.001)]
+
+
+def parse_delay(value: str) -> float:
+    """Délai en secondes d'un palier ('5s', '1m', '10m', '250ms')."""
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)(ms|s|m|h)', value.strip())
+    if not match:
+        raise ValueError(f"Invalid retry delay: {value!r}")
+    return float(match.group(1)) * dict(_UNITS)[match.group(2)]
+
+
+def format_delay(seconds: float) -> str:
+    """Suffixe d'un palier : plus grande unité exacte (600 -> '10m', 0.05 -> '50ms')."""
+    for unit, factor in _UNITS:
+        count = round(seconds / factor, 6)
+        if count >= 1 and count == int(count):
+            return f"{int(count)}{unit}"
+    return f"{round(seconds * 1000)}ms"
+
+
+def retry_topic(topic: str, delay: float) -> str:
+    return f"{topic}.retry.{format_delay(delay)}"
+
+
+def header_value(headers, name: str) -> Optional[str]:
+    for key, value in headers or ():
+        if key == name:
+            return value.decode('utf-8') if isinstance(value, bytes) else str(value)
+    return None
+
+
+def due_time_ms(record) -> Optional[int]:
+    """Heure (epoch, ms) à laquelle un enregistrement de retry doit être traité."""
+    value = header_value(getattr(record, 'headers', None), RETRY_DUE_HEADER)
+    return int(value) if value else None
+
+
+def all_sent(futures: List[Future]) -> Future:
+    """Future résolu à True quand tous les envois le sont à True (False sinon)."""
+    combined = Future()
+    remaining = [len(futures)]
+    outcomes = []
+    lock = threading.Lock()
+
+    def on_sent(future):
+        with lock:
+            outcomes.append(not future.exception() and bool(future.result()))
+            remaining[0] -= 1
+            done = remaining[0] == 0
+        if done:
+            combined.set_result(all(outcomes))
+
+    if not futures:
+        combined.set_result(True)
+    for future in futures:
+        future.add_done_callback(on_sent)
+    return combined
+
+
+class RetryScheduler:
+    """
+    Republie les messages en échec sur le palier de retry suivant, ou en DLQ
+    une fois les retries épuisés. Le nombre de retries déjà faits et le topic
+    d'origine voyagent dans ``metadata`` (retry_count, kafka_topic).
+    
+    L'envoi n'attend pas le broker : ``on_sent`` est appelé depuis le callback
+    de livraison, avec True une fois le message acquitté ou conservé dans le
+    spool du producer, False s'il est perdu. Le consumer ne commite l'offset
+    d'origine qu'à ce moment-là (voir RobustKafkaConsumer).
+    """
+
+    def __init__(self, config=None, producer=None, delays: Optional[List[float]] = None,
+                 max_retries: Optional[int] = None, dlq_topic: Optional[str] = None):
+        from .robust_kafka_client import StandardKafkaTopics, kafka_config
+
+        self.config = config or kafka_config
+        self.delays = list(delays or self.config.retry_delays)
+        self.max_retries = self.config.retry_max_retries if max_retries is None else max_retries
+        self.dlq_topic = dlq_topic or StandardKafkaTopics.DLQ_FAILED_MESSAGES
+        self._producer = producer
+        self.stats = {'retried': 0, 'dead_lettered': 0}
+
+    @property
+    def producer(self):
+        """Producer partagé du processus, sauf client injecté (tests)"""
+        return self._producer or get_shared_producer()
+
+    def retry_topics(self, topic: str) -> List[str]:
+        """Topics de retry d'un topic principal, du plus court au plus long palier"""
+        return list(dict.fromkeys(retry_topic(topic, delay) for delay in self.delays))
+
+    def schedule(self, message: Dict[str, Any], error: str, topic: Optional[str] = None, key=None,
+                 on_sent: Optional[Callable[[bool], Any]] = None) -> str:
+        """
+        Republie ``message`` sur le palier de retry suivant, ou en DLQ si les
+        retries sont épuisés. ``on_sent`` reçoit l'issue de l'envoi.
+
+        Returns:
+            str: le topic de destination
+        """
+        metadata = message.get('metadata') or {}
+        attempt = int(metadata.get('retry_count') or 0)
+        original_topic = metadata.get('kafka_topic') or topic
+        if attempt >= self.max_retries:
+            return self.send_to_dlq(message, error, topic=original_topic, key=key, on_sent=on_sent)
+
+        delay = self.delays[min(attempt, len(self.delays) - 1)]
+        due_ms = int((time.time() + delay) * 1000)
+        retried = dict(message)
+        retried['metadata'] = dict(metadata, retry_count=attempt + 1, kafka_topic=original_topic,
+                                   last_error=error)
+        target = retry_topic(original_topic, delay)
+        self._send(target, retried, key, [
+            (RETRY_ATTEMPT_HEADER, str(attempt + 1).encode('utf-8')),
+            (RETRY_DUE_HEADER, str(due_ms).encode('utf-8')),
+            (ORIGINAL_TOPIC_HEADER, original_topic.encode('utf-8')),
+        ], on_sent)
+        self.stats['retried'] += 1
+        record_retry(original_topic, format_delay(delay))
+        logger.warning(f"Retry {attempt + 1}/{self.max_retries} of message {message.get('id')} "
+                       f"scheduled on {target} in {format_delay(delay)}")
+        return target
+
+    def send_to_dlq(self, message: Any, error: str, reason: str = 'max_retries_exceeded',
+                    topic: Optional[str] = None, key=None, on_sent: Optional[Callable[[bool], Any]] = None) -> str:
+        """Envoie un message vers la Dead Letter Queue, enrichi de l'erreur"""
+        dlq_message = dict(message) if isinstance(message, dict) else {'original_data': message}
+        metadata = dlq_message.get('metadata') or {}
+        original_topic = topic or metadata.get('kafka_topic', 'unknown')
+        dlq_message['metadata'] = dict(
+            metadata,
+            error=error,
+            failed_at=datetime.utcnow().isoformat(),
+            original_topic=original_topic,
+            dlq_reason=reason,
+        )
+        self._send(self.dlq_topic, dlq_message, key,
+                   [(ORIGINAL_TOPIC_HEADER, str(original_topic).encode('utf-8'))], on_sent)
+        self.stats['dead_lettered'] += 1
+        record_dead_letter(original_topic, reason)
+        logger.error(f"Message {dlq_message.get('id', 'unknown')} sent to DLQ ({reason})")
+        return self.dlq_topic
+
+    def _send(self, topic: str, message: Dict[str, Any], key, headers: list,
+              on_sent: Optional[Callable[[bool], Any]] = None):
+        if key is None:
+            from .robust_kafka_client import RobustKafkaConsumer
+            key = RobustKafkaConsumer.message_key(message)
+        producer = self.producer
+        if isinstance(producer, SharedKafkaProducer):
+            future = producer.send(topic, message, key=key, headers=headers)
+            # Non délivré, le message est conservé dans le spool : il n'est pas perdu
+            safe_on_failure = True
+        else:
+            future = producer.send(topic, value=message, key=key, headers=headers)
+            safe_on_failure = False
+        if on_sent is None:
+            return
+        if future is None:
+            # Circuit ouvert : message déjà dans le spool
+            on_sent(True)
+            return
+
+        def on_failed(exception):
+            logger.error(f"Message to {topic} not acknowledged: {str(exception)}")
+            on_sent(safe_on_failure)
+
+        future.add_callback(lambda _: on_sent(True))
+        future.add_errback(on_failed)
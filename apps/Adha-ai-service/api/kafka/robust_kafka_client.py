@@ -3,15 +3,32 @@ Configuration Kafka robuste pour Adha AI Service (Django/Python)
 Compatible avec la configuration unifiée TypeScript
 """
 
-import json
 import logging
 import os
+import threading
 import time
 import uuid
+from concurrent.futures import Future
 from typing import Dict, Any, Optional, List, Callable
 from uuid import uuid4
 from datetime import datetime
-from kafka import KafkaProducer, KafkaConsumer
+
+from agents.utils.resilience import CircuitBreaker, CircuitOpenError  # noqa: F401 (ré-exportés)
+
+from . import message_codec
+from .async_producer import AsyncKafkaProducer
+from .consumer_metrics import ConsumerMetrics, LagMonitor
+from .flow_control import FlowController
+from .keyed_worker_pool import KeyedWorkerPool, PartitionOffsetTracker, worker_index
+from .offset_committer import CommitOnRevokeListener, OffsetCommitter
+from .retry_topics import due_time_ms, parse_delay
+from .shared_producer import SharedKafkaProducer, get_shared_producer
+
+try:
+    from kafka import KafkaProducer, KafkaConsumer
+except ImportError:
+    # kafka-python absent (tests avec le broker en mémoire, voir in_memory_broker)
+    KafkaProducer = KafkaConsumer = None
 
 # Gestion de l'import kafka.errors qui peut ne pas être résolu en environnement de développement
 # mais fonctionnera en production où kafka-python est installé
@@ -50,6 +67,44 @@ class KafkaConfig:
             'retries': 8,
             'max_retry_time': 30000,
         }
+
+        # Consommation : workers par consumer (ordre garanti par clé) et taille de leurs files
+        self.consumer_workers = int(os.environ.get('KAFKA_CONSUMER_WORKERS', 4))
+        self.worker_queue_size = int(os.environ.get('KAFKA_WORKER_QUEUE_SIZE', 100))
+        self.poll_timeout_ms = int(os.environ.get('KAFKA_POLL_TIMEOUT_MS', 1000))
+        self.max_poll_records = int(os.environ.get('KAFKA_MAX_POLL_RECORDS', 100))
+        # Contre-pression : partitions en pause au-delà de max_in_flight enregistrements
+        # reçus et non terminés, reprise sous resume_in_flight (voir flow_control)
+        self.max_in_flight = int(os.environ.get('KAFKA_MAX_IN_FLIGHT', 400))
+        self.resume_in_flight = int(os.environ.get('KAFKA_RESUME_IN_FLIGHT', 100))
+        # Commit manuel : asynchrone par lot, au premier seuil atteint
+        self.commit_interval_ms = int(os.environ.get('KAFKA_COMMIT_INTERVAL_MS', 5000))
+        self.commit_batch_size = int(os.environ.get('KAFKA_COMMIT_BATCH_SIZE', 500))
+        # Retries différés : paliers de topics de retry, puis DLQ (voir retry_topics)
+        self.retry_delays = [parse_delay(delay) for delay in
+                             os.environ.get('KAFKA_RETRY_DELAYS', '5s,1m,10m').split(',')]
+        self.retry_max_retries = int(os.environ.get('KAFKA_RETRY_MAX_RETRIES', 3))
+        # Relevé du lag des groupes en arrière-plan (0 : désactivé)
+        self.lag_interval_s = float(os.environ.get('KAFKA_LAG_INTERVAL_S', 15))
+        # Runtime asyncio : messages en cours par processus et appels LLM simultanés (voir async_consumer)
+        self.async_max_in_flight = int(os.environ.get('KAFKA_ASYNC_MAX_IN_FLIGHT', 500))
+        self.async_resume_in_flight = int(os.environ.get('KAFKA_ASYNC_RESUME_IN_FLIGHT', 250))
+        self.llm_max_concurrency = int(os.environ.get('LLM_MAX_CONCURRENCY', 50))
+
+        # Production non bloquante : regroupement, compression, spool des échecs
+        self.producer_linger_ms = int(os.environ.get('KAFKA_PRODUCER_LINGER_MS', 20))
+        self.producer_batch_size = int(os.environ.get('KAFKA_PRODUCER_BATCH_SIZE', 64 * 1024))
+        self.producer_compression = os.environ.get('KAFKA_PRODUCER_COMPRESSION', 'lz4')
+        self.producer_max_block_ms = int(os.environ.get('KAFKA_PRODUCER_MAX_BLOCK_MS', 1000))
+        # Topics encodés en binaire versionné (lus seulement par des services Python)
+        self.binary_topics = [topic.strip() for topic in
+                              os.environ.get('KAFKA_BINARY_TOPICS', '').split(',') if topic.strip()]
+        self.producer_spool_replay_interval_s = float(os.environ.get('KAFKA_PRODUCER_SPOOL_REPLAY_INTERVAL_S', 30))
+        self.producer_spool_path = os.environ.get(
+            'KAFKA_PRODUCER_SPOOL_PATH',
+            os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                         'data', 'kafka_spool', 'spool.sqlite3')
+        )
         
     def _get_brokers(self) -> List[str]:
         """Obtient la liste des brokers selon l'environnement"""
@@ -103,140 +158,188 @@ class MessageStandardizer:
     @staticmethod
     def convert_from_typescript(data: Any) -> Any:
         """Convertit les données TypeScript (camelCase) en Python (snake_case)"""
-        if isinstance(data, dict):
-            converted = {}
-            for key, value in data.items():
-                # Convertir camelCase en snake_case
-                python_key = MessageStandardizer._camel_to_snake(key)
-                converted[python_key] = MessageStandardizer.convert_from_typescript(value)
-            return converted
-        elif isinstance(data, list):
-            return [MessageStandardizer.convert_from_typescript(item) for item in data]
-        else:
-            return data
+        # Conversions de clés mémorisées (voir message_codec)
+        return message_codec.to_snake_case(data)
     
     @staticmethod
     def convert_to_typescript(data: Any) -> Any:
         """Convertit les données Python (snake_case) en TypeScript (camelCase)"""
-        if isinstance(data, dict):
-            converted = {}
-            for key, value in data.items():
-                # Convertir snake_case en camelCase
-                ts_key = MessageStandardizer._snake_to_camel(key)
-                converted[ts_key] = MessageStandardizer.convert_to_typescript(value)
-            return converted
-        elif isinstance(data, list):
-            return [MessageStandardizer.convert_to_typescript(item) for item in data]
-        else:
-            return data
+        return message_codec.to_camel_case(data)
     
     @staticmethod
     def _camel_to_snake(name: str) -> str:
         """Convertit camelCase en snake_case"""
-        import re
-        s1 = re.sub('(.)([A-Z][a-z]+)', r'\1_\2', name)
-        return re.sub('([a-z0-9])([A-Z])', r'\1_\2', s1).lower()
+        return message_codec.to_snake_keys[name]
     
     @staticmethod
     def _snake_to_camel(name: str) -> str:
         """Convertit snake_case en camelCase"""
-        components = name.split('_')
-        return components[0] + ''.join(x.capitalize() for x in components[1:])
+        return message_codec.to_camel_keys[name]
 
 class RobustKafkaProducer:
-    """Producer Kafka robuste avec retry et circuit breaker"""
+    """
+    Producer Kafka robuste avec circuit breaker.
+
+    Les envois ne sont plus synchrones : le message est standardisé puis confié
+    au producer partagé du processus (voir shared_producer), qui regroupe,
+    compresse et suit les livraisons par callbacks. Les échecs de livraison
+    alimentent le circuit breaker partagé et sont conservés dans le spool
+    local ; circuit ouvert, les messages vont directement au spool.
+    """
     
-    def __init__(self, config: KafkaConfig):
+    def __init__(self, config: KafkaConfig, producer: Optional[AsyncKafkaProducer] = None,
+                 shared: Optional[SharedKafkaProducer] = None):
         self.config = config
-        self.producer = None
-        self.circuit_breaker = CircuitBreaker()
-        self._initialize_producer()
+        # Un producer injecté (tests) a sa propre façade, sinon celle du processus
+        self.shared = shared or (SharedKafkaProducer(config, producer=producer) if producer
+                                 else get_shared_producer())
     
-    def _initialize_producer(self):
-        """Initialise le producer avec configuration robuste"""
-        try:
-            self.producer = KafkaProducer(
-                bootstrap_servers=self.config.brokers,
-                client_id=self.config.client_id,
-                value_serializer=lambda v: json.dumps(v, ensure_ascii=False).encode('utf-8'),
-                key_serializer=lambda k: k.encode('utf-8') if k else None,
-                retries=self.config.retries,
-                request_timeout_ms=self.config.request_timeout,
-                retry_backoff_ms=self.config.retry_config['initial_retry_time'],
-                max_in_flight_requests_per_connection=1,
-                enable_idempotence=True,
-                acks='all',
-            )
-            logger.info(f"Kafka producer initialized with brokers: {self.config.brokers}")
-        except Exception as e:
-            logger.error(f"Failed to initialize Kafka producer: {str(e)}")
-            raise
+    @property
+    def producer(self) -> AsyncKafkaProducer:
+        return self.shared.producer
+    
+    @property
+    def circuit_breaker(self) -> 'CircuitBreaker':
+        return self.shared.circuit_breaker
     
     async def send_message(self, topic: str, message: Dict[str, Any], key: Optional[str] = None) -> bool:
-        """Envoie un message avec retry automatique"""
-        return await self.circuit_breaker.execute(
-            lambda: self._send_message_internal(topic, message, key)
-        )
+        """Envoie un message sans attendre l'acquittement du broker"""
+        return self.publish(topic, message, key)
     
-    def _send_message_internal(self, topic: str, message: Dict[str, Any], key: Optional[str] = None) -> bool:
-        """Envoie un message (méthode interne)"""
-        try:
-            if not self.producer:
-                self._initialize_producer()
-            
-            # Standardiser le message
-            if 'metadata' not in message:
-                message = MessageStandardizer.create_standard_message(
-                    message, 'adha_ai', message.get('correlationId')
-                )
-            
-            future = self.producer.send(topic, value=message, key=key)
-            record_metadata = future.get(timeout=30)
-            
-            logger.info(f"Message sent to {topic}: {message.get('id', 'unknown')} "
-                       f"(partition: {record_metadata.partition}, offset: {record_metadata.offset})")
-            return True
-            
-        except KafkaTimeoutError:
-            logger.error(f"Timeout sending message to {topic}")
-            raise
-        except KafkaError as e:
-            logger.error(f"Kafka error sending message to {topic}: {str(e)}")
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error sending message to {topic}: {str(e)}")
-            raise
+    def publish(self, topic: str, message: Dict[str, Any], key: Optional[str] = None) -> bool:
+        """
+        Variante synchrone (non bloquante) de ``send_message``.
+        
+        Returns:
+            bool: True si le message a été confié au client Kafka, False s'il a été spoolé
+        """
+        message = self._standardize(message)
+        sent = self.shared.publish(topic, message, key=key)
+        logger.debug(f"Message {'queued' if sent else 'spooled'} for {topic}: {message.get('id', 'unknown')}")
+        return sent
+    
+    def send_batch(self, topic: str, messages: List[tuple]) -> int:
+        """
+        Envoie une liste de ``(clé, message)`` puis attend un seul flush.
+
+        Returns:
+            int: nombre de messages acquittés par le broker
+        """
+        return self.shared.send_batch(topic, [(key, self._standardize(message)) for key, message in messages])
+    
+    @staticmethod
+    def _standardize(message: Dict[str, Any]) -> Dict[str, Any]:
+        if 'metadata' not in message:
+            return MessageStandardizer.create_standard_message(
+                message, 'adha_ai', message.get('correlationId')
+            )
+        return message
     
     def close(self):
-        """Ferme le producer"""
-        if self.producer:
-            self.producer.close()
+        """Vide le buffer du producer partagé (fermé à l'arrêt du processus)"""
+        self.shared.flush()
+
+DEFAULT_LANE = 'default'  # Voie unique d'un KeyedWorkerPool
+
+# Issue d'un enregistrement en échec (voir RobustKafkaConsumer._settle)
+_DEFERRED = object()    # Envoi en retry / DLQ en attente d'acquittement
+_HANDED_OFF = object()  # Envoi acquitté avant la fin du handler
+_UNSETTLED = object()   # Ni en retry ni en DLQ : offset gardé en cours
+
+
+class RecordBatch(list):
+    """Enregistrements d'une même partition confiés ensemble à un worker (handlers par lot)."""
 
 class RobustKafkaConsumer:
-    """Consumer Kafka robuste avec gestion d'erreurs"""
+    """
+    Consumer Kafka robuste avec gestion d'erreurs.
+
+    La boucle de poll ne traite plus les messages elle-même : chaque
+    enregistrement est confié à un worker choisi par sa clé (identifiant de
+    l'entreprise), via une file bornée. Les messages d'une entreprise restent
+    ordonnés, les entreprises sont traitées en parallèle, et l'offset d'une
+    partition n'est commité qu'une fois tous les messages précédents terminés
+    (commit asynchrone par lot, synchrone au rebalance et à l'arrêt : voir
+    offset_committer). Un message peut donc être relu, jamais perdu.
+
+    Un topic peut aussi être servi par un handler par lot
+    (``register_batch_handler``) : les enregistrements d'un poll sont alors
+    regroupés par worker et le handler reçoit leur liste, ce qui permet
+    d'amortir transactions, accès cache et envois Kafka sur tout le lot.
+
+    Les enregistrements portant une heure d'échéance (topics de retry, voir
+    retry_topics) ne sont traités qu'à partir de cette heure : la partition est
+    mise en pause et relue à l'échéance, sans bloquer les autres partitions.
+    
+    Quand le travail en cours dépasse ``max_in_flight`` ou qu'une file de
+    worker est pleine, les partitions sont mises en pause et la boucle continue
+    de poller sans rien recevoir (voir flow_control) : mémoire bornée, et pas
+    d'exclusion du groupe pour dépassement de ``max.poll.interval.ms``.
+    
+    ``worker_pool_factory`` remplace le ``KeyedWorkerPool`` par un pool de même
+    interface, par exemple à voies de priorité (voir priority_lanes) : la
+    contre-pression s'applique alors voie par voie, aux seules partitions qui
+    alimentent la voie saturée.
     
-    def __init__(self, config: KafkaConfig, topics: List[str], group_id: str):
+    Un enregistrement dont le handler échoue est passé à l'error handler
+    (``register_error_handler``) ; son offset n'est libéré pour le commit que
+    si celui-ci répond vrai, c'est-à-dire après avoir republié le message sur
+    un topic de retry ou en DLQ. Sinon l'offset reste en cours et le message
+    est relu après un rééquilibrage ou un redémarrage. Handler et error
+    handler peuvent aussi rendre un ``Future`` (envoi en retry non bloquant,
+    voir retry_topics) : l'offset est alors libéré par son callback de
+    livraison.
+    
+    Chaque appel de handler est mesuré (``metrics``, voir consumer_metrics) et
+    le lag du groupe est relevé en arrière-plan par un client dédié
+    (``lag_client_factory``, créé par défaut pour un consumer Kafka réel).
+    """
+    
+    def __init__(self, config: KafkaConfig, topics: List[str], group_id: str,
+                 workers: Optional[int] = None, queue_size: Optional[int] = None, consumer=None,
+                 lag_client_factory: Optional[Callable] = None,
+                 worker_pool_factory: Optional[Callable[..., Any]] = None):
         self.config = config
         self.topics = topics
         self.group_id = group_id
-        self.consumer = None
+        self.consumer = consumer
         self.message_handlers: Dict[str, Callable] = {}
+        self.batch_handlers: Dict[str, Callable] = {}
         self.error_handler = None
+        self.workers = workers or config.consumer_workers
+        self.queue_size = queue_size or config.worker_queue_size
+        self.offset_tracker = PartitionOffsetTracker()
+        self.committer: Optional[OffsetCommitter] = None
+        self.worker_pool_factory = worker_pool_factory or KeyedWorkerPool
+        self.worker_pool = None
+        self.flows: Dict[str, FlowController] = {}  # Voie -> contrôleur de contre-pression
+        self._lane_partitions: Dict[str, set] = {}  # Voie -> partitions qui l'ont alimentée
+        self._delayed: Dict[Any, float] = {}  # Partition en pause -> échéance (epoch, s)
+        # (topic, partition, offset) -> issue d'un échec : en cours d'envoi en retry, confié, ou non confié
+        self._outcomes: Dict[tuple, Any] = {}
+        self._outcomes_lock = threading.Lock()
+        self._running = False
+        self._stop_requested = False
+        self.last_poll_at: Optional[float] = None  # Dernier tour de la boucle de poll (epoch, s)
+        self.metrics = ConsumerMetrics(group_id)
+        self.lag_client_factory = lag_client_factory
+        self.lag_monitor: Optional[LagMonitor] = None
         
     def _initialize_consumer(self):
         """Initialise le consumer"""
         try:
             self.consumer = KafkaConsumer(
-                *self.topics,
                 bootstrap_servers=self.config.brokers,
                 client_id=f"{self.config.client_id}-consumer",
                 group_id=self.group_id,
-                value_deserializer=lambda m: json.loads(m.decode('utf-8')),
+                # JSON (orjson si disponible) ou binaire versionné, voir message_codec
+                value_deserializer=message_codec.decode,
                 auto_offset_reset='earliest',
-                enable_auto_commit=True,
+                # Les offsets sont commités après traitement (voir OffsetCommitter)
+                enable_auto_commit=False,
                 session_timeout_ms=30000,
                 heartbeat_interval_ms=3000,
-                max_poll_records=100,
+                max_poll_records=self.config.max_poll_records,
                 max_poll_interval_ms=300000,
             )
             logger.info(f"Kafka consumer initialized for topics: {self.topics}")
@@ -248,20 +351,82 @@ class RobustKafkaConsumer:
         """Enregistre un handler pour un topic"""
         self.message_handlers[topic] = handler
     
+    def register_batch_handler(self, topic: str, handler: Callable):
+        """
+        Enregistre un handler par lot pour un topic (prioritaire sur le handler
+        par message). Il reçoit la liste des messages convertis et validés d'un
+        même poll servis par un même worker, dans l'ordre des offsets ; les
+        messages d'une entreprise restent donc ordonnés d'un lot à l'autre.
+        """
+        self.batch_handlers[topic] = handler
+    
     def register_error_handler(self, handler: Callable):
         """Enregistre un handler d'erreur"""
         self.error_handler = handler
     
+    def _create_lag_client(self):
+        """Client sans abonnement du groupe, pour lire offsets de fin et offsets commités"""
+        return KafkaConsumer(
+            bootstrap_servers=self.config.brokers,
+            client_id=f"{self.config.client_id}-lag",
+            group_id=self.group_id,
+            enable_auto_commit=False,
+        )
+    
     def start_consuming(self):
         """Démarre la consommation des messages"""
         if not self.consumer:
             self._initialize_consumer()
+            self.lag_client_factory = self.lag_client_factory or self._create_lag_client
+        if self.lag_client_factory and self.config.lag_interval_s > 0:
+            self.lag_monitor = LagMonitor(self.metrics, self.topics, self.lag_client_factory,
+                                          interval=self.config.lag_interval_s)
+            self.lag_monitor.start()
+        self.committer = OffsetCommitter(
+            self.consumer, self.offset_tracker,
+            interval_ms=self.config.commit_interval_ms, batch_size=self.config.commit_batch_size
+        )
+        # L'abonnement porte l'écouteur qui commite avant la perte des partitions
+        self.consumer.subscribe(
+            self.topics, listener=CommitOnRevokeListener(self.committer, on_revoked=self._on_revoked)
+        )
         
-        logger.info(f"Starting to consume messages from topics: {self.topics}")
+        logger.info(f"Starting to consume messages from topics: {self.topics} "
+                    f"with {self.workers} workers")
+        # Marge d'un poll au-delà du seuil de pause : submit ne bloque pas la boucle
+        self.worker_pool = self.worker_pool_factory(
+            self._process_item, workers=self.workers, queue_size=self.queue_size + self.config.max_poll_records,
+            name=f"{self.group_id}-worker"
+        )
+        lanes = getattr(self.worker_pool, 'lanes', None)
+        self._lane_partitions = {lane: set() for lane in lanes or ()}
+        self.flows = {
+            lane: FlowController(
+                self.consumer, self.config.max_in_flight, self.config.resume_in_flight,
+                queue_high_watermark=self.queue_size, name=lane,
+                partitions=(lambda lane=lane: self._lane_partitions[lane] & set(self.consumer.assignment()))
+                if lanes else None
+            )
+            for lane in (lanes or [DEFAULT_LANE])
+        }
+        # Un stop() arrivé pendant le démarrage n'est pas écrasé
+        self._running = not self._stop_requested
         
         try:
-            for message in self.consumer:
-                self._process_message(message)
+            while self._running:
+                self.last_poll_at = time.time()
+                self._resume_due_partitions()
+                batch = self._poll()
+                for tp, records in batch.items():
+                    records = self._due_records(tp, records)
+                    if not records:
+                        continue
+                    if tp.topic in self.batch_handlers:
+                        self._dispatch_batch(tp, records)
+                        continue
+                    for record in records:
+                        self._dispatch(tp, record)
+                self.committer.maybe_commit()
         except KeyboardInterrupt:
             logger.info("Consumer interrupted by user")
         except Exception as e:
@@ -270,9 +435,234 @@ class RobustKafkaConsumer:
                 self.error_handler(e)
         finally:
             self.close()
+
+    def stop(self):
+        """Demande l'arrêt de la boucle de poll (les messages en file sont terminés)."""
+        self._stop_requested = True
+        self._running = False
+
+    def _update_flow(self) -> bool:
+        """Applique la contre-pression ; True si plus aucune partition assignée ne peut être lue"""
+        for lane, flow in self.flows.items():
+            if lane in self._lane_partitions:
+                in_flight, depth = self.worker_pool.in_flight(lane), self.worker_pool.queue_depth(lane)
+            else:
+                in_flight, depth = self.offset_tracker.in_flight(), max(self.worker_pool.queue_depths())
+            flow.update(in_flight, depth, held=lambda lane=lane: self._held_partitions(exclude=lane))
+        if not any(flow.paused for flow in self.flows.values()):
+            return False
+        return set(self.consumer.assignment()) <= set(self.consumer.paused())
+    
+    def _held_partitions(self, exclude: Optional[str] = None) -> set:
+        """Partitions à garder en pause : retries pas encore dus et voies saturées"""
+        held = set(self._delayed)
+        for lane, flow in self.flows.items():
+            if lane != exclude:
+                held |= flow.held_partitions()
+        return held
+    
+    def _poll(self):
+        """
+        Poll, ou attente des workers tant que la contre-pression tient les
+        partitions en pause : ``poll()`` sans attente garde le membre dans le
+        groupe, puis la boucle se réveille à la fin du prochain message.
+        """
+        completed = self.worker_pool.completed
+        if not self._update_flow():
+            return self.consumer.poll(timeout_ms=self._poll_timeout_ms())
+        batch = self.consumer.poll(timeout_ms=0)
+        if batch or not self.worker_pool.wait_for_progress(completed, self._poll_timeout_ms() / 1000.0):
+            return batch
+        if self._update_flow():
+            return {}
+        # Workers rattrapés : reprise dans le même tour, avant le commit
+        return self.consumer.poll(timeout_ms=0)
+    
+    def _due_records(self, tp, records):
+        """
+        Enregistrements déjà dus. Au premier enregistrement pas encore dû, la
+        partition est mise en pause et rembobinée sur lui jusqu'à son échéance.
+        """
+        now_ms = time.time() * 1000
+        for index, record in enumerate(records):
+            due_ms = due_time_ms(record)
+            if due_ms is not None and due_ms > now_ms:
+                self.consumer.pause(tp)
+                self.consumer.seek(tp, record.offset)
+                self._delayed[tp] = due_ms / 1000.0
+                return records[:index]
+        return records
+    
+    def _resume_due_partitions(self):
+        now = time.time()
+        due = [tp for tp, due_at in self._delayed.items() if due_at <= now]
+        if due:
+            # Les partitions d'une voie saturée reprennent à la fin de sa contre-pression
+            held = set().union(*(flow.held_partitions() for flow in self.flows.values()))
+            resumed = [tp for tp in due if tp not in held]
+            if resumed:
+                self.consumer.resume(*resumed)
+            self._forget_delayed(due)
+    
+    def _forget_delayed(self, partitions):
+        for tp in partitions:
+            self._delayed.pop(tp, None)
+    
+    def _poll_timeout_ms(self) -> int:
+        """Timeout du poll, raccourci pour reprendre une partition en pause à l'heure"""
+        if not self._delayed:
+            return self.config.poll_timeout_ms
+        until_due = (min(self._delayed.values()) - time.time()) * 1000
+        return max(0, min(self.config.poll_timeout_ms, int(until_due) + 1))
+    
+    def _dispatch(self, tp, record):
+        """Confie un enregistrement au worker de sa clé (bloque si sa file est pleine)."""
+        self.offset_tracker.track(tp, record.offset)
+        lane = self.worker_pool.submit(
+            self._routing_key(record), record,
+            on_done=lambda: self._complete_batch(tp, (record,))
+        )
+        if lane is not None:
+            self._lane_partitions[lane].add(tp)
+
+    def _dispatch_batch(self, tp, records):
+        """Regroupe les enregistrements d'une partition par worker et confie chaque groupe en un bloc."""
+        groups: Dict[int, tuple] = {}
+        for record in records:
+            self.offset_tracker.track(tp, record.offset)
+            key = self._routing_key(record)
+            groups.setdefault(worker_index(key, self.worker_pool.workers), (key, RecordBatch()))[1].append(record)
+        for key, group in groups.values():
+            lane = self.worker_pool.submit(key, group, on_done=lambda group=group: self._complete_batch(tp, group))
+            if lane is not None:
+                self._lane_partitions[lane].add(tp)
+    
+    def _complete_batch(self, tp, group):
+        """
+        Libère les offsets traités. Ceux d'un échec non confié au retry / DLQ
+        restent en cours ; ceux d'un envoi en retry pas encore acquitté sont
+        libérés par son callback de livraison (``_on_handed_off``).
+        """
+        for record in group:
+            with self._outcomes_lock:
+                outcome = self._outcomes.pop(self._record_id(record), None)
+                if outcome is _DEFERRED:
+                    self._outcomes[self._record_id(record)] = tp
+            if outcome is None or outcome is _HANDED_OFF:
+                self.offset_tracker.complete(tp, record.offset)
+
+    @staticmethod
+    def _record_id(record) -> tuple:
+        return record.topic, record.partition, record.offset
+
+    def _settle(self, records, result, handed_off: bool = True):
+        """
+        Issue d'un handler ou de l'error handler pour ``records`` : un Future
+        (envoi en retry / DLQ en cours) diffère la libération des offsets
+        jusqu'à sa résolution ; sinon ``handed_off`` faux garde les offsets en
+        cours, et le message sera relu après un rééquilibrage ou un redémarrage.
+        """
+        if isinstance(result, Future):
+            with self._outcomes_lock:
+                for record in records:
+                    self._outcomes[self._record_id(record)] = _DEFERRED
+            for record in records:
+                result.add_done_callback(lambda future, record=record: self._on_handed_off(record, future))
+        elif not handed_off:
+            for record in records:
+                logger.warning(f"Message at {record.topic}[{record.partition}]@{record.offset} "
+                               f"was not handed to retry or DLQ, its offset stays uncommitted")
+            with self._outcomes_lock:
+                for record in records:
+                    self._outcomes[self._record_id(record)] = _UNSETTLED
+
+    def _on_handed_off(self, record, future: Future):
+        """Callback de livraison d'un envoi en retry / DLQ : libère l'offset s'il a abouti."""
+        sent = not future.exception() and bool(future.result())
+        if not sent:
+            logger.error(f"Message at {record.topic}[{record.partition}]@{record.offset} "
+                         f"could not be handed to retry or DLQ, its offset stays uncommitted")
+        with self._outcomes_lock:
+            outcome = self._outcomes.pop(self._record_id(record), None)
+            if outcome is _DEFERRED:
+                # Handler pas encore terminé : _complete_batch libérera l'offset
+                self._outcomes[self._record_id(record)] = _HANDED_OFF if sent else _UNSETTLED
+        if outcome is not None and outcome is not _DEFERRED and sent:
+            self.offset_tracker.complete(outcome, record.offset)
+
+    def _hand_off(self, error: Exception, record):
+        """Confie un enregistrement en échec à l'error handler (vrai ou Future : confié au retry / DLQ)."""
+        result = None
+        if self.error_handler:
+            try:
+                result = self.error_handler(error, record)
+            except Exception as handler_error:
+                logger.error(f"Error handler failed for message from {record.topic}: {str(handler_error)}")
+        self._settle([record], result, handed_off=bool(result))
+
+    def _on_revoked(self, partitions):
+        """Partitions révoquées : échéances et issues en attente abandonnées (relues par le nouveau membre)"""
+        self._forget_delayed(partitions)
+        revoked = {(tp.topic, tp.partition) for tp in partitions}
+        with self._outcomes_lock:
+            for record_id in [record_id for record_id in self._outcomes if record_id[:2] in revoked]:
+                del self._outcomes[record_id]
+
+    @classmethod
+    def _routing_key(cls, record):
+        """
+        Clé d'ordonnancement : clé Kafka, sinon identifiant d'entreprise du message,
+        sinon la partition (ordre de la partition conservé).
+        """
+        if record.key is not None:
+            return record.key
+        return cls.message_key(record.value) or f"{record.topic}:{record.partition}"
+    
+    @staticmethod
+    def message_key(value) -> Optional[str]:
+        """Identifiant d'entreprise / institution d'un message (None si absent)"""
+        value = value if isinstance(value, dict) else {}
+        data = value.get('data') if isinstance(value.get('data'), dict) else {}
+        for field in ('companyId', 'company_id', 'institutionId', 'institution_id', 'clientId', 'client_id'):
+            company_id = value.get(field) or data.get(field)
+            if company_id:
+                return str(company_id)
+        return None
+
+    def _process_item(self, item):
+        """Point d'entrée des workers : un enregistrement ou un lot (RecordBatch)"""
+        if isinstance(item, RecordBatch):
+            self._process_batch(item)
+        else:
+            self._process_message(item)
+    
+    def _process_batch(self, records):
+        """Traite un lot d'enregistrements d'un même topic (dans un thread worker)"""
+        topic = records[0].topic
+        messages = []
+        for record in records:
+            converted_data = MessageStandardizer.convert_from_typescript(record.value)
+            if self._validate_message(converted_data):
+                converted_data['metadata'].setdefault('kafka_topic', topic)
+                messages.append(converted_data)
+            else:
+                logger.warning(f"Invalid message format from {topic}")
+        if not messages:
+            return
+        
+        handler = self.batch_handlers[topic]
+        started = time.perf_counter()
+        try:
+            self._settle(records, handler(messages))
+            self.metrics.observe(topic, handler, len(messages), time.perf_counter() - started)
+        except Exception as e:
+            self.metrics.observe(topic, handler, len(messages), time.perf_counter() - started, failed=True)
+            logger.error(f"Error processing batch of {len(messages)} messages from {topic}: {str(e)}")
+            for record in records:
+                self._hand_off(e, record)
     
     def _process_message(self, message):
-        """Traite un message reçu"""
+        """Traite un message reçu (dans un thread worker)"""
         try:
             topic = message.topic
             data = message.value
@@ -284,20 +674,29 @@ class RobustKafkaConsumer:
             if not self._validate_message(converted_data):
                 logger.warning(f"Invalid message format from {topic}")
                 return
+            # Topic d'origine (conservé par les retries, voir retry_topics)
+            converted_data['metadata'].setdefault('kafka_topic', topic)
             
             # Appeler le handler approprié
             handler = self.message_handlers.get(topic)
             if handler:
-                handler(converted_data)
+                started = time.perf_counter()
+                try:
+                    result = handler(converted_data)
+                except Exception:
+                    self.metrics.observe(topic, handler, 1, time.perf_counter() - started, failed=True)
+                    raise
+                self.metrics.observe(topic, handler, 1, time.perf_counter() - started)
+                self._settle([message], result)
             else:
                 logger.warning(f"No handler registered for topic: {topic}")
                 
         except Exception as e:
             logger.error(f"Error processing message from {message.topic}: {str(e)}")
-            if self.error_handler:
-                self.error_handler(e, message)
+            self._hand_off(e, message)
     
-    def _validate_message(self, message: Dict[str, Any]) -> bool:
+    @staticmethod
+    def _validate_message(message: Dict[str, Any]) -> bool:
         """
         Valide la structure du message et convertit si nécessaire les clés entre
         camelCase et snake_case pour assurer la compatibilité entre les services
@@ -348,46 +747,18 @@ class RobustKafkaConsumer:
         return True
     
     def close(self):
-        """Ferme le consumer"""
+        """Termine les messages en file, commite leurs offsets et ferme le consumer"""
+        self._running = False
+        if self.lag_monitor:
+            self.lag_monitor.stop()
+            self.lag_monitor = None
+        if self.worker_pool:
+            self.worker_pool.stop()
+            self.worker_pool = None
         if self.consumer:
+            if self.committer:
+                self.committer.commit_sync()
             self.consumer.close()
 
-class CircuitBreaker:
-    """Circuit Breaker pour protéger contre les pannes"""
-    
-    def __init__(self, failure_threshold: int = 5, timeout: int = 60):
-        self.failure_threshold = failure_threshold
-        self.timeout = timeout
-        self.failures = 0
-        self.next_attempt = 0
-        self.state = 'CLOSED'  # CLOSED, OPEN, HALF_OPEN
-    
-    async def execute(self, operation: Callable):
-        """Exécute une opération avec circuit breaker"""
-        if self.state == 'OPEN':
-            if time.time() < self.next_attempt:
-                raise Exception('Circuit breaker is OPEN')
-            self.state = 'HALF_OPEN'
-        
-        try:
-            result = await operation() if hasattr(operation, '__await__') else operation()
-            self._on_success()
-            return result
-        except Exception as e:
-            self._on_failure()
-            raise e
-    
-    def _on_success(self):
-        """Appelé en cas de succès"""
-        self.failures = 0
-        self.state = 'CLOSED'
-    
-    def _on_failure(self):
-        """Appelé en cas d'échec"""
-        self.failures += 1
-        if self.failures >= self.failure_threshold:
-            self.state = 'OPEN'
-            self.next_attempt = time.time() + self.timeout
-
 # Instance globale de configuration
 kafka_config = KafkaConfig()
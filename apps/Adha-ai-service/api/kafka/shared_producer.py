@@ -0,0 +1,301 @@
+"""
+Producer Kafka unique par processus.
+
+Tous les émetteurs du service (événements génériques, écritures comptables,
+réponses portfolio, retries et DLQ) partagent un seul client Kafka : plus de
+connexion ouverte par message ou par module. Le client est créé à la première
+émission, donc après le fork des workers gunicorn, et recréé si le processus
+a changé (un client hérité du processus parent n'a plus son thread d'I/O).
+
+La sérialisation est choisie par topic (JSON par défaut) et chaque topic a
+ses compteurs (messages émis, délivrés, en échec, spoolés, octets) et sa
+latence de livraison, exportés vers Prometheus quand prometheus_client est
+disponible. Le circuit breaker est lui aussi partagé : un broker en échec
+l'ouvre pour tous les émetteurs, dont les messages vont alors au spool local.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, List, Optional
+
+from . import message_codec
+from .async_producer import AsyncKafkaProducer
+
+try:
+    from kafka.serializer import Serializer
+except ImportError:
+    # kafka-python absent (tests avec le broker en mémoire)
+    Serializer = object
+
+logger = logging.getLogger(__name__)
+
+LATENCY_SAMPLES = 1024
+
+try:
+    from prometheus_client import Counter, Histogram
+
+    PRODUCED_MESSAGES = Counter(
+        'adha_ai_kafka_produced_messages_total',
+        'Kafka messages handed to the shared producer, by outcome',
+        ['topic', 'outcome']
+    )
+    PRODUCED_BYTES = Counter(
+        'adha_ai_kafka_produced_bytes_total',
+        'Serialized bytes handed to the shared producer',
+        ['topic']
+    )
+    DELIVERY_TIME = Histogram(
+        'adha_ai_kafka_delivery_seconds',
+        'Time between send and broker acknowledgement',
+        ['topic']
+    )
+except ImportError:  # pragma: no cover - prometheus_client absent
+    PRODUCED_MESSAGES = PRODUCED_BYTES = DELIVERY_TIME = None
+
+
+json_serializer = message_codec.dumps
+
+
+def lenient_json_serializer(value: Any) -> bytes:
+    """JSON tolérant (dates, décimaux...) : un message en échec doit toujours partir en DLQ"""
+    return message_codec.dumps(value, lenient=True)
+
+
+class TopicSerializer(Serializer):
+    """
+    Sérialiseur de valeurs par topic, appelé par le client Kafka avec le topic
+    (interface kafka.serializer.Serializer). Les ``bytes`` passent tels quels.
+    """
+
+    def __init__(self, default: Callable[[Any], bytes] = json_serializer,
+                 on_serialized: Optional[Callable[[str, int], Any]] = None):
+        self.default = default
+        self.serializers: Dict[str, Callable[[Any], bytes]] = {}
+        self.on_serialized = on_serialized
+
+    def register(self, topic: str, serializer: Callable[[Any], bytes]):
+        self.serializers[topic] = serializer
+
+    def serialize(self, topic: str, value: Any) -> Optional[bytes]:
+        if value is None or isinstance(value, bytes):
+            data = value
+        else:
+            data = self.serializers.get(topic, self.default)(value)
+        if data is not None and self.on_serialized:
+            self.on_serialized(topic, len(data))
+        return data
+
+    def close(self):
+        pass
+
+
+class SharedKafkaProducer:
+    """
+    Façade du producer asynchrone, partagée par tous les émetteurs du processus.
+
+    ``send`` est non bloquant (voir AsyncKafkaProducer) ; ``send_and_wait``
+    attend l'acquittement quand l'appelant doit savoir le message en sécurité
+    avant de continuer. Les retries et la DLQ passent par ``send`` et les
+    callbacks du future (voir retry_topics), sans bloquer le worker.
+    """
+
+    def __init__(self, config=None, producer: Optional[AsyncKafkaProducer] = None):
+        from agents.utils.resilience import CircuitBreaker, shared_breaker_state
+        from .robust_kafka_client import StandardKafkaTopics, kafka_config
+
+        self.config = config or kafka_config
+        self.circuit_breaker = CircuitBreaker(name='kafka', shared_state=shared_breaker_state())
+        self.serializer = TopicSerializer(on_serialized=self._count_bytes)
+        self.serializer.register(StandardKafkaTopics.DLQ_FAILED_MESSAGES, lenient_json_serializer)
+        for topic in self.config.binary_topics:
+            self.serializer.register(topic, message_codec.binary_serializer(message_codec.get_schema(topic)))
+        self._client = producer
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._reset_metrics()
+
+    def _reset_metrics(self):
+        self._metrics: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {'sent': 0, 'delivered': 0, 'failed': 0, 'spooled': 0, 'bytes': 0}
+        )
+        self._latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES))
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # Verrou, client et compteurs hérités du parent : rien n'en est réutilisable
+            self._lock = threading.Lock()
+            self._client = None
+            self._reset_metrics()
+            self._pid = os.getpid()
+
+    @property
+    def producer(self) -> AsyncKafkaProducer:
+        """Producer asynchrone du processus courant (créé au premier envoi, recréé après un fork)"""
+        self._check_fork()
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = AsyncKafkaProducer(self.config, value_serializer=self.serializer)
+                    # Messages spoolés par ce processus ou un précédent
+                    self._client.start_replay(self.config.producer_spool_replay_interval_s,
+                                              replay=self._replay_through_breaker)
+                    logger.info(f"Shared Kafka producer created in process {self._pid}")
+        return self._client
+
+    def register_serializer(self, topic: str, serializer: Callable[[Any], bytes]):
+        """Sérialiseur propre à un topic (JSON par défaut)"""
+        self.serializer.register(topic, serializer)
+
+    def send(self, topic: str, value: Any, key=None, headers: Optional[list] = None):
+        """
+        Envoie un message sans attendre le broker ; circuit ouvert, il est spoolé.
+
+        Returns:
+            Le future du client Kafka, ou None si le message a été spoolé
+        """
+        producer = self.producer
+        self._count(topic, 'sent')
+        if self.circuit_breaker.is_open():
+            logger.warning(f"Circuit breaker is OPEN, message to {topic} spooled")
+            producer.spool_message(topic, value, key, headers, error='Circuit breaker is OPEN')
+            self._count(topic, 'spooled')
+            return None
+        future = producer.send(topic, value, key=key, headers=headers)
+        if future is None:
+            # Envoi refusé par le client : le message est déjà dans le spool
+            self._on_failed(topic, None)
+            return None
+        future.add_callback(self._on_delivered, topic, time.perf_counter())
+        future.add_errback(self._on_failed, topic)
+        return future
+
+    def publish(self, topic: str, value: Any, key=None, headers: Optional[list] = None) -> bool:
+        """True si le message a été confié au client Kafka, False s'il a été spoolé"""
+        return self.send(topic, value, key=key, headers=headers) is not None
+
+    def send_and_wait(self, topic: str, value: Any, key=None, headers: Optional[list] = None,
+                      timeout: float = 10) -> bool:
+        """
+        Envoie un message et attend l'acquittement.
+
+        Returns:
+            bool: True si acquitté, False si le message a été conservé dans le spool
+        """
+        future = self.send(topic, value, key=key, headers=headers)
+        if future is None:
+            return False
+        try:
+            future.get(timeout=timeout)
+            return True
+        except Exception as e:
+            # L'errback du producer asynchrone a conservé le message dans le spool
+            logger.error(f"Message to {topic} not acknowledged, kept in spool: {str(e)}")
+            return False
+
+    def send_batch(self, topic: str, messages: List[tuple], timeout: float = 30) -> int:
+        """
+        Envoie une liste de ``(clé, message)`` puis attend un seul flush.
+
+        Returns:
+            int: nombre de messages acquittés par le broker
+        """
+        futures = [self.send(topic, message, key=key) for key, message in messages]
+        self.flush(timeout=timeout)
+        sent = sum(1 for future in futures if future is not None and future.succeeded())
+        logger.info(f"Batch sent to {topic}: {sent}/{len(futures)} messages")
+        return sent
+
+    def _on_delivered(self, topic: str, started: float, record_metadata):
+        elapsed = time.perf_counter() - started
+        self.circuit_breaker.record_success()
+        with self._lock:
+            self._metrics[topic]['delivered'] += 1
+            self._latencies[topic].append(elapsed)
+        if PRODUCED_MESSAGES is not None:
+            PRODUCED_MESSAGES.labels(topic=topic, outcome='delivered').inc()
+            DELIVERY_TIME.labels(topic=topic).observe(elapsed)
+
+    def _on_failed(self, topic: str, exception):
+        # AsyncKafkaProducer conserve tout message non délivré dans le spool
+        self.circuit_breaker.record_failure(exception)
+        self._count(topic, 'failed')
+        self._count(topic, 'spooled')
+
+    def _count(self, topic: str, outcome: str):
+        with self._lock:
+            self._metrics[topic][outcome] += 1
+        if PRODUCED_MESSAGES is not None:
+            PRODUCED_MESSAGES.labels(topic=topic, outcome=outcome).inc()
+
+    def _count_bytes(self, topic: str, size: int):
+        with self._lock:
+            self._metrics[topic]['bytes'] += size
+        if PRODUCED_BYTES is not None:
+            PRODUCED_BYTES.labels(topic=topic).inc(size)
+
+    def replay_spool(self, limit: int = 500, timeout: float = 30) -> int:
+        """Renvoie les messages du spool local (voir AsyncKafkaProducer.replay_spool)"""
+        return self.producer.replay_spool(limit=limit, timeout=timeout)
+
+    def _replay_through_breaker(self) -> int:
+        """Renvoi périodique du spool : circuit ouvert, il n'est tenté qu'à l'échéance, comme appel d'essai"""
+        if self.circuit_breaker.is_open():
+            return 0
+        try:
+            replayed = self._client.replay_spool()
+        except Exception as e:
+            self.circuit_breaker.record_failure(e)
+            raise
+        if replayed or not len(self._client.spool):
+            self.circuit_breaker.record_success()
+        else:
+            self.circuit_breaker.record_failure()
+        return replayed
+
+    def flush(self, timeout: Optional[float] = None):
+        if self._client is not None and self._pid == os.getpid():
+            self._client.flush(timeout=timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        """Vide le buffer puis ferme le client (arrêt du processus)"""
+        if self._client is not None and self._pid == os.getpid():
+            self._client.close(timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        self._check_fork()
+        with self._lock:
+            topics = {}
+            for topic, counts in self._metrics.items():
+                samples = sorted(self._latencies[topic])
+                topics[topic] = dict(counts)
+                if samples:
+                    topics[topic]['latency_ms'] = {
+                        'p50': round(samples[len(samples) // 2] * 1000, 3),
+                        'p99': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 3),
+                    }
+        return {
+            'pid': self._pid,
+            'circuit_breaker': self.circuit_breaker.state,
+            'producer': self._client.get_stats() if self._client is not None else None,
+            'topics': topics,
+        }
+
+
+_shared_producer: Optional[SharedKafkaProducer] = None
+_shared_producer_lock = threading.Lock()
+
+
+def get_shared_producer() -> SharedKafkaProducer:
+    """Façade du processus ; son client Kafka est recréé après un fork (voir ``producer``)."""
+    global _shared_producer
+    if _shared_producer is None:
+        with _shared_producer_lock:
+            if _shared_producer is None:
+                _shared_producer = SharedKafkaProducer()
+                # Les messages encore dans le buffer (linger) partent avant la sortie
+                atexit.register(_shared_producer.close, 10)
+    return _shared_producer
@@ -8,8 +8,10 @@ import json
 import logging
 import os
 import asyncio
+import threading
+from concurrent.futures import Future
 from datetime import datetime
-from typing import List, Dict, Any, Callable
+from typing import List, Dict, Any, Callable, Optional
 
 from .robust_kafka_client import (
     RobustKafkaConsumer, 
@@ -17,6 +19,8 @@ from .robust_kafka_client import (
     kafka_config,
     MessageStandardizer
 )
+from .retry_topics import RetryScheduler, all_sent
+from .idempotency import DONE, PROCESSING, IdempotencyGuard, idempotency_key
 import time
 from api.services.task_router import task_router
 
@@ -26,45 +30,137 @@ class UnifiedConsumer:
     """
     Consommateur Kafka unifié robuste qui écoute plusieurs topics et route
     les messages vers le service approprié avec gestion d'erreurs complète.
+    
+    Les messages en échec sont republiés sur les topics de retry (paliers
+    5s / 1m / 10m par défaut), consommés par un second consumer qui attend
+    leur échéance partition en pause, puis envoyés en DLQ après le dernier
+    retry (voir retry_topics). L'envoi ne bloque pas le worker : les handlers
+    rendent un Future résolu par le callback de livraison, et le consumer ne
+    commite l'offset d'origine qu'à sa résolution.
+    
+    Chaque message est réservé dans le registre d'idempotence avant d'être
+    routé : un message déjà traité n'est pas recalculé, son résultat est
+    republié (voir idempotency).
+    
+    Args:
+        consumer_factory: crée le client Kafka d'un consumer (topics, group_id),
+            par exemple le broker en mémoire du banc de charge (voir load_harness)
+        router: routeur des tâches (task_router par défaut)
+        retry_scheduler: planificateur des retries (producer partagé par défaut)
+        idempotency: registre d'idempotence (cache Django par défaut)
     """
     
-    def __init__(self):
+    def __init__(self, consumer_factory: Optional[Callable[[List[str], str], Any]] = None, router=None,
+                 retry_scheduler: Optional[RetryScheduler] = None, idempotency: Optional[IdempotencyGuard] = None):
         self.topics = [
             StandardKafkaTopics.ADHA_AI_EVENTS,
             StandardKafkaTopics.COMMERCE_OPERATION_CREATED,
             StandardKafkaTopics.PORTFOLIO_ANALYSIS_REQUEST,
             StandardKafkaTopics.ACCOUNTING_JOURNAL_STATUS,
         ]
+        # Topics à fort volume traités par lot (écritures insérées et publiées ensemble)
+        self.batch_topics = [
+            StandardKafkaTopics.COMMERCE_OPERATION_CREATED,
+            StandardKafkaTopics.ACCOUNTING_JOURNAL_STATUS,
+        ]
+        self.consumer_factory = consumer_factory
+        self.router = router or task_router
+        self.retry_scheduler = retry_scheduler or RetryScheduler()
+        self.idempotency = idempotency or IdempotencyGuard()
+        self.retry_topics = [
+            retry_topic for topic in self.topics for retry_topic in self.retry_scheduler.retry_topics(topic)
+        ]
         self.consumer = None
+        self.retry_consumer = None
+        self._retry_thread = None
+        self._stop_event = threading.Event()
         self.is_running = False
         self.error_count = 0
         self.max_errors = 10
+        self.restart_delay = 5
+        self.max_restart_delay = 300
+        self.stop_timeout = 30
     
     def start(self):
         """
         Démarre le consommateur Kafka robuste et commence à traiter les messages.
+        Le consumer des topics de retry tourne dans un thread dédié, attendu
+        avant de rendre la main.
         """
+        self.is_running = True
+        self._stop_event.clear()
+        self._retry_thread = threading.Thread(
+            target=self._consume, args=('retry',), name='unified_retry_consumer_thread', daemon=True
+        )
+        self._retry_thread.start()
         try:
-            self.consumer = RobustKafkaConsumer(
+            self._consume('main')
+        finally:
+            self._join_retry_thread()
+    
+    def _consume(self, role: str):
+        """
+        Fait tourner un consumer tant que le consommateur unifié est actif. Si la
+        boucle de poll s'arrête sur une erreur, le consumer est recréé après un
+        délai croissant (pas de redémarrage récursif).
+        """
+        delay = self.restart_delay
+        while self.is_running:
+            started_at = time.time()
+            try:
+                consumer = self._create_consumer(role)
+                if not self.is_running:
+                    # stop() appelé pendant la création : ce consumer ne lui était pas visible
+                    break
+                logger.info(f"Unified robust consumer ({role}) started. "
+                            f"Listening to topics: {', '.join(consumer.topics)}")
+                consumer.start_consuming()
+            except Exception as e:
+                logger.exception(f"Error in unified consumer ({role}): {str(e)}")
+            
+            if not self.is_running:
+                break
+            if time.time() - started_at > self.max_restart_delay:
+                delay = self.restart_delay
+            logger.info(f"Restarting unified consumer ({role}) in {delay}s")
+            if self._stop_event.wait(delay):
+                break
+            delay = min(delay * 2, self.max_restart_delay)
+    
+    def _create_consumer(self, role: str) -> RobustKafkaConsumer:
+        """Crée le consumer principal ou celui des topics de retry, handlers enregistrés"""
+        if role == 'retry':
+            consumer = RobustKafkaConsumer(
+                config=kafka_config,
+                topics=self.retry_topics,
+                group_id='adha-ai-unified-retry-group',
+                consumer=self._kafka_client(self.retry_topics, 'adha-ai-unified-retry-group')
+            )
+            # Retries traités message par message
+            for topic in self.retry_topics:
+                consumer.register_handler(topic, self._process_message)
+            self.retry_consumer = consumer
+        else:
+            # Voies de priorité : le chat ne patiente pas derrière les analyses
+            consumer = RobustKafkaConsumer(
                 config=kafka_config,
                 topics=self.topics,
-                group_id='adha-ai-unified-group'
+                group_id='adha-ai-unified-group',
+                consumer=self._kafka_client(self.topics, 'adha-ai-unified-group'),
+                worker_pool_factory=self.router.worker_pool
             )
-            
-            # Enregistrer les handlers
             for topic in self.topics:
-                self.consumer.register_handler(topic, self._process_message)
-            
-            self.consumer.register_error_handler(self._handle_error)
-            
-            logger.info(f"Unified robust consumer started. Listening to topics: {', '.join(self.topics)}")
-            self.is_running = True
-            self.consumer.start_consuming()
-            
-        except Exception as e:
-            logger.exception(f"Error starting unified consumer: {str(e)}")
-            self.is_running = False
-            raise
+                consumer.register_handler(topic, self._process_message)
+            for topic in self.batch_topics:
+                consumer.register_batch_handler(topic, self._process_batch)
+            self.consumer = consumer
+        
+        consumer.register_error_handler(self._handle_error)
+        return consumer
+    
+    def _kafka_client(self, topics: List[str], group_id: str):
+        """Client injecté (consumer_factory), sinon None : RobustKafkaConsumer crée un KafkaConsumer"""
+        return self.consumer_factory(topics, group_id) if self.consumer_factory else None
     
     def _process_message(self, message: Dict[str, Any]):
         """
@@ -73,173 +169,259 @@ class UnifiedConsumer:
         """
         start_time = time.time()
         topic = message.get('metadata', {}).get('kafka_topic', 'unknown')
+        key = idempotency_key(message)
+        if key:
+            record = self.idempotency.claim(key)
+            if record is not None:
+                return self._handle_duplicates([(message, record)])
         
         try:
             # Extraire les métadonnées
             metadata = message.get('metadata', {})
-            data = message.get('data', message)  # Fallback si pas de structure standard
             message_id = message.get('id', 'unknown')
             correlation_id = metadata.get('correlation_id', 'unknown')
             
             logger.info(f"Processing message {message_id} (correlation: {correlation_id}) from topic {topic}")
             
             # Enrichir le message avec des métadonnées de traitement
-            if 'processing_metadata' not in data:
-                data['processing_metadata'] = {}
-            
-            data['processing_metadata'].update({
-                'received_at': datetime.utcnow().isoformat(),
-                'consumer_version': '2.0.0',
-                'retry_count': metadata.get('retry_count', 0)
-            })
+            data = self._prepare_data(message)
             
             # Router le message vers le service approprié
-            response = task_router.route_task(data)
+            response = self.router.route_task(data)
             
             processing_time = (time.time() - start_time) * 1000  # Convertir en ms
             
             if response and 'error' in response:
                 logger.error(f"Error processing message {message_id}: {response.get('error')} (processed in {processing_time:.2f}ms)")
-                self._handle_processing_error(message, response.get('error'))
+                self._release(key)
                 # Note: Le monitoring d'erreur sera fait dans _handle_processing_error
+                return self._handle_processing_error(message, response.get('error'))
             else:
                 logger.info(f"Successfully processed message {message_id} of type: {response.get('type', 'unknown')} in {processing_time:.2f}ms")
+                if key:
+                    self.idempotency.complete(key, response)
                 self.error_count = max(0, self.error_count - 1)  # Réduire le compteur d'erreurs
                 
-                # Enregistrer les métriques de succès
-                try:
-                    # Import dynamique pour éviter les dépendances circulaires
-                    import logging
-                    # Pour l'instant, on log les métriques. Plus tard on pourra intégrer un système de monitoring Python
-                    logger.debug(f"METRICS: message_received_success topic={topic} processing_time={processing_time:.2f}ms")
-                except Exception as metrics_error:
-                    logger.warning(f"Failed to record success metrics: {str(metrics_error)}")
-                
         except Exception as e:
             processing_time = (time.time() - start_time) * 1000
             logger.exception(f"Critical error processing message: {str(e)} (failed after {processing_time:.2f}ms)")
-            self._handle_processing_error(message, str(e))
-            
-            # Enregistrer les métriques d'erreur
-            try:
-                logger.debug(f"METRICS: message_received_error topic={topic} processing_time={processing_time:.2f}ms error={str(e)}")
-            except Exception as metrics_error:
-                logger.warning(f"Failed to record error metrics: {str(metrics_error)}")
+            self._release(key)
+            return self._handle_processing_error(message, str(e))
     
-    def _handle_processing_error(self, message: Dict[str, Any], error: str):
+    def _prepare_data(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Extrait les données du message et les enrichit des métadonnées de traitement.
         """
-        Gère les erreurs de traitement avec retry et DLQ
+        metadata = message.get('metadata', {})
+        data = message.get('data', message)  # Fallback si pas de structure standard
+        if 'processing_metadata' not in data:
+            data['processing_metadata'] = {}
+        
+        data['processing_metadata'].update({
+            'received_at': datetime.utcnow().isoformat(),
+            'consumer_version': '2.0.0',
+            'retry_count': metadata.get('retry_count', 0)
+        })
+        return data
+    
+    def _process_batch(self, messages: List[Dict[str, Any]]):
         """
+        Traite en un lot les messages d'un poll (topics de batch_topics) : le
+        TaskRouter insère les écritures en une transaction et les publie avec
+        un seul flush. Les erreurs restent traitées message par message.
+        
+        Les clés d'idempotence du lot sont lues en une fois : seuls les messages
+        jamais traités sont routés, les doublons republient leur résultat.
+        
+        Returns:
+            Future des envois en retry du lot (None si aucun)
+        """
+        start_time = time.time()
+        keys = [idempotency_key(message) for message in messages]
+        existing = self.idempotency.claim_many([key for key in keys if key])
+        fresh, duplicates, claimed = [], [], set()
+        for message, key in zip(messages, keys):
+            if key is None:
+                fresh.append((message, None))
+            elif key in existing:
+                duplicates.append((message, existing[key]))
+            elif key in claimed:
+                # Même opération deux fois dans le lot : traitée une seule fois
+                duplicates.append((message, {'state': PROCESSING}))
+            else:
+                claimed.add(key)
+                fresh.append((message, key))
+        sent = [self._handle_duplicates(duplicates)] if duplicates else []
+        if not fresh:
+            return all_sent(sent) if sent else None
+        
         try:
-            retry_count = message.get('metadata', {}).get('retry_count', 0)
-            max_retries = 3
-            
-            if retry_count < max_retries:
-                # Tenter un retry avec délai exponentiel
-                delay = min(2 ** retry_count, 60)  # Max 60 secondes
-                logger.warning(f"Scheduling retry {retry_count + 1}/{max_retries} in {delay}s for message {message.get('id')}")
-                
-                # Ici on pourrait implémenter un système de retry asynchrone
-                # Pour l'instant, on log l'intention
-                
+            responses = self.router.route_batch([self._prepare_data(message) for message, _ in fresh])
+        except Exception as e:
+            logger.exception(f"Critical error processing batch of {len(fresh)} messages: {str(e)}")
+            for message, key in fresh:
+                self._release(key)
+                sent.append(self._handle_processing_error(message, str(e)))
+            return all_sent(sent)
+        
+        failed = 0
+        completed = {}
+        for (message, key), response in zip(fresh, responses):
+            if response and 'error' in response:
+                failed += 1
+                logger.error(f"Error processing message {message.get('id', 'unknown')}: {response.get('error')}")
+                self._release(key)
+                sent.append(self._handle_processing_error(message, response.get('error')))
             else:
-                # Envoyer vers DLQ
-                logger.error(f"Max retries exceeded for message {message.get('id')}, sending to DLQ")
-                self._send_to_dlq(message, error)
-            
-            self.error_count += 1
-            if self.error_count > self.max_errors:
-                logger.critical(f"Too many errors ({self.error_count}), stopping consumer")
-                self.stop()
+                self.error_count = max(0, self.error_count - 1)
+                if key:
+                    completed[key] = response
+        self.idempotency.complete_many(completed)
+        
+        processing_time = (time.time() - start_time) * 1000
+        logger.info(f"Processed batch of {len(fresh)} messages ({failed} failed, {len(duplicates)} duplicates) "
+                    f"in {processing_time:.2f}ms")
+        return all_sent(sent) if sent else None
+    
+    def _handle_duplicates(self, duplicates: List[tuple]):
+        """
+        Messages déjà réservés : un résultat enregistré est republié sans
+        recalcul ; un traitement encore en cours ailleurs passe par le retry
+        (le message sera revu une fois ce traitement terminé ou expiré).
         
+        Returns:
+            Future des envois en retry
+        """
+        results, sent = [], []
+        for message, record in duplicates:
+            if record.get('state') == DONE:
+                logger.info(f"Message {message.get('id', 'unknown')} already processed, resending its result")
+                results.append(record.get('result'))
+            else:
+                logger.info(f"Message {message.get('id', 'unknown')} is being processed elsewhere, retrying later")
+                sent.append(self._schedule_retry(message, 'Duplicate of a message still in progress'))
+        if results:
+            try:
+                self.router.resend_results(results)
+            except Exception as e:
+                logger.error(f"Failed to resend results of {len(results)} duplicate messages: {str(e)}")
+        return all_sent(sent)
+    
+    def _release(self, key):
+        """Libère la réservation d'un message en échec (le retry le retraitera)"""
+        if key:
+            try:
+                self.idempotency.release(key)
+            except Exception as e:
+                logger.error(f"Failed to release idempotency key {key}: {str(e)}")
+    
+    def _handle_processing_error(self, message: Dict[str, Any], error: str) -> Future:
+        """
+        Gère les erreurs de traitement : retry différé sur le palier suivant,
+        DLQ une fois les retries épuisés. Le consumer continue sur les messages
+        suivants (une panne passagère ne bloque pas le topic principal).
+        """
+        self.error_count += 1
+        if self.error_count > self.max_errors:
+            logger.warning(f"High error rate: {self.error_count} recent processing errors")
+        return self._schedule_retry(message, error)
+    
+    def _schedule_retry(self, message: Dict[str, Any], error: str) -> Future:
+        """
+        Republie le message sur son palier de retry sans attendre le broker.
+        
+        Returns:
+            Future résolu à True une fois le message acquitté ou spoolé
+        """
+        sent = Future()
+        try:
+            self.retry_scheduler.schedule(message, error, on_sent=sent.set_result)
         except Exception as e:
-            logger.critical(f"Error in error handler: {str(e)}")
+            logger.critical(f"Failed to schedule retry for message {message.get('id', 'unknown')}: {str(e)}")
+            sent.set_result(False)
+        return sent
     
     def _send_to_dlq(self, message: Dict[str, Any], error: str):
         """
         Envoie un message vers la Dead Letter Queue
         """
         try:
-            # Ajouter des informations sur l'erreur
-            from .robust_kafka_client import StandardKafkaTopics
-            from kafka import KafkaProducer
-            import json
-            
-            # Enrichir le message avec des informations sur l'erreur
-            dlq_message = message.copy() if isinstance(message, dict) else {'original_data': message}
-            
-            if 'metadata' not in dlq_message:
-                dlq_message['metadata'] = {}
-            
-            dlq_message['metadata'].update({
-                'error': error,
-                'failed_at': datetime.utcnow().isoformat(),
-                'original_topic': message.get('metadata', {}).get('kafka_topic', 'unknown'),
-                'dlq_reason': 'max_retries_exceeded'
-            })
-            
-            # Créer un producer spécifique pour le DLQ
-            producer = KafkaProducer(
-                bootstrap_servers=self.consumer.config.brokers,
-                value_serializer=lambda v: json.dumps(v).encode('utf-8')
-            )
-            
-            # Envoyer vers la DLQ
-            future = producer.send(
-                StandardKafkaTopics.DLQ_FAILED_MESSAGES,
-                value=dlq_message
-            )
-            
-            # Attendre confirmation d'envoi
-            record_metadata = future.get(timeout=10)
-            logger.info(f"Message sent to DLQ: {dlq_message.get('id', 'unknown')} "
-                      f"(partition: {record_metadata.partition}, offset: {record_metadata.offset})")
-            
-            # Fermer le producer
-            producer.close()
-            
+            self.retry_scheduler.send_to_dlq(message, error)
         except Exception as e:
             logger.critical(f"Failed to send message to DLQ: {str(e)}")
     
     def _handle_error(self, error: Exception, message=None):
         """
-        Gère les erreurs générales du consumer
+        Gère les erreurs du consumer. Une erreur de la boucle de poll (sans
+        message) l'arrête ; _consume recrée alors le consumer après un délai.
+        Un enregistrement dont le handler a échoué part en retry (ou en DLQ
+        s'il n'est pas exploitable) : le Future rendu libère son offset.
         """
         logger.error(f"Consumer error: {str(error)}")
-        
-        # Tenter de redémarrer le consumer après une courte pause
-        if self.is_running:
-            logger.info("Attempting to restart consumer after error...")
-            try:
-                if self.consumer:
-                    self.consumer.close()
-                # Attendre avant de redémarrer
-                import time
-                time.sleep(5)
-                self.start()
-            except Exception as restart_error:
-                logger.critical(f"Failed to restart consumer: {str(restart_error)}")
-                self.is_running = False
+        if message is None:
+            return None
+        value = message.value
+        if isinstance(value, dict):
+            metadata = value.get('metadata') if isinstance(value.get('metadata'), dict) else {}
+            return self._handle_processing_error(
+                dict(value, metadata=dict(metadata, kafka_topic=metadata.get('kafka_topic') or message.topic)),
+                str(error)
+            )
+        sent = Future()
+        try:
+            self.retry_scheduler.send_to_dlq(value, str(error), reason='invalid_message', topic=message.topic,
+                                             on_sent=sent.set_result)
+        except Exception as e:
+            logger.critical(f"Failed to send message to DLQ: {str(e)}")
+            sent.set_result(False)
+        return sent
     
     def stop(self):
         """
         Arrête le consommateur Kafka proprement.
         """
         self.is_running = False
-        if self.consumer:
-            self.consumer.close()
-            logger.info("Unified consumer stopped")
+        self._stop_event.set()  # Réveille une attente avant redémarrage
+        for consumer in (self.consumer, self.retry_consumer):
+            if consumer:
+                # La boucle de poll termine les messages en cours puis ferme le consumer
+                consumer.stop()
+        self._join_retry_thread()
+        logger.info("Unified consumer stopped")
+    
+    def _join_retry_thread(self):
+        """Attend la fin du consumer des topics de retry (au plus ``stop_timeout`` secondes)"""
+        thread = self._retry_thread
+        if thread is None or thread is threading.current_thread():
+            return
+        thread.join(self.stop_timeout)
+        if thread.is_alive():
+            logger.warning(f"Unified retry consumer still running after {self.stop_timeout}s")
     
     def health_check(self) -> Dict[str, Any]:
         """
         Vérifie l'état de santé du consumer
         """
+        polled = [consumer.last_poll_at for consumer in (self.consumer, self.retry_consumer)
+                  if consumer and consumer.last_poll_at]
         return {
             'status': 'healthy' if self.is_running and self.error_count < self.max_errors else 'unhealthy',
+            # Boucle de poll la moins récente (supervision des processus, voir consumer_supervisor)
+            'last_poll_at': min(polled) if polled else None,
             'is_running': self.is_running,
             'error_count': self.error_count,
             'max_errors': self.max_errors,
             'topics': self.topics,
+            'retry_topics': self.retry_topics,
+            'retries': dict(self.retry_scheduler.stats),
+            'idempotency': dict(self.idempotency.stats),
+            # Débit, latence des handlers et lag (aussi exportés vers Prometheus), contre-pression
+            'consumers': {
+                role: dict(consumer.metrics.snapshot(),
+                           backpressure={lane: flow.snapshot() for lane, flow in consumer.flows.items()},
+                           workers=consumer.worker_pool.stats() if consumer.worker_pool else None)
+                for role, consumer in (('main', self.consumer), ('retry', self.retry_consumer)) if consumer
+            },
         }
 
 
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Resends the Kafka messages kept in the local delivery spool (undelivered while the broker was down)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=500,
+                            help='Messages resent per round-trip')
+        parser.add_argument('--timeout', type=float, default=30.0,
+                            help='Seconds to wait for the broker acknowledgements of a round-trip')
+
+    def handle(self, *args, **options):
+        from api.kafka.shared_producer import get_shared_producer
+
+        shared = get_shared_producer()
+        producer = shared.producer
+        self.stdout.write(f'{len(producer.spool)} message(s) in the spool {producer.spool.path}')
+
+        replayed = 0
+        try:
+            while True:
+                sent = shared.replay_spool(limit=options['limit'], timeout=options['timeout'])
+                replayed += sent
+                # Lot incomplet ou broker encore injoignable : les messages restants attendront
+                if sent < options['limit']:
+                    break
+        finally:
+            shared.close(timeout=options['timeout'])
+
+        remaining = len(producer.spool)
+        style = self.style.SUCCESS if remaining == 0 else self.style.WARNING
+        self.stdout.write(style(f'{replayed} message(s) replayed, {remaining} left in the spool'))
@@ -0,0 +1,73 @@
+import multiprocessing
+import os
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _worker_main(claim_size, lease_seconds, poll_interval):
+    """Point d'entrée d'un processus worker : un BatchWorker sur la base de données."""
+    from api.services.batch_engine import AgentStageHandlers, BatchWorker, DatabaseBatchStore
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+
+    worker = BatchWorker(
+        DatabaseBatchStore(),
+        AgentStageHandlers().as_dict(),
+        claim_size=claim_size,
+        lease_seconds=lease_seconds,
+        poll_interval=poll_interval,
+        backoff_base=getattr(settings, 'BATCH_BACKOFF_BASE_SECONDS', 2.0),
+        backoff_cap=getattr(settings, 'BATCH_BACKOFF_CAP_SECONDS', 300.0),
+    )
+    worker.run(stop_event)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Starts the batch document workers (DDE -> AA -> CCC) that process BatchDocument rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+                            default=getattr(settings, 'BATCH_WORKER_PROCESSES', 2),
+                            help='Number of worker processes')
+        parser.add_argument('--claim-size', type=int, default=1,
+                            help='Documents claimed per database round-trip')
+        parser.add_argument('--lease-seconds', type=int,
+                            default=getattr(settings, 'BATCH_LEASE_SECONDS', 600),
+                            help='After this delay a running document of a dead worker is reclaimed')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when no document is ready')
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        self.stdout.write(f'Starting {processes} batch worker process(es)...')
+
+        # Les connexions ne doivent pas être partagées avec les processus enfants
+        connections.close_all()
+        children = []
+        for _ in range(processes):
+            child = multiprocessing.Process(
+                target=_worker_main,
+                args=(options['claim_size'], options['lease_seconds'], options['poll_interval']),
+            )
+            child.start()
+            children.append(child)
+
+        def _stop(*_):
+            for child in children:
+                if child.is_alive():
+                    os.kill(child.pid, signal.SIGTERM)
+
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+
+        for child in children:
+            child.join()
+
+        self.stdout.write(self.style.SUCCESS('Batch workers stopped'))
@@ -10,6 +10,8 @@ from django.core.cache import cache
 from django.http import JsonResponse
 from rest_framework import status
 
+from agents.utils.resilience import BulkheadFullError, CallTimeoutError, CircuitOpenError, dependency
+
 logger = logging.getLogger(__name__)
 
 class EnhancedIsolationMiddleware:
@@ -121,8 +123,10 @@ class EnhancedIsolationMiddleware:
                 'Content-Type': 'application/json'
             }
             
-            # Appeler l'endpoint du customer-service pour récupérer le contexte
-            response = requests.get(
+            # Appeler l'endpoint du customer-service pour récupérer le contexte ;
+            # disjoncteur ouvert ou bulkhead plein : échec immédiat, contexte de fallback
+            response = dependency('customer_service').call(
+                requests.get,
                 f"{self.customer_service_url}/api/v1/users/profile",
                 headers=headers,
                 timeout=5  # Timeout court pour éviter la latence
@@ -146,6 +150,9 @@ class EnhancedIsolationMiddleware:
                 logger.warning(f"Customer service returned {response.status_code} for user {user.id}")
                 return None
                 
+        except (CircuitOpenError, BulkheadFullError, CallTimeoutError) as e:
+            logger.warning(f"Customer service unavailable for user {user.id}: {str(e)}")
+            return None
         except requests.RequestException as e:
             logger.error(f"Network error calling customer service: {str(e)}")
             return None
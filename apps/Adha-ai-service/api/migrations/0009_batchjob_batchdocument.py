@@ -0,0 +1,65 @@
+# Generated by Django 4.2.20 on 2026-10-19 09:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0008_usertokenquota_alter_tokenusage_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('intention', models.CharField(default='ecriture_simple', max_length=50, verbose_name='Intention')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('partial', 'Completed with errors'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='pending', max_length=20, verbose_name='Status')),
+                ('total_documents', models.IntegerField(default=0, verbose_name='Total Documents')),
+                ('cancel_requested', models.BooleanField(default=False, verbose_name='Cancel Requested')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+                ('completed_at', models.DateTimeField(blank=True, null=True, verbose_name='Completed At')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='batch_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Batch Job',
+                'verbose_name_plural': 'Batch Jobs',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BatchDocument',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255, verbose_name='Name')),
+                ('file_path', models.CharField(blank=True, max_length=500, verbose_name='File Path')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Payload')),
+                ('stage', models.CharField(choices=[('dde', 'Data extraction'), ('aa', 'Accounting analysis'), ('ccc', 'Consistency check'), ('done', 'Done')], default='dde', max_length=10, verbose_name='Stage')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='pending', max_length=20, verbose_name='Status')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Attempts')),
+                ('max_attempts', models.IntegerField(default=3, verbose_name='Max Attempts')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Next Attempt At')),
+                ('locked_by', models.CharField(blank=True, max_length=100, verbose_name='Locked By')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='Locked At')),
+                ('stage_results', models.JSONField(blank=True, default=dict, verbose_name='Stage Results')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='Result')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='documents', to='api.batchjob')),
+            ],
+            options={
+                'verbose_name': 'Batch Document',
+                'verbose_name_plural': 'Batch Documents',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='batchdoc_claim_idx'), models.Index(fields=['batch', 'status'], name='batchdoc_batch_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-19 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_batchjob_batchdocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='subscription_plan',
+            field=models.CharField(choices=[('free', 'Free'), ('standard', 'Standard'), ('premium', 'Premium'), ('enterprise', 'Enterprise')], default='standard', help_text="Formule d'abonnement ; fixe la part de la capacité LLM de l'entreprise (agents.utils.fair_scheduler)", max_length=20),
+        ),
+    ]
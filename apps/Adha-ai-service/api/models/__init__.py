@@ -10,6 +10,7 @@ from .admin_key import AdminAccessKey
 from .journal_entry import JournalEntry
 from .token_usage import TokenUsage, UserTokenQuota
 from .chat import ChatConversation, ChatMessage
+from .batch_job import BatchJob, BatchDocument
 
 # AdminAccessKey is specifically for admin users, not companies
 __all__ = [
@@ -21,6 +22,8 @@ __all__ = [
     'UserTokenQuota',
     'ChatConversation',
     'ChatMessage',
+    'BatchJob',
+    'BatchDocument',
     'TokenPrice',
     'TokenPurchaseRequest',
     'TokenQuota'
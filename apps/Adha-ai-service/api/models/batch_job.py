@@ -0,0 +1,93 @@
+import uuid
+from django.db import models
+from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class BatchJob(models.Model):
+    """
+    A batch of documents submitted through BatchProcessingView.
+
+    The batch only aggregates its documents: workers claim and process
+    BatchDocument rows (see api.services.batch_engine).
+    """
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("processing", "Processing"),
+        ("completed", "Completed"),
+        ("partial", "Completed with errors"),
+        ("failed", "Failed"),
+        ("cancelled", "Cancelled"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name="batch_jobs")
+    intention = models.CharField(_("Intention"), max_length=50, default="ecriture_simple")
+    status = models.CharField(_("Status"), max_length=20, choices=STATUS_CHOICES, default="pending")
+    total_documents = models.IntegerField(_("Total Documents"), default=0)
+    cancel_requested = models.BooleanField(_("Cancel Requested"), default=False)
+    created_at = models.DateTimeField(_("Created At"), auto_now_add=True)
+    updated_at = models.DateTimeField(_("Updated At"), auto_now=True)
+    completed_at = models.DateTimeField(_("Completed At"), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Batch Job")
+        verbose_name_plural = _("Batch Jobs")
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"Batch {self.id} ({self.status})"
+
+
+class BatchDocument(models.Model):
+    """
+    One document of a batch, with its position in the DDE -> AA -> CCC pipeline.
+
+    ``stage`` is the next stage to run and ``stage_results`` keeps the output of
+    the stages already done, so a retry resumes where the previous attempt failed.
+    """
+    STAGE_CHOICES = [
+        ("dde", "Data extraction"),
+        ("aa", "Accounting analysis"),
+        ("ccc", "Consistency check"),
+        ("done", "Done"),
+    ]
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("completed", "Completed"),
+        ("failed", "Failed"),
+        ("cancelled", "Cancelled"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    batch = models.ForeignKey(BatchJob, on_delete=models.CASCADE, related_name="documents")
+    name = models.CharField(_("Name"), max_length=255)
+    file_path = models.CharField(_("File Path"), max_length=500, blank=True)
+    payload = models.JSONField(_("Payload"), default=dict, blank=True)
+    stage = models.CharField(_("Stage"), max_length=10, choices=STAGE_CHOICES, default="dde")
+    status = models.CharField(_("Status"), max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.IntegerField(_("Attempts"), default=0)
+    max_attempts = models.IntegerField(_("Max Attempts"), default=3)
+    next_attempt_at = models.DateTimeField(_("Next Attempt At"), default=timezone.now)
+    locked_by = models.CharField(_("Locked By"), max_length=100, blank=True)
+    locked_at = models.DateTimeField(_("Locked At"), null=True, blank=True)
+    stage_results = models.JSONField(_("Stage Results"), default=dict, blank=True)
+    result = models.JSONField(_("Result"), null=True, blank=True)
+    error = models.TextField(_("Error"), blank=True)
+    created_at = models.DateTimeField(_("Created At"), auto_now_add=True)
+    updated_at = models.DateTimeField(_("Updated At"), auto_now=True)
+
+    class Meta:
+        verbose_name = _("Batch Document")
+        verbose_name_plural = _("Batch Documents")
+        ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="batchdoc_claim_idx"),
+            models.Index(fields=["batch", "status"], name="batchdoc_batch_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} [{self.stage}/{self.status}]"
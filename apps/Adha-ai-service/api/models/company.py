@@ -8,6 +8,13 @@ class Company(models.Model):
     """
     Company model for storing business information.
     """
+    SUBSCRIPTION_PLAN_CHOICES = [
+        ('free', 'Free'),
+        ('standard', 'Standard'),
+        ('premium', 'Premium'),
+        ('enterprise', 'Enterprise'),
+    ]
+
     name = models.CharField(max_length=255)
     registration_number = models.CharField(max_length=100, blank=True)
     vat_number = models.CharField(max_length=100, blank=True)
@@ -40,6 +47,10 @@ class Company(models.Model):
     # Subscription fields - set default to True so companies can use tokens immediately
     is_subscription_active = models.BooleanField(default=True)
     subscription_renewal_date = models.DateField(null=True, blank=True)
+    subscription_plan = models.CharField(
+        max_length=20, choices=SUBSCRIPTION_PLAN_CHOICES, default='standard',
+        help_text="Formule d'abonnement ; fixe la part de la capacité LLM de l'entreprise (agents.utils.fair_scheduler)"
+    )
     
     # Token management - initialize with the monthly allowance
     token_quota = models.BigIntegerField(default=1000000)  # Start with 1 million tokens
@@ -105,6 +105,8 @@ def process_business_operation(operation):
             'date': operation.get('date') if isinstance(operation.get('date'), str) else operation.get('date').isoformat(),
             'description': operation.get('description'),
             'amount': amount,
+            'totalDebit': amount,
+            'totalCredit': amount,
             'currency': 'CDF',
             'createdAt': datetime.now().isoformat(),
             'createdBy': 'adha-ai-service',
@@ -155,6 +157,49 @@ def process_business_operation(operation):
         return None
 
 
+def _journal_entry_row(journal_entry: Dict[str, Any]):
+    """Construit le modèle JournalEntry d'une écriture générée (lignes au format compte/montant/libelle)"""
+    from api.models import JournalEntry
+
+    try:
+        entry_date = datetime.fromisoformat(str(journal_entry.get('date'))[:10]).date()
+    except ValueError:
+        entry_date = datetime.now().date()
+    lines = journal_entry.get('lines', [])
+    return JournalEntry(
+        date=entry_date,
+        piece_reference=str(journal_entry.get('sourceId') or '')[:50],
+        description=(journal_entry.get('description') or '')[:255],
+        debit_data=[{'compte': line['accountCode'], 'montant': line['debit'], 'libelle': line['description']}
+                    for line in lines if line.get('debit')],
+        credit_data=[{'compte': line['accountCode'], 'montant': line['credit'], 'libelle': line['description']}
+                     for line in lines if line.get('credit')],
+        journal=(journal_entry.get('journalType') or 'JO')[:10],
+        source_data={
+            'journal_entry_id': journal_entry.get('id'),
+            'company_id': journal_entry.get('companyId'),
+            'client_id': journal_entry.get('clientId'),
+        },
+        source_type='import',
+    )
+
+
+def save_journal_entries(journal_entries):
+    """
+    Enregistre les écritures générées en une seule transaction (bulk_create).
+    Les écritures ont déjà été validées (équilibre) par la base de connaissances.
+
+    Returns:
+        list: Les JournalEntry créés
+    """
+    from django.db import transaction
+    from api.models import JournalEntry
+
+    rows = [_journal_entry_row(entry) for entry in journal_entries]
+    with transaction.atomic():
+        return JournalEntry.objects.bulk_create(rows, batch_size=500)
+
+
 def handle_accounting_status(status_message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
     Traite les messages de statut de traitement des écritures comptables
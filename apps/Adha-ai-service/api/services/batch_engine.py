@@ -0,0 +1,689 @@
+"""
+Moteur de traitement par lot durable pour les documents comptables.
+
+Chaque document d'un lot est une ligne ``BatchDocument`` en base. Des processus
+workers (commande ``run_batch_workers``) réclament les documents prêts avec
+``SELECT ... FOR UPDATE SKIP LOCKED`` : plusieurs workers ne prennent jamais le
+même document et le débit augmente avec le nombre de processus.
+
+Chaque document avance étape par étape (DDE -> AA -> CCC). Le résultat de chaque
+étape est enregistré avant de passer à la suivante, de sorte qu'une nouvelle
+tentative (après une erreur ou la mort d'un worker) reprend à l'étape en échec.
+Les erreurs sont réessayées avec un backoff exponentiel jusqu'à ``max_attempts``,
+puis le document passe en ``failed``. Un bail expiré (worker mort, OOM) compte
+aussi comme une tentative. Les écritures d'un worker sont limitées aux documents
+dont il détient encore le bail (``locked_by``) : un worker trop lent dont le
+document a été repris ne peut pas écraser le résultat du nouveau propriétaire.
+L'annulation d'un lot est vérifiée entre deux étapes ; un document du lot
+annulé qui échoue ensuite, ou dont le bail expire, est annulé au lieu d'être
+remis en attente. Les fichiers déposés d'un lot sont supprimés dès qu'il
+atteint un statut final.
+
+Le stockage est abstrait : ``DatabaseBatchStore`` (Django, production) et
+``InMemoryBatchStore`` (tests et exécution locale) ont le même contrat.
+"""
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from agents.utils.pipeline_executor import DB, gated
+
+logger = logging.getLogger(__name__)
+
+# Étapes du pipeline, dans l'ordre ; "done" marque la fin
+STAGES = ("dde", "aa", "ccc")
+DONE = "done"
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_LEASE_SECONDS = 600
+DEFAULT_BACKOFF_BASE = 2.0
+DEFAULT_BACKOFF_CAP = 300.0
+
+LEASE_EXPIRED_ERROR = "Bail expiré : le worker s'est arrêté pendant le traitement"
+
+
+class StageError(Exception):
+    """Erreur d'une étape du pipeline ; ``retryable=False`` fait échouer le document sans nouvel essai."""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+@dataclass
+class ClaimedDocument:
+    """Document réclamé par un worker, avec l'état nécessaire pour reprendre le traitement."""
+    id: str
+    batch_id: str
+    name: str
+    intention: str
+    stage: str = STAGES[0]
+    file_path: str = ""
+    payload: Dict[str, Any] = field(default_factory=dict)
+    attempts: int = 0
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS
+    stage_results: Dict[str, Any] = field(default_factory=dict)
+
+
+def next_stage(stage: str) -> str:
+    """Retourne l'étape suivant ``stage`` (ou ``done``)."""
+    index = STAGES.index(stage)
+    return STAGES[index + 1] if index + 1 < len(STAGES) else DONE
+
+
+def compute_backoff(attempt: int, base: float = DEFAULT_BACKOFF_BASE,
+                    cap: float = DEFAULT_BACKOFF_CAP, jitter: float = 0.1) -> float:
+    """Délai avant la tentative ``attempt + 1`` : base * 2^(attempt-1), plafonné, avec un peu de gigue."""
+    delay = min(cap, base * (2 ** max(0, attempt - 1)))
+    return delay * (1 + random.uniform(-jitter, jitter))
+
+
+def build_result(stage_results: Dict[str, Any]) -> Dict[str, Any]:
+    """Construit le résultat final d'un document (même forme que OrchestrationAgent.process_document)."""
+    analysis = stage_results.get("aa") or {}
+    result = {
+        "entries": analysis.get("proposals", []),
+        "verification": stage_results.get("ccc"),
+    }
+    if "details" in analysis:
+        result["details"] = analysis["details"]
+    return result
+
+
+def _to_json(value: Any) -> Any:
+    """Rend une sortie d'agent sérialisable pour un JSONField (Decimal, dates...)."""
+    return json.loads(json.dumps(value, default=str))
+
+
+def _summarize_batch(batch_id: str, batch_status: str, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Agrège l'état des documents d'un lot pour BatchStatusView."""
+    counts = {s: 0 for s in ("pending", "running", "completed", "failed", "cancelled")}
+    for doc in documents:
+        counts[doc["status"]] = counts.get(doc["status"], 0) + 1
+    total = len(documents)
+    finished = counts["completed"] + counts["failed"] + counts["cancelled"]
+    return {
+        "batch_id": batch_id,
+        "status": batch_status,
+        "progress": int(finished * 100 / total) if total else 100,
+        "total": total,
+        "counts": counts,
+        "documents": [
+            {k: doc.get(k) for k in ("id", "name", "stage", "status", "attempts", "error")}
+            for doc in documents
+        ],
+        "results": [
+            {"document_id": doc["id"], "name": doc["name"], "result": doc.get("result")}
+            for doc in documents if doc["status"] == "completed"
+        ],
+    }
+
+
+def remove_batch_files(file_paths: List[str]) -> None:
+    """
+    Supprime les fichiers déposés d'un lot terminé, puis leur répertoire de dépôt
+    (``BATCH_UPLOAD_DIR/<uuid>``) une fois vide.
+    """
+    for path in file_paths:
+        if path:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Fichier de lot {path} non supprimé: {e}")
+    for directory in {os.path.dirname(path) for path in file_paths if path}:
+        try:
+            os.rmdir(directory)
+        except OSError:
+            pass  # Répertoire partagé ou non vide : laissé en place
+
+
+def _final_batch_status(counts: Dict[str, int], cancel_requested: bool) -> Optional[str]:
+    """Statut final du lot, ou None tant que des documents restent à traiter."""
+    if counts.get("pending", 0) or counts.get("running", 0):
+        return None
+    if cancel_requested:
+        return "cancelled"
+    if counts.get("failed", 0):
+        return "partial" if counts.get("completed", 0) else "failed"
+    return "completed"
+
+
+class InMemoryBatchStore:
+    """
+    Implémentation en mémoire du stockage des lots, protégée par un verrou.
+
+    Même sémantique que DatabaseBatchStore (réclamation exclusive, bail, backoff) ;
+    utilisée pour les tests et l'exécution locale sans base de données.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._batches: Dict[str, Dict[str, Any]] = {}
+        self._documents: Dict[str, Dict[str, Any]] = {}
+        # Documents encore à traiter (pending ou running), dans l'ordre de création
+        self._active: Dict[str, None] = {}
+
+    @staticmethod
+    def _now() -> float:
+        return time.time()
+
+    def create_batch(self, documents: List[Dict[str, Any]], intention: str = "ecriture_simple",
+                     created_by=None, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> str:
+        batch_id = str(uuid.uuid4())
+        with self._lock:
+            self._batches[batch_id] = {
+                "status": "pending", "intention": intention, "created_by": created_by,
+                "cancel_requested": False, "document_ids": [],
+            }
+            for document in documents:
+                doc_id = str(uuid.uuid4())
+                self._documents[doc_id] = {
+                    "id": doc_id, "batch_id": batch_id, "name": document.get("name", doc_id),
+                    "file_path": document.get("file", ""), "payload": document.get("payload", {}),
+                    "stage": STAGES[0], "status": "pending", "attempts": 0,
+                    "max_attempts": max_attempts, "next_attempt_at": 0.0,
+                    "locked_by": "", "locked_at": None, "stage_results": {},
+                    "result": None, "error": "",
+                }
+                self._batches[batch_id]["document_ids"].append(doc_id)
+                self._active[doc_id] = None
+        return batch_id
+
+    def claim(self, worker_id: str, limit: int = 1,
+              lease_seconds: float = DEFAULT_LEASE_SECONDS) -> List[ClaimedDocument]:
+        claimed, exhausted, cancelled = [], [], []
+        with self._lock:
+            now = self._now()
+            for doc_id in self._active:
+                doc = self._documents[doc_id]
+                batch = self._batches[doc["batch_id"]]
+                ready = doc["status"] == "pending" and doc["next_attempt_at"] <= now
+                expired = doc["status"] == "running" and doc["locked_at"] < now - lease_seconds
+                if batch["cancel_requested"] and (expired or doc["status"] == "pending"):
+                    # Lot annulé : aucun worker ne reprendra ce document, il est annulé ici
+                    cancelled.append(doc_id)
+                    continue
+                if not (ready or expired):
+                    continue
+                if expired:
+                    # Le worker précédent est mort pendant le traitement : c'est une tentative
+                    doc["attempts"] += 1
+                    if doc["attempts"] >= doc["max_attempts"]:
+                        exhausted.append(doc_id)
+                        continue
+                doc.update(status="running", locked_by=worker_id, locked_at=now)
+                if batch["status"] == "pending":
+                    batch["status"] = "processing"
+                claimed.append(ClaimedDocument(
+                    id=doc_id, batch_id=doc["batch_id"], name=doc["name"],
+                    intention=batch["intention"], stage=doc["stage"],
+                    file_path=doc["file_path"], payload=doc["payload"],
+                    attempts=doc["attempts"], max_attempts=doc["max_attempts"],
+                    stage_results=dict(doc["stage_results"]),
+                ))
+                if len(claimed) >= limit:
+                    break
+            for doc_id in exhausted:
+                doc = self._documents[doc_id]
+                doc.update(status="failed", error=LEASE_EXPIRED_ERROR, locked_by="", locked_at=None)
+                self._active.pop(doc_id, None)
+                self._refresh_batch(doc["batch_id"])
+            for doc_id in cancelled:
+                doc = self._documents[doc_id]
+                doc.update(status="cancelled", locked_by="", locked_at=None)
+                self._active.pop(doc_id, None)
+                self._refresh_batch(doc["batch_id"])
+        return claimed
+
+    @staticmethod
+    def _owns(doc: Dict[str, Any], worker_id: Optional[str]) -> bool:
+        return worker_id is None or doc["locked_by"] == worker_id
+
+    def save_stage(self, doc_id: str, stage: str, stage_results: Dict[str, Any],
+                   worker_id: Optional[str] = None) -> bool:
+        with self._lock:
+            doc = self._documents[doc_id]
+            if not self._owns(doc, worker_id):
+                return False
+            doc.update(stage=stage, stage_results=dict(stage_results), locked_at=self._now())
+            return True
+
+    def complete(self, doc_id: str, result: Dict[str, Any], worker_id: Optional[str] = None) -> bool:
+        return self._finish(doc_id, worker_id, status="completed", stage=DONE, result=result, error="")
+
+    def retry(self, doc_id: str, error: str, delay: float, worker_id: Optional[str] = None) -> bool:
+        with self._lock:
+            doc = self._documents[doc_id]
+            if not self._owns(doc, worker_id):
+                return False
+            if self._batches[doc["batch_id"]]["cancel_requested"]:
+                # Lot annulé pendant l'étape : un document remis en attente ne serait plus réclamé
+                doc.update(status="cancelled", attempts=doc["attempts"] + 1, error=error,
+                           locked_by="", locked_at=None)
+                self._active.pop(doc_id, None)
+                self._refresh_batch(doc["batch_id"])
+                return True
+            doc.update(status="pending", attempts=doc["attempts"] + 1, error=error,
+                       next_attempt_at=self._now() + delay, locked_by="", locked_at=None)
+            return True
+
+    def fail(self, doc_id: str, error: str, worker_id: Optional[str] = None) -> bool:
+        with self._lock:
+            attempts = self._documents[doc_id]["attempts"] + 1
+        return self._finish(doc_id, worker_id, status="failed", attempts=attempts, error=error)
+
+    def cancel_document(self, doc_id: str, worker_id: Optional[str] = None) -> bool:
+        return self._finish(doc_id, worker_id, status="cancelled")
+
+    def _finish(self, doc_id: str, worker_id: Optional[str] = None, **changes) -> bool:
+        with self._lock:
+            doc = self._documents[doc_id]
+            if not self._owns(doc, worker_id):
+                return False
+            doc.update(locked_by="", locked_at=None, **changes)
+            self._active.pop(doc_id, None)
+            self._refresh_batch(doc["batch_id"])
+            return True
+
+    def _refresh_batch(self, batch_id: str) -> None:
+        batch = self._batches[batch_id]
+        counts: Dict[str, int] = {}
+        for doc_id in batch["document_ids"]:
+            status = self._documents[doc_id]["status"]
+            counts[status] = counts.get(status, 0) + 1
+        final = _final_batch_status(counts, batch["cancel_requested"])
+        if final and batch["status"] != final:
+            batch["status"] = final
+            # Plus aucun worker ne lira les fichiers du lot
+            remove_batch_files([self._documents[doc_id]["file_path"] for doc_id in batch["document_ids"]])
+
+    def is_cancel_requested(self, batch_id: str) -> bool:
+        with self._lock:
+            return self._batches[batch_id]["cancel_requested"]
+
+    def cancel_batch(self, batch_id: str) -> bool:
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None or batch["status"] in ("completed", "partial", "failed", "cancelled"):
+                return False
+            batch["cancel_requested"] = True
+            # Les documents en attente sont annulés tout de suite, ceux en cours entre deux étapes
+            for doc_id in batch["document_ids"]:
+                doc = self._documents[doc_id]
+                if doc["status"] == "pending":
+                    doc["status"] = "cancelled"
+                    self._active.pop(doc_id, None)
+            self._refresh_batch(batch_id)
+            return True
+
+    def get_owner(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            return {"created_by": batch["created_by"]} if batch else None
+
+    def batch_status(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return None
+            documents = [dict(self._documents[doc_id]) for doc_id in batch["document_ids"]]
+            return _summarize_batch(batch_id, batch["status"], documents)
+
+
+class DatabaseBatchStore:
+    """
+    Stockage des lots dans PostgreSQL via les modèles BatchJob / BatchDocument.
+
+    La réclamation utilise ``select_for_update(skip_locked=True)`` : les lignes déjà
+    verrouillées par un autre worker sont ignorées au lieu de bloquer. Les écritures
+    prennent un jeton ``db`` de l'exécuteur du pipeline (PIPELINE_DB_CONCURRENCY) :
+    les threads d'un processus ne saturent pas le pool de connexions.
+    """
+
+    @gated(DB)
+    def create_batch(self, documents: List[Dict[str, Any]], intention: str = "ecriture_simple",
+                     created_by=None, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> str:
+        from django.db import transaction
+        from api.models import BatchJob, BatchDocument
+
+        with transaction.atomic():
+            batch = BatchJob.objects.create(created_by=created_by, intention=intention,
+                                            total_documents=len(documents))
+            BatchDocument.objects.bulk_create([
+                BatchDocument(batch=batch, name=document.get("name", ""),
+                              file_path=document.get("file", ""),
+                              payload=document.get("payload", {}), max_attempts=max_attempts)
+                for document in documents
+            ])
+        return str(batch.id)
+
+    @gated(DB)
+    def claim(self, worker_id: str, limit: int = 1,
+              lease_seconds: float = DEFAULT_LEASE_SECONDS) -> List[ClaimedDocument]:
+        from django.db import transaction
+        from django.db.models import F, Q
+        from django.utils import timezone
+        from api.models import BatchJob, BatchDocument
+
+        now = timezone.now()
+        expired = Q(status="running", locked_at__lt=now - timedelta(seconds=lease_seconds))
+        with transaction.atomic():
+            # Lot annulé : aucun worker ne reprendra ses documents en attente ou au bail expiré
+            cancelled = list(
+                BatchDocument.objects.select_for_update(skip_locked=True, of=("self",))
+                .filter(Q(status="pending") | expired, batch__cancel_requested=True)
+                .only("id", "batch_id")
+            )
+            if cancelled:
+                BatchDocument.objects.filter(id__in=[d.id for d in cancelled]).update(
+                    status="cancelled", locked_by="", locked_at=None
+                )
+                for batch_id in {d.batch_id for d in cancelled}:
+                    self._refresh_batch(batch_id)
+            documents = list(
+                BatchDocument.objects.select_for_update(skip_locked=True, of=("self",))
+                .select_related("batch")
+                .filter(Q(status="pending", next_attempt_at__lte=now) | expired)
+                .filter(batch__cancel_requested=False)
+                .order_by("next_attempt_at", "created_at")[:limit]
+            )
+            if not documents:
+                return []
+            # Bail expiré : le worker précédent est mort pendant le traitement, c'est une tentative
+            expired = [d for d in documents if d.status == "running"]
+            exhausted = [d for d in expired if d.attempts + 1 >= d.max_attempts]
+            if exhausted:
+                BatchDocument.objects.filter(id__in=[d.id for d in exhausted]).update(
+                    status="failed", attempts=F("attempts") + 1, error=LEASE_EXPIRED_ERROR,
+                    locked_by="", locked_at=None
+                )
+                for batch_id in {d.batch_id for d in exhausted}:
+                    self._refresh_batch(batch_id)
+            documents = [d for d in documents if d not in exhausted]
+            reclaimed = [d for d in expired if d not in exhausted]
+            BatchDocument.objects.filter(id__in=[d.id for d in reclaimed]).update(attempts=F("attempts") + 1)
+            for d in reclaimed:
+                d.attempts += 1
+            BatchDocument.objects.filter(id__in=[d.id for d in documents]).update(
+                status="running", locked_by=worker_id, locked_at=now
+            )
+            BatchJob.objects.filter(id__in={d.batch_id for d in documents}, status="pending").update(
+                status="processing"
+            )
+        return [
+            ClaimedDocument(
+                id=str(d.id), batch_id=str(d.batch_id), name=d.name, intention=d.batch.intention,
+                stage=d.stage, file_path=d.file_path, payload=d.payload or {},
+                attempts=d.attempts, max_attempts=d.max_attempts,
+                stage_results=d.stage_results or {},
+            )
+            for d in documents
+        ]
+
+    @staticmethod
+    def _owned(doc_id: str, worker_id: Optional[str]):
+        """Document ``doc_id``, restreint au bail de ``worker_id`` s'il est donné."""
+        from api.models import BatchDocument
+
+        documents = BatchDocument.objects.filter(id=doc_id)
+        return documents if worker_id is None else documents.filter(locked_by=worker_id)
+
+    @gated(DB)
+    def save_stage(self, doc_id: str, stage: str, stage_results: Dict[str, Any],
+                   worker_id: Optional[str] = None) -> bool:
+        from django.utils import timezone
+
+        # Renouvelle aussi le bail : un worker qui avance n'est pas considéré comme mort
+        return bool(self._owned(doc_id, worker_id).update(
+            stage=stage, stage_results=_to_json(stage_results), locked_at=timezone.now()
+        ))
+
+    @gated(DB)
+    def complete(self, doc_id: str, result: Dict[str, Any], worker_id: Optional[str] = None) -> bool:
+        return self._finish(doc_id, worker_id, status="completed", stage=DONE, result=_to_json(result), error="")
+
+    @gated(DB)
+    def retry(self, doc_id: str, error: str, delay: float, worker_id: Optional[str] = None) -> bool:
+        from django.db import transaction
+        from django.db.models import F
+        from django.utils import timezone
+        from api.models import BatchDocument, BatchJob
+
+        with transaction.atomic():
+            batch_id = BatchDocument.objects.filter(id=doc_id).values_list("batch_id", flat=True).first()
+            # Verrou du lot : sérialisé avec cancel_batch, qui annule les documents en attente
+            batch = BatchJob.objects.select_for_update().filter(id=batch_id).first()
+            if batch is not None and batch.cancel_requested:
+                # Lot annulé pendant l'étape : un document remis en attente ne serait plus réclamé
+                if not self._owned(doc_id, worker_id).update(
+                    status="cancelled", attempts=F("attempts") + 1, error=error[:5000], locked_by="", locked_at=None
+                ):
+                    return False
+                self._refresh_batch(batch_id)
+                return True
+            return bool(self._owned(doc_id, worker_id).update(
+                status="pending", attempts=F("attempts") + 1, error=error[:5000],
+                next_attempt_at=timezone.now() + timedelta(seconds=delay), locked_by="", locked_at=None
+            ))
+
+    @gated(DB)
+    def fail(self, doc_id: str, error: str, worker_id: Optional[str] = None) -> bool:
+        from django.db.models import F
+        return self._finish(doc_id, worker_id, status="failed", attempts=F("attempts") + 1, error=error[:5000])
+
+    @gated(DB)
+    def cancel_document(self, doc_id: str, worker_id: Optional[str] = None) -> bool:
+        return self._finish(doc_id, worker_id, status="cancelled")
+
+    def _finish(self, doc_id: str, worker_id: Optional[str] = None, **changes) -> bool:
+        from django.db import transaction
+        from api.models import BatchDocument
+
+        with transaction.atomic():
+            if not self._owned(doc_id, worker_id).update(locked_by="", locked_at=None, **changes):
+                return False
+            batch_id = BatchDocument.objects.filter(id=doc_id).values_list("batch_id", flat=True).first()
+            self._refresh_batch(batch_id)
+        return True
+
+    def _refresh_batch(self, batch_id) -> None:
+        from django.db import transaction
+        from django.db.models import Count
+        from django.utils import timezone
+        from api.models import BatchJob
+
+        batch = BatchJob.objects.select_for_update().filter(id=batch_id).first()
+        if batch is None:
+            return
+        counts = dict(batch.documents.order_by().values_list("status").annotate(n=Count("id")))
+        final = _final_batch_status(counts, batch.cancel_requested)
+        if final and batch.status != final:
+            batch.status = final
+            batch.completed_at = timezone.now()
+            batch.save(update_fields=["status", "completed_at", "updated_at"])
+            # Plus aucun worker ne lira les fichiers du lot : supprimés une fois le statut validé
+            file_paths = list(batch.documents.values_list("file_path", flat=True))
+            transaction.on_commit(lambda: remove_batch_files(file_paths))
+
+    def is_cancel_requested(self, batch_id: str) -> bool:
+        from api.models import BatchJob
+        return BatchJob.objects.filter(id=batch_id, cancel_requested=True).exists()
+
+    @gated(DB)
+    def cancel_batch(self, batch_id: str) -> bool:
+        from django.db import transaction
+        from api.models import BatchJob
+
+        with transaction.atomic():
+            batch = BatchJob.objects.select_for_update().filter(id=batch_id).first()
+            if batch is None or batch.status in ("completed", "partial", "failed", "cancelled"):
+                return False
+            batch.cancel_requested = True
+            batch.save(update_fields=["cancel_requested", "updated_at"])
+            batch.documents.filter(status="pending").update(status="cancelled")
+            self._refresh_batch(batch.id)
+        return True
+
+    def get_owner(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """Retourne ``{"created_by": user_id}`` ou None si le lot n'existe pas."""
+        from api.models import BatchJob
+        row = BatchJob.objects.filter(id=batch_id).values("created_by_id").first()
+        return {"created_by": row["created_by_id"]} if row else None
+
+    def batch_status(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        from api.models import BatchJob
+
+        batch = BatchJob.objects.filter(id=batch_id).first()
+        if batch is None:
+            return None
+        documents = [
+            {"id": str(d["id"]), "name": d["name"], "stage": d["stage"], "status": d["status"],
+             "attempts": d["attempts"], "error": d["error"], "result": d["result"]}
+            for d in batch.documents.values("id", "name", "stage", "status", "attempts", "error", "result")
+        ]
+        return _summarize_batch(str(batch.id), batch.status, documents)
+
+
+StageHandler = Callable[[ClaimedDocument, Dict[str, Any]], Any]
+
+
+class AgentStageHandlers:
+    """
+    Étapes DDE / AA / CCC exécutées avec les agents du pipeline.
+
+    Les agents proviennent du pool du processus (agents.utils.agent_pool) :
+    ils sont créés à la première utilisation et partagés par tous les documents.
+    """
+
+    def as_dict(self) -> Dict[str, StageHandler]:
+        return {"dde": self.extract, "aa": self.analyze, "ccc": self.verify}
+
+    def extract(self, doc: ClaimedDocument, results: Dict[str, Any]) -> Any:
+        from agents.utils.agent_pool import agent_pool
+        dde = agent_pool.get("dde")
+        if doc.file_path:
+            if not os.path.exists(doc.file_path):
+                raise StageError(f"Fichier introuvable: {doc.file_path}", retryable=False)
+            extracted = dde.process(doc.file_path)
+        else:
+            extracted = dde.process_prompt(doc.payload.get("prompt", ""))
+        if isinstance(extracted, dict) and "error" in extracted:
+            raise StageError(str(extracted["error"]))
+        return extracted
+
+    def analyze(self, doc: ClaimedDocument, results: Dict[str, Any]) -> Any:
+        from agents.utils.agent_pool import agent_pool
+        return agent_pool.get("aa").process(doc.intention, doc.payload.get("entities", {}), results["dde"])
+
+    def verify(self, doc: ClaimedDocument, results: Dict[str, Any]) -> Any:
+        from agents.utils.agent_pool import agent_pool
+        return agent_pool.get("ccc").verify((results.get("aa") or {}).get("proposals", []))
+
+
+class BatchWorker:
+    """
+    Worker qui réclame des documents dans un store et les fait avancer dans le pipeline.
+
+    Plusieurs workers (threads ou processus) peuvent partager le même store : la
+    réclamation est exclusive et un document dont le bail expire est repris.
+    """
+
+    def __init__(self, store, stage_handlers: Dict[str, StageHandler], worker_id: Optional[str] = None,
+                 claim_size: int = 1, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 poll_interval: float = 1.0, backoff_base: float = DEFAULT_BACKOFF_BASE,
+                 backoff_cap: float = DEFAULT_BACKOFF_CAP):
+        self.store = store
+        self.stage_handlers = stage_handlers
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}"
+        self.claim_size = claim_size
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.stats = {"processed": 0, "completed": 0, "retried": 0, "failed": 0, "cancelled": 0,
+                      "lease_lost": 0}
+
+    def run_once(self) -> int:
+        """Réclame et traite au plus ``claim_size`` documents ; retourne le nombre traité."""
+        documents = self.store.claim(self.worker_id, self.claim_size, self.lease_seconds)
+        for doc in documents:
+            self.process(doc)
+        return len(documents)
+
+    def run(self, stop_event: Optional[threading.Event] = None, idle_exit: bool = False) -> None:
+        """
+        Boucle principale. S'arrête quand ``stop_event`` est positionné, ou dès que la
+        file est vide si ``idle_exit`` est vrai.
+        """
+        stop_event = stop_event or threading.Event()
+        logger.info(f"Worker de lot {self.worker_id} démarré")
+        while not stop_event.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception as e:
+                logger.error(f"Erreur du worker {self.worker_id}: {e}", exc_info=True)
+            if idle_exit:
+                break
+            stop_event.wait(self.poll_interval)
+        logger.info(f"Worker de lot {self.worker_id} arrêté: {self.stats}")
+
+    def _lease_lost(self, doc: ClaimedDocument) -> str:
+        logger.warning(f"Worker {self.worker_id}: bail du document {doc.id} repris par un autre worker, "
+                       f"résultat abandonné")
+        self.stats["lease_lost"] += 1
+        return "lost"
+
+    def process(self, doc: ClaimedDocument) -> str:
+        """
+        Fait avancer un document jusqu'à la fin du pipeline ; retourne son nouveau
+        statut, ou ``lost`` si son bail a été repris entre-temps par un autre worker.
+        """
+        self.stats["processed"] += 1
+        from agents.utils.agent_pool import agent_context
+        results = dict(doc.stage_results)
+        stage = doc.stage
+        try:
+            while stage != DONE:
+                if self.store.is_cancel_requested(doc.batch_id):
+                    if not self.store.cancel_document(doc.id, worker_id=self.worker_id):
+                        return self._lease_lost(doc)
+                    self.stats["cancelled"] += 1
+                    return "cancelled"
+                # Les lots cèdent le budget OpenAI aux requêtes interactives ; la capacité
+                # LLM est partagée équitablement entre les clients (company_id / institution_id)
+                with agent_context(priority="batch", company_id=doc.payload.get("company_id"),
+                                   institution_id=doc.payload.get("institution_id")):
+                    results[stage] = self.stage_handlers[stage](doc, results)
+                stage = next_stage(stage)
+                if not self.store.save_stage(doc.id, stage, results, worker_id=self.worker_id):
+                    return self._lease_lost(doc)
+            if not self.store.complete(doc.id, build_result(results), worker_id=self.worker_id):
+                return self._lease_lost(doc)
+            self.stats["completed"] += 1
+            return "completed"
+        except Exception as e:
+            error = f"{stage}: {e}"
+            retryable = getattr(e, "retryable", True)
+            if retryable and doc.attempts + 1 < doc.max_attempts:
+                delay = compute_backoff(doc.attempts + 1, self.backoff_base, self.backoff_cap)
+                logger.warning(f"Document {doc.id} en échec à l'étape {stage}, nouvel essai dans {delay:.1f}s: {e}")
+                if not self.store.retry(doc.id, error, delay, worker_id=self.worker_id):
+                    return self._lease_lost(doc)
+                self.stats["retried"] += 1
+                return "pending"
+            logger.error(f"Document {doc.id} en échec définitif à l'étape {stage}: {e}")
+            if not self.store.fail(doc.id, error, worker_id=self.worker_id):
+                return self._lease_lost(doc)
+            self.stats["failed"] += 1
+            return "failed"
@@ -5,14 +5,19 @@ vers le processeur approprié en fonction de leur type et contexte.
 """
 
 import logging
+import os
 import time
 from enum import Enum
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
-from .accounting_processor import process_business_operation, handle_accounting_status
+from agents.utils.agent_pool import agent_context
+from agents.utils.rate_limiter import BATCH, CHAT, DEFAULT
+
+from .accounting_processor import process_business_operation, handle_accounting_status, save_journal_entries
 from .portfolio_analyzer import analyze_portfolio
 from .chat_processor import process_chat_message
-from ..kafka.producer_accounting import publish_journal_entry
+from ..kafka.priority_lanes import Lane, PriorityLanePool
+from ..kafka.producer_accounting import publish_journal_entry, publish_journal_entries
 
 logger = logging.getLogger(__name__)
 
@@ -23,12 +28,82 @@ class TaskType(Enum):
     PORTFOLIO_ANALYSIS = "portfolio_analysis"
 
 
+# Voies par défaut : (priorité, workers, poids, objectif de latence en ms).
+# Le chat et les statuts sont interactifs ; la comptabilité et les analyses de
+# portefeuille sont traitées en fond et cèdent la place entre deux messages.
+DEFAULT_LANES = {
+    TaskType.CHAT: (0, 2, 1, 5000),
+    TaskType.ACCOUNTING_STATUS: (0, 1, 1, 2000),
+    TaskType.ACCOUNTING: (1, 2, 2, 60000),
+    TaskType.PORTFOLIO_ANALYSIS: (1, 1, 1, 300000),
+}
+
+# Topics dont le type de tâche ne dépend pas du contenu
+TOPIC_TASK_TYPES = {
+    'commerce.operation.created': TaskType.ACCOUNTING,
+    'accounting.journal.status': TaskType.ACCOUNTING_STATUS,
+    'portfolio.analysis.request': TaskType.PORTFOLIO_ANALYSIS,
+    'portfolio.chat.message': TaskType.CHAT,
+}
+
+# Classe de priorité des appels OpenAI de chaque type de tâche (voir agents.utils.rate_limiter)
+TASK_LLM_PRIORITIES = {
+    TaskType.CHAT: CHAT,
+    TaskType.ACCOUNTING_STATUS: CHAT,
+    TaskType.ACCOUNTING: DEFAULT,
+    TaskType.PORTFOLIO_ANALYSIS: BATCH,
+}
+
+
+def message_tenant(message: Dict[str, Any]) -> Dict[str, Optional[str]]:
+    """
+    Société ou institution à l'origine d'un message, pour le partage équitable
+    de la capacité LLM entre clients (voir agents.utils.fair_scheduler).
+    """
+    sources = [message, message.get('context_info') or message.get('contextInfo') or {}]
+
+    def first(*names):
+        for source in sources:
+            for name in names:
+                if source.get(name):
+                    return str(source[name])
+        return None
+
+    return {
+        'company_id': first('company_id', 'companyId'),
+        'institution_id': first('institution_id', 'institutionId'),
+    }
+
+
+def task_lanes() -> Dict[TaskType, Lane]:
+    """
+    Voies des types de tâches, ajustables par variables d'environnement :
+    TASK_LANE_<TYPE>_PRIORITY, _WORKERS, _WEIGHT et _SLO_MS (ex. TASK_LANE_CHAT_WORKERS).
+    """
+    lanes = {}
+    for task_type, (priority, workers, weight, slo_ms) in DEFAULT_LANES.items():
+        prefix = f"TASK_LANE_{task_type.name}_"
+        lanes[task_type] = Lane(
+            task_type.value,
+            priority=int(os.environ.get(f"{prefix}PRIORITY", priority)),
+            workers=int(os.environ.get(f"{prefix}WORKERS", workers)),
+            weight=float(os.environ.get(f"{prefix}WEIGHT", weight)),
+            slo_ms=float(os.environ.get(f"{prefix}SLO_MS", slo_ms)),
+        )
+    return lanes
+
+
 class TaskRouter:
     """
     Routeur de tâches qui analyse les demandes et les dirige vers le service approprié.
+    
+    Chaque type de tâche a sa voie (``lanes``) : les consumers Kafka traitent
+    les messages dans un pool à voies de priorité (``worker_pool``), où une
+    réponse de chat n'attend pas derrière un arriéré d'analyses.
     """
     
     def __init__(self):
+        self.lanes = task_lanes()
         self.processors = {
             TaskType.CHAT: self.process_chat_task,
             TaskType.ACCOUNTING: self.process_accounting_task,
@@ -74,6 +149,38 @@ class TaskRouter:
         # Par défaut, traiter comme une tâche de chat
         return TaskType.CHAT
     
+    def record_lane(self, item) -> str:
+        """
+        Voie d'un enregistrement Kafka (ou d'un lot d'un même topic), d'après
+        son topic ou le contenu brut du message.
+        
+        Args:
+            item: ConsumerRecord, ou liste d'enregistrements d'une partition
+            
+        Returns:
+            str: Le nom de la voie
+        """
+        record = item[0] if isinstance(item, list) else item
+        task_type = TOPIC_TASK_TYPES.get(record.topic)
+        if task_type is None:
+            value = record.value if isinstance(record.value, dict) else {}
+            data = value.get('data') if isinstance(value.get('data'), dict) else value
+            metadata = value.get('metadata') or data.get('metadata') or {}
+            task_type = self.determine_task_type(dict(data, metadata=metadata))
+        return self.lanes[task_type].name
+    
+    def worker_pool(self, handler, workers: Optional[int] = None, queue_size: int = 100,
+                    name: str = 'task-worker') -> PriorityLanePool:
+        """
+        Pool de workers à voies de priorité pour RobustKafkaConsumer
+        (``worker_pool_factory``). Sans TASK_LANE_THREADS, le pool a un thread
+        par worker de voie : les voies ne se prennent pas de threads.
+        """
+        return PriorityLanePool(
+            handler, self.lanes.values(), classify=self.record_lane, default=TaskType.CHAT.value,
+            threads=int(os.environ.get('TASK_LANE_THREADS', 0)) or None, queue_size=queue_size, name=name
+        )
+    
     def route_task(self, message: Dict[str, Any]) -> Dict[str, Any]:
         """
         Route la tâche vers le processeur approprié.
@@ -93,7 +200,8 @@ class TaskRouter:
             
             processor = self.processors.get(task_type)
             if processor:
-                result = processor(message)
+                with agent_context(priority=TASK_LLM_PRIORITIES[task_type], **message_tenant(message)):
+                    result = processor(message)
                 
                 # Loguer le temps de traitement
                 end_time = time.time()
@@ -110,6 +218,68 @@ class TaskRouter:
             logger.exception(f"Error routing task: {str(e)}")
             return {"error": f"Error routing task: {str(e)}"}
     
+    def route_batch(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Route un lot de messages (handlers Kafka par lot). Les tâches comptables
+        sont traitées ensemble ; les autres passent par route_task.
+        
+        Args:
+            messages: Les messages à traiter
+            
+        Returns:
+            List[Dict]: Les réponses, dans l'ordre des messages
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+        accounting = []
+        for index, message in enumerate(messages):
+            if self.determine_task_type(message) == TaskType.ACCOUNTING:
+                accounting.append(index)
+            else:
+                results[index] = self.route_task(message)
+        
+        if accounting:
+            start_time = time.time()
+            try:
+                with agent_context(priority=TASK_LLM_PRIORITIES[TaskType.ACCOUNTING]):
+                    responses = self.process_accounting_batch([messages[index] for index in accounting])
+            except Exception as e:
+                logger.exception(f"Error routing accounting batch: {str(e)}")
+                responses = [{"error": f"Error routing task: {str(e)}"}] * len(accounting)
+            for index, response in zip(accounting, responses):
+                results[index] = response
+            logger.info(
+                f"Accounting batch of {len(accounting)} tasks processed in {time.time() - start_time:.3f}s"
+            )
+        
+        return results
+    
+    def resend_results(self, results: List[Dict[str, Any]]) -> int:
+        """
+        Republie des résultats déjà calculés (messages reçus en double) sans
+        refaire le traitement : écritures comptables, analyses et réponses de chat.
+    
+        Args:
+            results: Les réponses enregistrées lors du premier traitement
+    
+        Returns:
+            int: Le nombre de résultats republiés
+        """
+        journal_entries = []
+        resent = 0
+        for result in results:
+            result_type = (result or {}).get('type')
+            if result_type == 'accounting_response' and result.get('journal_entry'):
+                journal_entries.append(result['journal_entry'])
+            elif result_type == 'portfolio_analysis_response':
+                from ..kafka.producer_portfolio import send_analysis_response
+                resent += bool(send_analysis_response(result))
+            elif result_type == 'chat_response':
+                from ..kafka.producer_portfolio import send_chat_response
+                resent += bool(send_chat_response(result))
+        if journal_entries:
+            resent += publish_journal_entries(journal_entries)
+        return resent
+    
     def process_chat_task(self, message: Dict[str, Any]) -> Dict[str, Any]:
         """
         Traite une tâche de chat.
@@ -135,11 +305,34 @@ class TaskRouter:
         """
         journal_entry = process_business_operation(message)
         if journal_entry:
+            save_journal_entries([journal_entry])
             # Publier l'écriture comptable
             publish_journal_entry(journal_entry)
             return {"type": "accounting_response", "journal_entry": journal_entry}
         return {"error": "Failed to process accounting task"}
     
+    def process_accounting_batch(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Traite un lot de tâches comptables : écritures insérées en une
+        transaction et publiées avec un seul flush du producer.
+        
+        Args:
+            messages: Les messages à traiter
+            
+        Returns:
+            List[Dict]: Les écritures générées, dans l'ordre des messages
+        """
+        journal_entries = [process_business_operation(message) for message in messages]
+        generated = [journal_entry for journal_entry in journal_entries if journal_entry]
+        if generated:
+            save_journal_entries(generated)
+            publish_journal_entries(generated)
+        return [
+            {"type": "accounting_response", "journal_entry": journal_entry} if journal_entry
+            else {"error": "Failed to process accounting task"}
+            for journal_entry in journal_entries
+        ]
+    
     def process_portfolio_analysis_task(self, message: Dict[str, Any]) -> Dict[str, Any]:
         """
         Traite une tâche d'analyse de portefeuille pour les institutions.
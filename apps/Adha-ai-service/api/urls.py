@@ -31,6 +31,7 @@ from .views import (
     ChatConversationDetailView,
     BatchProcessingView,
     BatchStatusView,
+    BatchCancelView,
     TokenUsageView,
     DiagnosticParsingView,
     TokenQuotaView,
@@ -107,6 +108,7 @@ company_urls = [
     path('document/upload/', FileInputView.as_view(), name='document_upload'),
     path('document/batch/', BatchProcessingView.as_view(), name='batch_process'),
     path('document/batch/<uuid:batch_id>/status/', BatchStatusView.as_view(), name='batch_status'),
+    path('document/batch/<uuid:batch_id>/cancel/', BatchCancelView.as_view(), name='batch_cancel'),
     path('journal/', JournalEntryView.as_view(), name='journal_entries'),
     path('journal/<int:pk>/', ModifyEntryView.as_view(), name='modify_entry'),
     path('prompt/', PromptInputView.as_view(), name='prompt_input'),
@@ -9,7 +9,7 @@ All views are now defined in separate files in the 'views/' directory.
 # from .auth_views import SignupView, AdminSignupView, LoginView, TokenRefreshView, UserProfileView
 from .document_views import (
     FileInputView, JournalEntryView, ModifyEntryView,
-    BatchProcessingView, BatchStatusView
+    BatchProcessingView, BatchStatusView, BatchCancelView
 )
 from .prompt_views import PromptInputView
 from .chat_views import ChatView, ChatHistoryView, ChatConversationDetailView
@@ -36,6 +36,7 @@ __all__ = [
     'JournalEntry',
     'BatchProcessingView',
     'BatchStatusView',
+    'BatchCancelView',
     'TokenUsageView',
     'UsageStatsView',
     'LoginView',
@@ -2,9 +2,8 @@
 Views for document processing and journal entry management.
 """
 import os
-import asyncio
 import uuid
-import tempfile
+from django.conf import settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
@@ -12,15 +11,13 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.permissions import IsAuthenticated
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from agents.logic.dde_agent import DDEAgent
-from agents.logic.aa_agent import AAgent
-from agents.logic.ccc_agent import CCCAgent
 from agents.logic.history_agent import HistoryAgent
-from agents.logic.orchestration_agent import OrchestrationAgent
 from agents.utils.token_manager import get_token_counter
+from agents.utils.agent_pool import AgentContext, agent_pool
+from ..services.batch_engine import DatabaseBatchStore
 from ..models import JournalEntry
 from ..serializers import DocumentAnalysisResponseSerializer, BatchDocumentRequestSerializer, JournalEntrySerializer
-from .utils import create_temp_file, cleanup_temp_file, create_token_response, error_response
+from .utils import create_temp_file, cleanup_temp_file, company_name, create_token_response, error_response, tenant_ids
 
 class JournalEntryView(APIView):
     """
@@ -213,10 +210,12 @@ class FileInputView(APIView):
             # Save the uploaded file to a temporary location
             temp_file_path = create_temp_file(file)
 
+            # Agents partagés par le processus ; l'état propre à la requête (client compris) passe par le contexte
+            context = AgentContext(token_counter=token_counter, user_id=str(request.user.id), **tenant_ids(request))
             try:
                 # Process the temporary file
-                dde_agent = DDEAgent()
-                extracted_data = dde_agent.process(open(temp_file_path, 'rb'))
+                dde_agent = agent_pool.get("dde")
+                extracted_data = context.run(dde_agent.process, open(temp_file_path, 'rb'))
 
                 # Clean up the temporary file
                 cleanup_temp_file(temp_file_path)
@@ -226,13 +225,14 @@ class FileInputView(APIView):
                     return error_response(extracted_data['error'])
 
                 # Rest of the processing
-                aa_agent = AAgent()
+                aa_agent = agent_pool.get("aa")
                 
                 # Ajouter un log clair avant le traitement
                 print(f"Sending extracted data to AA Agent for processing with intent: {intention}")
                 
                 try:
-                    analysis_result = aa_agent.process(intention, {}, extracted_data)
+                    analysis_result = context.run(aa_agent.process, intention, {'company_name': company_name(request)},
+                                                  extracted_data)
                     
                     # Ajouter un log après le traitement
                     print(f"AA Agent processing result: {analysis_result}")
@@ -257,12 +257,12 @@ class FileInputView(APIView):
 
                 try:
                     # Vérification des propositions
-                    ccc_agent = CCCAgent()
+                    ccc_agent = agent_pool.get("ccc")
                     
                     # Ajouter un log clair avant la vérification
                     print(f"Sending proposals to CCC Agent for verification: {analysis_result.get('proposals')}")
                     
-                    verification_results = ccc_agent.verify(analysis_result.get('proposals', []))
+                    verification_results = context.run(ccc_agent.verify, analysis_result.get('proposals', []))
                     
                     # Ajouter un log après la vérification
                     print(f"CCC Agent verification results: {verification_results}")
@@ -376,31 +376,39 @@ class BatchProcessingView(APIView):
         intention = request.data.get('intention', 'ecriture_simple')
         
         try:
-            # Création d'un ID de lot
-            batch_id = str(uuid.uuid4())
-            
-            # Stockage temporaire des fichiers
-            temp_dir = tempfile.mkdtemp()
+            # Stockage durable des fichiers : ils sont lus plus tard par les workers de lot
+            upload_dir = os.path.join(settings.BATCH_UPLOAD_DIR, str(uuid.uuid4()))
+            os.makedirs(upload_dir, exist_ok=True)
             documents = []
+            # Client du lot (contexte posé par EnhancedIsolationMiddleware) : part équitable de la capacité LLM
+            tenant = tenant_ids(request)
+            # Entreprise du client : sens (achat / vente) des factures en ecriture_simple
+            company = company_name(request)
             
-            for file in request.FILES.getlist('file'):
-                temp_path = os.path.join(temp_dir, file.name)
-                with open(temp_path, 'wb') as temp_file:
+            for index, file in enumerate(request.FILES.getlist('file')):
+                file_name = os.path.basename(file.name)
+                file_path = os.path.join(upload_dir, f"{index:04d}_{file_name}")
+                with open(file_path, 'wb') as stored_file:
                     for chunk in file.chunks():
-                        temp_file.write(chunk)
+                        stored_file.write(chunk)
                 documents.append({
-                    "file": temp_path,
-                    "name": file.name
+                    "file": file_path,
+                    "name": file_name,
+                    "payload": dict(tenant, entities={'company_name': company}) if company else dict(tenant),
                 })
                 
-            # Lancement du traitement asynchrone
-            orchestrator = OrchestrationAgent()
-            asyncio.ensure_future(orchestrator.process_batch(documents, intention))
+            # Création du lot en base ; le traitement est fait par les workers (run_batch_workers)
+            batch_id = DatabaseBatchStore().create_batch(
+                documents,
+                intention=intention,
+                created_by=request.user if request.user.is_authenticated else None,
+                max_attempts=settings.BATCH_MAX_ATTEMPTS,
+            )
             
             return Response({
                 'batch_id': batch_id,
                 'message': f'Traitement par lot initié pour {len(documents)} documents',
-                'status_endpoint': f'/api/batch/{batch_id}/status'
+                'status_endpoint': f'/api/document/batch/{batch_id}/status/'
             }, status=status.HTTP_202_ACCEPTED)
             
         except Exception as e:
@@ -410,6 +418,15 @@ class BatchProcessingView(APIView):
             )
 
 
+def _get_user_batch(request, store, batch_id):
+    """Vérifie que le lot existe et appartient à l'utilisateur (ou que celui-ci est staff)."""
+    owner = store.get_owner(batch_id)
+    if owner is None:
+        return False
+    # Un lot sans propriétaire (utilisateur supprimé) n'est visible que du staff
+    return request.user.is_staff or (owner["created_by"] is not None and owner["created_by"] == request.user.id)
+
+
 class BatchStatusView(APIView):
     """
     Endpoint pour vérifier le statut d'un traitement par lot.
@@ -435,10 +452,37 @@ class BatchStatusView(APIView):
         }
     )
     def get(self, request, batch_id):
-        orchestrator = OrchestrationAgent()
-        batch_status = orchestrator.get_task_status(batch_id)
+        store = DatabaseBatchStore()
+        batch_id = str(batch_id)
 
-        if batch_status.get("status") == "not_found":
+        if not _get_user_batch(request, store, batch_id):
             return error_response(f"Traitement par lot non trouvé: {batch_id}", status.HTTP_404_NOT_FOUND)
 
-        return Response(batch_status, status=status.HTTP_200_OK)
+        return Response(store.batch_status(batch_id), status=status.HTTP_200_OK)
+
+
+class BatchCancelView(APIView):
+    """
+    Endpoint pour annuler un traitement par lot.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Annuler un traitement par lot (les documents en cours s'arrêtent entre deux étapes)",
+        responses={
+            status.HTTP_200_OK: openapi.Response(description="Annulation demandée"),
+            status.HTTP_404_NOT_FOUND: openapi.Response(description="Lot non trouvé"),
+            status.HTTP_409_CONFLICT: openapi.Response(description="Lot déjà terminé"),
+        }
+    )
+    def post(self, request, batch_id):
+        store = DatabaseBatchStore()
+        batch_id = str(batch_id)
+
+        if not _get_user_batch(request, store, batch_id):
+            return error_response(f"Traitement par lot non trouvé: {batch_id}", status.HTTP_404_NOT_FOUND)
+
+        if not store.cancel_batch(batch_id):
+            return error_response(f"Le traitement par lot {batch_id} est déjà terminé", status.HTTP_409_CONFLICT)
+
+        return Response(store.batch_status(batch_id), status=status.HTTP_200_OK)
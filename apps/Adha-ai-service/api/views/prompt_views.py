@@ -6,14 +6,12 @@ from rest_framework.response import Response
 from rest_framework import status
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from agents.logic.dde_agent import DDEAgent
-from agents.logic.aa_agent import AAgent
-from agents.logic.ccc_agent import CCCAgent
 from agents.logic.jep_agent import JEPAgent
 from agents.logic.history_agent import HistoryAgent
 from agents.utils.token_manager import get_token_counter
+from agents.utils.agent_pool import AgentContext, agent_pool
 from ..serializers import JournalEntrySerializer
-from .utils import create_token_response, error_response
+from .utils import create_token_response, error_response, tenant_ids
 
 class PromptInputView(APIView):
     """
@@ -104,23 +102,27 @@ class PromptInputView(APIView):
                     enriched_prompt = f"{prompt}\nContexte: {context_text}"
                     context_added = True
             
+            # Pooled agents; the token counter and tenant of this request travel in the context
+            agent_ctx = AgentContext(token_counter=token_counter, user_id=str(request.user.id), priority="chat",
+                                     **tenant_ids(request))
+
             # Step 1: Use DDE Agent to process the prompt
-            dde_agent = DDEAgent(token_limit=token_limit)
-            extracted_data = dde_agent.process_prompt(enriched_prompt)
+            dde_agent = agent_pool.get("dde")
+            extracted_data = agent_ctx.run(dde_agent.process_prompt, enriched_prompt)
             
             if 'error' in extracted_data:
                 return error_response(f"Error extracting data from prompt: {extracted_data['error']}")
             
             # Step 2: Use AA Agent to analyze the data
-            aa_agent = AAgent()
+            aa_agent = agent_pool.get("aa")
             intent = "ecriture_simple"  # Default intent
             
             # Process with AA Agent to get accounting entries
-            analysis_result = aa_agent.process(intent, context, extracted_data)
+            analysis_result = agent_ctx.run(aa_agent.process, intent, context, extracted_data)
             
             # Step 3: Verify accounting entries for consistency
-            ccc_agent = CCCAgent()
-            verification_results = ccc_agent.verify(analysis_result.get("proposals", []))
+            ccc_agent = agent_pool.get("ccc")
+            verification_results = agent_ctx.run(ccc_agent.verify, analysis_result.get("proposals", []))
             
             # Step 4: Format the results
             jep_agent = JEPAgent()
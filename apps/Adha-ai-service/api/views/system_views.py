@@ -8,6 +8,7 @@ from rest_framework.permissions import IsAuthenticated
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from agents.utils.token_manager import get_token_counter
+from agents.utils.agent_pool import agent_pool
 from django.utils import timezone
 from django.db.models import Sum
 from datetime import timedelta
@@ -123,8 +124,8 @@ class DiagnosticParsingView(APIView):
             
         try:
             # Instancier les agents nécessaires
-            aa_agent = AAgent()
-            ccc_agent = CCCAgent()
+            aa_agent = agent_pool.get("aa")
+            ccc_agent = agent_pool.get("ccc")
             
             # Test du parsing avec chaque méthode disponible
             parsed_results = {
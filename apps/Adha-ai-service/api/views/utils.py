@@ -23,6 +23,23 @@ def cleanup_temp_file(temp_file_path):
         except Exception as e:
             print(f"Error deleting temporary file: {e}")
 
+def tenant_ids(request):
+    """
+    Company / institution of the user, set on request.user by
+    EnhancedIsolationMiddleware (missing ids are left out).
+    """
+    return {
+        key: str(value) for key, value in (
+            ('company_id', getattr(request.user, 'company_id', None)),
+            ('institution_id', getattr(request.user, 'institution_id', None)),
+        ) if value
+    }
+
+def company_name(request):
+    """Company name of the user profile, None when the user has no profile."""
+    profile = getattr(request.user, 'profile', None)
+    return getattr(profile, 'company_name', None) or None
+
 def create_token_response(response_data, token_counter, status_code=status.HTTP_200_OK):
     """Create a response with token usage headers."""
     # Create a standard response
@@ -12,6 +12,10 @@ from unittest.mock import MagicMock
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
+def pytest_configure(config):
+    """Marqueurs de pytest.ini, dont la section [tool:pytest] n'est pas lue par pytest"""
+    config.addinivalue_line("markers", "slow: marks tests as slow running")
+
 @pytest.fixture(autouse=True)
 def setup_test_environment():
     """Configuration automatique de l'environnement de test"""
@@ -0,0 +1,172 @@
+import asyncio
+import contextlib
+import contextvars
+import io
+import threading
+import time
+import unittest
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from agents.utils.agent_pool import (
+    AgentContext, AgentPool, ContextTokenCounterMixin, agent_context, agent_pool, current_context
+)
+
+# Slow construction widens the window in which concurrent callers could build twice
+CONSTRUCTION_COST = 0.02
+
+
+class StubCounter:
+    def __init__(self):
+        self.calls = 0
+
+    def log_operation(self, *args, **kwargs):
+        self.calls += 1
+
+
+class StubAgent(ContextTokenCounterMixin):
+    built = 0
+
+    def __init__(self):
+        time.sleep(CONSTRUCTION_COST)
+        StubAgent.built += 1
+
+    def process(self, document):
+        self.token_counter.log_operation("StubAgent", "stub", document, "")
+        return {"document": document, "counter": self.token_counter}
+
+
+class TestAgentPool(unittest.TestCase):
+    def setUp(self):
+        StubAgent.built = 0
+        self.pool = AgentPool()
+        self.pool.register("stub", StubAgent)
+
+    def test_instance_is_built_once_under_concurrency(self):
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            agents = list(executor.map(lambda _: self.pool.get("stub"), range(64)))
+        self.assertEqual(StubAgent.built, 1)
+        self.assertTrue(all(agent is agents[0] for agent in agents))
+
+    def test_unknown_entry(self):
+        with self.assertRaises(KeyError):
+            self.pool.get("missing")
+
+    def test_reset_and_fork_rebuild(self):
+        first = self.pool.get("stub")
+        self.pool.reset("stub")
+        self.assertIsNot(self.pool.get("stub"), first)
+        # A child process must not reuse the parent's instances
+        second = self.pool.get("stub")
+        self.pool._pid = -1
+        self.assertIsNot(self.pool.get("stub"), second)
+
+    def test_token_counter_follows_the_call(self):
+        agent = self.pool.get("stub")
+        default = StubCounter()
+        agent.token_counter = default
+        first, second = StubCounter(), StubCounter()
+
+        def run(counter):
+            with agent_context(token_counter=counter):
+                return agent.process("doc")["counter"]
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(run, [first, second] * 10))
+        self.assertEqual(results, [first, second] * 10)
+        self.assertEqual((first.calls, second.calls), (10, 10))
+        # Outside of any call the agent falls back to its own counter
+        agent.process("doc")
+        self.assertEqual(default.calls, 1)
+        self.assertIsNone(current_context().token_counter)
+
+    def test_fallback_counter_is_per_thread(self):
+        agent = self.pool.get("stub")
+        token_manager = SimpleNamespace(get_token_counter=lambda limit=None: StubCounter())
+        counters = []
+        barrier = threading.Barrier(4)
+
+        def run(_):
+            barrier.wait()
+            counters.append(agent.process("doc")["counter"])
+            return agent.process("doc")["counter"]
+
+        # Lanes and batch workers call agents without a counter: no counter shared between threads
+        with mock.patch.dict("sys.modules", {"agents.utils.token_manager": token_manager}):
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                second = list(executor.map(run, range(4)))
+        self.assertEqual(len({id(counter) for counter in counters}), 4)
+        # Each thread keeps its own counter from one call to the next
+        self.assertEqual({id(counter) for counter in second}, {id(counter) for counter in counters})
+        self.assertTrue(all(counter.calls == 2 for counter in counters))
+
+    def test_context_reaches_executor_threads(self):
+        counter = StubCounter()
+        agent = self.pool.get("stub")
+        context = AgentContext(token_counter=counter, company_id="c1")
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(context.run, agent.process, "doc").result()
+
+            async def orchestrate():
+                with agent_context(token_counter=counter):
+                    loop = asyncio.get_event_loop()
+                    return await loop.run_in_executor(
+                        executor, contextvars.copy_context().run, agent.process, "doc")
+
+            result = asyncio.run(orchestrate())
+        self.assertIs(result["counter"], counter)
+        self.assertEqual(counter.calls, 2)
+
+
+
+class TestPipelineAgentsOverhead(unittest.TestCase):
+    """Real DDEAgent / AAgent / CCCAgent built per document (former behaviour) against the pool."""
+
+    def setUp(self):
+        self.factories = dict(agent_pool._factories)
+        # The OpenAI clients, retriever and generator the agents take from the pool are mocks:
+        # the embedding model load is left out, only the agents' own construction is measured
+        for name in ("openai_client", "config_openai_client", "retriever", "generator"):
+            agent_pool.register(name, mock.MagicMock)
+        config = mock.patch("agents.logic.dde_agent.load_config", return_value={"OPENAI_API_KEY": "sk-test"})
+        config.start()
+        self.addCleanup(config.stop)
+
+    def tearDown(self):
+        for name, factory in self.factories.items():
+            agent_pool.register(name, factory)
+
+    @pytest.mark.slow
+    def test_per_document_overhead(self):
+        from agents.logic.aa_agent import AAgent
+        from agents.logic.ccc_agent import CCCAgent
+        from agents.logic.dde_agent import DDEAgent
+
+        builds = Counter()
+        pool = AgentPool()
+        for name, agent_class in (("dde", DDEAgent), ("aa", AAgent), ("ccc", CCCAgent)):
+            pool.register(name, lambda name=name, agent_class=agent_class: builds.update([name]) or agent_class())
+        documents = 50
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for _ in range(documents):
+                DDEAgent(), AAgent(), CCCAgent()
+            constructed = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for _ in range(documents):
+                with agent_context(token_counter=StubCounter()):
+                    pool.get("dde"), pool.get("aa"), pool.get("ccc")
+            pooled = time.perf_counter() - start
+
+        self.assertEqual(builds, {"dde": 1, "aa": 1, "ccc": 1})
+        self.assertLess(pooled, constructed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import random
+import time
+import unittest
+from decimal import Decimal
+
+import pytest
+
+from agents.utils.calculation_detector import CalculationDetector
+from agents.utils.document_extraction import DocumentExtractor
+from agents.utils.extraction_patterns import (
+    DATE_PATTERN, MONTANT_PATTERNS, MONTANTS_CLES_PATTERNS, PARTIES_PATTERNS, REFERENCE_PATTERNS,
+    parse_item_line, parse_price_line,
+)
+
+INVOICE = """FACTURE N° FV-2024-001
+Date: 12/03/2024
+Fournisseur: Papeco SARL
+Client: Boutiques Express
+Chaise de bureau 2 12 500 25 000
+Table réunion 1 150000 18% 177000
+3 Cartouches encre 4500 13500
+Stylo bleu 10 x 150
+Sous-total: 213 500
+TVA: 38 430
+Total TTC: 251 930 FCFA
+Mode de paiement: virement
+"""
+
+# Inputs that made the former patterns backtrack quadratically: long runs of digit
+# groups without a currency, repeated keywords without a value, unterminated names...
+ADVERSARIAL_UNITS = {
+    "digit_groups": "1 ",
+    "keywords": "total ht tva ",
+    "unterminated_party": "Fournisseur: Aa",
+    "date_then_blanks": "01/01 ",
+    "question": "combien ",
+}
+
+
+def _adversarial(unit, size):
+    return (unit * (size // len(unit) + 1))[:size]
+
+
+class TestItemTokenizer(unittest.TestCase):
+    def test_table_layouts(self):
+        item = parse_item_line("Chaise de bureau 2 12 500 25 000")
+        self.assertEqual((item["quantity"], item["unit_price"], item["amount"]), ("2", "12 500", "25 000"))
+
+        item = parse_item_line("Table réunion 1 150000 18% 177000")
+        self.assertEqual(item["tax_rate"], "18%")
+
+        item = parse_item_line("3 Cartouches encre 4500 13500")
+        self.assertEqual((item["description"], item["quantity"]), ("Cartouches encre", "3"))
+
+        item = parse_item_line("Stylo bleu 10 x 150")
+        self.assertEqual((item["quantity"], item["unit_price"], item["amount"]), ("10", "150", None))
+
+    def test_non_item_lines(self):
+        self.assertIsNone(parse_item_line("Total TTC 1 251930 18% 251930"))
+        self.assertIsNone(parse_item_line("Date: 12/03/2024"))
+        self.assertIsNone(parse_price_line("TVA 38 430"))
+        self.assertEqual(parse_price_line("Frais de dossier 12 500 FCFA")["price"], "12 500")
+
+
+class TestDocumentExtractor(unittest.TestCase):
+    def setUp(self):
+        self.extractor = DocumentExtractor()
+
+    def test_invoice_extraction(self):
+        data = self.extractor.extract_data(INVOICE)
+        self.assertEqual(data.document_type, "invoice")
+        self.assertEqual(data.reference, "FV-2024-001")
+        self.assertEqual(data.date, "12/03/2024")
+        self.assertEqual(data.supplier_name, "Papeco SARL")
+        self.assertEqual(len(data.items), 4)
+        self.assertEqual(data.items[0].unit_price, Decimal("12500"))
+        self.assertEqual(data.subtotal, Decimal("213500"))
+        self.assertEqual(data.tax_total, Decimal("38430"))
+        self.assertEqual(data.total, Decimal("251930"))
+        self.assertEqual(data.payment_method, "virement")
+
+    def test_document_type_priority(self):
+        # A receipt keyword before the invoice keyword must not win
+        self.assertEqual(self.extractor._detect_document_type("Reçu ... Facture 12"), "invoice")
+        self.assertEqual(self.extractor._detect_document_type("Relevé de compte"), "bank_statement")
+        self.assertEqual(self.extractor._detect_document_type("Bon de livraison"), "unknown")
+
+    def test_random_token_soup(self):
+        rng = random.Random(42)
+        vocabulary = ["Total", "TVA", "HT", "18%", "12", "500", "FCFA", "x", "Client:", "Facture",
+                      "01/02/2024", "-", "€", "1.234,56", "\n", "  ", "Chaise", "ref", "N°"]
+        for _ in range(500):
+            text = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(1, 80)))
+            data = self.extractor.extract_data(text)
+            self.assertIsInstance(data.items, list)
+
+
+class TestCalculationDetector(unittest.TestCase):
+    def test_numbers_are_counted_once(self):
+        detector = CalculationDetector()
+        self.assertEqual(detector._extract_numbers("total de 10 euros et 20 euros"),
+                         [Decimal("10"), Decimal("20")])
+        # Euro amounts first, then percentages
+        self.assertEqual(detector._extract_numbers("TVA 20% sur 100 euros"),
+                         [Decimal("100"), Decimal("20")])
+        self.assertTrue(detector.detect_calculation("combien fait 12 + 30"))
+        self.assertFalse(detector.detect_calculation("bonjour"))
+
+
+@pytest.mark.slow
+class TestLinearTime(unittest.TestCase):
+    """Running every extractor on adversarial text must scale linearly."""
+
+    def setUp(self):
+        self.extractor = DocumentExtractor()
+        self.detector = CalculationDetector()
+
+    def _run_all(self, text):
+        self.extractor.extract_data("facture\n" + text)
+        self.extractor._extract_transactions(text)
+        self.extractor._extract_all_amounts(text)
+        for pattern in MONTANT_PATTERNS:
+            list(pattern.finditer(text))
+        lowered = text.lower()
+        for patterns in MONTANTS_CLES_PATTERNS.values():
+            for pattern in patterns:
+                pattern.search(lowered)
+        list(DATE_PATTERN.finditer(text))
+        for patterns in list(REFERENCE_PATTERNS.values()) + list(PARTIES_PATTERNS.values()):
+            for pattern in patterns:
+                list(pattern.finditer(text))
+        self.detector.detect_calculation(text)
+        self.detector._extract_numbers(text)
+
+    def _elapsed(self, text, repeat=2):
+        # re exposes no step counter: best CPU time of a few runs, insensitive to other processes
+        timings = []
+        for _ in range(repeat):
+            start = time.process_time()
+            self._run_all(text)
+            timings.append(time.process_time() - start)
+        return min(timings)
+
+    def test_adversarial_inputs_scale_linearly(self):
+        for name, unit in ADVERSARIAL_UNITS.items():
+            with self.subTest(input=name):
+                small = self._elapsed(_adversarial(unit, 16 * 1024))
+                large = self._elapsed(_adversarial(unit, 64 * 1024))
+                # 4x the input: linear gives ~4x, quadratic would give ~16x
+                self.assertLess(large, 10 * small + 0.05, f"{name}: {small:.3f}s -> {large:.3f}s")
+
+
+if __name__ == '__main__':
+    unittest.main()
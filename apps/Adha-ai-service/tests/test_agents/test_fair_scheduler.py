@@ -0,0 +1,166 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from agents.utils.agent_pool import agent_context
+from agents.utils.fair_scheduler import (
+    ENTERPRISE, FREE, PREMIUM, SHARED_TENANT, FairQueueTimeout, FairScheduler, PlanWeights, fair_scheduled,
+)
+from api.kafka.load_harness import StubLLM
+
+
+def messages(size=200):
+    return [{"role": "user", "content": "x" * size}]
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.001)
+
+
+class TestDeficitRoundRobin(unittest.TestCase):
+    def test_capacity_is_shared_by_weight(self):
+        weights = {"company:small": 1, "company:big": 3}
+        scheduler = FairScheduler(capacity=1, quantum=1, weight_of=lambda tenant: weights.get(tenant, 1))
+        order = []
+
+        def call(tenant):
+            with scheduler.slot(tenant):
+                order.append(tenant)
+
+        # Saturate the only slot so that both backlogs are queued before serving
+        scheduler.acquire("company:holder")
+        with ThreadPoolExecutor(max_workers=80) as executor:
+            futures = [executor.submit(call, tenant) for tenant in ["company:small", "company:big"] * 40]
+            wait_for(lambda: sum(scheduler.snapshot()["waiting"].values()) == 80)
+            scheduler.release()
+            for future in futures:
+                future.result()
+
+        # Three calls of the big tenant for each call of the small one, while both have a backlog
+        self.assertEqual(order[:40].count("company:big"), 30)
+        self.assertEqual(order[:40].count("company:small"), 10)
+        self.assertEqual(len(order), 80)
+        self.assertEqual(scheduler.snapshot()["in_flight"], 0)
+
+    def test_no_queue_while_slots_are_free(self):
+        scheduler = FairScheduler(capacity=2)
+        with scheduler.slot("company:1"), scheduler.slot("company:2"):
+            self.assertEqual(scheduler.snapshot()["in_flight"], 2)
+        self.assertEqual(scheduler.snapshot()["tenants"]["company:1"]["queued"], 0)
+
+    def test_timeout_withdraws_the_call(self):
+        scheduler = FairScheduler(capacity=1)
+        scheduler.acquire("company:1")
+        with self.assertRaises(FairQueueTimeout):
+            scheduler.acquire("company:2", timeout=0.05)
+        self.assertEqual(scheduler.snapshot()["waiting"], {})
+        scheduler.release()
+        with scheduler.slot("company:2", timeout=0.05):
+            pass
+        self.assertEqual(scheduler.snapshot()["tenants"]["company:2"]["timeouts"], 1)
+
+
+class TestNoisyNeighbour(unittest.TestCase):
+    """A heavy tenant saturates a stub LLM while a small tenant keeps chatting."""
+
+    # One slot: calls run one after the other, so they start in the order they were granted
+    CAPACITY = 1
+    HEAVY_THREADS = 32
+    HEAVY_CALLS = 5
+
+    def run_load(self, small_tenant):
+        """Number of heavy calls granted while each call of the small tenant was queued."""
+        stub = StubLLM(latency_ms=2, completion_tokens=50)
+        scheduler = FairScheduler(capacity=self.CAPACITY, quantum=300)
+        small_thread = threading.current_thread()
+        granted = []
+
+        def create(**kwargs):
+            granted.append(threading.current_thread() is small_thread)
+            return stub.create(**kwargs)
+
+        client = fair_scheduled(SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))),
+                                scheduler)
+        heavy_ahead = []
+
+        def heavy(_):
+            with agent_context(company_id="heavy"):
+                for _ in range(self.HEAVY_CALLS):
+                    client.chat.completions.create(messages=messages(), max_tokens=50)
+
+        with ThreadPoolExecutor(max_workers=self.HEAVY_THREADS) as executor:
+            futures = [executor.submit(heavy, n) for n in range(self.HEAVY_THREADS)]
+            wait_for(lambda: sum(scheduler.snapshot()["waiting"].values()) >= self.HEAVY_THREADS - self.CAPACITY)
+            with agent_context(company_id=small_tenant):
+                for _ in range(5):
+                    queued = len(granted)
+                    client.chat.completions.create(messages=messages(), max_tokens=50)
+                    heavy_ahead.append(len(granted) - queued - 1)
+            for future in futures:
+                future.result()
+        self.assertEqual(stub.stats["peak_concurrency"], self.CAPACITY)
+        self.assertEqual(len(granted), self.HEAVY_THREADS * self.HEAVY_CALLS + 5)
+        return heavy_ahead
+
+    def test_small_tenant_wait_stays_bounded(self):
+        # Baseline: the small tenant shares the queue of the heavy one (first come, first served)
+        fifo = self.run_load(small_tenant="heavy")
+        fair = self.run_load(small_tenant="small")
+
+        # FIFO: the first call waits behind the queued calls of the heavy tenant
+        self.assertGreaterEqual(fifo[0], self.HEAVY_THREADS - self.CAPACITY)
+        # Fair: the heavy call already granted, then at most one heavy round (300 credits,
+        # 2 calls of ~154 tokens) before each call
+        self.assertLessEqual(max(fair), 3)
+
+
+class TestTenantsAndPlans(unittest.TestCase):
+    def test_weight_follows_the_plan(self):
+        plans = {"1": FREE, "2": PREMIUM, "3": ENTERPRISE}
+        lookups = []
+
+        def lookup(company_id):
+            lookups.append(company_id)
+            if company_id == "broken":
+                raise RuntimeError("database down")
+            return plans.get(company_id)
+
+        weights = PlanWeights(ttl=60, lookup=lookup)
+        self.assertEqual([weights(f"company:{n}") for n in "123"], [1.0, 4.0, 8.0])
+        self.assertEqual(weights("company:1"), 1.0)
+        self.assertEqual(lookups, ["1", "2", "3"])
+        # Unknown company, lookup error, institution, no tenant
+        self.assertEqual(weights("company:4"), 2.0)
+        self.assertEqual(weights("company:broken"), 2.0)
+        self.assertEqual(weights("institution:7"), 2.0)
+        self.assertEqual(weights(SHARED_TENANT), 1.0)
+
+    def test_client_calls_are_scheduled_by_context_tenant(self):
+        scheduler = FairScheduler(capacity=2)
+        client = fair_scheduled(StubLLM(latency_ms=0), scheduler)
+        self.assertIs(fair_scheduled(client), client)
+        with agent_context(company_id="42"):
+            client.chat.completions.create(messages=messages())
+        with agent_context(institution_id="bank-1"):
+            client.chat.completions.create(messages=messages())
+        client.chat.completions.create(messages=messages())
+        self.assertEqual(set(scheduler.snapshot()["tenants"]), {"company:42", "institution:bank-1", SHARED_TENANT})
+
+        def in_worker():
+            with agent_context(company_id="43"):
+                client.chat.completions.create(messages=messages())
+
+        thread = threading.Thread(target=in_worker)
+        thread.start()
+        thread.join()
+        self.assertIn("company:43", scheduler.snapshot()["tenants"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import json
+import unittest
+from types import SimpleNamespace
+
+from agents.utils.model_router import (
+    FAST, STRONG, CallSite, ModelRouter, has_content, journal_entries, json_object, one_of, price,
+)
+from agents.utils.resilience import CircuitOpenError
+from api.kafka.load_harness import RoutedAnswers, StubLLM, StubLLMError, TrafficGenerator, run_routing_replay
+
+
+def messages(size=200):
+    return [{"role": "user", "content": "x" * size}]
+
+
+def entries(debit=100.0, credit=100.0):
+    return json.dumps({"proposals": [{
+        "description": "Achat fournitures",
+        "debit": [{"compte": "601", "montant": debit, "libelle": "Achat"}],
+        "credit": [{"compte": "401", "montant": credit, "libelle": "Fournisseur"}],
+    }]})
+
+
+def answer(content):
+    return SimpleNamespace(content=content, tool_calls=None)
+
+
+class FailingClient:
+    """OpenAI-like client whose calls raise ``error``."""
+
+    def __init__(self, error):
+        self.calls = []
+
+        def create(model, messages, **kwargs):
+            self.calls.append(model)
+            raise error
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+
+
+class TestTierChoice(unittest.TestCase):
+    def setUp(self):
+        self.router = ModelRouter(sites={
+            "short": CallSite(fast_max_tokens=100),
+            "templated": CallSite(fast_max_tokens=100, template_required=True),
+            "documents": CallSite(fast_max_tokens=100, fast_doc_types=frozenset({"invoice"})),
+        })
+
+    def test_complexity_signals(self):
+        self.assertEqual(self.router.choose("short", messages(200)), FAST)
+        self.assertEqual(self.router.choose("short", messages(800)), STRONG)
+        # A matched template doubles the prompt length allowed on the fast tier
+        self.assertEqual(self.router.choose("short", messages(600), template_matched=True), FAST)
+        self.assertEqual(self.router.choose("templated", messages(200)), STRONG)
+        self.assertEqual(self.router.choose("templated", messages(200), template_matched=True), FAST)
+        self.assertEqual(self.router.choose("documents", messages(200), doc_type="invoice"), FAST)
+        self.assertEqual(self.router.choose("documents", messages(200), doc_type="bank_statement"), STRONG)
+        self.assertEqual(self.router.choose("unknown", messages(10)), STRONG)
+
+        disabled = ModelRouter(enabled=False)
+        self.assertEqual(disabled.choose("history.chat", messages(10)), STRONG)
+
+
+class TestValidators(unittest.TestCase):
+    def test_journal_entries(self):
+        self.assertEqual(journal_entries(answer(entries())), (True, []))
+        self.assertEqual(journal_entries(answer("Voici l'écriture :\n" + entries() + "\nCordialement")), (True, []))
+        # CCCAgent has to force the balance: rejected
+        self.assertFalse(journal_entries(answer(entries(credit=90.0)))[0])
+        self.assertFalse(journal_entries(answer(json.dumps({"proposals": [{"description": "x", "debit": []}]})))[0])
+        self.assertFalse(journal_entries(answer("Je ne sais pas"))[0])
+        self.assertFalse(journal_entries(answer(""))[0])
+
+    def test_other_validators(self):
+        self.assertTrue(one_of(["vente_marchandises"])(answer(" Vente_marchandises.\n"))[0])
+        self.assertFalse(one_of(["vente_marchandises"])(answer("Il s'agit d'une vente"))[0])
+        self.assertTrue(json_object("intent")(answer("{'intent': 'achat', 'entities': {}}"))[0])
+        self.assertFalse(json_object("intent")(answer('{"entities": {}}'))[0])
+        self.assertFalse(has_content(answer("  "))[0])
+        self.assertTrue(has_content(SimpleNamespace(content=None, tool_calls=[object()]))[0])
+
+
+class TestEscalation(unittest.TestCase):
+    def test_rejected_answer_goes_to_the_strong_tier(self):
+        llm = StubLLM(latency_ms=0, content=lambda model, _: entries(credit=90.0 if model == "gpt-4o-mini" else 100.0))
+        router = ModelRouter()
+        response = router.complete(llm, "aa.entries", messages(), validate=journal_entries, template_matched=True)
+        self.assertEqual(response.model, "gpt-4o-2024-08-06")
+        self.assertEqual(journal_entries(response.choices[0].message), (True, []))
+
+        response = router.complete(llm, "history.chat", messages(), validate=has_content)
+        self.assertEqual(response.model, "gpt-4o-mini")
+
+        stats = router.stats()
+        self.assertEqual(stats["sites"]["aa.entries"], {"calls": 1, "fast": 0, "strong": 0, "escalated": 1})
+        self.assertEqual(stats["tiers"][FAST]["rejected"], 1)
+        self.assertEqual((stats["tiers"][FAST]["calls"], stats["tiers"][STRONG]["calls"]), (2, 1))
+        self.assertEqual(stats["escalation_rate"], 0.5)
+        expected = sum(price(stats["tiers"][tier]["model"], stats["tiers"][tier]["prompt_tokens"],
+                             stats["tiers"][tier]["completion_tokens"]) for tier in (FAST, STRONG))
+        self.assertAlmostEqual(stats["cost_usd"], expected, places=6)
+
+    def test_failed_call_escalates_but_capacity_errors_do_not(self):
+        router = ModelRouter()
+        client = FailingClient(StubLLMError("500"))
+        with self.assertRaises(StubLLMError):
+            router.complete(client, "history.chat", messages())
+        self.assertEqual(client.calls, ["gpt-4o-mini", "gpt-4o-2024-08-06"])
+
+        # The strong tier shares the breaker and the budget of the fast one
+        client = FailingClient(CircuitOpenError("openai"))
+        with self.assertRaises(CircuitOpenError):
+            router.complete(client, "history.chat", messages())
+        self.assertEqual(client.calls, ["gpt-4o-mini"])
+
+
+class TestRoutingReplay(unittest.TestCase):
+    def replay(self, fast_error_rate):
+        records = list(TrafficGenerator(seed=3).records(1500))
+        llm = StubLLM(latency_ms=3, content=RoutedAnswers(fast_error_rate=fast_error_rate, seed=3),
+                      model_latency_ms={"gpt-4o-mini": 1, "gpt-4o-2024": 3})
+        return run_routing_replay(records, llm=llm)
+
+    def test_escalation_rate_follows_the_fast_tier_errors(self):
+        report = self.replay(fast_error_rate=0.1)
+        self.assertGreater(report["calls"], 1000)
+        self.assertGreater(report["escalation_rate"], 0.05)
+        self.assertLess(report["escalation_rate"], 0.15)
+        # Untemplated entries (catégorie "autre") go straight to the strong tier
+        self.assertGreater(report["sites"]["aa.entries"]["strong"], 0)
+        self.assertEqual(report["sites"]["aa.classify"]["strong"], 0)
+        self.assertLess(report["cost_usd"], report["strong_only_cost_usd"] / 2)
+        self.assertGreater(report["tiers"][FAST]["calls"], report["tiers"][STRONG]["calls"])
+
+        report = self.replay(fast_error_rate=0.0)
+        self.assertEqual(report["escalation_rate"], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
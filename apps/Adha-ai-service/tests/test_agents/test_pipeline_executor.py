@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from agents.logic.orchestration_agent import OrchestrationAgent
+from agents.utils.agent_pool import agent_pool
+from agents.utils.pipeline_executor import (
+    CPU, DB, LLM, PipelineExecutor, ResourceGate, gated, get_pipeline_executor,
+)
+
+LLM_LATENCY = 0.02
+LLM_CAPACITY = 4  # Beyond this many parallel calls the stub API slows down
+
+
+class StubLLM:
+    """LLM API whose latency grows once it is oversubscribed (throttling, queueing)."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.overloaded = 0  # Calls made while the API was oversubscribed
+        self._lock = threading.Lock()
+
+    def call(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            overload = max(0, self.in_flight - LLM_CAPACITY)
+            self.overloaded += bool(overload)
+        time.sleep(LLM_LATENCY * (1 + overload / LLM_CAPACITY))
+        with self._lock:
+            self.in_flight -= 1
+
+
+class StubDDE:
+    def __init__(self, llm):
+        self.llm = llm
+
+    def process_prompt(self, prompt):
+        self.llm.call()
+        return {"full_text": prompt}
+
+
+class StubAA:
+    def __init__(self, llm):
+        self.llm = llm
+
+    def process(self, intention, entities, extracted_data):
+        self.llm.call()
+        return {"proposals": [{"description": extracted_data["full_text"]}]}
+
+
+class StubCCC:
+    def verify(self, proposals):
+        return {"is_coherent": True}
+
+
+class TestResourceGate(unittest.TestCase):
+    def test_permits_are_bounded_and_fifo(self):
+        gate = ResourceGate("llm", 2)
+        order = []
+
+        async def task(i):
+            await gate.acquire_async()
+            try:
+                order.append(i)
+                await asyncio.sleep(0.005)
+                self.assertLessEqual(gate.in_flight, 2)
+            finally:
+                gate.release()
+
+        async def main():
+            await asyncio.gather(*(task(i) for i in range(10)))
+
+        asyncio.run(main())
+        self.assertEqual(order, list(range(10)))
+        stats = gate.stats()
+        self.assertEqual((stats["acquired"], stats["max_in_flight"], stats["in_flight"]), (10, 2, 0))
+        self.assertEqual(stats["max_queue_depth"], 8)
+        self.assertGreater(stats["wait_p99"], 0)
+
+    def test_cancelled_waiter_does_not_leak_a_permit(self):
+        gate = ResourceGate("db", 1)
+
+        async def main():
+            await gate.acquire_async()
+            waiter = asyncio.ensure_future(gate.acquire_async())
+            await asyncio.sleep(0)
+            self.assertEqual(gate.queue_depth, 1)
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+            gate.release()
+
+        asyncio.run(main())
+        self.assertEqual((gate.in_flight, gate.queue_depth), (0, 0))
+        with gate.hold(timeout=1):
+            self.assertEqual(gate.in_flight, 1)
+
+    def test_sync_timeout(self):
+        gate = ResourceGate("cpu", 1)
+        gate.acquire()
+        with self.assertRaises(TimeoutError):
+            gate.acquire(timeout=0.01)
+        gate.release()
+        self.assertEqual((gate.in_flight, gate.queue_depth), (0, 0))
+
+
+    def test_gated_writes_hold_a_db_permit(self):
+        gate = get_pipeline_executor().gate(DB)
+        seen = []
+
+        @gated(DB)
+        def write(value):
+            seen.append(gate.in_flight)
+            return value
+
+        acquired = gate.acquired
+        self.assertEqual(write(42), 42)
+        self.assertEqual(seen, [1])
+        self.assertEqual((gate.acquired - acquired, gate.in_flight), (1, 0))
+
+class TestPipelineLoad(unittest.TestCase):
+    """Concurrent batches through OrchestrationAgent with stub agents."""
+
+    def setUp(self):
+        self.factories = dict(agent_pool._factories)
+        self.llm = StubLLM()
+        agent_pool.register("dde", lambda: StubDDE(self.llm))
+        agent_pool.register("aa", lambda: StubAA(self.llm))
+        agent_pool.register("ccc", StubCCC)
+
+    def tearDown(self):
+        for name, factory in self.factories.items():
+            agent_pool.register(name, factory)
+
+    def _run(self, batches, llm_limit, documents=8):
+        executor = PipelineExecutor({LLM: llm_limit, CPU: 2})
+
+        async def main():
+            orchestrators = []
+            for _ in range(batches):
+                orchestrator = OrchestrationAgent()
+                orchestrator.executor = executor
+                orchestrators.append(orchestrator)
+            docs = [{"prompt": f"vente {i}"} for i in range(documents)]
+            return await asyncio.gather(*(o.process_batch(docs, "ecriture_simple") for o in orchestrators))
+
+        results = asyncio.run(main())
+        stats = executor.stats()
+        executor.shutdown()
+        for batch in results:
+            self.assertTrue(all("entries" in result for result in batch))
+        return stats
+
+    def test_llm_calls_stay_within_the_gate_as_batches_grow(self):
+        for batches in (1, 4, 16):
+            stats = self._run(batches, llm_limit=LLM_CAPACITY)
+            llm_stats = stats["resources"][LLM]
+            self.assertEqual(llm_stats["acquired"], batches * 8 * 2)
+            self.assertLessEqual(llm_stats["max_in_flight"], LLM_CAPACITY)
+            self.assertEqual(stats["max_workers"], LLM_CAPACITY + 2 + stats["resources"]["db"]["limit"])
+        # The API is never oversubscribed, however many batches run at once
+        self.assertLessEqual(self.llm.max_in_flight, LLM_CAPACITY)
+        self.assertEqual(self.llm.overloaded, 0)
+
+        # Without the LLM gate the same load oversubscribes the API
+        self._run(16, llm_limit=1000)
+        self.assertGreater(self.llm.max_in_flight, LLM_CAPACITY)
+        self.assertGreater(self.llm.overloaded, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
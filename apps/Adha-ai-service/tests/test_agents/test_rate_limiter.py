@@ -0,0 +1,171 @@
+import asyncio
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from agents.utils.agent_pool import agent_context
+from agents.utils.rate_limiter import (
+    BATCH, CHAT, Budget, RateLimiter, RateLimitTimeout, estimate_tokens, rate_limited,
+)
+from api.kafka.load_harness import StubLLM, StubRateLimitError
+
+try:
+    import redis
+    redis.Redis().ping()
+except Exception:
+    redis = None
+
+
+class FlakyStore:
+    """Shared store that is down (Redis unreachable)."""
+
+    def take(self, budget, tokens, reserve):
+        raise ConnectionError("redis down")
+
+    def adjust(self, budget, delta):
+        raise ConnectionError("redis down")
+
+
+def messages(size=200):
+    return [{"role": "user", "content": "x" * size}]
+
+
+class TestBuckets(unittest.TestCase):
+    def test_requests_per_period(self):
+        limiter = RateLimiter(Budget("test", requests=20, tokens=10_000, period=1.0))
+        # timeout=0: granted only if the bucket allows the request right away
+        for _ in range(20):
+            limiter.acquire(10, priority=CHAT, timeout=0)
+        with self.assertRaises(RateLimitTimeout):
+            limiter.acquire(10, priority=CHAT, timeout=0)
+        # The bucket is empty: the next request waits for one refill (1/20 s)
+        reservation = limiter.acquire(10, priority=CHAT)
+        self.assertGreaterEqual(reservation.waited, 0.04)
+
+    def test_reserve_then_reconcile(self):
+        limiter = RateLimiter(Budget("test", requests=100, tokens=1000, period=60.0))
+        reservation = limiter.acquire(800)
+        with self.assertRaises(RateLimitTimeout):
+            limiter.acquire(800, timeout=0.05)
+        # The call used 100 tokens: the 700 left over go back to the bucket
+        reservation.reconcile(100)
+        limiter.acquire(800, timeout=0)
+        reservation.reconcile(100)
+        self.assertEqual(limiter.stats["reconciled_tokens"], 700)
+
+    def test_call_larger_than_the_bucket_waits_for_a_full_bucket(self):
+        limiter = RateLimiter(Budget("test", requests=100, tokens=100, period=1.0))
+        limiter.acquire(50)
+        reservation = limiter.acquire(150, priority=CHAT)
+        self.assertGreaterEqual(reservation.waited, 0.4)
+
+    def test_chat_keeps_headroom_over_batch(self):
+        limiter = RateLimiter(Budget("test", requests=10, tokens=100_000, period=60.0))
+        for _ in range(7):
+            limiter.acquire(10, priority=BATCH)
+        # Batch must leave 30% of the bucket, chat may empty it
+        with self.assertRaises(RateLimitTimeout):
+            limiter.acquire(10, priority=BATCH, timeout=0.05)
+        for _ in range(3):
+            limiter.acquire(10, priority=CHAT, timeout=0.05)
+
+        # The class comes from the context of the call
+        with agent_context(priority=BATCH), self.assertRaises(RateLimitTimeout):
+            limiter.acquire(10, timeout=0.05)
+
+    def test_local_fallback_when_the_store_is_down(self):
+        limiter = RateLimiter(Budget("test", requests=40, tokens=10_000, period=1.0), store=FlakyStore(),
+                              fallback_processes=4)
+        started = time.monotonic()
+        for _ in range(12):
+            limiter.acquire(10)
+        # A quarter of the budget for this process: 10 at once, then 10 per second
+        self.assertGreaterEqual(time.monotonic() - started, 0.15)
+        self.assertEqual(limiter.stats["fallbacks"], 1)
+        limiter.adjust(5)
+
+    def test_async_acquire(self):
+        limiter = RateLimiter(Budget("test", requests=10, tokens=10_000, period=1.0))
+
+        async def burst():
+            return await asyncio.gather(*(limiter.acquire_async(10) for _ in range(12)))
+
+        reservations = asyncio.run(burst())
+        self.assertEqual(len(reservations), 12)
+        self.assertGreater(max(reservation.waited for reservation in reservations), 0.05)
+
+    def test_token_estimate(self):
+        self.assertEqual(estimate_tokens({"messages": messages(400), "max_tokens": 100}), 100 + 4 + 100)
+        self.assertEqual(estimate_tokens({"input": ["abcd" * 10, "abcd"]}), 11 + 2)
+
+
+class TestOverload(unittest.TestCase):
+    """Stub API with OpenAI-like quotas, hammered by 16 threads."""
+
+    CALLS = 80
+
+    def hammer(self, client):
+        def call(_):
+            try:
+                client.chat.completions.create(model="gpt-4o-mini", messages=messages(), max_tokens=100)
+                return "ok"
+            except StubRateLimitError:
+                return "429"
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            return list(executor.map(call, range(self.CALLS)))
+
+    def test_no_429_under_overload(self):
+        # 50 requests and 6000 tokens per second on the stub side, ~150 tokens per call
+        quotas = dict(completion_tokens=100, requests_per_minute=50, tokens_per_minute=6000, period=1.0)
+        unprotected = self.hammer(StubLLM(latency_ms=5, **quotas))
+        self.assertGreater(unprotected.count("429"), 0)
+
+        stub = StubLLM(latency_ms=5, **quotas)
+        limiter = RateLimiter(Budget("openai", requests=45, tokens=5400, period=1.0))
+        outcomes = self.hammer(rate_limited(stub, limiter))
+        self.assertEqual(outcomes.count("429"), 0)
+        self.assertEqual(stub.stats["rate_limited"], 0)
+        self.assertEqual(stub.stats["calls"], self.CALLS)
+        # Reserved 154 tokens per call (estimate), used 151 (usage of the response)
+        self.assertEqual(limiter.stats["reconciled_tokens"], 3 * self.CALLS)
+
+    def test_chat_goes_first_when_batch_saturates(self):
+        stub = StubLLM(latency_ms=1, requests_per_minute=40, tokens_per_minute=100_000, period=1.0)
+        limiter = RateLimiter(Budget("openai", requests=36, tokens=90_000, period=1.0))
+        client = rate_limited(stub, limiter)
+        granted = []
+
+        def call(priority):
+            with agent_context(priority=priority):
+                client.chat.completions.create(messages=messages(40), max_tokens=50)
+            granted.append(priority)
+
+        with ThreadPoolExecutor(max_workers=24) as executor:
+            list(executor.map(call, [BATCH] * 60))
+        granted.clear()
+        # The bucket is drained: the chat calls submitted last still get through before the batch calls
+        with ThreadPoolExecutor(max_workers=24) as executor:
+            list(executor.map(call, [BATCH] * 20 + [CHAT] * 4))
+        self.assertEqual(stub.stats["rate_limited"], 0)
+        self.assertLess(max(n for n, priority in enumerate(granted) if priority == CHAT),
+                        max(n for n, priority in enumerate(granted) if priority == BATCH))
+
+
+@unittest.skipIf(redis is None, "no Redis server")
+class TestRedisBuckets(unittest.TestCase):
+    def test_processes_share_one_budget(self):
+        from agents.utils.rate_limiter import RedisBucketStore
+        client = redis.Redis()
+        client.delete("ratelimit:{shared-test}:requests", "ratelimit:{shared-test}:tokens")
+        budget = Budget("shared-test", requests=10, tokens=10_000, period=60.0)
+        workers = [RateLimiter(budget, store=RedisBucketStore(client)) for _ in range(2)]
+        for n in range(10):
+            workers[n % 2].acquire(10, priority=CHAT)
+        with self.assertRaises(RateLimitTimeout):
+            workers[0].acquire(10, priority=CHAT, timeout=0.05)
+        self.assertEqual(workers[1].stats["fallbacks"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
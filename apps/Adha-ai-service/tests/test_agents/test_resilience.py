@@ -0,0 +1,254 @@
+import threading
+import time
+import unittest
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from agents.utils.agent_pool import agent_context, current_context
+from agents.utils.resilience import (
+    CLOSED, HALF_OPEN, OPEN, Bulkhead, BulkheadFullError, CallTimeoutError, CircuitBreaker, CircuitOpenError,
+    Dependency, DependencyRegistry, RedisBreakerState, build_dependency, client_error, resilient,
+)
+
+
+class DictRedis:
+    """The three Redis commands used by RedisBreakerState, expiry included."""
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        value, expires = self.values.get(key, (None, 0))
+        return value if time.time() < expires else None
+
+    def set(self, key, value, px):
+        self.values[key] = (value.encode(), time.time() + px / 1000)
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+class HangingService:
+    """Stub dependency: answers at once, or hangs until released."""
+
+    def __init__(self):
+        self.hanging = False
+        self.released = threading.Event()
+        self.calls = 0
+
+    def fetch(self, user_id):
+        self.calls += 1
+        if self.hanging:
+            self.released.wait(5)
+        return {"id": user_id}
+
+
+def fail():
+    raise ConnectionError("down")
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_concurrent_failures_are_all_counted(self):
+        breaker = CircuitBreaker(failure_threshold=10_000, timeout=60)
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(lambda _: breaker.record_failure(), range(4000)))
+        self.assertEqual(breaker.failures, 4000)
+        self.assertEqual(breaker.state, CLOSED)
+
+        breaker = CircuitBreaker(failure_threshold=100, timeout=60)
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(lambda _: breaker.record_failure(), range(1000)))
+        self.assertEqual((breaker.state, breaker.trips), (OPEN, 1))
+
+    def test_open_half_open_closed(self):
+        breaker = CircuitBreaker(failure_threshold=2, timeout=0.05, name="svc")
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                breaker.call(fail)
+        self.assertTrue(breaker.is_open())
+        with self.assertRaises(CircuitOpenError):
+            breaker.call(lambda: "not called")
+
+        time.sleep(0.06)
+        # One trial only while half-open; its failure reopens the breaker
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open())
+
+        time.sleep(0.06)
+        self.assertEqual(breaker.call(lambda: "ok"), "ok")
+        self.assertEqual((breaker.state, breaker.failures), (CLOSED, 0))
+
+    def test_failures_after_the_delay_trip_it_again(self):
+        breaker = CircuitBreaker(failure_threshold=2, timeout=0.05, name="kafka")
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open())
+
+        # Delay elapsed: is_open() hands out the trial, whose failure re-arms the delay
+        time.sleep(0.06)
+        self.assertFalse(breaker.is_open())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertTrue(breaker.is_open())
+        breaker.record_failure()
+        self.assertEqual((breaker.state, breaker.trips), (OPEN, 2))
+        self.assertTrue(breaker.is_open())
+
+        # Failures of calls let through before the trip push the delay back
+        retry_at = breaker.next_attempt
+        time.sleep(0.01)
+        breaker.record_failure()
+        self.assertGreater(breaker.next_attempt, retry_at)
+        self.assertEqual(breaker.trips, 2)
+
+        time.sleep(0.06)
+        self.assertFalse(breaker.is_open())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_client_errors_are_not_outages(self):
+        class APIStatusError(Exception):
+            def __init__(self, status_code):
+                super().__init__(f"HTTP {status_code}")
+                self.status_code = status_code
+
+        self.assertTrue(client_error(APIStatusError(400)))
+        self.assertTrue(client_error(APIStatusError(404)))
+        self.assertFalse(client_error(APIStatusError(429)))
+        self.assertFalse(client_error(APIStatusError(503)))
+        self.assertFalse(client_error(ConnectionError("down")))
+
+        breaker = build_dependency("openai").breaker
+        breaker.failure_threshold = 1
+        for _ in range(3):
+            breaker.record_failure(APIStatusError(400))  # context length exceeded
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record_failure(APIStatusError(429))
+        self.assertEqual(breaker.state, OPEN)
+
+        # A rejected trial still proves the API answers: the trial slot is given back
+        breaker.next_attempt = 0
+        self.assertTrue(breaker.allow())
+        breaker.record_failure(APIStatusError(401))
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_excluded_exceptions_do_not_trip(self):
+        breaker = CircuitBreaker(failure_threshold=1, excluded_exceptions=(ValueError,))
+        with self.assertRaises(ValueError):
+            breaker.call(int, "not a number")
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_trip_is_shared_through_redis(self):
+        state = RedisBreakerState(DictRedis())
+        worker_a = CircuitBreaker(failure_threshold=1, timeout=60, name="openai", shared_state=state)
+        worker_b = CircuitBreaker(failure_threshold=1, timeout=60, name="openai", shared_state=state, sync_interval=0)
+        self.assertTrue(worker_b.allow())
+        worker_a.record_failure()
+        self.assertTrue(worker_b.is_open())
+        with self.assertRaises(CircuitOpenError):
+            worker_b.call(lambda: "not called")
+
+        # The trial of worker A succeeds: the shared trip is cleared
+        worker_a.next_attempt = 0
+        worker_a.call(lambda: "ok")
+        self.assertIsNone(state.client.get("resilience:breaker:openai"))
+
+
+class TestBulkhead(unittest.TestCase):
+    def test_rejects_beyond_capacity(self):
+        bulkhead = Bulkhead(max_concurrent=2, name="chroma")
+        with bulkhead, bulkhead:
+            with self.assertRaises(BulkheadFullError):
+                bulkhead.acquire()
+        self.assertEqual(bulkhead.stats(), {"max_concurrent": 2, "in_flight": 0, "peak": 2, "rejected": 1})
+
+
+class TestDependencyChaos(unittest.TestCase):
+    def test_hanging_dependency_fails_fast(self):
+        service = HangingService()
+        dependency = Dependency(
+            "customer_service",
+            CircuitBreaker(failure_threshold=3, timeout=0.3, name="customer_service"),
+            Bulkhead(max_concurrent=4, name="customer_service"),
+            call_timeout=0.05,
+        )
+        self.assertEqual(dependency.call(service.fetch, "u1"), {"id": "u1"})
+
+        service.hanging = True
+        threads_before = threading.active_count()
+
+        def call(n):
+            try:
+                dependency.call(service.fetch, f"u{n}")
+                return "ok"
+            except (CallTimeoutError, BulkheadFullError, CircuitOpenError) as e:
+                return type(e).__name__
+
+        with ThreadPoolExecutor(max_workers=50) as callers:
+            outcomes = Counter(callers.map(call, range(200)))
+
+        self.assertNotIn("ok", outcomes)
+        # Only the calls let through by the bulkhead wait for the call timeout, the others fail at once
+        self.assertLessEqual(outcomes["CallTimeoutError"], 4)
+        self.assertEqual(outcomes["BulkheadFullError"] + outcomes["CircuitOpenError"],
+                         200 - outcomes["CallTimeoutError"])
+        self.assertTrue(dependency.breaker.is_open())
+        # Hanging calls hold at most the bulkhead's threads
+        self.assertLessEqual(service.calls, 1 + 4)
+        self.assertLessEqual(threading.active_count() - threads_before, 4)
+
+        calls = service.calls
+        with self.assertRaises(CircuitOpenError):
+            dependency.call(service.fetch, "u-open")
+        self.assertEqual(service.calls, calls)
+
+        # The dependency recovers: hung calls return, the half-open trial closes the breaker
+        service.hanging = False
+        service.released.set()
+        time.sleep(0.35)
+        self.assertEqual(dependency.call(service.fetch, "u2"), {"id": "u2"})
+        self.assertEqual(dependency.breaker.state, CLOSED)
+        self.assertEqual(dependency.bulkhead.in_flight, 0)
+        stats = dependency.stats()
+        self.assertEqual(stats["calls"], 1 + 200 + 1 + 1)
+        self.assertEqual(stats["succeeded"], 2)
+
+
+class TestResilientClient(unittest.TestCase):
+    def setUp(self):
+        self.registry = DependencyRegistry(
+            lambda name: Dependency(name, CircuitBreaker(failure_threshold=2, name=name), Bulkhead(4), 1.0))
+
+    def test_nested_method_calls_go_through_the_dependency(self):
+        class Completions:
+            def create(self, **kwargs):
+                return {"model": kwargs["model"], "company": current_context().company_id}
+
+        class Chat:
+            completions = Completions()
+
+        class Client:
+            api_key = "sk-test"
+            chat = Chat()
+
+        client = resilient(Client(), "openai")
+        self.assertEqual(client.api_key, "sk-test")
+        with agent_context(company_id="c1"):
+            # The call runs on the executor of the dependency, with the caller's context
+            response = client.chat.completions.create(model="gpt-4o")
+        self.assertEqual(response, {"model": "gpt-4o", "company": "c1"})
+        self.assertIs(resilient(client, "openai"), client)
+
+    def test_registry_shares_one_dependency_per_name(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            dependencies = list(executor.map(lambda _: self.registry.get("chroma"), range(32)))
+        self.assertTrue(all(dependency is dependencies[0] for dependency in dependencies))
+        self.registry._pid = -1
+        self.assertIsNot(self.registry.get("chroma"), dependencies[0])
+        self.assertEqual(set(self.registry.stats()), {"chroma"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import contextlib
+import io
+import unittest
+
+from agents.logic.aa_agent import AAgent
+from agents.utils.syscohada_rules import SyscohadaRulesEngine
+from api.kafka.load_harness import document_corpus, extracted_document, run_fast_path_benchmark
+
+INVOICE = """FACTURE N° FA-2025-0142
+Date : 12/03/2025
+Fournisseur : Kivu Distribution SARL
+Client : Wanzo Commerce
+Désignation Qté PU Montant
+Riz 25kg 10 5 000 50 000
+Huile 5L 2 5 000 10 000
+Total HT : 60 000
+TVA : 9 600
+Total TTC : 69 600
+"""
+
+RECEIPT = """REÇU N° R-778
+Date : 14/03/2025
+Beni Market
+Total : 12 500 FC
+Payé en espèces
+"""
+
+
+def accounts(lines):
+    return [(line["compte"], line["montant"]) for line in lines]
+
+
+class TestSyscohadaRules(unittest.TestCase):
+    def setUp(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.engine = SyscohadaRulesEngine(AAgent._load_syscohada_templates(None), min_confidence=0.8)
+
+    def test_purchase_invoice(self):
+        result = self.engine.propose(extracted_document(INVOICE), "achat_marchandises")
+        entry = result["proposals"][0]
+        self.assertEqual(accounts(entry["debit"]), [("607000", 60000.0), ("445000", 9600.0)])
+        self.assertEqual(accounts(entry["credit"]), [("401000", 69600.0)])
+        self.assertEqual((entry["journal"], entry["piece_reference"]), ("AC", "FA-2025-0142"))
+        self.assertEqual(result["confidence"], 1.0)
+        self.assertEqual(result["token_usage"]["total_tokens"], 0)
+
+    def test_generic_intent_infers_the_direction_from_the_company(self):
+        invoice = extracted_document(INVOICE)
+        # ecriture_simple does not tell a purchase from a sale: without the company, the LLM decides
+        self.assertIsNone(self.engine.propose(invoice, "ecriture_simple"))
+        self.assertIsNone(self.engine.propose(invoice))
+        self.assertEqual(self.engine.match(invoice, "ecriture_simple").reasons,
+                         ["Sens du document inconnu (achat ou vente)"])
+        # Neither party of the invoice
+        self.assertIsNone(self.engine.propose(invoice, "ecriture_simple", company_name="Beni Market"))
+
+        # The company is the client: a purchase
+        result = self.engine.propose(invoice, "ecriture_simple", company_name="wanzo  commerce")
+        entry = result["proposals"][0]
+        self.assertEqual(accounts(entry["credit"]), [("401000", 69600.0)])
+        self.assertEqual(result["confidence"], 0.95)
+
+        # The company is the supplier: a sale
+        entry = self.engine.propose(invoice, "ecriture_simple", company_name="Kivu Distribution SARL")["proposals"][0]
+        self.assertEqual(accounts(entry["debit"]), [("411000", 69600.0)])
+        self.assertEqual(entry["journal"], "VE")
+
+    def test_sale_invoice(self):
+        entry = self.engine.propose(extracted_document(INVOICE), "vente_marchandises")["proposals"][0]
+        self.assertEqual(accounts(entry["debit"]), [("411000", 69600.0)])
+        self.assertEqual(accounts(entry["credit"]), [("701000", 60000.0), ("443000", 9600.0)])
+        self.assertEqual(entry["journal"], "VE")
+
+    def test_cash_receipt_is_settled_by_the_till(self):
+        entry = self.engine.propose(extracted_document(RECEIPT), "achat")["proposals"][0]
+        self.assertEqual(accounts(entry["debit"]), [("607000", 12500.0)])
+        self.assertEqual(accounts(entry["credit"]), [("571000", 12500.0)])
+        self.assertEqual(entry["journal"], "CA")
+
+        # Issued by another party: paid by the company
+        issued = extracted_document(RECEIPT.replace("Beni Market", "Fournisseur : Beni Market"))
+        entry = self.engine.propose(issued, "ecriture_simple", company_name="Wanzo Commerce")["proposals"][0]
+        self.assertEqual(accounts(entry["debit"]), [("607000", 12500.0)])
+        # Without the company, or without a readable issuer, the receipt may be a sale as well: the LLM decides
+        self.assertIsNone(self.engine.propose(issued, "ecriture_simple"))
+        self.assertIsNone(self.engine.propose(extracted_document(RECEIPT), "ecriture_simple",
+                                              company_name="Wanzo Commerce"))
+
+    def test_sale_receipt(self):
+        receipt = extracted_document(RECEIPT.replace("Beni Market", "Fournisseur : Wanzo Commerce"))
+        result = self.engine.propose(receipt, "ecriture_simple", company_name="Wanzo Commerce")
+        entry = result["proposals"][0]
+        self.assertEqual(accounts(entry["debit"]), [("571000", 12500.0)])
+        self.assertEqual(accounts(entry["credit"]), [("701000", 12500.0)])
+        self.assertNotIn("Wanzo Commerce", entry["description"])
+
+    def test_low_confidence_falls_through(self):
+        # "TVA 16%" is read as a tax of 16: the tax is derived from the totals
+        quirk = extracted_document(INVOICE.replace("TVA :", "TVA 16% :"))
+        self.assertEqual(accounts(self.engine.propose(quirk, "achat")["proposals"][0]["debit"])[1], ("445000", 9600.0))
+
+        undated = extracted_document(INVOICE.replace("Date : 12/03/2025\n", "").replace("Fournisseur : Kivu Distribution SARL\n", ""))
+        match = self.engine.match(undated, "achat")
+        self.assertLess(match.confidence, 0.8)
+        self.assertIsNone(self.engine.propose(undated, "achat"))
+
+        inconsistent = extracted_document(INVOICE.replace("Total TTC : 69 600", "Total TTC : 50 400"))
+        self.assertIsNone(self.engine.propose(inconsistent, "achat"))
+        self.assertIsNone(self.engine.propose(extracted_document("RELEVÉ BANCAIRE N° RB-1\nSolde : 10 000")))
+        self.assertIsNone(self.engine.propose({"document_type": "prompt", "full_text": "Achat de riz 10 000 FC"}))
+
+        stats = self.engine.stats()
+        self.assertEqual((stats["matched"], stats["fallthrough"]), (1, 4))
+
+
+class TestFastPathBenchmark(unittest.TestCase):
+    def test_common_documents_bypass_the_llm(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = run_fast_path_benchmark(document_corpus(200, seed=5))
+        self.assertGreater(report["bypass_rate"], 0.6)
+        self.assertGreater(report["token_savings"], 0.6)
+        self.assertEqual(report["llm_only"]["llm_calls"], 200)
+        self.assertEqual(report["fast_path"]["llm_calls"], 200 - report["bypassed"])
+        # Bank statements, notes and inconsistent totals still go to the LLM
+        for kind in ("bank_statement", "note", "inconsistent_totals"):
+            self.assertEqual(report["kinds"].get(kind, {}).get("bypassed", 0), 0)
+        self.assertEqual(report["kinds"]["purchase_invoice"]["bypassed"], report["kinds"]["purchase_invoice"]["documents"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+from datetime import datetime, timedelta
+from agents.utils.tabular_summarizer import TabularSummarizer, estimate_tokens, parse_number
+
+
+def _ledger_rows(n_rows):
+    """Sales ledger with a title row above the header, a total row and one outlier."""
+    clients = ["Boutiques Express", "Papeco SARL", "RIME RTA", "InfoTech", "SCI Aurora"]
+    start = datetime(2024, 1, 1)
+    rows = [["Journal des ventes - Exercice 2024", None, None, None],
+            ["Date", "Client", "Libellé", "Montant TTC"]]
+    for i in range(n_rows):
+        amount = 250000 if i == 7 else 1000 + (i % 50) * 10
+        rows.append([start + timedelta(days=i % 365), clients[i % len(clients)],
+                     f"Vente marchandises facture FV{i:05d}", amount])
+    total = sum(r[3] for r in rows[2:])
+    rows.append([None, None, "TOTAL GENERAL", total])
+    return rows
+
+
+class TestTabularSummarizer(unittest.TestCase):
+    def setUp(self):
+        self.summarizer = TabularSummarizer(token_budget=800)
+
+    def test_parse_number_formats(self):
+        self.assertEqual(parse_number("1 234,56"), 1234.56)
+        self.assertEqual(parse_number("1,234.56"), 1234.56)
+        self.assertEqual(parse_number("12 500 FC"), 12500.0)
+        self.assertEqual(parse_number("(120)"), -120.0)
+        self.assertIsNone(parse_number("Papeco SARL"))
+
+    def test_summary_statistics(self):
+        summary = self.summarizer.summarize_rows(_ledger_rows(200), "Ventes")
+        self.assertEqual(summary.header_row, 1)
+        self.assertEqual(summary.row_count, 200)
+        kinds = {c.name: c.kind for c in summary.columns}
+        self.assertEqual(kinds["Date"], "date")
+        self.assertEqual(kinds["Montant TTC"], "number")
+        self.assertEqual(summary.amount_column, "Montant TTC")
+        self.assertEqual(summary.counterparty_column, "Client")
+        self.assertEqual(summary.document_type, "invoice")
+        computed = next(c.total for c in summary.columns if c.name == "Montant TTC")
+        self.assertEqual(summary.stated_totals["Montant TTC"], computed)
+        self.assertEqual(summary.outliers[0]["value"], 250000)
+        self.assertEqual(len(summary.top_counterparties), 5)
+        self.assertLessEqual(len(summary.sample_rows), 5)
+
+    def test_digest_is_fixed_size(self):
+        small = self.summarizer.build_digest([self.summarizer.summarize_rows(_ledger_rows(20), "Ventes")])
+        large_rows = _ledger_rows(20000)
+        large = self.summarizer.build_digest([self.summarizer.summarize_rows(large_rows, "Ventes")])
+        self.assertLessEqual(estimate_tokens(small), 800)
+        self.assertLessEqual(estimate_tokens(large), 800)
+        self.assertIn("Top counterparties", large)
+
+        # Order-of-magnitude reduction against the former stringified dump
+        raw_dump = "\n".join(" | ".join(str(v) for v in row) for row in large_rows)
+        self.assertGreater(estimate_tokens(raw_dump), 10 * estimate_tokens(large))
+
+    def test_workbook_budget_is_shared(self):
+        summaries = [self.summarizer.summarize_rows(_ledger_rows(500), f"Sheet{i}") for i in range(6)]
+        digest = self.summarizer.build_digest(summaries)
+        self.assertLessEqual(estimate_tokens(digest), 800)
+        self.assertIn("Sheet5", digest)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+Tests de DatabaseBatchStore (modèles BatchJob / BatchDocument) : réclamation
+exclusive, bail expiré, annulation et suppression des fichiers du lot. Ils
+utilisent la base de test Django (python manage.py test
+tests.test_batch_database_store).
+"""
+import os
+import tempfile
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from api.models import BatchDocument
+from api.services.batch_engine import LEASE_EXPIRED_ERROR, DatabaseBatchStore
+
+
+def _documents(count):
+    return [{"name": f"facture_{i:04d}.pdf"} for i in range(count)]
+
+
+class TestDatabaseBatchStore(TestCase):
+    def setUp(self):
+        self.store = DatabaseBatchStore()
+
+    @staticmethod
+    def _expire_leases(batch_id):
+        # Bail pris il y a une heure : le worker qui le détient est considéré comme mort
+        BatchDocument.objects.filter(batch_id=batch_id, status="running").update(
+            locked_at=timezone.now() - timedelta(hours=1)
+        )
+
+    def test_claim_is_exclusive(self):
+        batch_id = self.store.create_batch(_documents(3))
+
+        first = self.store.claim("w1", limit=2)
+        second = self.store.claim("w2", limit=2)
+        self.assertEqual((len(first), len(second)), (2, 1))
+        self.assertFalse({d.id for d in first} & {d.id for d in second})
+        self.assertEqual(self.store.claim("w3"), [])
+        self.assertEqual(self.store.batch_status(batch_id)["status"], "processing")
+
+    def test_expired_lease_is_reclaimed(self):
+        batch_id = self.store.create_batch(_documents(1))
+        stale = self.store.claim("dead-worker")[0]
+        self.assertEqual(self.store.claim("other"), [])
+        self._expire_leases(batch_id)
+
+        claimed = self.store.claim("new-owner")
+        self.assertEqual(len(claimed), 1)
+        # Le bail expiré compte comme une tentative
+        self.assertEqual(claimed[0].attempts, 1)
+
+        # Le worker mort a perdu son bail : ses écritures sont refusées
+        self.assertFalse(self.store.save_stage(stale.id, "aa", {"dde": {}}, worker_id="dead-worker"))
+        self.assertFalse(self.store.complete(stale.id, {"entries": []}, worker_id="dead-worker"))
+        self.assertTrue(self.store.complete(claimed[0].id, {"entries": []}, worker_id="new-owner"))
+        self.assertEqual(self.store.batch_status(batch_id)["status"], "completed")
+
+    def test_expired_leases_exhaust_attempts(self):
+        batch_id = self.store.create_batch(_documents(1), max_attempts=2)
+        self.store.claim("worker-0")
+        self._expire_leases(batch_id)
+        self.assertEqual(self.store.claim("worker-1")[0].attempts, 1)
+        self._expire_leases(batch_id)
+
+        self.assertEqual(self.store.claim("worker-2"), [])
+        status = self.store.batch_status(batch_id)
+        self.assertEqual(status["status"], "failed")
+        self.assertEqual(status["documents"][0]["attempts"], 2)
+        self.assertEqual(status["documents"][0]["error"], LEASE_EXPIRED_ERROR)
+
+    def test_cancel_batch(self):
+        batch_id = self.store.create_batch(_documents(3))
+        running = self.store.claim("worker")[0]
+
+        # Les documents en attente sont annulés tout de suite, celui en cours entre deux étapes
+        self.assertTrue(self.store.cancel_batch(batch_id))
+        status = self.store.batch_status(batch_id)
+        self.assertEqual((status["status"], status["counts"]["cancelled"]), ("processing", 2))
+        self.assertTrue(self.store.is_cancel_requested(batch_id))
+        self.assertEqual(self.store.claim("other"), [])
+
+        self.assertTrue(self.store.cancel_document(running.id, worker_id="worker"))
+        self.assertEqual(self.store.batch_status(batch_id)["status"], "cancelled")
+        self.assertFalse(self.store.cancel_batch(batch_id))
+
+    def test_retry_after_cancel_cancels_the_document(self):
+        batch_id = self.store.create_batch(_documents(1))
+        running = self.store.claim("worker")[0]
+        self.assertTrue(self.store.cancel_batch(batch_id))
+
+        # L'étape en cours échoue après l'annulation : le document n'est pas remis en attente
+        self.assertTrue(self.store.retry(running.id, "aa: quota", 0, worker_id="worker"))
+        status = self.store.batch_status(batch_id)
+        self.assertEqual(status["status"], "cancelled")
+        self.assertEqual(status["documents"][0]["status"], "cancelled")
+
+    def test_expired_lease_after_cancel_cancels_the_document(self):
+        batch_id = self.store.create_batch(_documents(2))
+        self.store.claim("dead-worker")
+        self.assertTrue(self.store.cancel_batch(batch_id))
+        self._expire_leases(batch_id)
+
+        self.assertEqual(self.store.claim("other"), [])
+        status = self.store.batch_status(batch_id)
+        self.assertEqual(status["status"], "cancelled")
+        self.assertEqual(status["counts"]["cancelled"], 2)
+
+    def test_files_are_removed_once_the_batch_is_final(self):
+        upload_dir = tempfile.mkdtemp()
+        documents = _documents(2)
+        for document in documents:
+            document["file"] = os.path.join(upload_dir, document["name"])
+            with open(document["file"], "wb") as stored_file:
+                stored_file.write(b"%PDF")
+        batch_id = self.store.create_batch(documents)
+        claimed = self.store.claim("worker", limit=2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(self.store.complete(claimed[0].id, {"entries": []}, worker_id="worker"))
+        self.assertEqual(len(os.listdir(upload_dir)), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(self.store.fail(claimed[1].id, "aa: illisible", worker_id="worker"))
+
+        self.assertEqual(self.store.batch_status(batch_id)["status"], "partial")
+        self.assertFalse(os.path.exists(upload_dir))
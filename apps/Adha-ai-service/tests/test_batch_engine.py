@@ -0,0 +1,283 @@
+"""
+Tests du moteur de traitement par lot (api.services.batch_engine) avec des
+étapes DDE/AA/CCC simulées et le store en mémoire.
+"""
+
+import threading
+import time
+from collections import Counter
+
+from api.services.batch_engine import (
+    BatchWorker, InMemoryBatchStore, StageError, compute_backoff
+)
+
+
+class StubStages:
+    """Étapes simulées ; ``fail_once`` échoue une fois à l'étape AA pour les documents listés."""
+
+    def __init__(self, delay=0.0, fail_once=(), always_fail=()):
+        self.delay = delay
+        self.fail_once = set(fail_once)
+        self.always_fail = set(always_fail)
+        self.calls = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _record(self, stage, doc):
+        with self._lock:
+            self.calls[(stage, doc.name)] += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        if self.delay:
+            time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+
+    def extract(self, doc, results):
+        self._record("dde", doc)
+        return {"montant": 1000, "document": doc.name}
+
+    def analyze(self, doc, results):
+        self._record("aa", doc)
+        with self._lock:
+            if doc.name in self.fail_once:
+                self.fail_once.discard(doc.name)
+                raise RuntimeError("LLM timeout")
+        if doc.name in self.always_fail:
+            raise StageError("document illisible", retryable=False)
+        return {"proposals": [{"montant": results["dde"]["montant"]}]}
+
+    def verify(self, doc, results):
+        self._record("ccc", doc)
+        return {"is_coherent": True}
+
+    def as_dict(self):
+        return {"dde": self.extract, "aa": self.analyze, "ccc": self.verify}
+
+
+def _documents(count):
+    # Chemins fictifs : les fichiers d'un lot terminé sont supprimés
+    return [{"name": f"facture_{i:04d}.pdf", "file": f"/lots-inexistants/facture_{i:04d}.pdf"} for i in range(count)]
+
+
+def _run_workers(store, stages, workers, **options):
+    options.setdefault("backoff_base", 0.001)
+    options.setdefault("poll_interval", 0.001)
+    stop = threading.Event()
+    pool = [BatchWorker(store, stages.as_dict(), worker_id=f"w{i}", **options) for i in range(workers)]
+    threads = [threading.Thread(target=w.run, args=(stop,)) for w in pool]
+    for thread in threads:
+        thread.start()
+    return stop, threads, pool
+
+
+def _wait_for(store, batch_id, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = store.batch_status(batch_id)
+        if status["status"] in ("completed", "partial", "failed", "cancelled"):
+            return status
+        time.sleep(0.01)
+    raise AssertionError(f"Lot {batch_id} non terminé: {store.batch_status(batch_id)['counts']}")
+
+
+class TestBatchEngine:
+    def test_thousand_documents_with_retries(self):
+        store = InMemoryBatchStore()
+        flaky = {f"facture_{i:04d}.pdf" for i in range(0, 1000, 20)}
+        stages = StubStages(fail_once=flaky)
+        batch_id = store.create_batch(_documents(1000), intention="ecriture_simple")
+
+        stop, threads, workers = _run_workers(store, stages, workers=8)
+        status = _wait_for(store, batch_id)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        assert status["status"] == "completed"
+        assert status["counts"]["completed"] == 1000
+        assert status["progress"] == 100
+        assert len(status["results"]) == 1000
+        assert status["results"][0]["result"]["entries"] == [{"montant": 1000}]
+        # Chaque document n'est traité qu'une fois par étape réussie ; les documents
+        # en échec à l'étape AA reprennent à AA sans refaire l'extraction
+        for i in range(1000):
+            name = f"facture_{i:04d}.pdf"
+            assert stages.calls[("dde", name)] == 1
+            assert stages.calls[("ccc", name)] == 1
+            assert stages.calls[("aa", name)] == (2 if name in flaky else 1)
+        assert sum(w.stats["retried"] for w in workers) == len(flaky)
+
+    def test_permanent_failure_and_max_attempts(self):
+        store = InMemoryBatchStore()
+        stages = StubStages(always_fail={"facture_0001.pdf"})
+        batch_id = store.create_batch(_documents(3), max_attempts=3)
+
+        worker = BatchWorker(store, stages.as_dict(), backoff_base=0.001, poll_interval=0.001)
+        worker.run(idle_exit=True)
+
+        status = store.batch_status(batch_id)
+        assert status["status"] == "partial"
+        failed = [d for d in status["documents"] if d["status"] == "failed"]
+        assert len(failed) == 1
+        assert failed[0]["stage"] == "aa"
+        # Erreur non réessayable : une seule tentative
+        assert failed[0]["attempts"] == 1
+        assert "document illisible" in failed[0]["error"]
+
+    def test_retryable_error_exhausts_attempts(self):
+        store = InMemoryBatchStore()
+        stages = StubStages()
+
+        def analyze(doc, results):
+            raise RuntimeError("quota")
+
+        stages.analyze = analyze
+        batch_id = store.create_batch(_documents(1), max_attempts=3)
+        worker = BatchWorker(store, stages.as_dict(), backoff_base=0.001, poll_interval=0.001)
+
+        deadline = time.time() + 5
+        while store.batch_status(batch_id)["status"] != "failed" and time.time() < deadline:
+            worker.run_once()
+
+        document = store.batch_status(batch_id)["documents"][0]
+        assert document["status"] == "failed"
+        assert document["attempts"] == 3
+
+    def test_cancellation(self):
+        store = InMemoryBatchStore()
+        stages = StubStages(delay=0.002)
+        batch_id = store.create_batch(_documents(200))
+
+        stop, threads, _ = _run_workers(store, stages, workers=2)
+        time.sleep(0.05)
+        assert store.cancel_batch(batch_id)
+        status = _wait_for(store, batch_id)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        assert status["status"] == "cancelled"
+        assert status["counts"]["cancelled"] > 0
+        assert status["counts"]["pending"] == status["counts"]["running"] == 0
+        # Un lot terminé ne peut plus être annulé
+        assert not store.cancel_batch(batch_id)
+
+    def test_cancel_during_a_failing_stage(self):
+        store = InMemoryBatchStore()
+        batch_id = store.create_batch(_documents(1))
+        stages = StubStages()
+
+        def analyze(doc, results):
+            # Le lot est annulé pendant l'étape, qui échoue ensuite avec une erreur réessayable
+            assert store.cancel_batch(batch_id)
+            raise RuntimeError("LLM timeout")
+
+        stages.analyze = analyze
+        worker = BatchWorker(store, stages.as_dict(), backoff_base=0.001)
+        assert worker.run_once() == 1
+
+        status = store.batch_status(batch_id)
+        assert status["status"] == "cancelled"
+        assert status["documents"][0]["status"] == "cancelled"
+        assert worker.run_once() == 0
+
+    def test_expired_lease_of_a_cancelled_batch(self):
+        store = InMemoryBatchStore()
+        batch_id = store.create_batch(_documents(2))
+        # Le worker meurt avec le premier document ; le lot est annulé entre-temps
+        assert len(store.claim("dead-worker", lease_seconds=0.05)) == 1
+        assert store.cancel_batch(batch_id)
+        assert store.batch_status(batch_id)["status"] == "processing"
+        time.sleep(0.06)
+
+        assert store.claim("other", lease_seconds=0.05) == []
+        status = store.batch_status(batch_id)
+        assert status["status"] == "cancelled"
+        assert status["counts"]["cancelled"] == 2
+
+    def test_files_are_removed_once_the_batch_is_final(self, tmp_path):
+        store = InMemoryBatchStore()
+        upload_dir = tmp_path / "lot"
+        upload_dir.mkdir()
+        documents = _documents(3)
+        for document in documents:
+            document["file"] = str(upload_dir / document["name"])
+            (upload_dir / document["name"]).write_bytes(b"%PDF")
+        batch_id = store.create_batch(documents)
+        running = store.claim("worker")[0]
+
+        # Lot annulé avec un document en cours : les fichiers restent jusqu'à la fin du lot
+        assert store.cancel_batch(batch_id)
+        assert len(list(upload_dir.iterdir())) == 3
+        assert store.cancel_document(running.id, worker_id="worker")
+        assert store.batch_status(batch_id)["status"] == "cancelled"
+        assert not upload_dir.exists()
+
+    def test_expired_lease_is_reclaimed(self):
+        store = InMemoryBatchStore()
+        batch_id = store.create_batch(_documents(1))
+        # Un worker réclame le document puis "meurt" sans le terminer
+        assert len(store.claim("dead-worker", lease_seconds=0.05)) == 1
+        assert store.claim("other", lease_seconds=0.05) == []
+        time.sleep(0.06)
+
+        worker = BatchWorker(store, StubStages().as_dict(), lease_seconds=0.05)
+        assert worker.run_once() == 1
+        assert store.batch_status(batch_id)["status"] == "completed"
+
+    def test_worker_crashes_exhaust_attempts(self):
+        store = InMemoryBatchStore()
+        batch_id = store.create_batch(_documents(1), max_attempts=3)
+        # Le document fait tomber chaque worker qui le prend (OOM) : chaque bail expiré compte
+        for attempt in range(3):
+            claimed = store.claim(f"worker-{attempt}", lease_seconds=0.01)
+            assert len(claimed) == 1
+            assert claimed[0].attempts == attempt
+            time.sleep(0.02)
+        assert store.claim("worker-3", lease_seconds=0.01) == []
+
+        status = store.batch_status(batch_id)
+        assert status["status"] == "failed"
+        assert status["documents"][0]["attempts"] == 3
+        assert "Bail expiré" in status["documents"][0]["error"]
+
+    def test_slow_worker_cannot_overwrite_the_new_owner(self):
+        store = InMemoryBatchStore()
+        batch_id = store.create_batch(_documents(1))
+        stale = store.claim("slow-worker", lease_seconds=0.01)[0]
+        time.sleep(0.02)
+
+        worker = BatchWorker(store, StubStages().as_dict(), worker_id="new-owner", lease_seconds=0.01)
+        assert worker.run_once() == 1
+        result = store.batch_status(batch_id)["results"][0]["result"]
+
+        # Le worker lent termine après la reprise : ses écritures sont refusées
+        slow = BatchWorker(store, StubStages().as_dict(), worker_id="slow-worker")
+        assert slow.process(stale) == "lost"
+        assert not store.complete(stale.id, {"entries": []}, worker_id="slow-worker")
+        assert store.batch_status(batch_id)["results"][0]["result"] == result
+        assert slow.stats["lease_lost"] == 1
+
+    def test_workers_share_the_batch(self):
+        store = InMemoryBatchStore()
+        batch_id = store.create_batch(_documents(120))
+        stages = StubStages(delay=0.002)
+        stop, threads, pool = _run_workers(store, stages, workers=4)
+        status = _wait_for(store, batch_id)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        assert status["counts"]["completed"] == 120
+        assert sum(worker.stats["completed"] for worker in pool) == 120
+        # Chaque worker a pris sa part, et les étapes ont tourné en parallèle
+        assert all(worker.stats["completed"] > 0 for worker in pool)
+        assert 1 < stages.max_in_flight <= 4
+
+    def test_backoff_is_exponential_and_capped(self):
+        assert compute_backoff(1, base=2, jitter=0) == 2
+        assert compute_backoff(3, base=2, jitter=0) == 8
+        assert compute_backoff(20, base=2, cap=300, jitter=0) == 300
+        assert 1.8 <= compute_backoff(1, base=2, jitter=0.1) <= 2.2
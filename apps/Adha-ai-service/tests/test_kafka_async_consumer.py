@@ -0,0 +1,254 @@
+"""
+Tests du runtime asyncio des consumers (api.kafka.async_consumer) avec le
+broker en mémoire : appels d'I/O simultanés face au pool de
+threads, ordre par clé, limite d'appels LLM simultanés, contre-pression,
+arrêt coopératif et commits.
+"""
+
+import asyncio
+import random
+import threading
+import time
+
+from api.kafka.async_consumer import AsyncKafkaConsumer, BoundedLLM
+from api.kafka.in_memory_broker import InMemoryBroker, TopicPartition
+from api.kafka.load_harness import AsyncStubLLM, StubLLM
+from api.kafka.robust_kafka_client import KafkaConfig, RobustKafkaConsumer
+
+TOPIC = 'adha-ai-events'
+
+
+def _config():
+    config = KafkaConfig()
+    config.poll_timeout_ms = 20
+    config.commit_interval_ms = 10
+    return config
+
+
+def _publish(broker, count, keys):
+    for n in range(count):
+        key = f"user-{n % keys}"
+        broker.produce(TOPIC, {'id': f"msg-{n}", 'data': {'userId': key, 'n': n, 'content': 'Bonjour'}}, key=key)
+
+
+async def _consume(consumer, until, timeout=20):
+    """Fait tourner le consumer jusqu'à ``until()``, puis l'arrête."""
+    task = asyncio.create_task(consumer.run())
+    deadline = time.monotonic() + timeout
+    while not until() and time.monotonic() < deadline:
+        await asyncio.sleep(0.005)
+    consumer.stop()
+    await task
+
+
+def _committed(broker, group_id, partitions):
+    return sum(broker.committed(group_id, TopicPartition(TOPIC, p)) or 0 for p in range(partitions))
+
+
+class TestThroughput:
+    def test_io_bound_handlers_overlap_without_threads(self):
+        messages = 400
+        # Référence : pool de threads de RobustKafkaConsumer, un appel LLM bloquant par message
+        broker = InMemoryBroker(partitions=4)
+        _publish(broker, messages, keys=messages)
+        llm = StubLLM(latency_ms=20)
+        handled = []
+        threaded = RobustKafkaConsumer(_config(), [TOPIC], 'threads', consumer=broker.consumer(TOPIC, group_id='threads'))
+        threaded.register_handler(TOPIC, lambda message: handled.append(llm.create(messages=[])))
+        thread = threading.Thread(target=threaded.start_consuming)
+        thread.start()
+        deadline = time.time() + 30
+        while len(handled) < messages and time.time() < deadline:
+            time.sleep(0.005)
+        threaded.stop()
+        thread.join()
+
+        broker = InMemoryBroker(partitions=4)
+        _publish(broker, messages, keys=messages)
+        bounded = BoundedLLM(AsyncStubLLM(latency_ms=20), limit=200)
+        threads_seen = set()
+        done = []
+        consumer = AsyncKafkaConsumer([TOPIC], 'asyncio', client=broker.async_consumer(TOPIC, group_id='asyncio'),
+                                      config=_config())
+
+        async def handle(message):
+            threads_seen.add(threading.active_count())
+            await bounded.chat.completions.create(model='gpt-4o-mini', messages=[])
+            done.append(message['id'])
+
+        consumer.register_handler(TOPIC, handle)
+        threads_before = threading.active_count()
+        asyncio.run(_consume(consumer, lambda: len(done) == messages))
+
+        assert len(handled) == messages
+        assert len(done) == messages
+        assert threads_seen == {threads_before}
+        # Un appel en vol par thread d'un côté, des centaines de coroutines sur un seul thread de l'autre
+        assert llm.stats['peak_concurrency'] <= threaded.workers
+        assert bounded.stats['peak_in_flight'] > 10 * llm.stats['peak_concurrency'], (
+            bounded.stats, llm.stats)
+        assert _committed(broker, 'asyncio', 4) == messages
+
+
+class TestOrderingAndLimits:
+    def test_messages_of_a_key_stay_ordered(self):
+        broker = InMemoryBroker(partitions=3)
+        _publish(broker, 300, keys=7)
+        seen = {}
+        rng = random.Random(3)
+
+        async def handle(message):
+            await asyncio.sleep(rng.random() / 500)
+            seen.setdefault(message['data']['user_id'], []).append(message['data']['n'])
+
+        consumer = AsyncKafkaConsumer([TOPIC], 'ordered', client=broker.async_consumer(TOPIC, group_id='ordered'),
+                                      config=_config())
+        consumer.register_handler(TOPIC, handle)
+        asyncio.run(_consume(consumer, lambda: sum(map(len, seen.values())) == 300))
+
+        assert len(seen) == 7
+        for key, numbers in seen.items():
+            assert numbers == sorted(numbers)
+            assert numbers == [n for n in range(300) if f"user-{n % 7}" == key]
+
+    def test_llm_concurrency_is_bounded(self):
+        broker = InMemoryBroker(partitions=2)
+        _publish(broker, 200, keys=200)
+        bounded = BoundedLLM(AsyncStubLLM(latency_ms=10), limit=8)
+        done = []
+
+        async def handle(message):
+            await bounded.chat.completions.create(messages=[{'role': 'user', 'content': 'Bonjour'}])
+            done.append(message)
+
+        consumer = AsyncKafkaConsumer([TOPIC], 'bounded', client=broker.async_consumer(TOPIC, group_id='bounded'),
+                                      config=_config())
+        consumer.register_handler(TOPIC, handle)
+        asyncio.run(_consume(consumer, lambda: len(done) == 200))
+
+        assert len(done) == 200
+        assert bounded.stats['peak_in_flight'] == 8
+        assert bounded.stats['waited'] > 0
+        assert bounded.client.stats['peak_concurrency'] == 8
+
+    def test_in_flight_messages_are_bounded_by_pausing_partitions(self):
+        broker = InMemoryBroker(partitions=2)
+        _publish(broker, 300, keys=300)
+        config = _config()
+        config.max_poll_records = 10
+        peak = []
+        done = []
+        consumer = AsyncKafkaConsumer([TOPIC], 'paused', client=broker.async_consumer(TOPIC, group_id='paused'),
+                                      config=config, max_in_flight=40, resume_in_flight=10)
+
+        async def handle(message):
+            peak.append(consumer.in_flight)
+            await asyncio.sleep(0.005)
+            done.append(message)
+
+        consumer.register_handler(TOPIC, handle)
+        asyncio.run(_consume(consumer, lambda: len(done) == 300))
+
+        assert len(done) == 300
+        assert max(peak) <= 40 + config.max_poll_records
+        assert consumer.flow.stats['pauses'] > 0
+
+
+class TestShutdown:
+    def test_stop_drains_in_flight_messages_and_commits(self):
+        broker = InMemoryBroker(partitions=2)
+        _publish(broker, 100, keys=100)
+        started, done = [], []
+
+        async def handle(message):
+            started.append(message)
+            await asyncio.sleep(0.05)
+            done.append(message)
+
+        consumer = AsyncKafkaConsumer([TOPIC], 'drain', client=broker.async_consumer(TOPIC, group_id='drain'),
+                                      config=_config())
+        consumer.register_handler(TOPIC, handle)
+        asyncio.run(_consume(consumer, lambda: len(started) >= 50))
+
+        # Messages commencés terminés avant l'arrêt, offsets commités
+        assert len(done) == len(started) >= 50
+        assert _committed(broker, 'drain', 2) == len(done)
+        assert consumer.client.consumer.closed
+
+    def test_drain_timeout_leaves_unfinished_messages_for_redelivery(self):
+        broker = InMemoryBroker(partitions=1)
+        _publish(broker, 10, keys=1)
+        done = []
+
+        async def slow(message):
+            await asyncio.sleep(0.02 if message['data']['n'] < 3 else 10)
+            done.append(message['data']['n'])
+
+        consumer = AsyncKafkaConsumer([TOPIC], 'timeout', client=broker.async_consumer(TOPIC, group_id='timeout'),
+                                      config=_config(), drain_timeout=0.1)
+        consumer.register_handler(TOPIC, slow)
+        asyncio.run(_consume(consumer, lambda: len(done) == 3))
+        assert done == [0, 1, 2]
+        assert consumer.stats['cancelled'] == 1
+        assert _committed(broker, 'timeout', 1) == 3
+
+        # Le consumer suivant du groupe reprend au premier message non terminé
+        redelivered = []
+        consumer = AsyncKafkaConsumer([TOPIC], 'timeout', client=broker.async_consumer(TOPIC, group_id='timeout'),
+                                      config=_config())
+        consumer.register_handler(TOPIC, lambda message: redelivered.append(message['data']['n']))
+        asyncio.run(_consume(consumer, lambda: len(redelivered) == 7))
+        assert redelivered == list(range(3, 10))
+
+    def test_failed_messages_go_to_the_error_handler_and_are_committed(self):
+        broker = InMemoryBroker(partitions=1)
+        _publish(broker, 20, keys=4)
+        failures = []
+
+        async def handle(message):
+            if message['data']['n'] % 5 == 0:
+                raise ValueError('LLM API unavailable')
+
+        async def on_error(error, record):
+            failures.append((str(error), record.value['id']))
+
+        consumer = AsyncKafkaConsumer([TOPIC], 'errors', client=broker.async_consumer(TOPIC, group_id='errors'),
+                                      config=_config())
+        consumer.register_handler(TOPIC, handle)
+        consumer.register_error_handler(on_error)
+        asyncio.run(_consume(consumer, lambda: consumer.tracker.completed == 20))
+
+        assert failures == [('LLM API unavailable', f"msg-{n}") for n in range(0, 20, 5)]
+        assert _committed(broker, 'errors', 1) == 20
+        topic = consumer.metrics.snapshot()['topics'][TOPIC]
+        assert (topic['processed'], topic['failed']) == (16, 4)
+
+
+class TestRebalance:
+    def test_revoked_partition_is_drained_committed_and_forgotten(self):
+        broker = InMemoryBroker(partitions=2)
+        _publish(broker, 40, keys=8)
+        client = broker.async_consumer(TOPIC, group_id='rebalance')
+        tp0, tp1 = TopicPartition(TOPIC, 0), TopicPartition(TOPIC, 1)
+        partitions = {record.value['id']: record.partition for record in broker.records(TOPIC)}
+        handled = {0: [], 1: []}
+        revoked_at = {}
+
+        async def handle(message):
+            await asyncio.sleep(0.005)
+            handled[partitions[message['id']]].append(message['id'])
+            if len(handled[0]) + len(handled[1]) == 5 and not revoked_at:
+                # Rebalance au prochain getmany, messages de la partition 0 encore en cours
+                revoked_at['in_flight'] = consumer.tracker.in_flight(tp0)
+                client.consumer.revoke([tp0])
+
+        consumer = AsyncKafkaConsumer([TOPIC], 'rebalance', client=client, config=_config())
+        consumer.register_handler(TOPIC, handle)
+        asyncio.run(_consume(consumer, lambda: tp0 not in client.assignment() and consumer.in_flight == 0))
+
+        assert revoked_at['in_flight'] > 0
+        # Les messages reçus de la partition 0 ont été terminés et commités avant la révocation
+        assert broker.committed('rebalance', tp0) == len(handled[0])
+        assert tp0 not in consumer._pending
+        assert consumer.tracker.in_flight(tp0) == 0
+        assert broker.committed('rebalance', tp1) == len(handled[1]) == list(partitions.values()).count(1)
@@ -0,0 +1,203 @@
+"""
+Tests du producer non bloquant (api.kafka.async_producer) : envoi sans attente de
+l'acquittement, callbacks de livraison, spool durable des échecs et renvoi.
+"""
+
+import queue
+import threading
+import time
+
+from api.kafka.async_producer import AsyncKafkaProducer
+from api.kafka.delivery_spool import DeliverySpool
+from api.kafka.robust_kafka_client import KafkaConfig, RobustKafkaProducer
+
+BROKER_LATENCY = 0.002
+
+
+class StubFuture:
+    """Future du client Kafka (add_callback / add_errback / get / succeeded)."""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._callbacks = []
+        self._errbacks = []
+        self.value = None
+        self.exception = None
+        self._lock = threading.Lock()
+
+    def resolve(self, value=None, exception=None):
+        with self._lock:
+            self.value, self.exception = value, exception
+            self._done.set()
+            callbacks = self._errbacks if exception else self._callbacks
+        for fn, args in callbacks:
+            fn(*args, exception if exception else value)
+
+    def add_callback(self, fn, *args):
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append((fn, args))
+                return self
+        if not self.exception:
+            fn(*args, self.value)
+        return self
+
+    def add_errback(self, fn, *args):
+        with self._lock:
+            if not self._done.is_set():
+                self._errbacks.append((fn, args))
+                return self
+        if self.exception:
+            fn(*args, self.exception)
+        return self
+
+    def get(self, timeout=None):
+        self._done.wait(timeout)
+        if self.exception:
+            raise self.exception
+        return self.value
+
+    def succeeded(self):
+        return self._done.is_set() and self.exception is None
+
+
+class StubKafkaProducer:
+    """
+    Client Kafka simulé : acquittement après BROKER_LATENCY par un thread d'I/O,
+    retenu tant que ``acks`` n'est pas levé.
+    """
+
+    def __init__(self, failing=False, refuse=False):
+        self.failing = failing
+        self.refuse = refuse
+        self.sent = []
+        self.acks = threading.Event()
+        self.acks.set()
+        self._pending = queue.Queue()
+        self._unresolved = []
+        threading.Thread(target=self._io_loop, daemon=True).start()
+
+    def send(self, topic, value=None, key=None, headers=None):
+        if self.refuse:
+            raise TimeoutError('Failed to update metadata after 1.0 secs')
+        future = StubFuture()
+        self._unresolved.append(future)
+        self._pending.put((future, topic, value))
+        return future
+
+    def _io_loop(self):
+        while True:
+            future, topic, value = self._pending.get()
+            self.acks.wait()
+            time.sleep(BROKER_LATENCY)
+            if self.failing:
+                future.resolve(exception=ConnectionError('NotLeaderForPartitionError'))
+            else:
+                self.sent.append((topic, value))
+                future.resolve(value=(topic, len(self.sent)))
+            self._unresolved.remove(future)
+
+    def flush(self, timeout=None):
+        # Comme KafkaProducer.flush : rend la main une fois les callbacks exécutés
+        while self._unresolved:
+            time.sleep(0.001)
+
+    def close(self, timeout=None):
+        pass
+
+
+def _config(tmp_path):
+    config = KafkaConfig()
+    config.producer_spool_path = str(tmp_path / 'spool.sqlite3')
+    return config
+
+
+def _producer(tmp_path, stub):
+    config = _config(tmp_path)
+    return AsyncKafkaProducer(config, producer=stub, spool=DeliverySpool(config.producer_spool_path))
+
+
+class TestAsyncKafkaProducer:
+    def test_send_does_not_wait_for_the_ack(self, tmp_path):
+        messages = 100
+        stub = StubKafkaProducer()
+        stub.acks.clear()
+        producer = _producer(tmp_path, stub)
+        # Aucun acquittement tant que le broker est retenu : send rend pourtant la main
+        for i in range(messages):
+            producer.send('adha-ai-events', {'i': i})
+        assert producer.stats['delivered'] == 0
+        assert stub.sent == []
+
+        stub.acks.set()
+        producer.flush()
+        assert producer.stats['delivered'] == messages
+        assert len(producer.spool) == 0
+
+    def test_failed_deliveries_are_spooled_durably_and_replayed(self, tmp_path):
+        failing = StubKafkaProducer(failing=True)
+        producer = _producer(tmp_path, failing)
+        failures = []
+        producer.on_failure = failures.append
+        for i in range(5):
+            assert producer.send('accounting.journal.entry', {'i': i}, key=f"company-{i % 2}") is not None
+        producer.flush()
+        assert producer.stats['failed'] == 5
+        assert len(failures) == 5
+
+        # Le spool survit au processus : une nouvelle instance relit le même fichier
+        spool = DeliverySpool(str(tmp_path / 'spool.sqlite3'))
+        assert [(topic, value, key) for _, topic, value, key, _ in spool.pending()] == [
+            ('accounting.journal.entry', {'i': i}, f"company-{i % 2}") for i in range(5)
+        ]
+
+        recovered = StubKafkaProducer()
+        replayer = AsyncKafkaProducer(_config(tmp_path), producer=recovered, spool=spool)
+        assert replayer.replay_spool() == 5
+        assert [value for _, value in recovered.sent] == [{'i': i} for i in range(5)]
+        assert len(spool) == 0
+
+    def test_spool_is_replayed_in_the_background(self, tmp_path):
+        producer = _producer(tmp_path, StubKafkaProducer(failing=True))
+        for i in range(3):
+            producer.send('accounting.journal.entry', {'i': i})
+        producer.flush()
+        assert len(producer.spool) == 3
+
+        # Broker revenu, mais circuit encore ouvert : rien n'est renvoyé
+        recovered = producer._producer = StubKafkaProducer()
+        circuit_closed = threading.Event()
+        producer.start_replay(0.02, replay=lambda: producer.replay_spool() if circuit_closed.is_set() else 0)
+        time.sleep(0.1)
+        assert recovered.sent == []
+
+        circuit_closed.set()
+        deadline = time.time() + 5
+        while len(producer.spool) and time.time() < deadline:
+            time.sleep(0.01)
+        producer.close()
+        assert [value for _, value in recovered.sent] == [{'i': i} for i in range(3)]
+        assert len(producer.spool) == 0
+        assert producer.stats['replayed'] == 3
+
+    def test_refused_send_is_spooled_without_raising(self, tmp_path):
+        producer = _producer(tmp_path, StubKafkaProducer(refuse=True))
+        assert producer.send('token.usage', {'tokens': 10}, headers=[('x-source', b'chat')]) is None
+        [(_, topic, value, _, headers)] = producer.spool.pending()
+        assert (topic, value, headers) == ('token.usage', {'tokens': 10}, [('x-source', b'chat')])
+        assert producer.get_stats()['spool_size'] == 1
+
+
+class TestRobustKafkaProducer:
+    def test_open_circuit_spools_without_sending(self, tmp_path):
+        stub = StubKafkaProducer(failing=True)
+        robust = RobustKafkaProducer(_config(tmp_path), producer=_producer(tmp_path, stub))
+        for i in range(5):
+            assert robust.publish('adha-ai-events', {'id': str(i), 'metadata': {}})
+        robust.producer.flush()
+        assert robust.circuit_breaker.is_open()
+
+        calls = stub._pending.qsize()
+        assert robust.publish('adha-ai-events', {'id': 'late', 'metadata': {}}) is False
+        assert stub._pending.qsize() == calls
+        assert len(robust.producer.spool) == 6
@@ -0,0 +1,147 @@
+"""
+Tests de la contre-pression des consumers (api.kafka.flow_control) avec le
+broker en mémoire : handler lent simulant la latence LLM, partitions en pause
+au-delà du seuil haut, boucle de poll jamais bloquée (pas d'exclusion du
+groupe), travail en cours borné.
+"""
+
+import threading
+import time
+
+from api.kafka.flow_control import FlowController
+from api.kafka.in_memory_broker import InMemoryBroker, TopicPartition
+from api.kafka.robust_kafka_client import KafkaConfig, RobustKafkaConsumer
+
+TOPIC = 'commerce.operation.created'
+MAX_POLL_INTERVAL_MS = 200
+
+
+class SlowHandler:
+    """Handler à latence fixe (appel LLM simulé)."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.ids = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, message):
+        time.sleep(self.delay)
+        with self._lock:
+            self.ids.add(message['id'])
+
+    @property
+    def count(self):
+        return len(self.ids)
+
+
+def _publish(broker, total, companies):
+    for sequence in range(total):
+        company = f"company-{sequence % companies}"
+        broker.produce(TOPIC, {'id': f"msg-{sequence}", 'data': {'companyId': company}}, key=company)
+
+
+def _soak(broker, handler, total):
+    config = KafkaConfig()
+    config.poll_timeout_ms = 50
+    config.max_poll_records = 20
+    config.max_in_flight = 60
+    config.resume_in_flight = 20
+    kafka_consumer = broker.consumer(TOPIC, group_id='soak', max_poll_records=config.max_poll_records,
+                                     max_poll_interval_ms=MAX_POLL_INTERVAL_MS)
+    consumer = RobustKafkaConsumer(config, [TOPIC], 'soak', workers=4, queue_size=20, consumer=kafka_consumer)
+    consumer.register_handler(TOPIC, handler)
+    thread = threading.Thread(target=consumer.start_consuming)
+    thread.start()
+    deadline = time.time() + 30
+    while handler.count < total and time.time() < deadline:
+        time.sleep(0.01)
+    consumer.stop()
+    thread.join()
+    return consumer, kafka_consumer, config
+
+
+class TestBackpressureSoak:
+    def test_slow_handlers_pause_partitions_without_rebalance(self):
+        broker = InMemoryBroker(partitions=3)
+        _publish(broker, 600, companies=20)
+        handler = SlowHandler(delay=0.004)
+
+        consumer, kafka_consumer, config = _soak(broker, handler, 600)
+
+        stats = consumer.flows['default'].snapshot()
+        assert handler.count == 600
+        assert stats['pauses'] > 0
+        # Au plus un poll reçu après le franchissement du seuil haut
+        assert stats['peak_in_flight'] <= config.max_in_flight + config.max_poll_records
+        # Le broker compte un rebalance pour tout écart entre deux polls au-delà de MAX_POLL_INTERVAL_MS
+        assert kafka_consumer.rebalances == 0
+        assert sum(broker.committed('soak', TopicPartition(TOPIC, p)) or 0 for p in range(3)) == 600
+
+    def test_hot_key_pauses_on_its_worker_queue(self):
+        # Une seule société : une seule file de worker se remplit, bien avant le seuil global
+        broker = InMemoryBroker(partitions=1)
+        _publish(broker, 150, companies=1)
+        handler = SlowHandler(delay=0.003)
+
+        consumer, kafka_consumer, config = _soak(broker, handler, 150)
+
+        stats = consumer.flows['default'].snapshot()
+        assert handler.count == 150
+        assert stats['pauses'] > 0
+        assert stats['peak_in_flight'] <= 20 + config.max_poll_records
+        assert kafka_consumer.rebalances == 0
+
+
+class FakeConsumer:
+    def __init__(self, partitions):
+        self.assigned = set(partitions)
+        self.paused_partitions = set()
+
+    def assignment(self):
+        return set(self.assigned)
+
+    def paused(self):
+        return set(self.paused_partitions)
+
+    def pause(self, *partitions):
+        self.paused_partitions.update(partitions)
+
+    def resume(self, *partitions):
+        self.paused_partitions.difference_update(partitions)
+
+
+class TestFlowController:
+    def test_watermarks_with_hysteresis(self):
+        consumer = FakeConsumer({TopicPartition(TOPIC, 0), TopicPartition(TOPIC, 1)})
+        flow = FlowController(consumer, high_watermark=100, low_watermark=20)
+
+        assert not flow.update(99)
+        assert flow.update(100)
+        assert consumer.paused_partitions == consumer.assigned
+        # Entre les deux seuils : toujours en pause
+        assert flow.update(50)
+        assert not flow.update(20)
+        assert consumer.paused_partitions == set()
+        assert flow.stats['pauses'] == flow.stats['resumes'] == 1
+
+    def test_retry_partitions_stay_paused_and_new_assignments_are_paused(self):
+        delayed, other = TopicPartition(TOPIC, 0), TopicPartition(TOPIC, 1)
+        consumer = FakeConsumer({delayed, other})
+        flow = FlowController(consumer, high_watermark=10, low_watermark=2, queue_high_watermark=4)
+
+        assert flow.update(0, queue_depth=4)
+        # Partition reçue pendant la pause (rebalance)
+        assigned = TopicPartition(TOPIC, 2)
+        consumer.assigned.add(assigned)
+        assert flow.update(5, queue_depth=3)
+        assert assigned in consumer.paused_partitions
+        # File sous la moitié du seuil : reprise, sauf la partition qui attend un retry
+        assert not flow.update(2, queue_depth=2, held=lambda: {delayed})
+        assert consumer.paused_partitions == {delayed}
+
+    def test_low_watermark_must_be_below_high(self):
+        try:
+            FlowController(FakeConsumer(()), high_watermark=10, low_watermark=10)
+        except ValueError:
+            return
+        raise AssertionError('ValueError expected')
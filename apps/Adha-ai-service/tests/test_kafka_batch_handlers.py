@@ -0,0 +1,147 @@
+"""
+Tests des handlers par lot de RobustKafkaConsumer (register_batch_handler) avec
+le broker en mémoire, et allers-retours par message contre par lot.
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+from api.kafka.in_memory_broker import InMemoryBroker
+from api.kafka.robust_kafka_client import KafkaConfig, RobustKafkaConsumer
+
+TOPIC = 'commerce.operation.created'
+ROUND_TRIP = 0.002  # Transaction base de données ou flush du producer
+
+
+class StubBackend:
+    """Base de données et producer simulés : chaque aller-retour coûte ROUND_TRIP."""
+
+    def __init__(self):
+        self.rows = []
+        self.published = []
+        self.transactions = 0
+        self.flushes = 0
+        self._lock = threading.Lock()
+
+    def bulk_insert(self, rows):
+        time.sleep(ROUND_TRIP)
+        with self._lock:
+            self.rows.extend(rows)
+            self.transactions += 1
+
+    def publish(self, entries):
+        time.sleep(ROUND_TRIP)
+        with self._lock:
+            self.published.extend(entries)
+            self.flushes += 1
+
+    @property
+    def count(self):
+        return len(self.published)
+
+
+def _publish(broker, companies=8, per_company=50):
+    for sequence in range(per_company):
+        for c in range(companies):
+            company = f"company-{c}"
+            broker.produce(TOPIC, {
+                'id': f"{company}-{sequence}",
+                'data': {'companyId': company, 'sequence': sequence, 'amountCdf': 1000},
+            }, key=company)
+    return companies * per_company
+
+
+def _run(broker, register, backend, total, group_id, workers=4, timeout=30):
+    config = KafkaConfig()
+    config.poll_timeout_ms = 10
+    consumer = RobustKafkaConsumer(config, [TOPIC], group_id, workers=workers,
+                                   consumer=broker.consumer(TOPIC, group_id=group_id))
+    register(consumer)
+    thread = threading.Thread(target=consumer.start_consuming)
+    thread.start()
+    deadline = time.time() + timeout
+    while backend.count < total and time.time() < deadline:
+        time.sleep(0.002)
+    consumer.stop()
+    thread.join()
+    return consumer
+
+
+class TestBatchHandlers:
+    def test_batch_handler_keeps_per_company_order_and_commits(self):
+        broker = InMemoryBroker(partitions=3)
+        total = _publish(broker, companies=6, per_company=30)
+        backend = StubBackend()
+        sizes = []
+
+        def handle_batch(messages):
+            sizes.append(len(messages))
+            backend.publish([(m['data']['company_id'], m['data']['sequence']) for m in messages])
+
+        _run(broker, lambda c: c.register_batch_handler(TOPIC, handle_batch), backend, total, 'batch-order')
+
+        assert backend.count == total
+        sequences = defaultdict(list)
+        for company, sequence in backend.published:
+            sequences[company].append(sequence)
+        assert all(s == list(range(30)) for s in sequences.values())
+        # Les messages arrivent effectivement groupés
+        assert max(sizes) > 1
+        for tp, end in broker.end_offsets(TOPIC).items():
+            assert broker.committed('batch-order', tp) == end
+
+    def test_batch_handler_failure_reports_each_record(self):
+        broker = InMemoryBroker(partitions=1)
+        total = _publish(broker, companies=2, per_company=5)
+        failed = []
+        done = threading.Event()
+
+        def handle_batch(messages):
+            raise RuntimeError('database unavailable')
+
+        def on_error(error, record):
+            failed.append(record.offset)
+            if len(failed) == total:
+                done.set()
+
+        config = KafkaConfig()
+        config.poll_timeout_ms = 10
+        consumer = RobustKafkaConsumer(config, [TOPIC], 'batch-errors', workers=2,
+                                       consumer=broker.consumer(TOPIC, group_id='batch-errors'))
+        consumer.register_batch_handler(TOPIC, handle_batch)
+        consumer.register_error_handler(on_error)
+        thread = threading.Thread(target=consumer.start_consuming)
+        thread.start()
+        assert done.wait(10)
+        consumer.stop()
+        thread.join()
+        assert sorted(failed) == list(range(total))
+
+    def test_batch_path_groups_round_trips(self):
+        """Un aller-retour base + producer par message contre un par lot."""
+        backends = {}
+        for mode in ('per_record', 'batch'):
+            broker = InMemoryBroker(partitions=3)
+            total = _publish(broker)
+            backend = backends[mode] = StubBackend()
+
+            def handle(message, backend=backend):
+                backend.bulk_insert([message['id']])
+                backend.publish([message['id']])
+
+            def handle_batch(messages, backend=backend):
+                ids = [message['id'] for message in messages]
+                backend.bulk_insert(ids)
+                backend.publish(ids)
+
+            if mode == 'batch':
+                register = lambda c: c.register_batch_handler(TOPIC, handle_batch)
+            else:
+                register = lambda c: c.register_handler(TOPIC, handle)
+            _run(broker, register, backend, total, mode)
+            assert backend.count == total
+            assert sorted(backend.rows) == sorted(backend.published)
+
+        assert backends['per_record'].flushes == total
+        assert backends['batch'].flushes < backends['per_record'].flushes / 5
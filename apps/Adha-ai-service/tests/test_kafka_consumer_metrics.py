@@ -0,0 +1,169 @@
+"""
+Tests des métriques des consumers (api.kafka.consumer_metrics) avec le broker
+en mémoire : lag relevé en arrière-plan, débit et latence par handler,
+compteurs de retries et de DLQ.
+"""
+
+import threading
+import time
+from collections import Counter
+
+from api.kafka import consumer_metrics
+from api.kafka.consumer_metrics import ConsumerMetrics, LagMonitor
+from api.kafka.in_memory_broker import InMemoryBroker, TopicPartition
+from api.kafka.retry_topics import RetryScheduler
+from api.kafka.robust_kafka_client import KafkaConfig, RobustKafkaConsumer
+
+TOPIC = 'commerce.operation.created'
+
+
+class CountingClient:
+    """Client de relevé des offsets qui compte ses appels."""
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = 0
+
+    def partitions_for_topic(self, topic):
+        return self.client.partitions_for_topic(topic)
+
+    def end_offsets(self, partitions):
+        self.calls += 1
+        return self.client.end_offsets(partitions)
+
+    def committed(self, tp):
+        return self.client.committed(tp)
+
+
+class FakeMetric:
+    """Compteur prometheus_client simulé (labels().inc())."""
+
+    def __init__(self):
+        self.values = Counter()
+
+    def labels(self, **labels):
+        key = tuple(sorted(labels.items()))
+        metric = self
+
+        class Child:
+            def inc(self, amount=1):
+                metric.values[key] += amount
+
+        return Child()
+
+
+def _publish(broker, count):
+    for i in range(count):
+        broker.produce(TOPIC, {'id': f"op-{i}", 'data': {'companyId': f"company-{i % 5}"}}, key=f"company-{i % 5}")
+
+
+def _consumer(broker, group_id, lag_client):
+    config = KafkaConfig()
+    config.poll_timeout_ms = 10
+    config.commit_interval_ms = 10
+    config.lag_interval_s = 0.02
+    return RobustKafkaConsumer(config, [TOPIC], group_id, workers=2,
+                               consumer=broker.consumer(TOPIC, group_id=group_id),
+                               lag_client_factory=lambda: lag_client)
+
+
+class TestConsumerMetrics:
+    def test_lag_is_polled_in_the_background(self):
+        broker = InMemoryBroker(partitions=3)
+        _publish(broker, 300)
+        lag_client = CountingClient(broker.consumer(group_id='metrics'))
+        consumer = _consumer(broker, 'metrics', lag_client)
+        lag_seen = []
+
+        def handle(message):
+            lag_seen.append(consumer.metrics.snapshot()['total_lag'])
+            time.sleep(0.001)
+
+        consumer.register_handler(TOPIC, handle)
+        thread = threading.Thread(target=consumer.start_consuming)
+        thread.start()
+        deadline = time.time() + 10
+        while consumer.metrics.snapshot()['topics'].get(TOPIC, {}).get('processed', 0) < 300 \
+                and time.time() < deadline:
+            time.sleep(0.01)
+        # Offsets commités : le relevé suivant voit un lag nul
+        while consumer.metrics.snapshot()['total_lag'] and time.time() < deadline:
+            time.sleep(0.01)
+        consumer.stop()
+        thread.join()
+
+        snapshot = consumer.metrics.snapshot()
+        assert max(lag_seen) > 0
+        assert snapshot['total_lag'] == 0
+        assert set(snapshot['lag']) == {f"{TOPIC}:{p}" for p in range(3)}
+        # Un relevé par intervalle, pas par message
+        assert 0 < lag_client.calls < 300 / 5
+        assert consumer.lag_monitor is None
+
+    def test_throughput_and_handler_latency(self):
+        broker = InMemoryBroker(partitions=2)
+        _publish(broker, 100)
+        consumer = _consumer(broker, 'batches', CountingClient(broker.consumer(group_id='batches')))
+
+        def handle_batch(messages):
+            time.sleep(0.002)
+            if any(message['id'] == 'op-0' for message in messages):
+                raise ValueError('poison message')
+
+        consumer.register_batch_handler(TOPIC, handle_batch)
+        thread = threading.Thread(target=consumer.start_consuming)
+        thread.start()
+        deadline = time.time() + 10
+        while sum(consumer.metrics.snapshot()['topics'].get(TOPIC, {'processed': 0, 'failed': 0}).values()) < 100 \
+                and time.time() < deadline:
+            time.sleep(0.01)
+        consumer.stop()
+        thread.join()
+
+        snapshot = consumer.metrics.snapshot()
+        topic = snapshot['topics'][TOPIC]
+        assert topic['processed'] + topic['failed'] == 100
+        assert 0 < topic['failed'] < 100
+        assert topic['records_per_sec'] > 0
+        [(name, latency)] = snapshot['handlers'].items()
+        assert name.endswith('handle_batch')
+        assert 2 <= latency['p50_ms'] <= latency['p99_ms']
+
+
+class TestPrometheusExport:
+    def test_retry_and_dlq_counters(self, monkeypatch):
+        retried, dead = FakeMetric(), FakeMetric()
+        monkeypatch.setattr(consumer_metrics, 'RETRIED_MESSAGES', retried)
+        monkeypatch.setattr(consumer_metrics, 'DEAD_LETTERED_MESSAGES', dead)
+        broker = InMemoryBroker(partitions=1)
+        scheduler = RetryScheduler(config=KafkaConfig(), producer=broker.producer(), delays=[5, 60], max_retries=2)
+        message = {'id': 'op-1', 'metadata': {'kafka_topic': TOPIC}}
+
+        scheduler.schedule(message, 'LLM API unavailable')
+        scheduler.schedule({'id': 'op-1', 'metadata': {'kafka_topic': TOPIC, 'retry_count': 1}}, 'timeout')
+        scheduler.schedule({'id': 'op-1', 'metadata': {'kafka_topic': TOPIC, 'retry_count': 2}}, 'timeout')
+
+        assert retried.values == {
+            (('tier', '5s'), ('topic', TOPIC)): 1, (('tier', '1m'), ('topic', TOPIC)): 1,
+        }
+        assert dead.values == {(('reason', 'max_retries_exceeded'), ('topic', TOPIC)): 1}
+
+    def test_lag_gauge_per_partition(self, monkeypatch):
+        gauge = {}
+
+        class FakeGauge:
+            def labels(self, **labels):
+                return type('Child', (), {'set': lambda _, value: gauge.__setitem__(
+                    (labels['group'], labels['topic'], labels['partition']), value)})()
+
+        monkeypatch.setattr(consumer_metrics, 'CONSUMER_LAG', FakeGauge())
+        broker = InMemoryBroker(partitions=2)
+        _publish(broker, 10)
+        broker.commit('lagging', {TopicPartition(TOPIC, 0): 1})
+        monitor = LagMonitor(ConsumerMetrics('lagging'), [TOPIC], lambda: broker.consumer(group_id='lagging'))
+
+        lag = monitor.poll()
+        ends = broker.end_offsets(TOPIC)
+        assert lag == {TopicPartition(TOPIC, 0): ends[TopicPartition(TOPIC, 0)] - 1,
+                       TopicPartition(TOPIC, 1): ends[TopicPartition(TOPIC, 1)]}
+        assert gauge == {('lagging', TOPIC, str(tp.partition)): value for tp, value in lag.items()}
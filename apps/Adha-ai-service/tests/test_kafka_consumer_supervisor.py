@@ -0,0 +1,182 @@
+"""
+Tests du superviseur de processus consumers (api.kafka.consumer_supervisor) :
+redémarrage avec délai croissant, drain à SIGTERM, redémarrage d'une boucle
+de poll bloquée, agrégation des états et handlers CPU en parallèle.
+"""
+
+import os
+import threading
+import time
+
+import pytest
+
+from api.kafka.consumer_supervisor import ConsumerGroup, ConsumerSupervisor, merge_health
+
+EVENTS_ENV = 'SUPERVISOR_TEST_EVENTS'
+
+
+def _record(event):
+    with open(os.environ[EVENTS_ENV], 'a') as events:
+        events.write(f"{event} {os.getpid()} {time.time()}\n")
+
+
+def _events(path, event):
+    if not path.exists():
+        return []
+    return [line.split() for line in path.read_text().splitlines() if line.startswith(f"{event} ")]
+
+
+class CrashingConsumer:
+    """Consumer dont la boucle s'arrête aussitôt (plantage)."""
+
+    def start_consuming(self):
+        _record('start')
+        raise RuntimeError('handler crashed')
+
+    def stop(self):
+        pass
+
+
+class DrainingConsumer:
+    """Consumer qui tourne jusqu'à stop() puis note le drain."""
+
+    def __init__(self):
+        self.stopped = threading.Event()
+
+    def start_consuming(self):
+        _record('start')
+        while not self.stopped.wait(0.01):
+            pass
+        _record('drained')
+
+    def stop(self):
+        self.stopped.set()
+
+    def health_check(self):
+        return {'status': 'healthy', 'last_poll_at': time.time(), 'processed': 1}
+
+
+class StuckConsumer(DrainingConsumer):
+    """Boucle de poll bloquée : son dernier tour est ancien."""
+
+    def health_check(self):
+        return {'status': 'healthy', 'last_poll_at': time.time() - 3600}
+
+
+CPU_ITERATIONS = 3_000_000
+
+
+def _burn():
+    total = 0
+    for n in range(CPU_ITERATIONS):
+        total += n * n
+    return total
+
+
+class CpuConsumer(DrainingConsumer):
+    """Handler gourmand en CPU (extraction, embeddings) : une unité de travail puis attente."""
+
+    def start_consuming(self):
+        _record('start')
+        _burn()
+        _record('done')
+        while not self.stopped.wait(0.01):
+            pass
+
+
+def _group(name, consumer, processes=1):
+    return ConsumerGroup(name, f"{__name__}:{consumer}", run='start_consuming', processes=processes)
+
+
+def _supervise(supervisor, until, timeout=10):
+    deadline = time.time() + timeout
+    while not until() and time.time() < deadline:
+        supervisor.check()
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def events(tmp_path, monkeypatch):
+    path = tmp_path / 'events'
+    monkeypatch.setenv(EVENTS_ENV, str(path))
+    return path
+
+
+class TestConsumerSupervisor:
+    def test_crashed_process_restarts_with_growing_delay(self, events):
+        supervisor = ConsumerSupervisor([_group('crashing', 'CrashingConsumer')],
+                                        report_interval=0.05, restart_delay=0.1, max_restart_delay=1)
+        supervisor.start()
+        try:
+            _supervise(supervisor, lambda: len(_events(events, 'start')) >= 4)
+        finally:
+            supervisor.shutdown()
+
+        starts = [float(at) for _, _, at in _events(events, 'start')]
+        gaps = [later - earlier for earlier, later in zip(starts, starts[1:])]
+        assert len(starts) >= 4
+        assert gaps[0] >= 0.1 and gaps[1] >= 0.2 and gaps[2] >= 0.4
+        assert supervisor.slots[0].process.exitcode == 1
+        assert supervisor.status()['crashing']['processes'][0]['restarts'] >= 3
+
+    def test_sigterm_drains_every_process(self, events, monkeypatch):
+        monkeypatch.setenv('CONSUMER_PROCESSES_DRAINING', '3')
+        supervisor = ConsumerSupervisor([_group('draining', 'DrainingConsumer')], report_interval=0.05)
+        supervisor.start()
+        _supervise(supervisor, lambda: len(_events(events, 'start')) == 3)
+        _supervise(supervisor, lambda: len([slot for slot in supervisor.slots if slot.health]) == 3)
+        status = supervisor.status()['draining']
+        supervisor.shutdown()
+
+        assert status['alive'] == 3
+        assert status['health']['processed'] == 3
+        pids = {slot.process.pid for slot in supervisor.slots}
+        assert {int(pid) for _, pid, _ in _events(events, 'drained')} == pids
+        assert [slot.process.exitcode for slot in supervisor.slots] == [0, 0, 0]
+        # Arrêt demandé : aucun redémarrage
+        supervisor.check()
+        assert not any(slot.alive() for slot in supervisor.slots)
+
+    def test_stuck_poll_loop_is_restarted(self, events):
+        supervisor = ConsumerSupervisor([_group('stuck', 'StuckConsumer')], health_timeout=0.5,
+                                        report_interval=0.05, restart_delay=0.05)
+        supervisor.start()
+        try:
+            _supervise(supervisor, lambda: len(_events(events, 'start')) >= 2)
+        finally:
+            supervisor.shutdown()
+
+        assert len(_events(events, 'start')) >= 2
+        # Le processus bloqué a été drainé avant son remplacement
+        assert len(_events(events, 'drained')) >= 1
+
+    @pytest.mark.skipif((os.cpu_count() or 1) < 2, reason='needs at least two CPU cores')
+    def test_cpu_bound_handlers_run_in_parallel_processes(self, events):
+        supervisor = ConsumerSupervisor([_group('cpu', 'CpuConsumer', processes=2)], report_interval=0.05)
+        supervisor.start()
+        try:
+            _supervise(supervisor, lambda: len(_events(events, 'done')) == 2, timeout=30)
+        finally:
+            supervisor.shutdown()
+
+        starts, done = _events(events, 'start'), _events(events, 'done')
+        assert len({pid for _, pid, _ in done}) == 2
+        # Chaque processus a commencé son calcul avant que l'autre ne termine le sien
+        assert max(float(at) for _, _, at in starts) < min(float(at) for _, _, at in done)
+
+
+class TestMergeHealth:
+    def test_counters_add_up_and_latencies_take_the_maximum(self):
+        merged = merge_health([
+            {'status': 'healthy', 'last_poll_at': 10.0, 'topics': ['a'],
+             'consumers': {'main': {'processed': 5, 'p99_ms': 12.0, 'lanes': {'chat': {'priority': 0, 'queued': 2}}}}},
+            {'status': 'unhealthy', 'last_poll_at': 12.0, 'topics': ['a'],
+             'consumers': {'main': {'processed': 7, 'p99_ms': 30.0, 'lanes': {'chat': {'priority': 0, 'queued': 1}}}}},
+        ])
+        assert merged == {
+            'status': 'unhealthy', 'last_poll_at': 12.0, 'topics': ['a'],
+            'consumers': {'main': {'processed': 12, 'p99_ms': 30.0, 'lanes': {'chat': {'priority': 0, 'queued': 3}}}},
+        }
+
+    def test_no_report(self):
+        assert merge_health([]) == {}
@@ -0,0 +1,178 @@
+"""
+Tests de la consommation idempotente (api.kafka.idempotency) avec le broker en
+mémoire : relecture complète d'un topic sans nouvel appel LLM, résultats
+republiés, réservation libérée après un échec, coût du contrôle par message.
+"""
+
+import threading
+import time
+
+import pytest
+
+from api.kafka import unified_consumer as unified_module
+from api.kafka.idempotency import (
+    DONE, InMemoryIdempotencyStore, IdempotencyGuard, idempotency_key,
+)
+from api.kafka.in_memory_broker import InMemoryBroker
+from api.kafka.retry_topics import RetryScheduler
+from api.kafka.robust_kafka_client import KafkaConfig, RobustKafkaConsumer
+from api.kafka.unified_consumer import UnifiedConsumer
+
+TOPIC = 'commerce.operation.created'
+
+
+class StubRouter:
+    """TaskRouter simulé : chaque tâche routée est un appel LLM."""
+
+    def __init__(self, failures=0):
+        self.llm_calls = []
+        self.resent = []
+        self.failures = failures
+        self._lock = threading.Lock()
+
+    def route_task(self, data):
+        with self._lock:
+            self.llm_calls.append(data['id'])
+            if self.failures:
+                self.failures -= 1
+                return {'error': 'LLM API unavailable'}
+        return {'type': 'accounting_response', 'journal_entry': {'id': f"je-{data['id']}"}}
+
+    def route_batch(self, messages):
+        return [self.route_task(data) for data in messages]
+
+    def resend_results(self, results):
+        with self._lock:
+            self.resent.extend(result['journal_entry']['id'] for result in results)
+        return len(results)
+
+
+@pytest.fixture
+def router(monkeypatch):
+    stub = StubRouter()
+    monkeypatch.setattr(unified_module, 'task_router', stub)
+    return stub
+
+
+def _unified(broker):
+    unified = UnifiedConsumer()
+    unified.retry_scheduler = RetryScheduler(config=KafkaConfig(), producer=broker.producer(), delays=[0.1])
+    unified.idempotency = IdempotencyGuard(store=InMemoryIdempotencyStore())
+    return unified
+
+
+def _operation(i, message_id=None):
+    return {
+        'id': message_id or f"evt-{i}", 'eventType': TOPIC,
+        'data': {'id': f"op-{i}", 'companyId': f"company-{i % 4}", 'clientId': 'client-1', 'amountCdf': 1000},
+        'metadata': {'kafka_topic': TOPIC, 'source': 'gestion_commerciale'},
+    }
+
+
+def _consume(broker, unified, group_id, until, timeout=10):
+    config = KafkaConfig()
+    config.poll_timeout_ms = 10
+    consumer = RobustKafkaConsumer(config, [TOPIC], group_id, workers=2,
+                                   consumer=broker.consumer(TOPIC, group_id=group_id))
+    consumer.register_handler(TOPIC, unified._process_message)
+    consumer.register_batch_handler(TOPIC, unified._process_batch)
+    thread = threading.Thread(target=consumer.start_consuming)
+    thread.start()
+    deadline = time.time() + timeout
+    while not until() and time.time() < deadline:
+        time.sleep(0.005)
+    consumer.stop()
+    thread.join()
+    return until()
+
+
+class TestIdempotencyKey:
+    def test_commerce_operations_share_a_key_across_envelopes(self):
+        wrapped = _operation(1)
+        flat = {'id': 'op-1', 'clientId': 'client-1', 'amountCdf': 1000}
+        assert idempotency_key(wrapped) == idempotency_key(flat, TOPIC) == f"kafka:processed:{TOPIC}:op-1"
+        assert idempotency_key({'id': 'req-1', 'metadata': {'kafka_topic': 'portfolio.analysis.request'}}) == \
+            'kafka:processed:message:req-1'
+        assert idempotency_key({'data': {}}) is None
+
+
+class TestReplay:
+    def test_replaying_the_topic_makes_no_extra_llm_call(self, router):
+        broker = InMemoryBroker(partitions=3)
+        operations = 40
+        for i in range(operations):
+            broker.produce(TOPIC, _operation(i), key=f"company-{i % 4}")
+        # Même opération republiée par le producteur (nouvel identifiant de message)
+        broker.produce(TOPIC, _operation(7, message_id='evt-7-bis'), key='company-3')
+        unified = _unified(broker)
+
+        assert _consume(broker, unified, 'first-pass', lambda: len(router.llm_calls) == operations)
+        time.sleep(0.05)
+        assert sorted(router.llm_calls) == sorted(f"op-{i}" for i in range(operations))
+
+        # Relecture complète du topic (nouveau groupe, comme après une perte d'offsets)
+        assert _consume(broker, unified, 'replay', lambda: len(router.resent) >= operations + 1)
+        assert len(router.llm_calls) == operations
+        assert sorted(set(router.resent)) == sorted(f"je-op-{i}" for i in range(operations))
+        assert unified.idempotency.stats['claimed'] == operations
+        assert all(broker.committed('replay', tp) == end for tp, end in broker.end_offsets(TOPIC).items())
+
+    def test_failure_releases_the_claim(self, router):
+        broker = InMemoryBroker(partitions=1)
+        unified = _unified(broker)
+        router.failures = 1
+        message = _operation(1)
+
+        unified._process_message(dict(message, data=dict(message['data'])))
+        [retried] = broker.records(f"{TOPIC}.retry.100ms")
+        assert retried.value['metadata']['retry_count'] == 1
+        assert unified.idempotency.stats['released'] == 1
+
+        # Le retry retraite le message, puis les doublons ne font que republier
+        unified._process_message(retried.value)
+        unified._process_message(dict(message, data=dict(message['data'])))
+        assert router.llm_calls == ['op-1', 'op-1']
+        assert router.resent == ['je-op-1']
+
+    def test_in_flight_duplicate_goes_to_retry(self, router):
+        broker = InMemoryBroker(partitions=1)
+        unified = _unified(broker)
+        assert unified.idempotency.claim(idempotency_key(_operation(2))) is None
+
+        unified._process_batch([_operation(2), _operation(3), _operation(3, message_id='evt-3-bis')])
+        assert router.llm_calls == ['op-3']
+        assert sorted(record.value['id'] for record in broker.records(f"{TOPIC}.retry.100ms")) == \
+            ['evt-2', 'evt-3-bis']
+
+
+class TestGuard:
+    def test_unavailable_store_does_not_block_processing(self):
+        class BrokenStore(InMemoryIdempotencyStore):
+            def add(self, *args, **kwargs):
+                raise ConnectionError('Redis down')
+
+            get_many = add
+
+        guard = IdempotencyGuard(store=BrokenStore())
+        assert guard.claim('kafka:processed:message:1') is None
+        assert guard.claim_many(['kafka:processed:message:1']) == {}
+
+    @pytest.mark.slow
+    def test_check_costs_well_under_a_millisecond(self):
+        guard = IdempotencyGuard(store=InMemoryIdempotencyStore())
+        messages = [_operation(i) for i in range(2000)]
+        result = {'type': 'accounting_response', 'journal_entry': {'id': 'je'}}
+
+        start = time.perf_counter()
+        for message in messages:
+            key = idempotency_key(message)
+            assert guard.claim(key) is None
+            guard.complete(key, result)
+        first_us = (time.perf_counter() - start) / len(messages) * 1e6
+
+        start = time.perf_counter()
+        for message in messages:
+            assert guard.claim(idempotency_key(message))['state'] == DONE
+        duplicate_us = (time.perf_counter() - start) / len(messages) * 1e6
+
+        assert first_us < 100 and duplicate_us < 100
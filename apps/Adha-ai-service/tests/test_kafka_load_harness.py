@@ -0,0 +1,114 @@
+"""
+Tests du banc de charge (api.kafka.load_harness) : trafic synthétique,
+capture et rejeu JSONL, LLM simulé, benchmark du consumer unifié sur le
+broker en mémoire.
+"""
+
+import threading
+import time
+
+import pytest
+
+from api.kafka.in_memory_broker import InMemoryBroker
+from api.kafka.load_harness import (
+    COMMERCE_OPERATION_CREATED, DEFAULT_MIX, PORTFOLIO_ANALYSIS_REQUEST, StubLLM, StubLLMError,
+    TrafficGenerator, TrafficRecord, capture, format_report, read_traffic, replay, run_benchmark,
+    write_traffic,
+)
+from api.kafka.robust_kafka_client import MessageStandardizer
+
+
+class TestTrafficGenerator:
+    def test_same_seed_same_traffic(self):
+        first = list(TrafficGenerator(seed=7).records(200))
+        second = list(TrafficGenerator(seed=7).records(200))
+        assert first == second
+        assert first != list(TrafficGenerator(seed=8).records(200))
+        assert {record.topic for record in first} <= set(DEFAULT_MIX)
+
+    def test_payloads_follow_the_typescript_envelope(self):
+        generator = TrafficGenerator(seed=1)
+        operation = generator.commerce_operation()
+        assert operation.topic == COMMERCE_OPERATION_CREATED
+        assert operation.key == operation.value['data']['companyId']
+        # Champs exigés par validate_operation, au format camelCase
+        for field in ('id', 'type', 'date', 'description', 'amountCdf', 'clientId', 'companyId'):
+            assert operation.value['data'][field]
+        converted = MessageStandardizer.convert_from_typescript(operation.value)
+        assert converted['metadata']['correlation_id'] == operation.value['metadata']['correlationId']
+
+        analysis = generator.portfolio_analysis_request()
+        assert analysis.topic == PORTFOLIO_ANALYSIS_REQUEST
+        assert analysis.value['data']['contextInfo']['source'] == 'portfolio_institution'
+        assert analysis.timestamp > operation.timestamp
+
+    def test_mix_restricts_topics(self):
+        records = list(TrafficGenerator(mix={'customer.user.updated': 1, 'user.login': 1}).records(50))
+        assert {record.topic for record in records} == {'customer.user.updated', 'user.login'}
+        with pytest.raises(ValueError):
+            TrafficGenerator(mix={'unknown.topic': 1})
+
+
+class TestReplay:
+    def test_capture_and_replay_roundtrip(self, tmp_path):
+        source = InMemoryBroker(partitions=2)
+        records = list(TrafficGenerator(seed=3).records(40))
+        replay(source, records)
+        path = str(tmp_path / 'traffic.jsonl')
+        topics = sorted({record.topic for record in records})
+        assert capture(source.consumer(*topics, group_id='capture'), path, limit=40, timeout=5) == 40
+
+        captured = list(read_traffic(path))
+        assert sorted(record.value['id'] for record in captured) == sorted(record.value['id'] for record in records)
+        target = InMemoryBroker(partitions=2)
+        assert replay(target, captured) == 40
+        assert sum(len(target.records(topic)) for topic in topics) == 40
+
+    def test_replay_keeps_the_original_pace(self, tmp_path):
+        path = str(tmp_path / 'traffic.jsonl')
+        write_traffic(path, [TrafficRecord('user.login', 'user-1', {'id': str(n)}, 1000 + n * 100) for n in range(4)])
+        broker = InMemoryBroker(partitions=1)
+        started = time.monotonic()
+        replay(broker, read_traffic(path), speed=2)
+        # 300 ms d'écart d'origine, rejoués deux fois plus vite : jamais avant 150 ms
+        assert time.monotonic() - started >= 0.14
+        assert [record.value['id'] for record in broker.records('user.login')] == ['0', '1', '2', '3']
+
+
+class TestStubLLM:
+    def test_latency_tokens_and_concurrency(self):
+        llm = StubLLM(latency_ms=30, completion_tokens=10)
+        threads = [threading.Thread(target=llm.chat.completions.create,
+                                    kwargs={'messages': [{'role': 'user', 'content': 'x' * 40}]})
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert llm.stats['calls'] == 4 and llm.stats['peak_concurrency'] >= 2
+        response = llm.chat.completions.create(model='gpt-4o', messages=[{'role': 'user', 'content': 'Bonjour'}])
+        assert response.choices[0].message.content
+        assert response.usage.total_tokens == response.usage.prompt_tokens + 10
+
+    def test_error_rate(self):
+        llm = StubLLM(latency_ms=0, error_rate=1.0)
+        with pytest.raises(StubLLMError):
+            llm.chat.completions.create(messages=[])
+        assert llm.stats['errors'] == 1
+
+
+class TestBenchmark:
+    def test_unified_consumer_report(self):
+        records = list(TrafficGenerator(seed=5).records(300))
+        report = run_benchmark('unified', records, llm=StubLLM(latency_ms=1), timeout=60)
+
+        assert report['processed'] == report['messages'] > 0
+        assert report['messages_per_sec'] > 0
+        latency = report['latency_ms']
+        assert 0 < latency['p50'] <= latency['p95'] <= latency['p99'] <= latency['max']
+        assert set(report['topics']) == {record.topic for record in records} & {
+            'adha-ai-events', 'commerce.operation.created', 'portfolio.analysis.request', 'accounting.journal.status'
+        }
+        assert sum(topic['processed'] for topic in report['topics'].values()) == report['messages']
+        assert len(format_report(report).splitlines()) == 1 + len(report['topics'])
+        assert report['llm']['calls'] > 0
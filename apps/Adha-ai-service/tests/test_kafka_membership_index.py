@@ -0,0 +1,174 @@
+"""
+Tests de l'index des membres société/institution (api.kafka.membership_index)
+sur un client Redis simulé qui compte les allers-retours : ensembles natifs,
+invalidation pipelinée, version de clés, rafale de 10 000 événements.
+"""
+
+import threading
+from collections import defaultdict
+
+from api.kafka.membership_index import (
+    COMPANY, INSTITUTION, CacheMembershipIndex, RedisMembershipIndex, group_members, user_context_key,
+)
+
+
+class FakeRedis:
+    """Sous-ensemble de redis-py : chaque commande ou pipeline exécuté est un aller-retour."""
+
+    def __init__(self):
+        self.data = {}
+        self.expiry = {}
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    def _call(self, name, *args):
+        with self._lock:
+            return getattr(self, f"_{name}")(*args)
+
+    def _sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(members)
+
+    def _srem(self, key, *members):
+        self.data.get(key, set()).difference_update(members)
+
+    def _smembers(self, key):
+        return {member.encode() for member in self.data.get(key, set())}
+
+    def _expire(self, key, ttl):
+        self.expiry[key] = ttl
+
+    def _unlink(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def _get(self, key):
+        return self.data.get(key)
+
+    def _incr(self, key):
+        self.data[key] = str(int(self.data.get(key) or 0) + 1).encode()
+        return int(self.data[key])
+
+    def __getattr__(self, name):
+        if name in ('sadd', 'srem', 'smembers', 'expire', 'unlink', 'get', 'incr'):
+            def command(*args):
+                self.round_trips += 1
+                return self._call(name, *args)
+            return command
+        raise AttributeError(name)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((name, args))
+
+    def execute(self):
+        self.client.round_trips += 1
+        return [self.client._call(name, *args) for name, args in self.commands]
+
+
+def _index(client=None):
+    return RedisMembershipIndex(client or FakeRedis(), ttl=3600, make_key=lambda key: f"adha_ai:1:{key}")
+
+
+def _context(user, company=None, institution=None):
+    return {'user_id': user, 'company_id': company, 'financial_institution_id': institution}
+
+
+class TestRedisMembershipIndex:
+    def test_burst_of_user_events_in_few_round_trips(self):
+        index = _index()
+        contexts = [_context(f"user-{n}", company=f"company-{n % 50}", institution=f"bank-{n % 3}")
+                    for n in range(10000)]
+
+        index.update(group_members(contexts))
+
+        # Lecture de la version + un pipeline (au lieu de 2 lectures et 2 écritures par événement)
+        assert index.client.round_trips == 2
+        assert len(index.members(COMPANY, 'company-7')) == 200
+        assert len(index.members(INSTITUTION, 'bank-0')) == 3334
+        assert index.client.expiry['adha_ai:1:company_users_v0_company-7'] == 3600
+
+    def test_moves_are_removed_from_the_previous_owner(self):
+        index = _index()
+        index.update(group_members([_context('u1', company='a'), _context('u2', company='a')]))
+        added = group_members([_context('u1', company='b')])
+        removed = {owner: users - added.get(owner, set())
+                   for owner, users in group_members([_context('u1', company='a')]).items()}
+        index.update(added, removed)
+        assert index.members(COMPANY, 'a') == {'u2'}
+        assert index.members(COMPANY, 'b') == {'u1'}
+
+    def test_invalidation_unlinks_contexts_in_one_pipeline(self):
+        client = FakeRedis()
+        index = _index(client)
+        users = [f"user-{n}" for n in range(2500)]
+        for user in users:
+            client.data[f"adha_ai:1:{user_context_key(user)}"] = b'context'
+        client.data['adha_ai:1:user_context_other'] = b'context'
+        index.update({(COMPANY, 'c1'): set(users)})
+        client.round_trips = 0
+
+        assert index.invalidate_users(COMPANY, 'c1') == 2500
+        # Version, SMEMBERS, puis un seul pipeline d'UNLINK
+        assert client.round_trips == 3
+        assert not any(key.startswith('adha_ai:1:user_context_user-') for key in client.data)
+        assert 'adha_ai:1:user_context_other' in client.data
+
+    def test_version_bump_drops_every_set(self):
+        index = _index()
+        index.update({(COMPANY, 'c1'): {'u1'}, (INSTITUTION, 'b1'): {'u2'}})
+        assert index.invalidate_all() == 1
+        assert index.members(COMPANY, 'c1') == set()
+        index.update({(COMPANY, 'c1'): {'u3'}})
+        assert index.members(COMPANY, 'c1') == {'u3'}
+
+    def test_concurrent_updates_are_not_lost(self):
+        index = _index()
+        threads = [
+            threading.Thread(target=lambda w=w: [index.update({(COMPANY, 'shared'): {f"w{w}-u{n}"}})
+                                                 for n in range(200)])
+            for w in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(index.members(COMPANY, 'shared')) == 800
+
+
+class LocalCache:
+    """Cache Django local (get_many / set_many / delete_many)"""
+
+    def __init__(self):
+        self.data = defaultdict(set)
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def get_many(self, keys):
+        return {key: self.data[key] for key in keys if key in self.data}
+
+    def set_many(self, values, timeout=None):
+        self.data.update(values)
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+class TestCacheFallback:
+    def test_same_interface_without_redis(self):
+        cache = LocalCache()
+        index = CacheMembershipIndex(cache, ttl=3600)
+        cache.data[user_context_key('u1')] = {'user_id': 'u1'}
+        index.update({(COMPANY, 'c1'): {'u1', 'u2'}})
+        index.update({}, {(COMPANY, 'c1'): {'u2'}})
+        assert index.members(COMPANY, 'c1') == {'u1'}
+        assert index.invalidate_users(COMPANY, 'c1') == 1
+        assert user_context_key('u1') not in cache.data
@@ -0,0 +1,158 @@
+"""
+Tests du codec des messages Kafka (api.kafka.message_codec) : conversions de
+clés mémorisées, cartes de clés des schémas, encodage binaire versionné, et
+banc d'essai en µs par message pour des charges commerce et portfolio.
+"""
+
+import json
+import re
+import time
+
+import pytest
+
+from api.kafka import message_codec
+from api.kafka.message_codec import (
+    KeyCache, MessageSchema, camel_to_snake, decode, encode_binary, get_schema, register_schema,
+    to_camel_case, to_snake_case,
+)
+from api.kafka.robust_kafka_client import MessageStandardizer
+
+
+def legacy_from_typescript(data):
+    """Ancienne implémentation : expression régulière sur chaque clé de chaque message"""
+    if isinstance(data, dict):
+        converted = {}
+        for key, value in data.items():
+            s1 = re.sub('(.)([A-Z][a-z]+)', r'\1_\2', key)
+            converted[re.sub('([a-z0-9])([A-Z])', r'\1_\2', s1).lower()] = legacy_from_typescript(value)
+        return converted
+    if isinstance(data, list):
+        return [legacy_from_typescript(item) for item in data]
+    return data
+
+
+def legacy_to_typescript(data):
+    if isinstance(data, dict):
+        converted = {}
+        for key, value in data.items():
+            components = key.split('_')
+            converted[components[0] + ''.join(x.capitalize() for x in components[1:])] = \
+                legacy_to_typescript(value)
+        return converted
+    if isinstance(data, list):
+        return [legacy_to_typescript(item) for item in data]
+    return data
+
+
+def commerce_event(i=0):
+    return {
+        'id': f"evt-{i}", 'eventType': 'commerce.operation.created', 'timestamp': '2026-05-04T10:00:00Z',
+        'data': {
+            'id': f"op-{i}", 'type': 'SALE', 'companyId': 'company-123', 'clientId': 'client-9',
+            'date': '2026-05-04', 'description': 'Vente comptoir', 'amountCdf': 150000.0, 'amountUsd': 54.2,
+            'exchangeRate': 2767.5, 'relatedPartyId': 'client-456', 'relatedPartyName': 'Client Test',
+            'paymentMethod': 'MOBILE_MONEY', 'status': 'COMPLETED',
+            'items': [{'productId': f"p-{n}", 'productName': 'Savon', 'quantity': 2, 'unitPrice': 2500.0,
+                       'totalPrice': 5000.0, 'taxRate': 0.16} for n in range(8)],
+        },
+        'metadata': {'correlationId': f"corr-{i}", 'timestamp': '2026-05-04T10:00:00Z',
+                     'source': 'gestion_commerciale', 'version': '1.0.0', 'retryCount': 0},
+    }
+
+
+def portfolio_request(i=0):
+    return {
+        'id': f"req-{i}", 'portfolioId': 'portfolio-789', 'institutionId': 'institution-123',
+        'userId': 'user-456', 'userRole': 'INSTITUTION_ADMIN', 'analysisTypes': ['FINANCIAL', 'RISK'],
+        'timestamp': '2026-05-04T10:00:00Z',
+        'contextInfo': {
+            'portfolioType': 'credit', 'totalOutstanding': 1.2e9, 'nonPerformingLoans': 4.1e7,
+            'averageInterestRate': 0.18, 'currency': 'CDF',
+            'portfolio': {
+                'id': 'portfolio-789', 'type': 'credit',
+                'loans': [{'loanId': f"loan-{n}", 'clientId': f"client-{n}", 'outstandingAmount': 1.5e6,
+                           'interestRate': 0.18, 'daysPastDue': n % 90, 'riskGrade': 'B',
+                           'sectorCode': 'AGRI', 'guaranteeValue': 2.0e6, 'disbursementDate': '2025-01-10'}
+                          for n in range(60)],
+            },
+        },
+        'metadata': {'correlationId': f"corr-{i}", 'source': 'portfolio_institution', 'version': '1.0.0'},
+    }
+
+
+class TestKeyConversion:
+    def test_same_result_as_regex_conversion(self):
+        payloads = [commerce_event(), portfolio_request(),
+                    {'HTTPResponseCode': 1, 'already_snake': 2, 'ID': 3, 'userID2Fa': [{'aB': None}]}]
+        for payload in payloads:
+            assert to_snake_case(payload) == legacy_from_typescript(payload)
+            snake = legacy_from_typescript(payload)
+            assert to_camel_case(snake) == legacy_to_typescript(snake)
+        assert MessageStandardizer.convert_from_typescript(commerce_event()) == legacy_from_typescript(
+            commerce_event())
+        assert MessageStandardizer._camel_to_snake('relatedPartyName') == 'related_party_name'
+
+    def test_cache_is_bounded(self):
+        cache = KeyCache(camel_to_snake, maxsize=3)
+        keys = [f"fieldNumber{n}" for n in range(10)]
+        assert [cache[key] for key in keys] == [f"field_number{n}" for n in range(10)]
+        assert len(cache) == 3
+
+    def test_schema_key_map_overrides_conversion(self):
+        register_schema(MessageSchema('test.key.map', 1, ['amountCDF', 'customerRef'],
+                                      key_map={'amountCDF': 'amount_cdf'}))
+        assert to_snake_case({'amountCDF': 1, 'customerRef': 2}) == {'amount_cdf': 1, 'customer_ref': 2}
+        assert to_camel_case({'amount_cdf': 1}) == {'amountCDF': 1}
+
+
+class TestBinaryEncoding:
+    def test_round_trip_and_size(self):
+        for payload, schema in ((commerce_event(), 'commerce.operation.created'),
+                                (portfolio_request(), 'portfolio.analysis.request')):
+            encoded = encode_binary(payload, get_schema(schema))
+            assert decode(encoded) == payload
+            assert len(encoded) < len(message_codec.dumps(payload))
+        assert decode(message_codec.dumps(commerce_event())) == commerce_event()
+        assert decode(None) is None
+
+    def test_old_versions_stay_readable(self):
+        v1 = register_schema(MessageSchema('test.versioned', 1, ['id', 'amount']))
+        old_message = encode_binary({'id': 'a', 'amount': 1, 'note': 'extra'}, v1)
+        v2 = register_schema(MessageSchema('test.versioned', 2, ['id', 'amount', 'currency']))
+
+        assert get_schema('test.versioned') is v2
+        assert decode(old_message) == {'id': 'a', 'amount': 1, 'note': 'extra'}
+        assert decode(encode_binary({'id': 'b', 'currency': 'CDF'}, v2)) == {'id': 'b', 'currency': 'CDF'}
+        # Champ objet déclaré mais valeur d'un autre type : conservée telle quelle
+        commerce = get_schema('commerce.operation.created')
+        assert decode(encode_binary({'id': 'c', 'data': None}, commerce)) == {'id': 'c', 'data': None}
+
+
+class TestCodecBenchmark:
+    def _per_message_us(self, function, payloads, rounds=3):
+        best = float('inf')
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for payload in payloads:
+                function(payload)
+            best = min(best, time.perf_counter() - start)
+        return best / len(payloads) * 1e6
+
+    @pytest.mark.slow
+    def test_microbenchmark(self):
+        """µs par message : lecture (bytes -> dict snake_case) et écriture (dict -> bytes camelCase)."""
+        for name, build in (('commerce', commerce_event), ('portfolio', portfolio_request)):
+            raw = [json.dumps(build(i)).encode('utf-8') for i in range(50)]
+            snake = [legacy_from_typescript(build(i)) for i in range(50)]
+            results = {
+                'consume (legacy)': self._per_message_us(
+                    lambda data: legacy_from_typescript(json.loads(data.decode('utf-8'))), raw),
+                'consume (codec)': self._per_message_us(lambda data: to_snake_case(decode(data)), raw),
+                'produce (legacy)': self._per_message_us(
+                    lambda data: json.dumps(legacy_to_typescript(data), ensure_ascii=False).encode('utf-8'),
+                    snake),
+                'produce (codec)': self._per_message_us(lambda data: message_codec.dumps(to_camel_case(data)),
+                                                        snake),
+            }
+            assert results['consume (codec)'] * 1.5 < results['consume (legacy)'], name
+            assert results['produce (codec)'] < results['produce (legacy)'], name
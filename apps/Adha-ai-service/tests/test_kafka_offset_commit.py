@@ -0,0 +1,269 @@
+"""
+Tests du commit manuel des offsets (api.kafka.offset_committer) avec le broker
+en mémoire : au moins une fois, commits asynchrones par lot, commit synchrone au
+rebalance et à l'arrêt.
+"""
+
+import threading
+import time
+
+from api.kafka.in_memory_broker import InMemoryBroker, TopicPartition
+from api.kafka.keyed_worker_pool import PartitionOffsetTracker, worker_index
+from api.kafka.offset_committer import CommitOnRevokeListener, OffsetCommitter
+from api.kafka.robust_kafka_client import KafkaConfig, RobustKafkaConsumer
+
+TOPIC = 'commerce.operation.created'
+
+
+class CountingHandler:
+    def __init__(self, delay=0.0, block_offsets=()):
+        self.delay = delay
+        self.block_offsets = set(block_offsets)
+        self.release = threading.Event()
+        self.ids = []
+        self._lock = threading.Lock()
+
+    def __call__(self, message):
+        if message['data']['sequence'] in self.block_offsets:
+            self.release.wait(10)
+        if self.delay:
+            time.sleep(self.delay)
+        with self._lock:
+            self.ids.append(message['id'])
+
+    @property
+    def count(self):
+        return len(self.ids)
+
+
+def _publish(broker, total, first=0, companies=4):
+    for sequence in range(first, first + total):
+        company = f"company-{sequence % companies}"
+        broker.produce(TOPIC, {'id': f"msg-{sequence}", 'data': {'companyId': company, 'sequence': sequence}},
+                       key=company, partition=0)
+
+
+def _start(broker, handler, group_id='commit-group', interval_ms=5000, batch_size=500,
+           commit_latency=0.0, workers=4):
+    config = KafkaConfig()
+    config.poll_timeout_ms = 10
+    config.commit_interval_ms = interval_ms
+    config.commit_batch_size = batch_size
+    kafka_consumer = broker.consumer(TOPIC, group_id=group_id, commit_latency=commit_latency)
+    consumer = RobustKafkaConsumer(config, [TOPIC], group_id, workers=workers, consumer=kafka_consumer)
+    consumer.register_handler(TOPIC, handler)
+    thread = threading.Thread(target=consumer.start_consuming)
+    thread.start()
+    return consumer, thread, kafka_consumer
+
+
+def _wait(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+class TestOffsetCommitter:
+    def test_async_commit_on_batch_size_and_interval(self):
+        broker = InMemoryBroker(partitions=1)
+        tp = TopicPartition(TOPIC, 0)
+        consumer = broker.consumer(TOPIC, group_id='g')
+        tracker = PartitionOffsetTracker()
+        committer = OffsetCommitter(consumer, tracker, interval_ms=50, batch_size=3)
+
+        for offset in range(5):
+            tracker.track(tp, offset)
+        tracker.complete(tp, 0)
+        tracker.complete(tp, 1)
+        committer.maybe_commit()
+        # Ni le seuil de messages ni l'intervalle ne sont atteints
+        assert committer.stats['async_commits'] == 0
+
+        tracker.complete(tp, 2)
+        committer.maybe_commit()
+        assert committer.stats['async_commits'] == 1
+        # Le commit asynchrone n'est appliqué qu'au poll suivant, comme kafka-python
+        assert broker.committed('g', tp) is None
+        consumer.poll(timeout_ms=0)
+        assert broker.committed('g', tp) == 3
+
+        tracker.complete(tp, 3)
+        committer.maybe_commit()
+        assert committer.stats['async_commits'] == 1
+        time.sleep(0.06)
+        committer.maybe_commit()
+        consumer.poll(timeout_ms=0)
+        assert committer.stats['async_commits'] == 2
+        assert broker.committed('g', tp) == 4
+
+    def test_failed_async_commit_is_retried(self):
+        broker = InMemoryBroker(partitions=1)
+        tp = TopicPartition(TOPIC, 0)
+        consumer = broker.consumer(TOPIC, group_id='g')
+        tracker = PartitionOffsetTracker()
+        committer = OffsetCommitter(consumer, tracker, interval_ms=0)
+        tracker.track(tp, 0)
+        tracker.complete(tp, 0)
+        committer.maybe_commit()
+        # Le broker rejette le commit : les offsets reviennent dans le lot suivant
+        offsets, _ = consumer._async_commits.pop()
+        committer._on_commit(offsets, RuntimeError('coordinator not available'))
+        assert committer.stats['failed_commits'] == 1
+        committer.commit_sync()
+        assert broker.committed('g', tp) == 1
+
+
+class TestManualOffsetCommit:
+    def test_never_commits_past_unfinished_message_and_redelivers_it(self):
+        """Un message en cours au moment du crash est relu au redémarrage (au moins une fois)."""
+        broker = InMemoryBroker(partitions=1)
+        tp = TopicPartition(TOPIC, 0)
+        _publish(broker, 20)
+        # Le message 5 reste bloqué ; les autres entreprises avancent
+        handler = CountingHandler(block_offsets={5})
+        consumer, thread, _ = _start(broker, handler, interval_ms=0)
+        # Messages des entreprises servies par un autre worker que company-1
+        free = sum(1 for sequence in range(20)
+                   if worker_index(f"company-{sequence % 4}", 4) != worker_index('company-1', 4))
+        try:
+            assert _wait(lambda: handler.count >= free)
+            time.sleep(0.05)
+            assert broker.committed('commit-group', tp) == 5
+        finally:
+            # « Crash » : le consommateur disparaît sans terminer ni commiter le message 5
+            consumer.close = lambda: None
+            consumer.stop()
+            thread.join()
+            handler.release.set()
+            consumer.worker_pool.stop()
+
+        assert broker.committed('commit-group', tp) == 5
+        redelivered = CountingHandler()
+        consumer, thread, _ = _start(broker, redelivered)
+        assert _wait(lambda: redelivered.count == 15)
+        consumer.stop()
+        thread.join()
+        assert 'msg-5' in redelivered.ids
+        assert broker.committed('commit-group', tp) == 20
+
+    def test_failed_message_is_committed_only_once_handed_off(self):
+        """Un message en échec n'est commité qu'une fois confié au retry / DLQ par l'error handler."""
+        for handed_off, expected in ((True, 20), (False, 5)):
+            broker = InMemoryBroker(partitions=1)
+            tp = TopicPartition(TOPIC, 0)
+            _publish(broker, 20)
+            handler = CountingHandler()
+            failed = []
+
+            def handle(message, handler=handler):
+                if message['data']['sequence'] == 5:
+                    raise RuntimeError('database unavailable')
+                handler(message)
+
+            def on_error(error, record, failed=failed, handed_off=handed_off):
+                failed.append(record.offset)
+                return handed_off
+
+            config = KafkaConfig()
+            config.poll_timeout_ms = 10
+            config.commit_interval_ms = 0
+            consumer = RobustKafkaConsumer(config, [TOPIC], 'failure-group', workers=4,
+                                           consumer=broker.consumer(TOPIC, group_id='failure-group'))
+            consumer.register_handler(TOPIC, handle)
+            consumer.register_error_handler(on_error)
+            thread = threading.Thread(target=consumer.start_consuming)
+            thread.start()
+            assert _wait(lambda: handler.count == 19)
+            consumer.stop()
+            thread.join()
+            assert failed == [5]
+            assert broker.committed('failure-group', tp) == expected
+
+        # Sans relais vers le retry, le message est relu au redémarrage
+        redelivered = CountingHandler()
+        consumer, thread, _ = _start(broker, redelivered, group_id='failure-group')
+        assert _wait(lambda: redelivered.count == 15)
+        consumer.stop()
+        thread.join()
+        assert 'msg-5' in redelivered.ids
+
+    def test_sync_commit_on_shutdown(self):
+        broker = InMemoryBroker(partitions=1)
+        _publish(broker, 30)
+        handler = CountingHandler()
+        # Seuils jamais atteints : seul le commit de l'arrêt enregistre la position
+        consumer, thread, kafka_consumer = _start(broker, handler, interval_ms=60000, batch_size=10000)
+        assert _wait(lambda: handler.count == 30)
+        assert broker.committed('commit-group', TopicPartition(TOPIC, 0)) is None
+        consumer.stop()
+        thread.join()
+        assert consumer.committer.stats['sync_commits'] == 1
+        assert broker.committed('commit-group', TopicPartition(TOPIC, 0)) == 30
+        assert kafka_consumer.closed
+
+    def test_revoked_partition_is_drained_and_committed(self):
+        broker = InMemoryBroker(partitions=2)
+        for sequence in range(10):
+            for partition in (0, 1):
+                broker.produce(TOPIC, {'id': f"msg-{partition}-{sequence}",
+                                       'data': {'companyId': f"company-{partition}", 'sequence': sequence}},
+                               key=f"company-{partition}", partition=partition)
+        handler = CountingHandler(delay=0.002)
+        consumer, thread, kafka_consumer = _start(broker, handler, interval_ms=60000, batch_size=10000)
+        try:
+            assert _wait(lambda: handler.count == 20)
+            revoked = TopicPartition(TOPIC, 1)
+            kafka_consumer.revoke([revoked])
+            assert _wait(lambda: broker.committed('commit-group', revoked) == 10)
+            assert revoked not in kafka_consumer.assignment()
+            assert consumer.offset_tracker.in_flight(revoked) == 0
+            # La partition conservée n'est commitée qu'à l'arrêt
+            assert broker.committed('commit-group', TopicPartition(TOPIC, 0)) is None
+        finally:
+            consumer.stop()
+            thread.join()
+        assert broker.committed('commit-group', TopicPartition(TOPIC, 0)) == 10
+
+    def test_listener_waits_for_in_flight_messages(self):
+        broker = InMemoryBroker(partitions=1)
+        tp = TopicPartition(TOPIC, 0)
+        consumer = broker.consumer(TOPIC, group_id='g')
+        tracker = PartitionOffsetTracker()
+        listener = CommitOnRevokeListener(OffsetCommitter(consumer, tracker), drain_timeout=5)
+        tracker.track(tp, 0)
+        threading.Timer(0.05, tracker.complete, args=(tp, 0)).start()
+        listener.on_partitions_revoked([tp])
+        # L'offset 1 n'est commitable qu'une fois le message en cours terminé
+        assert broker.committed('g', tp) == 1
+        assert tracker.in_flight() == 0
+
+    def test_batched_async_commits_replace_sync_commit_per_poll(self, monkeypatch):
+        """Un commit synchrone par poll contre des commits asynchrones par lot."""
+        total = 400
+        commits = {}
+        for mode, (interval_ms, batch_size) in {'sync': (0, 1), 'batched': (100, 200)}.items():
+            broker = InMemoryBroker(partitions=1)
+            _publish(broker, total)
+            handler = CountingHandler()
+            config = KafkaConfig()
+            config.poll_timeout_ms = 10
+            config.commit_interval_ms = interval_ms
+            config.commit_batch_size = batch_size
+            kafka_consumer = broker.consumer(TOPIC, group_id=mode, commit_latency=0.005, max_poll_records=5)
+            consumer = RobustKafkaConsumer(config, [TOPIC], mode, workers=4, consumer=kafka_consumer)
+            consumer.register_handler(TOPIC, handler)
+            if mode == 'sync':
+                # Ancien comportement : commit synchrone à chaque tour de poll
+                monkeypatch.setattr(OffsetCommitter, 'maybe_commit', OffsetCommitter.commit_sync)
+            else:
+                monkeypatch.undo()
+            thread = threading.Thread(target=consumer.start_consuming)
+            thread.start()
+            assert _wait(lambda: handler.count == total)
+            consumer.stop()
+            thread.join()
+            commits[mode] = kafka_consumer.commits
+            assert broker.committed(mode, TopicPartition(TOPIC, 0)) == total
+
+        assert commits['batched'] < commits['sync'] / 5
@@ -0,0 +1,215 @@
+"""
+Tests des voies de priorité (api.kafka.priority_lanes) : charge mixte chat /
+analyses de portefeuille, préemption entre deux messages, partage pondéré,
+ordre par clé, et contre-pression par voie dans RobustKafkaConsumer.
+"""
+
+import threading
+import time
+from collections import Counter, namedtuple
+from functools import partial
+
+from api.kafka.in_memory_broker import InMemoryBroker
+from api.kafka.keyed_worker_pool import KeyedWorkerPool
+from api.kafka.priority_lanes import Lane, PriorityLanePool
+from api.kafka.robust_kafka_client import KafkaConfig, RobustKafkaConsumer
+from api.services.task_router import TaskRouter
+
+Task = namedtuple('Task', 'lane delay key')
+Record = namedtuple('Record', 'topic value')
+
+CHAT_TOPIC = 'adha-ai-events'
+ANALYSIS_TOPIC = 'portfolio.analysis.request'
+
+
+class StartOrder:
+    """
+    Handler simulé : attend ``delay`` et note l'ordre de démarrage des tâches et,
+    par voie, combien d'autres tâches ont démarré entre la soumission et le
+    démarrage de chacune.
+    """
+
+    def __init__(self):
+        self.overtaken = {}
+        self.order = []
+        self.submitted = {}
+        self.done = Counter()
+        self._lock = threading.Lock()
+
+    def submit(self, pool, name, task):
+        with self._lock:
+            self.submitted[name] = len(self.order)
+        pool.submit(task.key, (name, task), on_done=lambda: self._done(task))
+
+    def __call__(self, item):
+        name, task = item
+        with self._lock:
+            self.overtaken.setdefault(task.lane, []).append(len(self.order) - self.submitted[name])
+            self.order.append(name)
+        time.sleep(task.delay)
+
+    def _done(self, task):
+        with self._lock:
+            self.done[task.lane] += 1
+
+
+def _mixed_load(pool, tasks, analyses=60, chats=30):
+    """Arriéré d'analyses (20 ms) puis un chat (1 ms) toutes les 10 ms pendant qu'il se résorbe."""
+    for n in range(analyses):
+        tasks.submit(pool, f"analysis-{n}", Task('analysis', 0.02, f"institution-{n % 6}"))
+    for n in range(chats):
+        tasks.submit(pool, f"chat-{n}", Task('chat', 0.001, f"user-{n % 5}"))
+        time.sleep(0.01)
+    pool.stop()
+
+
+def _lane_pool(handler, **options):
+    lanes = [Lane('chat', priority=0, workers=1, slo_ms=50), Lane('analysis', priority=1, workers=2)]
+    return PriorityLanePool(handler, lanes, classify=lambda item: item[1].lane, **options)
+
+
+class TestMixedLoad:
+    def test_chat_is_not_queued_behind_the_analyses(self):
+        tasks = StartOrder()
+        pool = _lane_pool(tasks)
+        _mixed_load(pool, tasks)
+
+        baseline = StartOrder()
+        _mixed_load(KeyedWorkerPool(baseline, workers=3, queue_size=200), baseline)
+
+        assert tasks.done == {'chat': 30, 'analysis': 60}
+        assert pool.stats()['lanes']['chat']['processed'] == 30
+        # Pool unique : les chats d'un worker chargé d'analyses attendent derrière son arriéré
+        assert max(baseline.overtaken['chat']) >= 10
+        # Voies : le worker chat est libre, seuls les 2 workers d'analyse peuvent démarrer entre-temps
+        assert max(tasks.overtaken['chat']) <= 2
+
+    def test_interactive_lane_preempts_bulk_at_message_boundaries(self):
+        # Un seul thread partagé : la priorité décide de l'ordre
+        tasks = StartOrder()
+        pool = _lane_pool(tasks, threads=1)
+        for n in range(5):
+            tasks.submit(pool, f"analysis-{n}", Task('analysis', 0.02, f"institution-{n}"))
+        time.sleep(0.01)  # analysis-0 en cours
+        tasks.submit(pool, 'chat-0', Task('chat', 0, 'user-0'))
+        pool.stop()
+        assert tasks.order[:3] == ['analysis-0', 'chat-0', 'analysis-1']
+
+
+class TestScheduling:
+    def test_weighted_share_between_bulk_lanes(self):
+        started = threading.Event()
+        order = []
+
+        def handler(item):
+            started.wait(5)
+            order.append(item)
+
+        lanes = [Lane('accounting', priority=1, workers=1, weight=2), Lane('analysis', priority=1, workers=1)]
+        pool = PriorityLanePool(handler, lanes, classify=lambda item: item, threads=1, queue_size=100)
+        for n in range(30):
+            pool.submit(f"company-{n}", 'accounting')
+            pool.submit(f"institution-{n}", 'analysis')
+        started.set()
+        pool.stop()
+        assert Counter(order[:30]) == {'accounting': 20, 'analysis': 10}
+
+    def test_order_per_key_within_a_lane(self):
+        seen = []
+        lock = threading.Lock()
+
+        def handler(item):
+            time.sleep(0.001)
+            with lock:
+                seen.append(item)
+
+        pool = PriorityLanePool(handler, [Lane('accounting', workers=4)], classify=lambda item: 'accounting')
+        for n in range(50):
+            for company in ('a', 'b', 'c'):
+                pool.submit(company, (company, n))
+        pool.stop()
+        for company in ('a', 'b', 'c'):
+            assert [n for key, n in seen if key == company] == list(range(50))
+
+    def test_unknown_lane_falls_back_to_default(self):
+        pool = PriorityLanePool(lambda item: None, [Lane('chat'), Lane('analysis', priority=1)],
+                                classify=lambda item: 'other', default='chat')
+        assert pool.submit('k', 'item') == 'chat'
+        pool.stop()
+
+
+class TestTaskRouterLanes:
+    def test_record_lane_by_topic_and_content(self):
+        router = TaskRouter()
+        analysis = Record(ANALYSIS_TOPIC, {'data': {}})
+        accounting = Record('commerce.operation.created', {'data': {}})
+        portfolio_event = Record(CHAT_TOPIC, {'data': {'contextInfo': {'source': 'portfolio_institution',
+                                                                       'mode': 'analysis'}}})
+        chat = Record(CHAT_TOPIC, {'data': {'content': 'Bonjour'}})
+        assert router.record_lane(analysis) == 'portfolio_analysis'
+        assert router.record_lane([accounting, accounting]) == 'accounting'
+        assert router.record_lane(portfolio_event) == 'portfolio_analysis'
+        assert router.record_lane(chat) == 'chat'
+
+    def test_lanes_from_environment(self, monkeypatch):
+        monkeypatch.setenv('TASK_LANE_PORTFOLIO_ANALYSIS_WORKERS', '3')
+        monkeypatch.setenv('TASK_LANE_CHAT_SLO_MS', '1500')
+        router = TaskRouter()
+        lanes = {task_type.value: lane for task_type, lane in router.lanes.items()}
+        assert lanes['portfolio_analysis'].workers == 3
+        assert lanes['chat'].slo_ms == 1500
+        assert lanes['chat'].priority < lanes['portfolio_analysis'].priority
+
+
+class TestLaneBackpressure:
+    def test_analysis_backlog_only_pauses_its_partitions(self):
+        broker = InMemoryBroker(partitions=2)
+        for n in range(150):
+            broker.produce(ANALYSIS_TOPIC, {'id': f"analysis-{n}", 'data': {'institutionId': f"bank-{n % 10}"}})
+        handled = Counter()
+        analyses_before_chat = []
+        lock = threading.Lock()
+
+        def handle(message):
+            topic = message['metadata']['kafka_topic']
+            if topic == ANALYSIS_TOPIC:
+                time.sleep(0.005)
+            with lock:
+                if topic == CHAT_TOPIC:
+                    analyses_before_chat.append(handled[ANALYSIS_TOPIC])
+                handled[topic] += 1
+
+        config = KafkaConfig()
+        config.poll_timeout_ms = 20
+        config.max_poll_records = 10
+        config.max_in_flight = 30
+        config.resume_in_flight = 10
+        lanes = [Lane('chat', workers=1), Lane('analysis', priority=1, workers=2)]
+        factory = partial(PriorityLanePool, lanes=lanes,
+                          classify=lambda item: 'analysis' if item.topic == ANALYSIS_TOPIC else 'chat')
+        consumer = RobustKafkaConsumer(
+            config, [ANALYSIS_TOPIC, CHAT_TOPIC], 'lanes', queue_size=10,
+            consumer=broker.consumer(ANALYSIS_TOPIC, CHAT_TOPIC, group_id='lanes',
+                                     max_poll_records=config.max_poll_records),
+            worker_pool_factory=lambda handler, workers, queue_size, name: factory(
+                handler, queue_size=queue_size, name=name)
+        )
+        for topic in (ANALYSIS_TOPIC, CHAT_TOPIC):
+            consumer.register_handler(topic, handle)
+        thread = threading.Thread(target=consumer.start_consuming)
+        thread.start()
+        time.sleep(0.1)
+        for n in range(20):
+            broker.produce(CHAT_TOPIC, {'id': f"chat-{n}", 'data': {'userId': f"user-{n}"}})
+            time.sleep(0.01)
+        deadline = time.time() + 20
+        while sum(handled.values()) < 170 and time.time() < deadline:
+            time.sleep(0.01)
+        consumer.stop()
+        thread.join()
+
+        assert handled == {ANALYSIS_TOPIC: 150, CHAT_TOPIC: 20}
+        assert consumer.flows['analysis'].stats['pauses'] > 0
+        assert consumer.flows['chat'].stats['pauses'] == 0
+        # Chat lu et traité pendant que les partitions d'analyse sont en pause
+        assert max(analyses_before_chat) < 150, analyses_before_chat
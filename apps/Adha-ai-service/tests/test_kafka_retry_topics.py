@@ -0,0 +1,280 @@
+"""
+Tests des retries différés (api.kafka.retry_topics) avec le broker en mémoire :
+paliers de topics de retry, échéance en en-tête, partition en pause jusqu'à
+l'échéance, DLQ après le dernier retry.
+"""
+
+import threading
+import time
+
+from api.kafka.in_memory_broker import InMemoryBroker, TopicPartition
+from api.kafka.retry_topics import (
+    RETRY_ATTEMPT_HEADER, RETRY_DUE_HEADER, RetryScheduler, format_delay, header_value, parse_delay,
+)
+from api.kafka.robust_kafka_client import KafkaConfig, RobustKafkaConsumer
+
+TOPIC = 'commerce.operation.created'
+DLQ = 'dlq.failed.messages'
+DELAYS = [0.1, 0.2, 0.4]
+
+
+class FlakyLLM:
+    """Service LLM simulé : indisponible pour certaines entreprises ou jusqu'à une heure donnée."""
+
+    def __init__(self, failing=(), down_until=0.0):
+        self.failing = set(failing)
+        self.down_until = down_until
+        self.attempts = {}
+        self.succeeded = []
+        self._lock = threading.Lock()
+
+    def handler(self, scheduler):
+        def handle(message):
+            with self._lock:
+                self.attempts.setdefault(message['id'], []).append(time.time())
+            try:
+                if message['data']['company_id'] in self.failing or time.time() < self.down_until:
+                    raise ConnectionError('LLM API unavailable')
+                with self._lock:
+                    self.succeeded.append(message['id'])
+            except ConnectionError as e:
+                # Comme UnifiedConsumer._handle_processing_error
+                scheduler.schedule(message, str(e))
+        return handle
+
+
+def _config():
+    config = KafkaConfig()
+    config.poll_timeout_ms = 50
+    config.commit_interval_ms = 20
+    return config
+
+
+def _start(broker, topics, group_id, handler):
+    consumer = RobustKafkaConsumer(_config(), topics, group_id, workers=2,
+                                   consumer=broker.consumer(*topics, group_id=group_id))
+    for topic in topics:
+        consumer.register_handler(topic, handler)
+    thread = threading.Thread(target=consumer.start_consuming)
+    thread.start()
+    return consumer, thread
+
+
+def _wait(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def _run(broker, llm, until, timeout=10):
+    scheduler = RetryScheduler(config=_config(), producer=broker.producer(), delays=DELAYS, max_retries=3)
+    retry_topics = scheduler.retry_topics(TOPIC)
+    for topic in retry_topics:
+        broker.create_topic(topic, partitions=2)
+    handle = llm.handler(scheduler)
+    main = _start(broker, [TOPIC], 'main', handle)
+    retry = _start(broker, retry_topics, 'retry', handle)
+    try:
+        assert _wait(until, timeout)
+    finally:
+        for consumer, thread in (main, retry):
+            consumer.stop()
+            thread.join()
+    return scheduler, retry_topics
+
+
+def _publish(broker, companies, per_company=1):
+    for sequence in range(per_company):
+        for company in companies:
+            broker.produce(TOPIC, {'id': f"{company}-{sequence}", 'data': {'companyId': company}}, key=company)
+
+
+class HeldAcks:
+    """Producer dont les acquittements sont retenus jusqu'à ``ack()`` (broker lent)."""
+
+    def __init__(self, broker):
+        self.producer = broker.producer()
+        self.held = []
+        self._lock = threading.Lock()
+
+    def send(self, topic, value=None, key=None, headers=None):
+        return HeldFuture(self, self.producer.send(topic, value=value, key=key, headers=headers))
+
+    def ack(self):
+        with self._lock:
+            held, self.held = self.held, []
+        for fn, args in held:
+            fn(*args)
+
+
+class HeldFuture:
+    def __init__(self, producer, sent):
+        self.producer = producer
+        self.sent = sent
+
+    def add_callback(self, fn, *args):
+        with self.producer._lock:
+            self.producer.held.append((fn, args + (self.sent.record,)))
+
+    def add_errback(self, fn, *args):
+        pass
+
+
+class TestRetryTopicNames:
+    def test_tiers(self):
+        assert [parse_delay(d) for d in ('5s', '1m', '10m', '250ms')] == [5, 60, 600, 0.25]
+        assert [format_delay(d) for d in (5, 60, 600, 0.05)] == ['5s', '1m', '10m', '50ms']
+        scheduler = RetryScheduler(config=KafkaConfig(), producer=object(), delays=[5, 60, 600])
+        assert scheduler.retry_topics(TOPIC) == [
+            f"{TOPIC}.retry.5s", f"{TOPIC}.retry.1m", f"{TOPIC}.retry.10m",
+        ]
+
+
+class TestDelayedRetries:
+    def test_backoff_timing_attempt_counts_and_dlq(self):
+        broker = InMemoryBroker(partitions=2)
+        _publish(broker, ['company-bad'])
+        llm = FlakyLLM(failing={'company-bad'})
+
+        scheduler, retry_topics = _run(broker, llm, lambda: len(broker.records(DLQ)) == 1)
+
+        attempts = llm.attempts['company-bad-0']
+        # Tentative initiale + un retry par palier, puis DLQ
+        assert len(attempts) == 4
+        for delay, (before, after) in zip(DELAYS, zip(attempts, attempts[1:])):
+            # Jamais avant l'échéance du palier
+            assert after - before >= delay - 0.01, (delay, after - before)
+        for topic, attempt in zip(retry_topics, (1, 2, 3)):
+            [record] = broker.records(topic)
+            assert header_value(record.headers, RETRY_ATTEMPT_HEADER) == str(attempt)
+            assert int(header_value(record.headers, RETRY_DUE_HEADER)) > record.timestamp
+            assert record.key == 'company-bad'
+        [dead] = broker.records(DLQ)
+        assert dead.value['metadata']['retry_count'] == 3
+        assert dead.value['metadata']['original_topic'] == TOPIC
+        assert dead.value['metadata']['dlq_reason'] == 'max_retries_exceeded'
+        assert scheduler.stats == {'retried': 3, 'dead_lettered': 1}
+
+    def test_transient_outage_does_not_block_main_topic(self):
+        broker = InMemoryBroker(partitions=2)
+        companies = [f"company-{c}" for c in range(6)]
+        _publish(broker, companies, per_company=5)
+        total = len(companies) * 5
+        # Panne de 150 ms : les messages reçus pendant la panne passent par retry.100ms/200ms
+        llm = FlakyLLM(down_until=time.time() + 0.15)
+        main_done = {}
+
+        def until():
+            if 'at' not in main_done and all(
+                broker.committed('main', tp) == end for tp, end in broker.end_offsets(TOPIC).items()
+            ):
+                main_done['at'] = time.time()
+            return len(llm.succeeded) == total
+
+        _run(broker, llm, until)
+
+        assert sorted(llm.succeeded) == sorted(f"{c}-{s}" for c in companies for s in range(5))
+        assert broker.records(DLQ) == []
+        retried = [message_id for message_id, attempts in llm.attempts.items() if len(attempts) > 1]
+        assert retried
+        # Le topic principal a été lu et commité sans attendre la fin des retries
+        last_success = max(attempts[-1] for attempts in llm.attempts.values())
+        assert main_done['at'] < last_success
+
+    def test_retry_partition_is_paused_until_due(self):
+        broker = InMemoryBroker(partitions=2)
+        topic = f"{TOPIC}.retry.1s"
+        now_ms = int(time.time() * 1000)
+        broker.create_topic(topic, partitions=2)
+        broker.produce(topic, {'id': 'later', 'data': {}}, partition=0,
+                       headers=[(RETRY_DUE_HEADER, str(now_ms + 300).encode())])
+        broker.produce(topic, {'id': 'now', 'data': {}}, partition=1,
+                       headers=[(RETRY_DUE_HEADER, str(now_ms).encode())])
+        processed = {}
+        kafka_consumer = broker.consumer(topic, group_id='retry')
+        consumer = RobustKafkaConsumer(_config(), [topic], 'retry', workers=2, consumer=kafka_consumer)
+        consumer.register_handler(topic, lambda message: processed.setdefault(message['id'], time.time()))
+        start = time.time()
+        thread = threading.Thread(target=consumer.start_consuming)
+        thread.start()
+        try:
+            assert _wait(lambda: 'now' in processed)
+            # La partition 0 attend son échéance en pause, sans bloquer la partition 1
+            assert TopicPartition(topic, 0) in kafka_consumer.paused()
+            assert 'later' not in processed
+            assert _wait(lambda: 'later' in processed)
+        finally:
+            consumer.stop()
+            thread.join()
+        assert processed['later'] - start >= 0.29
+        assert kafka_consumer.paused() == set()
+
+    def test_failed_record_is_committed_once_its_retry_is_acknowledged(self):
+        from api.kafka.unified_consumer import UnifiedConsumer
+
+        broker = InMemoryBroker(partitions=1)
+        _publish(broker, ['company-0'], per_company=3)
+        producer = HeldAcks(broker)
+        unified = UnifiedConsumer(retry_scheduler=RetryScheduler(config=_config(), producer=producer, delays=DELAYS))
+
+        def handle(message):
+            if message['id'] == 'company-0-1':
+                raise ConnectionError('LLM API unavailable')
+
+        consumer = RobustKafkaConsumer(_config(), [TOPIC], 'main', workers=1,
+                                       consumer=broker.consumer(TOPIC, group_id='main'))
+        consumer.register_handler(TOPIC, handle)
+        consumer.register_error_handler(unified._handle_error)
+        thread = threading.Thread(target=consumer.start_consuming)
+        thread.start()
+        tp = TopicPartition(TOPIC, 0)
+        try:
+            # L'échec part en retry sans bloquer le worker...
+            assert _wait(lambda: len(broker.records(f"{TOPIC}.retry.100ms")) == 1)
+            [retried] = broker.records(f"{TOPIC}.retry.100ms")
+            assert retried.value['metadata']['retry_count'] == 1
+            assert retried.value['metadata']['kafka_topic'] == TOPIC
+            time.sleep(0.1)
+            # ... mais son offset n'est commité qu'à l'acquittement du retry
+            assert broker.committed('main', tp) == 1
+            producer.ack()
+            assert _wait(lambda: broker.committed('main', tp) == 3)
+        finally:
+            consumer.stop()
+            thread.join()
+
+
+class TestUnifiedShutdown:
+    def test_stop_joins_the_retry_consumer_before_start_returns(self):
+        from api.kafka.unified_consumer import UnifiedConsumer
+
+        broker = InMemoryBroker(partitions=1)
+        scheduler = RetryScheduler(config=_config(), producer=broker.producer(), delays=DELAYS)
+        unified = UnifiedConsumer(consumer_factory=lambda topics, group_id: broker.consumer(*topics, group_id=group_id),
+                                  retry_scheduler=scheduler)
+        thread = threading.Thread(target=unified.start)
+        thread.start()
+        assert _wait(lambda: unified.consumer is not None and unified.retry_consumer is not None)
+        retry_thread = unified._retry_thread
+
+        unified.stop()
+        thread.join(5)
+        assert not thread.is_alive()
+        assert not retry_thread.is_alive()
+
+    def test_stop_interrupts_the_restart_delay(self):
+        from api.kafka.unified_consumer import UnifiedConsumer
+
+        def broken_factory(topics, group_id):
+            raise ConnectionError('broker unavailable')
+
+        unified = UnifiedConsumer(consumer_factory=broken_factory, retry_scheduler=RetryScheduler(producer=object()))
+        unified.restart_delay = 60
+        thread = threading.Thread(target=unified.start)
+        thread.start()
+        time.sleep(0.1)
+        unified.stop()
+        # Sans interruption, le redémarrage attendrait 60 s
+        thread.join(5)
+        assert not thread.is_alive() and not unified._retry_thread.is_alive()
@@ -0,0 +1,172 @@
+"""
+Tests du producer partagé (api.kafka.shared_producer) : un seul client Kafka
+par processus pour tous les émetteurs, recréé après un fork, sérialisation et
+métriques par topic, client réutilisé pour les envois en DLQ.
+"""
+
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+
+import pytest
+
+from api.kafka import shared_producer
+from api.kafka.async_producer import AsyncKafkaProducer
+from api.kafka.message_codec import loads
+from api.kafka.robust_kafka_client import KafkaConfig, RobustKafkaProducer, StandardKafkaTopics, kafka_config
+from api.kafka.shared_producer import SharedKafkaProducer, get_shared_producer
+from tests.test_kafka_async_producer import StubKafkaProducer
+
+JOURNAL_ENTRY = {
+    'id': 'je-1', 'companyId': 'company-1', 'journalType': 'sales', 'totalDebit': 100,
+    'totalCredit': 100, 'lines': [{'accountCode': '701', 'credit': 100}],
+}
+
+
+@pytest.fixture
+def clients(monkeypatch, tmp_path):
+    """Clients Kafka créés par le producer partagé du processus (simulés)"""
+    created = []
+
+    def create_producer(self):
+        created.append(StubKafkaProducer())
+        return created[-1]
+
+    monkeypatch.setattr(AsyncKafkaProducer, '_create_producer', create_producer)
+    monkeypatch.setattr(kafka_config, 'producer_spool_path', str(tmp_path / 'spool.sqlite3'))
+    monkeypatch.setattr(shared_producer, '_shared_producer', None)
+    return created
+
+
+class TestSharedProducer:
+    def test_all_publishers_share_one_client(self, clients, monkeypatch):
+        from api.kafka import producer_accounting, producer_portfolio
+        from api.kafka.producer import send_event
+        from api.kafka.retry_topics import RetryScheduler
+
+        def no_event_loop():
+            raise AssertionError('send_journal_entry_to_accounting must not create an event loop')
+
+        monkeypatch.setattr(asyncio, 'new_event_loop', no_event_loop)
+        shared = get_shared_producer()
+        monkeypatch.setattr(producer_portfolio.portfolio_producer, 'producer', shared)
+        monkeypatch.setattr(producer_accounting.accounting_producer, 'producer', RobustKafkaProducer(kafka_config))
+
+        assert send_event('token.usage', {'tokens': 12}) is not None
+        assert producer_portfolio.send_chat_response({'requestId': 'r-1', 'answer': 'ok'})
+        assert producer_accounting.send_journal_entry_to_accounting(dict(JOURNAL_ENTRY))
+        RetryScheduler().send_to_dlq({'id': 'm-1', 'metadata': {'kafka_topic': 'commerce.operation.created'}},
+                                     'LLM API unavailable')
+        shared.flush()
+
+        assert len(clients) == 1
+        assert sorted(topic for topic, _ in clients[0].sent) == sorted([
+            'token.usage', StandardKafkaTopics.PORTFOLIO_CHAT_RESPONSE,
+            StandardKafkaTopics.ACCOUNTING_JOURNAL_ENTRY, StandardKafkaTopics.DLQ_FAILED_MESSAGES,
+        ])
+        topics = shared.stats()['topics']
+        assert topics['token.usage']['sent'] == topics['token.usage']['delivered'] == 1
+        assert topics[StandardKafkaTopics.DLQ_FAILED_MESSAGES]['latency_ms']['p50'] >= 0
+
+    def test_spool_left_by_a_previous_process_is_replayed_at_start(self, clients):
+        from api.kafka.delivery_spool import DeliverySpool
+
+        DeliverySpool(kafka_config.producer_spool_path).append('token.usage', {'tokens': 7}, error='broker down')
+        shared = get_shared_producer()
+        shared.producer  # Création du client : le spool est renvoyé au démarrage
+        deadline = time.time() + 5
+        while not (clients and clients[0].sent) and time.time() < deadline:
+            time.sleep(0.01)
+        shared.close()
+        assert clients[0].sent == [('token.usage', {'tokens': 7})]
+        assert shared.producer.get_stats()['spool_size'] == 0
+
+    def test_client_is_recreated_after_fork(self, clients):
+        shared = get_shared_producer()
+        shared.send('adha-ai-events', {'before': 'fork'})
+        shared.flush()
+        parent_client = shared.producer
+
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Processus enfant (worker gunicorn) : le client hérité n'est pas réutilisé
+            try:
+                result = {'stats_reset': shared.stats()['topics'] == {}}
+                shared.send('adha-ai-events', {'after': 'fork'})
+                shared.flush()
+                result['new_client'] = shared.producer is not parent_client
+                result['clients'] = len(clients)
+                result['delivered'] = shared.stats()['topics']['adha-ai-events']['delivered']
+                os.write(write_end, json.dumps(result).encode())
+            finally:
+                os._exit(0)
+        os.close(write_end)
+        os.waitpid(pid, 0)
+        with os.fdopen(read_end) as pipe:
+            child = json.loads(pipe.read())
+
+        assert child == {'stats_reset': True, 'new_client': True, 'clients': 2, 'delivered': 1}
+        assert shared.producer is parent_client
+        assert len(clients) == 1
+
+    def test_per_topic_serializers_and_bytes(self, clients):
+        shared = get_shared_producer()
+        shared.register_serializer('metrics.compact', lambda value: ','.join(map(str, value)).encode())
+        serializer = shared.serializer
+
+        assert serializer.serialize('metrics.compact', [1, 2, 3]) == b'1,2,3'
+        assert json.loads(serializer.serialize('adha-ai-events', {'é': 1})) == {'é': 1}
+        assert 'é'.encode('utf-8') in serializer.serialize('adha-ai-events', {'é': 1})
+        assert serializer.serialize('adha-ai-events', b'raw') == b'raw'
+        # La DLQ accepte les messages non sérialisables en JSON strict
+        failed_at = datetime(2026, 1, 1)
+        assert loads(serializer.serialize(StandardKafkaTopics.DLQ_FAILED_MESSAGES, {'at': failed_at}))['at'] in (
+            str(failed_at), failed_at.isoformat(),
+        )
+        assert shared.stats()['topics']['metrics.compact']['bytes'] == 5
+
+    def test_delivery_outcomes_feed_the_circuit_breaker(self, tmp_path):
+        config = KafkaConfig()
+        config.producer_spool_path = str(tmp_path / 'spool.sqlite3')
+        client = StubKafkaProducer(failing=True)
+        shared = SharedKafkaProducer(config, producer=AsyncKafkaProducer(config, producer=client))
+
+        assert not shared.send_and_wait('adha-ai-events', {'id': 1})
+        shared.flush()  # callbacks de livraison exécutés
+        assert shared.circuit_breaker.failures == 1
+        client.failing = False
+        assert shared.send_and_wait('adha-ai-events', {'id': 2})
+        shared.flush()
+        assert shared.circuit_breaker.failures == 0
+
+
+class TestDeadLetterStorm:
+    def test_dlq_storm_reuses_one_client(self, tmp_path):
+        """Client Kafka créé par message DLQ (ancien code) contre client partagé."""
+        messages = 30
+        clients = []
+
+        def new_client():
+            # Chaque client paie le bootstrap : connexion et métadonnées du cluster
+            clients.append(StubKafkaProducer())
+            return clients[-1]
+
+        for i in range(messages):
+            client = new_client()
+            client.send(StandardKafkaTopics.DLQ_FAILED_MESSAGES, {'id': i}).get(timeout=1)
+            client.close()
+        assert len(clients) == messages
+
+        clients.clear()
+        config = KafkaConfig()
+        config.producer_spool_path = str(tmp_path / 'spool.sqlite3')
+        shared = SharedKafkaProducer(config, producer=AsyncKafkaProducer(config, producer=new_client()))
+        for i in range(messages):
+            assert shared.send_and_wait(StandardKafkaTopics.DLQ_FAILED_MESSAGES, {'id': i})
+
+        assert len(clients) == 1
+        assert len(clients[0].sent) == messages
+        assert shared.stats()['topics'][StandardKafkaTopics.DLQ_FAILED_MESSAGES]['delivered'] == messages
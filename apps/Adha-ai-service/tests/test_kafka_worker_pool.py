@@ -0,0 +1,174 @@
+"""
+Tests de la consommation parallèle par clé de RobustKafkaConsumer avec le broker
+en mémoire (api.kafka.in_memory_broker).
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+from api.kafka.in_memory_broker import InMemoryBroker, TopicPartition
+from api.kafka.keyed_worker_pool import KeyedWorkerPool, PartitionOffsetTracker, worker_index
+from api.kafka.robust_kafka_client import KafkaConfig, RobustKafkaConsumer
+
+TOPIC = 'commerce.operation.created'
+
+
+class RecordingHandler:
+    """Handler simulé (appel LLM) qui enregistre l'ordre de traitement par entreprise."""
+
+    def __init__(self, delay=0.0, slow_companies=()):
+        self.delay = delay
+        self.slow_companies = set(slow_companies)
+        self.sequences = defaultdict(list)
+        self.count = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, message):
+        data = message['data']
+        company = data['company_id']
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay * (20 if company in self.slow_companies else 1))
+        with self._lock:
+            self.in_flight -= 1
+            self.sequences[company].append(data['sequence'])
+            self.count += 1
+
+
+def _publish(broker, companies=12, per_company=20, first_sequence=0):
+    for sequence in range(first_sequence, first_sequence + per_company):
+        for c in range(companies):
+            company = f"company-{c:02d}"
+            broker.produce(TOPIC, {
+                'id': f"{company}-{sequence}",
+                'data': {'companyId': company, 'sequence': sequence},
+                'metadata': {'correlationId': f"corr-{company}-{sequence}"},
+            }, key=company)
+    return companies * per_company
+
+
+def _consumer(broker, group_id, workers):
+    config = KafkaConfig()
+    config.poll_timeout_ms = 20
+    consumer = RobustKafkaConsumer(
+        config, [TOPIC], group_id, workers=workers, queue_size=8,
+        consumer=broker.consumer(TOPIC, group_id=group_id),
+    )
+    return consumer
+
+
+def _consume(broker, handler, total, workers, timeout=30):
+    consumer = _consumer(broker, 'test-group', workers)
+    consumer.register_handler(TOPIC, handler)
+    thread = threading.Thread(target=consumer.start_consuming)
+    thread.start()
+    deadline = time.time() + timeout
+    while handler.count < total and time.time() < deadline:
+        time.sleep(0.005)
+    consumer.stop()
+    thread.join()
+    return consumer
+
+
+class TestPartitionOffsetTracker:
+    def test_only_contiguous_offsets_are_committable(self):
+        tp = TopicPartition(TOPIC, 0)
+        tracker = PartitionOffsetTracker()
+        for offset in range(5):
+            tracker.track(tp, offset)
+        tracker.complete(tp, 1)
+        tracker.complete(tp, 2)
+        assert tracker.committable() == {}
+        tracker.complete(tp, 0)
+        assert tracker.committable() == {tp: 3}
+        tracker.complete(tp, 4)
+        assert tracker.committable() == {}
+        tracker.complete(tp, 3)
+        assert tracker.committable() == {tp: 5}
+        assert tracker.in_flight() == 0
+
+
+class TestKeyedWorkerPool:
+    def test_same_key_same_worker_in_order(self):
+        seen = defaultdict(list)
+        pool = KeyedWorkerPool(lambda item: seen[item[0]].append((threading.current_thread().name, item[1])),
+                               workers=4, queue_size=4)
+        for i in range(50):
+            for key in ('a', 'b', 'c'):
+                pool.submit(key, (key, i))
+        pool.stop()
+        for key, entries in seen.items():
+            assert [i for _, i in entries] == list(range(50))
+            assert len({name for name, _ in entries}) == 1
+
+
+class TestRobustKafkaConsumerWorkers:
+    def test_per_company_ordering_and_commits(self):
+        broker = InMemoryBroker(partitions=3)
+        total = _publish(broker)
+        handler = RecordingHandler(delay=0.001)
+
+        _consume(broker, handler, total, workers=6)
+
+        assert handler.count == total
+        for company, sequences in handler.sequences.items():
+            assert sequences == list(range(20)), company
+        # Tout est terminé : chaque partition est commitée jusqu'à sa fin
+        for tp, end in broker.end_offsets(TOPIC).items():
+            assert broker.committed('test-group', tp) == end
+
+    def test_slow_company_does_not_block_others_and_holds_its_offset(self):
+        broker = InMemoryBroker(partitions=1)
+        total = _publish(broker, companies=4, per_company=5)
+        handler = RecordingHandler(delay=0.01, slow_companies={'company-00'})
+        consumer = _consumer(broker, 'slow-group', workers=4)
+        consumer.register_handler(TOPIC, handler)
+        # Entreprises servies par un autre worker que company-00
+        others = [f"company-{c:02d}" for c in (1, 2, 3)
+                  if worker_index(f"company-{c:02d}", 4) != worker_index('company-00', 4)]
+        assert others
+        thread = threading.Thread(target=consumer.start_consuming)
+        thread.start()
+        try:
+            deadline = time.time() + 10
+            while any(len(handler.sequences[c]) < 5 for c in others) and time.time() < deadline:
+                time.sleep(0.005)
+            # Les autres entreprises ont fini pendant que company-00 est encore en cours
+            assert len(handler.sequences['company-00']) < 5
+            # L'offset 0 (company-00) n'est pas terminé : rien n'est commité au-delà
+            assert (broker.committed('slow-group', TopicPartition(TOPIC, 0)) or 0) < total
+
+            while handler.count < total and time.time() < deadline:
+                time.sleep(0.005)
+        finally:
+            consumer.stop()
+            thread.join()
+        assert broker.committed('slow-group', TopicPartition(TOPIC, 0)) == total
+
+    def test_restart_resumes_from_committed_offset(self):
+        broker = InMemoryBroker(partitions=2)
+        first = _publish(broker, companies=4, per_company=5)
+        _consume(broker, RecordingHandler(), first, workers=2)
+        handler = RecordingHandler()
+        second = _publish(broker, companies=4, per_company=5, first_sequence=5)
+        _consume(broker, handler, second, workers=2)
+        # Seuls les nouveaux messages sont lus
+        assert handler.count == second
+        assert all(sequences == list(range(5, 10)) for sequences in handler.sequences.values())
+
+    def test_handlers_run_concurrently_up_to_the_worker_count(self):
+        max_in_flight = {}
+        for workers in (1, 8):
+            broker = InMemoryBroker(partitions=3)
+            total = _publish(broker, companies=16, per_company=5)
+            handler = RecordingHandler(delay=0.005)
+            _consume(broker, handler, total, workers=workers)
+            assert handler.count == total
+            max_in_flight[workers] = handler.max_in_flight
+        # Plus de handlers en parallèle que de partitions : les 16 entreprises occupent les 8 workers
+        assert max_in_flight[1] == 1
+        assert 3 < max_in_flight[8] <= 8, max_in_flight